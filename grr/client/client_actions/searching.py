@@ -5,18 +5,122 @@
 import functools
 import itertools
 import os
+import Queue
 import stat
+import threading
 
 import logging
 
 from grr.client import actions
 from grr.client import vfs
+from grr.lib import config_lib
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
 
 
+class _Listing(object):
+  """The pending listing of a single directory."""
+
+  def __init__(self, pathspec):
+    self.pathspec = pathspec
+    self.done = threading.Event()
+    self.fd = None
+    self.files = None
+    self.error = None
+
+
+class DirectoryPrefetcher(object):
+  """Lists directories ahead of a recursive walk in a bounded thread pool.
+
+  Listing a directory stats every entry in it which, on large or remote
+  filesystems, is where a recursive walk spends most of its time. The walk
+  itself stays single threaded and depth first, it only asks the prefetcher
+  for the listings of the directories it is about to descend into. This keeps
+  the order of the results, and therefore the resumable state of the Find
+  action, exactly the same as for a sequential walk.
+
+  Pending listings are processed in depth first order so the worker threads
+  work on the directories the walk needs next.
+  """
+
+  def __init__(self, num_threads, max_pending=None):
+    self.max_pending = max_pending or num_threads * 16
+    self._queue = Queue.PriorityQueue()
+    self._listings = {}
+    self._lock = threading.Lock()
+    self._stopped = False
+    self._threads = []
+    for _ in xrange(num_threads):
+      thread = threading.Thread(target=self._Run, name="DirectoryPrefetcher")
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+  def _Run(self):
+    while True:
+      _, listing = self._queue.get()
+      if listing is None or self._stopped:
+        return
+
+      try:
+        listing.fd = vfs.VFSOpen(listing.pathspec)
+        listing.files = list(listing.fd.ListFiles())
+      except Exception as e:  # pylint: disable=broad-except
+        # Errors are raised in the walking thread when it needs the listing.
+        listing.error = e
+      finally:
+        listing.done.set()
+
+  def Prefetch(self, pathspec, order):
+    """Schedules a directory listing.
+
+    Args:
+      pathspec: The directory to list.
+      order: A tuple giving the position of the directory in the walk, i.e. the
+             indexes of the directory and its parents in their listings.
+    """
+    key = pathspec.CollapsePath()
+    with self._lock:
+      if (self._stopped or key in self._listings or
+          len(self._listings) >= self.max_pending):
+        return
+
+      listing = _Listing(pathspec)
+      self._listings[key] = listing
+    self._queue.put((order, listing))
+
+  def ListDirectory(self, pathspec, progress_callback=None):
+    """Returns the open directory and its files, listing it if necessary."""
+    with self._lock:
+      listing = self._listings.pop(pathspec.CollapsePath(), None)
+
+    if listing is None:
+      fd = vfs.VFSOpen(pathspec, progress_callback=progress_callback)
+      return fd, list(fd.ListFiles())
+
+    # Keep the nanny informed and enforce the CPU limit while we wait, the CPU
+    # time of the worker threads counts against the limit of the action.
+    while not listing.done.wait(1):
+      if progress_callback:
+        progress_callback()
+
+    if listing.error is not None:
+      raise listing.error  # pylint: disable=raising-bad-type
+
+    return listing.fd, listing.files
+
+  def Stop(self):
+    with self._lock:
+      self._stopped = True
+      self._listings = {}
+
+    for _ in self._threads:
+      # Sentinels sort after all pending listings.
+      self._queue.put(((float("inf"),), None))
+
+
 class Find(actions.IteratedAction):
   """Recurses through a directory returning files which match conditions."""
   in_rdfvalue = rdf_client.FindSpec
@@ -25,6 +129,9 @@ class Find(actions.IteratedAction):
   # The filesystem we are limiting ourselves to, if cross_devs is false.
   filesystem_id = None
 
+  # Lists directories ahead of ListDirectory, None lists them on demand.
+  prefetcher = None
+
   def QuickListDirectory(self, pathspec, state):
     """Quick recursive generator of files."""
     try:
@@ -59,15 +166,19 @@ class Find(actions.IteratedAction):
                       path_options="CASE_LITERAL")),
               st_mode=rdf_client.StatMode(stat.S_IFDIR if is_dir else 0))
 
-  def ListDirectory(self, pathspec, state, depth=0):
+  def ListDirectory(self, pathspec, state, depth=0, order=()):
     """A recursive generator of files."""
     # Limit recursion depth
     if depth >= self.request.max_depth:
       return
 
     try:
-      fd = vfs.VFSOpen(pathspec, progress_callback=self.Progress)
-      files = fd.ListFiles()
+      if self.prefetcher:
+        fd, files = self.prefetcher.ListDirectory(
+            pathspec, progress_callback=self.Progress)
+      else:
+        fd = vfs.VFSOpen(pathspec, progress_callback=self.Progress)
+        files = fd.ListFiles()
     except (IOError, OSError) as e:
       if depth == 0:
         # We failed to open the directory the server asked for because dir
@@ -90,17 +201,20 @@ class Find(actions.IteratedAction):
     # resume.
     start = state.get(pathspec.CollapsePath(), 0)
 
+    if self.prefetcher and depth + 1 < self.request.max_depth:
+      for i, file_stat in enumerate(files):
+        if i >= start and self._ShouldDescend(file_stat):
+          self.prefetcher.Prefetch(file_stat.pathspec, order + (i,))
+
     for i, file_stat in enumerate(files):
       # Skip the files we already did before
       if i < start:
         continue
 
-      if stat.S_ISDIR(file_stat.st_mode):
-        # Do not traverse directories in a different filesystem.
-        if self.request.cross_devs or self.filesystem_id == file_stat.st_dev:
-          for child_stat in self.ListDirectory(file_stat.pathspec, state,
-                                               depth + 1):
-            yield child_stat
+      if self._ShouldDescend(file_stat):
+        for child_stat in self.ListDirectory(file_stat.pathspec, state,
+                                             depth + 1, order + (i,)):
+          yield child_stat
 
       state[pathspec.CollapsePath()] = i + 1
       yield file_stat
@@ -111,6 +225,11 @@ class Find(actions.IteratedAction):
     except KeyError:
       pass
 
+  def _ShouldDescend(self, file_stat):
+    # Do not traverse directories in a different filesystem.
+    return stat.S_ISDIR(file_stat.st_mode) and (
+        self.request.cross_devs or self.filesystem_id == file_stat.st_dev)
+
   def TestFileContent(self, file_stat):
     """Checks the file for the presence of the regular expression."""
     # Content regex check
@@ -222,20 +341,34 @@ class Find(actions.IteratedAction):
     else:
       listing_strategy = self.ListDirectory
 
-    # TODO(user): What is a reasonable measure of work here?
-    for count, f in enumerate(listing_strategy(request.pathspec, client_state)):
-      self.Progress()
-
-      # Ignore this file if any of the checks fail.
-      if not any((check(f) for check in filters)):
-        self.SendReply(rdf_client.FindSpec(hit=f))
+      # Only the OS handler is safe to use from several threads, the image
+      # based handlers share the file handles of their images.
+      num_threads = config_lib.CONFIG["Client.find_threads"]
+      if num_threads > 1 and all(
+          component.pathtype == rdf_paths.PathSpec.PathType.OS
+          for component in request.pathspec):
+        self.prefetcher = DirectoryPrefetcher(num_threads)
 
-      # We only check a limited number of files in each iteration. This might
-      # result in returning an empty response - but the iterator is not yet
-      # complete. Flows must check the state of the iterator explicitly.
-      if count >= limit - 1:
-        logging.debug("Processed %s entries, quitting", count)
-        return
+    try:
+      # TODO(user): What is a reasonable measure of work here?
+      for count, f in enumerate(
+          listing_strategy(request.pathspec, client_state)):
+        self.Progress()
+
+        # Ignore this file if any of the checks fail.
+        if not any((check(f) for check in filters)):
+          self.SendReply(rdf_client.FindSpec(hit=f))
+
+        # We only check a limited number of files in each iteration. This
+        # might result in returning an empty response - but the iterator is not
+        # yet complete. Flows must check the state of the iterator explicitly.
+        if count >= limit - 1:
+          logging.debug("Processed %s entries, quitting", count)
+          return
+    finally:
+      if self.prefetcher:
+        self.prefetcher.Stop()
+        self.prefetcher = None
 
     # End this iterator
     request.iterator.state = rdf_client.Iterator.State.FINISHED
@@ -191,6 +191,64 @@ class FindTest(test_lib.EmptyActionTest):
     # Ensure we remove old states from client_state
     self.assertEqual(len(request.iterator.client_state.dat), 0)
 
+  def _FindAll(self, request):
+    request = request.Copy()
+    request.iterator.number = 200
+    result = self.RunAction(searching.Find, request)
+    return [x.hit for x in result if isinstance(x, rdf_client.FindSpec)]
+
+  def testFindActionWithPrefetching(self):
+    """Directory prefetching does not change the results or their order."""
+    pathspec = rdf_paths.PathSpec(
+        path="/mock2/", pathtype=rdf_paths.PathSpec.PathType.OS)
+    request = rdf_client.FindSpec(
+        pathspec=pathspec, path_regex=".", cross_devs=True)
+
+    with test_lib.ConfigOverrider({"Client.find_threads": 1}):
+      expected = self._FindAll(request)
+
+    with test_lib.ConfigOverrider({"Client.find_threads": 4}):
+      self.assertEqual(self._FindAll(request), expected)
+
+      # Resuming the iterator one file at a time also yields the same files.
+      files = []
+      request.iterator.number = 1
+      while True:
+        result = self.RunAction(searching.Find, request)
+        if request.iterator.state == rdf_client.Iterator.State.FINISHED:
+          break
+        files.extend(
+            x.hit for x in result if isinstance(x, rdf_client.FindSpec))
+        request.iterator = result[-1].Copy()
+
+    self.assertEqual(files, expected)
+
+  def testDirectoryPrefetcher(self):
+    prefetcher = searching.DirectoryPrefetcher(2)
+    try:
+      directory = rdf_paths.PathSpec(
+          path="/mock2/directory1", pathtype=rdf_paths.PathSpec.PathType.OS)
+      missing = rdf_paths.PathSpec(
+          path="/mock2/missing", pathtype=rdf_paths.PathSpec.PathType.OS)
+      prefetcher.Prefetch(directory, (0,))
+      prefetcher.Prefetch(missing, (1,))
+
+      _, files = prefetcher.ListDirectory(directory)
+      self.assertEqual([x.pathspec.Basename() for x in files],
+                       ["file1.txt", "file2.txt", "directory2"])
+
+      # Errors are raised when the listing is used.
+      self.assertRaises(IOError, prefetcher.ListDirectory, missing)
+
+      # Directories which were not prefetched are listed on demand.
+      _, files = prefetcher.ListDirectory(
+          rdf_paths.PathSpec(
+              path="/mock2/directory3",
+              pathtype=rdf_paths.PathSpec.PathType.OS))
+      self.assertEqual(len(files), 2)
+    finally:
+      prefetcher.Stop()
+
   def testFindAction2(self):
     """Test the find action path regex."""
     pathspec = rdf_paths.PathSpec(
@@ -734,6 +792,37 @@ class FindBenchmarks(test_lib.AverageMicroBenchmarks, test_lib.EmptyActionTest):
 
     self.TimeIt(RunFind, "Find files with no filters.")
 
+  def testFindActionThreads(self):
+    """Compares sequential and prefetched listing of a directory tree."""
+    root = os.path.join(self.temp_dir, "tree")
+    for i in range(10):
+      for j in range(10):
+        path = os.path.join(root, "dir%d" % i, "subdir%d" % j)
+        os.makedirs(path)
+        for k in range(10):
+          open(os.path.join(path, "file%d" % k), "wb").close()
+
+    def RunFind():
+      pathspec = rdf_paths.PathSpec(
+          path=root, pathtype=rdf_paths.PathSpec.PathType.OS)
+      request = rdf_client.FindSpec(pathspec=pathspec)
+      request.iterator.number = 10000
+      result = self.RunAction(searching.Find, request)
+      # Directories and files plus one iterator.
+      self.assertEqual(len(result), 10 + 10 * 10 + 10 * 10 * 10 + 1)
+
+    for threads in [1, 4]:
+      for use_scandir in [False, True]:
+        with test_lib.ConfigOverrider({
+            "Client.find_threads": threads,
+            "Client.vfs_use_scandir": use_scandir
+        }):
+          self.TimeIt(
+              RunFind,
+              "Find in 1110 entries, %d threads%s" %
+              (threads, ", scandir" if use_scandir else ""),
+              repetitions=3)
+
 
 def main(argv):
   test_lib.main(argv)
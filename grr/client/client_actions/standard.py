@@ -75,11 +75,14 @@ class TransferBuffer(actions.ActionPlugin):
     if args.length > MAX_BUFFER_SIZE:
       raise RuntimeError("Can not read buffers this large.")
 
+    # The data is only compressed and hashed here so it does not need to be
+    # copied out of the file.
     data = vfs.ReadVFS(
         args.pathspec,
         args.offset,
         args.length,
-        progress_callback=self.Progress)
+        progress_callback=self.Progress,
+        view=True)
     result = rdf_protodict.DataBlob(
         data=zlib.compress(data),
         compression=rdf_protodict.DataBlob.CompressionType.ZCOMPRESSION)
@@ -111,7 +114,7 @@ class HashBuffer(actions.ActionPlugin):
     if args.length > MAX_BUFFER_SIZE:
       raise RuntimeError("Can not read buffers this large.")
 
-    data = vfs.ReadVFS(args.pathspec, args.offset, args.length)
+    data = vfs.ReadVFS(args.pathspec, args.offset, args.length, view=True)
 
     digest = hashlib.sha256(data).digest()
 
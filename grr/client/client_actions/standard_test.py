@@ -5,6 +5,7 @@ import gzip
 import hashlib
 import os
 import time
+import zlib
 
 
 from grr.client.client_actions import standard
@@ -274,6 +275,57 @@ class TestCopyPathToFile(test_lib.EmptyActionTest):
     self.assertFalse(os.path.exists(result.dest_path.path))
 
 
+class TestTransferBuffer(test_lib.EmptyActionTest):
+  """Test the TransferBuffer and HashBuffer client actions."""
+
+  def setUp(self):
+    super(TestTransferBuffer, self).setUp()
+    self.path = os.path.join(self.temp_dir, "transfer")
+    self.data = os.urandom(256 * 1024) + "X" * 768 * 1024
+    with open(self.path, "wb") as fd:
+      fd.write(self.data)
+
+  def _BufferReference(self, offset, length):
+    return rdf_client.BufferReference(
+        pathspec=rdf_paths.PathSpec(
+            path=self.path, pathtype=rdf_paths.PathSpec.PathType.OS),
+        offset=offset,
+        length=length)
+
+  def _Run(self, action_cls, buffer_reference):
+    message = rdf_flows.GrrMessage(
+        name=action_cls.__name__,
+        payload=buffer_reference,
+        generate_task_id=True)
+    responses = action_mocks.ActionMock(action_cls).HandleMessage(message)
+    return [
+        response.payload for response in responses
+        if response.type == rdf_flows.GrrMessage.Type.MESSAGE
+    ]
+
+  def testTransferBuffer(self):
+    for mmap_reads in [True, False]:
+      with test_lib.ConfigOverrider({"Client.mmap_reads": mmap_reads}):
+        blob, reference = self._Run(standard.TransferBuffer,
+                                    self._BufferReference(100000, 600000))
+
+      expected = self.data[100000:700000]
+      self.assertEqual(zlib.decompress(blob.data), expected)
+      self.assertEqual(reference.offset, 100000)
+      self.assertEqual(reference.length, 600000)
+      self.assertEqual(reference.data, hashlib.sha256(expected).digest())
+
+  def testHashBuffer(self):
+    for mmap_reads in [True, False]:
+      with test_lib.ConfigOverrider({"Client.mmap_reads": mmap_reads}):
+        (reference,) = self._Run(standard.HashBuffer,
+                                 self._BufferReference(500000, 600000))
+
+      self.assertEqual(reference.length, 548576)
+      self.assertEqual(reference.data,
+                       hashlib.sha256(self.data[500000:]).digest())
+
+
 class TestNetworkByteLimits(test_lib.EmptyActionTest):
   """Test CopyPathToFile client actions."""
 
@@ -284,7 +336,8 @@ class TestNetworkByteLimits(test_lib.EmptyActionTest):
     self.buffer_ref = rdf_client.BufferReference(pathspec=pathspec, length=5000)
     self.data = "X" * 500
     self.old_read = standard.vfs.ReadVFS
-    standard.vfs.ReadVFS = lambda x, y, z, progress_callback=None: self.data
+    standard.vfs.ReadVFS = (
+        lambda x, y, z, progress_callback=None, view=False: self.data)
     self.transfer_buf = action_mocks.ActionMock(standard.TransferBuffer)
 
   def testTransferNetworkByteLimitError(self):
@@ -325,6 +378,71 @@ class TestNetworkByteLimits(test_lib.EmptyActionTest):
     standard.vfs.ReadVFS = self.old_read
 
 
+class TransferBufferBenchmarks(test_lib.MicroBenchmarks):
+  """Compares memory use of copied and mapped transfers."""
+
+  units = "ms"
+
+  CHUNK_SIZE = 512 * 1024
+  FILE_SIZE = 32 * 1024 * 1024
+
+  def setUp(self):
+    super(TransferBufferBenchmarks, self).setUp(["Heap growth (kB)"], ["<20"])
+
+  def _AnonymousMemory(self):
+    """Returns the anonymous (heap) memory of this process in kB."""
+    with open("/proc/self/status", "rb") as fd:
+      for line in fd:
+        if line.startswith("RssAnon:"):
+          return int(line.split()[1])
+
+  def testTransferBufferMemory(self):
+    if not os.path.exists("/proc/self/status"):
+      self.skipTest("Memory accounting is only supported on Linux.")
+
+    path = os.path.join(self.temp_dir, "transfer")
+    with open(path, "wb") as fd:
+      for _ in xrange(self.FILE_SIZE / self.CHUNK_SIZE):
+        fd.write(os.urandom(self.CHUNK_SIZE / 2) + "X" * (self.CHUNK_SIZE / 2))
+
+    pathspec = rdf_paths.PathSpec(
+        path=path, pathtype=rdf_paths.PathSpec.PathType.OS)
+    action = action_mocks.ActionMock(standard.TransferBuffer)
+
+    # The uncompressed and compressed chunks are both alive right after the
+    # compression, this is where a transfer uses the most memory.
+    peaks = []
+    compress = zlib.compress
+
+    def MeasuringCompress(data):
+      result = compress(data)
+      peaks.append(self._AnonymousMemory())
+      return result
+
+    chunks = self.FILE_SIZE / self.CHUNK_SIZE
+    for mmap_reads in [False, True]:
+      del peaks[:]
+      baseline = self._AnonymousMemory()
+      start = time.time()
+
+      with test_lib.ConfigOverrider({"Client.mmap_reads": mmap_reads}):
+        with utils.Stubber(standard.zlib, "compress", MeasuringCompress):
+          for i in xrange(chunks):
+            action.HandleMessage(
+                rdf_flows.GrrMessage(
+                    name="TransferBuffer",
+                    payload=rdf_client.BufferReference(
+                        pathspec=pathspec,
+                        offset=i * self.CHUNK_SIZE,
+                        length=self.CHUNK_SIZE),
+                    generate_task_id=True))
+
+      self.AddResult("TransferBuffer %dkB chunks, %s" %
+                     (self.CHUNK_SIZE / 1024, "mmap" if mmap_reads else "read"),
+                     (time.time() - start) / chunks, chunks,
+                     sum(peak - baseline for peak in peaks) / len(peaks))
+
+
 def main(argv):
   test_lib.main(argv)
 
@@ -572,6 +572,72 @@ class VFSTest(test_lib.GRRBaseTest):
                                      ("%s/b/c" % path, [], ["helloc.txt"]),
                                      ("%s/b/d" % path, [], ["hellod.txt"])])
 
+  def testReadView(self):
+    """Large reads from regular files are mapped instead of copied."""
+    path = os.path.join(self.temp_dir, "mapped")
+    data = os.urandom(1024 * 1024)
+    with open(path, "wb") as fd:
+      fd.write(data)
+
+    pathspec = rdf_paths.PathSpec(
+        path=path, pathtype=rdf_paths.PathSpec.PathType.OS)
+
+    with test_lib.ConfigOverrider({"Client.mmap_reads": True}):
+      fd = vfs.VFSOpen(pathspec)
+      # An offset which is not a multiple of the allocation granularity.
+      fd.Seek(70000)
+      view = fd.ReadView(500000)
+      self.assertTrue(isinstance(view, buffer))
+      self.assertEqual(view[:], data[70000:570000])
+      self.assertEqual(fd.Tell(), 570000)
+
+      # Reads past the end are truncated.
+      view = fd.ReadView(10 * 1024 * 1024)
+      self.assertEqual(view[:], data[570000:])
+      self.assertEqual(fd.ReadView(100), "")
+
+      # Small reads are not worth mapping.
+      fd.Seek(10)
+      self.assertEqual(fd.ReadView(100), data[10:110])
+
+    with test_lib.ConfigOverrider({"Client.mmap_reads": False}):
+      fd = vfs.VFSOpen(pathspec)
+      view = fd.ReadView(500000)
+      self.assertTrue(isinstance(view, str))
+      self.assertEqual(view, data[:500000])
+
+  def testScandirListFiles(self):
+    """The scandir listing returns the same entries as the stat based one."""
+    path = os.path.join(self.temp_dir, "scandir")
+    os.mkdir(path)
+    os.mkdir(os.path.join(path, "subdir"))
+    with open(os.path.join(path, "file.txt"), "wb") as fd:
+      fd.write("hello")
+    os.symlink(
+        os.path.join(path, "file.txt"), os.path.join(path, "link.txt"))
+    pathspec = rdf_paths.PathSpec(
+        path=path, pathtype=rdf_paths.PathSpec.PathType.OS)
+
+    listings = {}
+    for use_scandir in [True, False]:
+      with test_lib.ConfigOverrider({"Client.vfs_use_scandir": use_scandir}):
+        listing = vfs.VFSOpen(pathspec).ListFiles()
+        listings[use_scandir] = sorted(
+            listing, key=lambda x: x.pathspec.CollapsePath())
+
+    self.assertEqual(
+        [x.pathspec.Basename() for x in listings[True]],
+        ["file.txt", "link.txt", "subdir"])
+    self.assertEqual(listings[True], listings[False])
+    self.assertEqual(listings[True][1].symlink, os.path.join(path, "file.txt"))
+
+    with test_lib.ConfigOverrider({"Client.vfs_use_scandir": True}):
+      directory = vfs.VFSOpen(pathspec)
+      self.assertEqual(
+          list(directory.RecursiveListNames(depth=1)),
+          [(path, ["subdir"], ["file.txt", "link.txt"]),
+           (os.path.join(path, "subdir"), [], [])])
+
   def testTskRecursiveListNames(self):
     path = os.path.join(self.base_path, u"test_img.dd")
     ps2 = rdf_paths.PathSpec(pathtype=rdf_paths.PathSpec.PathType.TSK)
@@ -85,6 +85,20 @@ class VFSHandler(object):
     """Reads some data from the file."""
     raise NotImplementedError
 
+  def ReadView(self, length):
+    """Reads some data from the file without copying it if possible.
+
+    Handlers which can give access to the data in place override this.
+
+    Args:
+      length: The number of bytes to read.
+
+    Returns:
+      A string or a read only buffer object. Buffers stay valid for as long as
+      they are referenced.
+    """
+    return self.Read(length)
+
   def Stat(self):
     """Returns a StatEntry about this file."""
     raise NotImplementedError
@@ -411,7 +425,7 @@ def VFSOpen(pathspec, progress_callback=None):
   return fd
 
 
-def ReadVFS(pathspec, offset, length, progress_callback=None):
+def ReadVFS(pathspec, offset, length, progress_callback=None, view=False):
   """Read from the VFS and return the contents.
 
   Args:
@@ -420,10 +434,14 @@ def ReadVFS(pathspec, offset, length, progress_callback=None):
     length: number of bytes to read
     progress_callback: A callback to indicate that the open call is still
                        working but needs more time.
+    view: If True, the contents may be returned as a read only buffer
+          referencing the file data in place (see VFSHandler.ReadView).
 
   Returns:
     VFS file contents
   """
   fd = VFSOpen(pathspec, progress_callback=progress_callback)
   fd.Seek(offset)
+  if view:
+    return fd.ReadView(length)
   return fd.Read(length)
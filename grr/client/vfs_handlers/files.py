@@ -2,14 +2,23 @@
 """Implements VFSHandlers for files on the client."""
 
 import logging
+import mmap
 import os
 import platform
 import re
+import stat
 import sys
 import threading
 
+try:
+  # pylint: disable=g-import-not-at-top
+  import scandir
+except ImportError:
+  scandir = None
+
 from grr.client import client_utils
 from grr.client import vfs
+from grr.lib import config_lib
 from grr.lib import utils
 from grr.lib.rdfvalues import client
 from grr.lib.rdfvalues import paths
@@ -106,6 +115,10 @@ class File(vfs.VFSHandler):
   alignment = 1
   file_offset = 0
 
+  # The local path self.files was listed from, None if they were not read from
+  # the filesystem.
+  listed_path = None
+
   def __init__(self,
                base_fd,
                pathspec=None,
@@ -148,6 +161,7 @@ class File(vfs.VFSHandler):
         self.files = [
             utils.SmartUnicode(entry) for entry in os.listdir(local_path)
         ]
+        self.listed_path = local_path
     # Some filesystems do not support unicode properly
     except UnicodeEncodeError as e:
       raise IOError(str(e))
@@ -246,7 +260,13 @@ class File(vfs.VFSHandler):
     if not cross_devs:
       path_dev = self._GetDevice(path)
 
-    for root, dirs, files in os.walk(self.path):
+    walk = os.walk
+    if self._UseScandir():
+      # os.walk stats every entry to tell directories from files, scandir gets
+      # this from the directory listing on most platforms.
+      walk = scandir.walk
+
+    for root, dirs, files in walk(self.path):
       dirs.sort()
       files.sort()
 
@@ -285,6 +305,62 @@ class File(vfs.VFSHandler):
 
       return data[pre_padding:]
 
+  # Reads smaller than this are copied, mapping them costs more than the copy.
+  MIN_MAPPED_READ = 64 * 1024
+
+  def ReadView(self, length):
+    """Reads from the file by mapping it into memory.
+
+    The returned buffer references the page cache directly so the data is not
+    copied into a Python string. This is only done for regular files when
+    enabled by Client.mmap_reads, everything else falls back to Read().
+
+    Args:
+      length: The number of bytes to read.
+
+    Returns:
+      A read only buffer or a string.
+    """
+    if (not config_lib.CONFIG["Client.mmap_reads"] or self.alignment != 1 or
+        self.size is None):
+      return self.Read(length)
+
+    available_to_read = max(0, self.size - self.offset)
+    to_read = min(length, available_to_read)
+    if to_read < self.MIN_MAPPED_READ:
+      return self.Read(length)
+
+    if self.progress_callback:
+      self.progress_callback()
+
+    offset = self.file_offset + self.offset
+    # Mappings have to start at a multiple of the allocation granularity.
+    map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+
+    with FileHandleManager(self.filename) as fd:
+      fileno = fd.fd.fileno()
+      st = os.fstat(fileno)
+      # Devices, pipes and files which shrunk since we opened them are read
+      # the normal way.
+      if not stat.S_ISREG(st.st_mode) or offset + to_read > st.st_size:
+        return self.Read(length)
+
+      try:
+        mapped = mmap.mmap(
+            fileno,
+            offset + to_read - map_offset,
+            access=mmap.ACCESS_READ,
+            offset=map_offset)
+      except (mmap.error, ValueError) as e:
+        logging.debug("Failed to map %s: %s", self.filename, e)
+        return self.Read(length)
+
+    self.offset += to_read
+
+    # The buffer keeps the mapping alive, it is unmapped once the buffer is
+    # garbage collected.
+    return buffer(mapped, offset - map_offset, to_read)
+
   def Stat(self, path=None):
     """Returns stat information of a specific path.
 
@@ -311,11 +387,43 @@ class File(vfs.VFSHandler):
 
     return result
 
+  def _UseScandir(self):
+    return scandir is not None and config_lib.CONFIG["Client.vfs_use_scandir"]
+
+  def _ScandirListFiles(self):
+    """List all files in the dir using scandir."""
+    for entry in scandir.scandir(self.listed_path):
+      try:
+        # Windows returns the stat information with the listing, elsewhere
+        # this is equivalent to os.stat.
+        st = entry.stat()
+      except OSError:
+        continue
+
+      path = utils.SmartUnicode(entry.name)
+      pathspec = self.pathspec.Copy()
+      pathspec.last.path = utils.JoinPath(pathspec.last.path, path)
+      response = MakeStatResponse(st, pathspec)
+
+      # Only links need a readlink call, we know which ones they are from the
+      # listing.
+      if entry.is_symlink():
+        try:
+          response.symlink = utils.SmartUnicode(os.readlink(entry.path))
+        except (OSError, AttributeError):
+          pass
+
+      yield response
+
   def ListFiles(self):
     """List all files in the dir."""
     if not self.IsDirectory():
       raise IOError("%s is not a directory." % self.path)
 
+    elif self.listed_path is not None and self._UseScandir():
+      for response in self._ScandirListFiles():
+        yield response
+
     else:
       for path in self.files:
         try:
@@ -65,3 +65,29 @@ config_lib.DEFINE_list(
     "Artifacts.netgroup_user_blacklist", [],
     help="Exclude these users when parsing /etc/netgroup "
     "files.")
+
+config_lib.DEFINE_string(
+    "Artifacts.registry_snapshot", "",
+    "If set, artifacts loaded from files are stored in a snapshot at this "
+    "path. As long as the artifact files don't change, the snapshot is loaded "
+    "instead of parsing and validating them again.")
+
+config_lib.DEFINE_integer(
+    "Artifacts.parser_pool_size", 0,
+    "Number of processes to run artifact parsers in. If 0, parsers run in the "
+    "worker thread processing the flow.")
+
+config_lib.DEFINE_integer(
+    "Artifacts.parser_timeout", 300,
+    "Seconds a parser may run in the parser pool before it is killed.")
+
+config_lib.DEFINE_integer(
+    "Artifacts.parser_pool_max_file_size", 10 * 1024 * 1024,
+    "Files larger than this are parsed in the worker thread instead of being "
+    "sent to the parser pool.")
+
+config_lib.DEFINE_bool(
+    "Artifacts.coalesce_collection_requests", False,
+    "If set, file and registry sources collected by the same artifact "
+    "collector flow are merged into one Glob or FileFinder flow per path type "
+    "and their results are handed back to each source.")
@@ -129,6 +129,24 @@ config_lib.DEFINE_integer("Client.foreman_check_frequency", 1800,
                           "The minimum number of seconds before checking with "
                           "the foreman for new work.")
 
+config_lib.DEFINE_integer("Client.find_threads", 1,
+                          "Number of threads the Find client action uses to "
+                          "list directories ahead of its recursive walk. This "
+                          "pays off on network filesystems where stat calls "
+                          "are slow, on local disks the threads mostly "
+                          "compete for the interpreter lock.")
+
+config_lib.DEFINE_bool("Client.vfs_use_scandir", True,
+                       "Use scandir, if available, to list directories of the "
+                       "OS filesystem. This saves a stat or readlink call per "
+                       "directory entry.")
+
+config_lib.DEFINE_bool("Client.mmap_reads", False,
+                       "Read regular files for transfers and hashing by "
+                       "mapping them into memory instead of copying the data. "
+                       "Note that the client is killed by SIGBUS if a mapped "
+                       "file is truncated while it is being read.")
+
 config_lib.DEFINE_float("Client.rss_max", 1000,
                         "Maximum memory footprint in MB (soft limit). "
                         "Exceeding this will result in an orderly shutdown.")
@@ -21,6 +21,24 @@ config_lib.DEFINE_integer(
     default=600,
     help="How long do we wait for a transaction lock.")
 
+# Local file blob store.
+config_lib.DEFINE_string(
+    "LocalFileBlobstore.root_path",
+    default="%(Datastore.location)/blobs",
+    help="Directory the LocalFileBlobstore keeps blobs in.")
+
+config_lib.DEFINE_integer(
+    "LocalFileBlobstore.shard_levels",
+    default=2,
+    help=("Number of directory levels blobs are sharded into. Each level is "
+          "named after the next two characters of the blob digest."))
+
+config_lib.DEFINE_bool(
+    "LocalFileBlobstore.compress",
+    default=False,
+    help=("If True, new blobs are stored zlib compressed. Blobs stored "
+          "either way can always be read."))
+
 DATASTORE_PATHING = [
     r"%{(?P<path>files/hash/generic/sha256/...).*}",
     r"%{(?P<path>files/hash/generic/sha1/...).*}",
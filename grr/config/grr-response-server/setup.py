@@ -92,6 +92,11 @@ setup_args = dict(
         # store support:
         # pip install grr-response[mysqldatastore]
         "mysqldatastore": ["MySQL-python==1.2.5"],
+        # This is an optional component. Install to read sqlite databases,
+        # e.g. browser histories, in place instead of copying them to a
+        # tempfile first:
+        # pip install grr-response-server[sqlitevfs]
+        "sqlitevfs": ["apsw==3.9.2.post1"],
     },
     data_files=["version.ini"])
 
@@ -70,6 +70,22 @@ config_lib.DEFINE_integer(
     "Flows who got stuck in the worker for more than this time (in seconds) "
     "are forcibly terminated")
 
+config_lib.DEFINE_integer(
+    "Foreman.hunt_assignment_batch_size", 1,
+    "The foreman buffers clients it assigns to hunts and schedules them once "
+    "this many assignments are pending. The default of 1 schedules every "
+    "client right away.")
+
+config_lib.DEFINE_integer(
+    "Foreman.hunt_assignment_flush_interval", 5,
+    "Buffered hunt assignments are scheduled on the next client poll after "
+    "they have been pending for this many seconds.")
+
+config_lib.DEFINE_integer(
+    "Hunt.client_admission_batch_size", 1000,
+    "Clients are added to a hunt in batches of up to this many clients. Each "
+    "batch is queued as a single request for the hunt and processed at once.")
+
 config_lib.DEFINE_list("Frontend.well_known_flows", ["TransferStore", "Stats"],
                        "Allow these well known flows to run directly on the "
                        "frontend. Other flows are scheduled as normal.")
@@ -121,6 +137,11 @@ config_lib.DEFINE_semantic(
     "Frontend.certificate",
     description="An X509 certificate for the frontend server.")
 
+config_lib.DEFINE_integer(
+    "ClientFleetStats.ping_resolution", 600,
+    "Clients update their last ping in the fleet statistics index when it "
+    "moved on by at least this many seconds.")
+
 config_lib.DEFINE_bool("Cron.active", False,
                        "Set to true to run a cron thread on this binary.")
 
@@ -304,3 +325,22 @@ config_lib.DEFINE_string(
     default="retain",
     help="Inactive clients marked with "
     "this label will be retained forever.")
+
+# Filestore hash filters.
+config_lib.DEFINE_bool(
+    "FileStore.hash_filter_enabled",
+    default=False,
+    help="If True, hash file stores answer lookups for hashes that are "
+    "definitely not present from an in-memory bloom filter instead of the "
+    "data store. The filters are rebuilt periodically by a cron job.")
+
+config_lib.DEFINE_float(
+    "FileStore.hash_filter_error_rate", 0.001,
+    "Target false positive rate of the filestore hash filters.")
+
+config_lib.DEFINE_integer(
+    "FileStore.hash_filter_refresh_interval", 60,
+    "Time in seconds an in-memory hash filter is used before newly added "
+    "hashes and rebuilt filters are picked up from the data store. Until then, "
+    "hashes missing from the filter are checked against the hashes added since "
+    "the last rebuild.")
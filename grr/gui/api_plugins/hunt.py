@@ -106,7 +106,7 @@ class ApiHunt(rdf_structs.RDFProtoStruct):
     self.description = hunt.runner_args.description
     self.is_robot = context.creator == "GRRWorker"
 
-    hunt_stats = context.usage_stats
+    hunt_stats = hunt.GetClientResourcesStats()
     self.total_cpu_usage = hunt_stats.user_cpu_stats.sum
     self.total_net_usage = hunt_stats.network_bytes_sent_stats.sum
 
@@ -645,12 +645,17 @@ class ApiGetHuntClientCompletionStatsHandler(
         mode="r",
         token=token)
 
-    clients_by_status = hunt.GetClientsByStatus()
-    started_clients = clients_by_status["STARTED"]
-    completed_clients = clients_by_status["COMPLETED"]
+    client_stats = hunt.GetClientStats()
+    if client_stats is not None:
+      start_stats, complete_stats = client_stats.GetCompletionDataPoints()
+    else:
+      # Hunts created before client stats were maintained.
+      clients_by_status = hunt.GetClientsByStatus()
+      started_clients = clients_by_status["STARTED"]
+      completed_clients = clients_by_status["COMPLETED"]
 
-    (start_stats, complete_stats) = self._SampleClients(started_clients,
-                                                        completed_clients)
+      (start_stats, complete_stats) = self._SampleClients(started_clients,
+                                                          completed_clients)
 
     if len(start_stats) > target_size:
       # start_stats and complete_stats are equally big, so resample both
@@ -905,7 +910,7 @@ class ApiGetHuntStatsHandler(api_call_handler_base.ApiCallHandler):
     hunt = aff4.FACTORY.Open(
         HUNTS_ROOT_PATH.Add(args.hunt_id), aff4_type=hunts.GRRHunt, token=token)
 
-    stats = hunt.GetRunner().context.usage_stats
+    stats = hunt.GetClientResourcesStats()
 
     return ApiGetHuntStatsResult(stats=stats)
 
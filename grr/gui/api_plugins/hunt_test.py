@@ -890,7 +890,7 @@ class ApiGetHuntStatsHandlerRegressionTest(
     # Create replace dictionary.
     replace = {hunt_urn.Basename(): "H:123456"}
     with aff4.FACTORY.Open(hunt_urn, mode="r", token=self.token) as hunt:
-      stats = hunt.GetRunner().context.usage_stats
+      stats = hunt.GetClientResourcesStats()
       for performance in stats.worst_performers:
         session_id = performance.session_id.Basename()
         replace[session_id] = "<replaced session value>"
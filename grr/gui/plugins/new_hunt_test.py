@@ -40,7 +40,7 @@ class TestNewHuntWizard(test_lib.GRRSeleniumTest):
     fman = aff4.FACTORY.Open(
         "aff4:/foreman", mode="r", aff4_type=aff4_grr.GRRForeman, token=token)
     hunt_rules = []
-    rules = fman.Get(fman.Schema.RULES, [])
+    rules = fman.ReadRules()
     for rule in rules:
       for action in rule.actions:
         if action.hunt_id == hunt.urn:
@@ -80,7 +80,7 @@ class TestNewHuntWizard(test_lib.GRRSeleniumTest):
       with aff4.FACTORY.Create(
           "aff4:/foreman", aff4_grr.GRRForeman, mode="rw",
           token=self.token) as self.foreman:
-        self.foreman.Set(self.foreman.Schema.RULES())
+        self.foreman.SetRules([])
         self.foreman.Close()
 
   def testNewHuntWizard(self):
@@ -2,7 +2,9 @@
 """GRR specific AFF4 objects."""
 
 
+import random
 import re
+import threading
 import time
 
 
@@ -10,17 +12,21 @@ import logging
 from grr.client.components.rekall_support import rekall_types as rdf_rekall_types
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import flow
 from grr.lib import queue_manager
 from grr.lib import rdfvalue
 from grr.lib import registry
+from grr.lib import stats
 from grr.lib.aff4_objects import standard
+from grr.lib.aff4_objects import stats as aff4_stats
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
 from grr.lib.rdfvalues import protodict as rdf_protodict
+from grr.lib.rdfvalues import stats as rdf_stats
 from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import flows_pb2
 from grr.server import foreman as rdf_foreman
@@ -211,6 +217,9 @@ class VFSGRRClient(standard.VFSDirectory):
     # Our URN must be a valid client.id.
     self.client_id = rdf_client.ClientURN(self.urn)
 
+    # The ping last written to the fleet statistics index by this object.
+    self._fleet_stats_ping = None
+
   def Update(self, attribute=None, priority=None):
     if attribute == "CONTAINS":
       flow_id = flow.GRRFlow.StartFlow(
@@ -329,6 +338,72 @@ class VFSGRRClient(standard.VFSDirectory):
 
     return summary
 
+  def GetFleetStatsRecord(self):
+    """Gets the record of this client in the fleet statistics index.
+
+    Returns:
+      rdf_stats.ClientFleetStatsRecord
+    """
+    record = rdf_stats.ClientFleetStatsRecord(
+        client_id=self.urn,
+        labels=self.GetLabelsNames(owner="GRR"),
+        system=self.Get(self.Schema.SYSTEM, "Unknown"),
+        uname=self.Get(self.Schema.UNAME, "Unknown"))
+
+    ping = self.Get(self.Schema.PING)
+    if ping:
+      record.last_ping = ping
+
+    c_info = self.Get(self.Schema.CLIENT_INFO)
+    if c_info:
+      record.grr_version = " ".join([
+          c_info.client_description or c_info.client_name,
+          str(c_info.client_version)
+      ])
+
+    return record
+
+  def _FleetStatsRecordChanged(self):
+    """Checks if the unwritten attributes change the fleet statistics."""
+    # We need to be able to read the other attributes to write a record.
+    if "r" not in self.mode:
+      return False
+
+    for attribute in [
+        self.Schema.CLIENT_INFO, self.Schema.SYSTEM, self.Schema.UNAME,
+        self.Schema.LABELS
+    ]:
+      if attribute in self.new_attributes:
+        return True
+
+    # The ping changes on every poll, but the statistics only need to know it
+    # approximately.
+    if self.Schema.PING in self.new_attributes:
+      if self._fleet_stats_ping is None:
+        return True
+
+      ping = self.Get(self.Schema.PING)
+      resolution = config_lib.CONFIG["ClientFleetStats.ping_resolution"]
+      return (ping.AsSecondsFromEpoch() -
+              self._fleet_stats_ping.AsSecondsFromEpoch() >= resolution)
+
+    return False
+
+  def _WriteAttributes(self, sync=True):
+    update_fleet_stats = self._FleetStatsRecordChanged()
+
+    super(VFSGRRClient, self)._WriteAttributes(sync=sync)
+
+    if update_fleet_stats:
+      record = self.GetFleetStatsRecord()
+      index = aff4.FACTORY.Create(
+          aff4_stats.ClientFleetStatsIndex.INDEX_URN,
+          aff4_stats.ClientFleetStatsIndex,
+          mode="w",
+          token=self.token)
+      index.UpdateRecords([record], mutation_pool=self.mutation_pool)
+      self._fleet_stats_ping = self.Get(self.Schema.PING)
+
   def AddLabels(self, *label_names, **kwargs):
     super(VFSGRRClient, self).AddLabels(*label_names, **kwargs)
     with aff4.FACTORY.Create(
@@ -471,10 +546,27 @@ class VFSMemoryFile(aff4.AFF4MemoryStream):
 
 
 class GRRForeman(aff4.AFF4Object):
-  """The foreman starts flows for clients depending on rules."""
+  """The foreman starts flows for clients depending on rules.
+
+  Every rule is stored as a separate record below RULES_URN, so rules can be
+  added and removed without rewriting (or locking) the others. Every change
+  also writes a new RULES_VERSION to the foreman object itself, which allows
+  readers to only fetch the rule records once they have changed.
+  """
+
+  # The rule records are stored below this urn.
+  RULES_URN = rdfvalue.RDFURN("aff4:/foreman/rules")
+
+  # The attribute a rule record is stored in.
+  RULE_ATTRIBUTE = "aff4:foreman_rule"
+
+  # The largest possible suffix of a rule record id.
+  MAX_RULE_SUFFIX = 2**24 - 1
 
   class SchemaCls(aff4.AFF4Object.SchemaCls):
     """Attributes specific to VFSDirectory."""
+    # Deprecated: rules used to be stored in this attribute. Rules found here
+    # are moved to rule records by MigrateLegacyRules.
     RULES = aff4.Attribute(
         "aff4:rules",
         rdf_foreman.ForemanRules,
@@ -483,19 +575,124 @@ class GRRForeman(aff4.AFF4Object):
         creates_new_object_version=False,
         default=rdf_foreman.ForemanRules())
 
+    RULES_VERSION = aff4.Attribute(
+        "aff4:rules_version",
+        rdfvalue.RDFString,
+        "Changes whenever the rules are changed.",
+        versioned=False,
+        creates_new_object_version=False)
+
+  # The most recently compiled rule index, shared by all foreman objects in
+  # this process. Rules only change when hunts are started or expire so this
+  # is recompiled rarely.
+  _rule_index = None
+
+  def _RuleURN(self, rule, suffix=None):
+    if suffix is None:
+      suffix = random.randint(1, self.MAX_RULE_SUFFIX)
+    # Rule records are read in the order of their urns, which keeps the rules
+    # in the order they were created in.
+    return self.RULES_URN.Add("%016x.%06x" % (int(rule.created), suffix))
+
+  def _ScanRuleRecords(self):
+    """Yields (subject, rule) pairs for all the stored rules."""
+    for subject, _, value in data_store.DB.ScanAttribute(
+        self.RULES_URN, self.RULE_ATTRIBUTE, token=self.token):
+      yield subject, rdf_foreman.ForemanRule.FromSerializedString(value)
+
+  def _UpdateRulesVersion(self):
+    self.Set(self.Schema.RULES_VERSION("%016x" % random.getrandbits(64)))
+    self.Flush()
+
+  def ReadRules(self):
+    """Reads all the stored rules.
+
+    Returns:
+      A ForemanRules object holding the rules.
+    """
+    rules = rdf_foreman.ForemanRules()
+    for _, rule in self._ScanRuleRecords():
+      rules.Append(rule)
+    return rules
+
+  def AddRule(self, rule):
+    """Stores a new rule."""
+    data_store.DB.Set(
+        self._RuleURN(rule),
+        self.RULE_ATTRIBUTE,
+        rule.SerializeToString(),
+        token=self.token)
+    self._UpdateRulesVersion()
+
+  def SetRules(self, rules):
+    """Replaces all the stored rules with the given ones."""
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      for subject, _ in self._ScanRuleRecords():
+        mutation_pool.DeleteSubject(subject)
+
+      for i, rule in enumerate(rules):
+        mutation_pool.Set(
+            self._RuleURN(rule, suffix=i + 1), self.RULE_ATTRIBUTE,
+            rule.SerializeToString())
+    self._UpdateRulesVersion()
+
+  def RemoveHuntRules(self, hunt_id):
+    """Removes the rules which start the given hunt."""
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      removed = 0
+      for subject, rule in self._ScanRuleRecords():
+        if rule.hunt_id == hunt_id:
+          mutation_pool.DeleteSubject(subject)
+          removed += 1
+
+    if removed:
+      self._UpdateRulesVersion()
+
+  def MigrateLegacyRules(self):
+    """Moves rules stored in the deprecated RULES attribute to rule records."""
+    legacy_rules = self.Get(self.Schema.RULES)
+    if not legacy_rules:
+      return
+
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      for rule in legacy_rules:
+        mutation_pool.Set(
+            self._RuleURN(rule), self.RULE_ATTRIBUTE, rule.SerializeToString())
+    self.DeleteAttribute(self.Schema.RULES)
+    self._UpdateRulesVersion()
+
+  def GetRuleIndex(self):
+    """Returns the compiled index of the current rules.
+
+    The rule records are only read when the rules version stored in the
+    foreman object differs from the version of the cached index.
+    """
+    version = self.Get(self.Schema.RULES_VERSION)
+    index = GRRForeman._rule_index
+    if index is None or index.version != version:
+      index = rdf_foreman.ForemanRuleIndex(self.ReadRules(), version=version)
+      GRRForeman._rule_index = index
+      stats.STATS.IncrementCounter("foreman_rule_index_compilations")
+
+    return index
+
   def ExpireRules(self):
-    """Removes any rules with an expiration date in the past."""
-    rules = self.Get(self.Schema.RULES)
-    new_rules = self.Schema.RULES()
+    """Removes any rules with an expiration date in the past.
+
+    This is run periodically by a cron job and not when clients poll, rules
+    which expired in the meantime are ignored by AssignTasksToClient.
+    """
     now = time.time() * 1e6
     expired_session_ids = set()
-    for rule in rules:
-      if rule.expires > now:
-        new_rules.Append(rule)
-      else:
-        for action in rule.actions:
-          if action.hunt_id:
-            expired_session_ids.add(action.hunt_id)
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      expired = 0
+      for subject, rule in self._ScanRuleRecords():
+        if rule.expires <= now:
+          mutation_pool.DeleteSubject(subject)
+          expired += 1
+          for action in rule.actions:
+            if action.hunt_id:
+              expired_session_ids.add(action.hunt_id)
 
     if expired_session_ids:
       # Notify the worker to mark this hunt as terminated.
@@ -505,29 +702,131 @@ class GRRForeman(aff4.AFF4Object):
           for session_id in expired_session_ids
       ])
 
-    if len(new_rules) < len(rules):
-      self.Set(self.Schema.RULES, new_rules)
-      self.Flush()
+    if expired:
+      self._UpdateRulesVersion()
 
-  def _CheckIfHuntTaskWasAssigned(self, client_id, hunt_id):
-    """Will return True if hunt's task was assigned to this client before."""
-    for _ in aff4.FACTORY.Stat(
-        [client_id.Add("flows/%s:hunt" % rdfvalue.RDFURN(hunt_id).Basename())],
-        token=self.token):
-      return True
+    return expired
 
-    return False
+  def Initialize(self):
+    super(GRRForeman, self).Initialize()
+    # Clients waiting to be scheduled on hunts, keyed by (hunt class, hunt id).
+    self._pending_assignments = {}
+    # Rule timestamps to record as LAST_FOREMAN_TIME once the clients' buffered
+    # assignments are scheduled, keyed by client id.
+    self._pending_foreman_times = {}
+    self._pending_count = 0
+    self._pending_since = None
+    self._pending_lock = threading.Lock()
+
+  def _GetAssignedHuntIds(self, client_id, hunt_ids):
+    """Returns the hunts which were assigned to this client before.
+
+    Args:
+      client_id: The client id.
+      hunt_ids: The ids of the hunts to check.
+
+    Returns:
+      The set of hunt ids from hunt_ids which the client was assigned to,
+      including assignments which are still buffered.
+    """
+    hunt_urns = {}
+    for hunt_id in hunt_ids:
+      urn = client_id.Add("flows/%s:hunt" % rdfvalue.RDFURN(hunt_id).Basename())
+      hunt_urns[str(urn)] = hunt_id
+
+    # A single round trip for all the hunts.
+    assigned = set()
+    for stat in aff4.FACTORY.Stat(hunt_urns, token=self.token):
+      assigned.add(hunt_urns[str(stat["urn"])])
+
+    with self._pending_lock:
+      for (_, hunt_id), client_ids in self._pending_assignments.iteritems():
+        if hunt_id in hunt_ids and client_id in client_ids:
+          assigned.add(hunt_id)
+
+    return assigned
+
+  def _QueueHuntAssignment(self, flow_cls, hunt_id, client_id):
+    """Buffers the assignment of a client to a hunt."""
+    with self._pending_lock:
+      self._pending_assignments.setdefault((flow_cls, hunt_id),
+                                           []).append(client_id)
+      self._pending_count += 1
+      if self._pending_since is None:
+        self._pending_since = time.time()
+
+  def FlushHuntAssignments(self):
+    """Schedules all buffered hunt assignments in one transaction.
+
+    The LAST_FOREMAN_TIME of the scheduled clients is only advanced once their
+    assignments were written, so clients whose assignments are lost (e.g. when
+    the frontend dies with a pending batch) are matched again on their next
+    poll.
+
+    Returns:
+      The number of clients scheduled.
+    """
+    with self._pending_lock:
+      pending = self._pending_assignments
+      foreman_times = self._pending_foreman_times
+      self._pending_assignments = {}
+      self._pending_foreman_times = {}
+      self._pending_count = 0
+      self._pending_since = None
+
+    if not pending:
+      return 0
+
+    count = 0
+    failed_client_ids = set()
+    with queue_manager.QueueManager(token=self.token) as manager:
+      for (flow_cls, hunt_id), client_ids in pending.iteritems():
+        try:
+          flow_cls.StartClients(hunt_id, client_ids, flow_manager=manager)
+          count += len(client_ids)
+        # There could be all kinds of errors we don't know about when starting
+        # the hunt so we catch everything here.
+        except Exception as e:  # pylint: disable=broad-except
+          logging.exception("Failure starting hunt %s on clients %s: %s",
+                            hunt_id, client_ids, e)
+          failed_client_ids.update(client_ids)
+
+    # Clients which failed to start are left to be matched again.
+    foreman_times = {
+        str(client_id): foreman_time
+        for client_id, foreman_time in foreman_times.iteritems()
+        if client_id not in failed_client_ids
+    }
+    for client in aff4.FACTORY.MultiOpen(
+        foreman_times, mode="rw", token=self.token):
+      foreman_time = foreman_times[str(client.urn)]
+      client.Set(client.Schema.LAST_FOREMAN_TIME(foreman_time))
+      client.Close()
+
+    return count
+
+  def _MaybeFlushHuntAssignments(self):
+    """Flushes the buffered hunt assignments if the batch is due."""
+    with self._pending_lock:
+      if not self._pending_count:
+        return
+
+      due = (self._pending_count >=
+             config_lib.CONFIG["Foreman.hunt_assignment_batch_size"] or
+             time.time() - self._pending_since >=
+             config_lib.CONFIG["Foreman.hunt_assignment_flush_interval"])
 
-  def _EvaluateRules(self, objects, rule, client_id):
-    """Evaluates the rules."""
-    return rule.client_rule_set.Evaluate(objects, client_id)
+    if due:
+      self.FlushHuntAssignments()
 
-  def _RunActions(self, rule, client_id):
+  def _RunActions(self, rule, client_id, assigned_hunt_ids):
     """Run all the actions specified in the rule.
 
     Args:
       rule: Rule which actions are to be executed.
       client_id: Id of a client where rule's actions are to be executed.
+      assigned_hunt_ids: Set of ids of the hunts the client was already
+          assigned to. Hunts started here are added to it.
 
     Returns:
       Number of actions started.
@@ -541,7 +840,7 @@ class GRRForeman(aff4.AFF4Object):
         token.username = "Foreman"
 
         if action.HasField("hunt_id"):
-          if self._CheckIfHuntTaskWasAssigned(client_id, action.hunt_id):
+          if action.hunt_id in assigned_hunt_ids:
             logging.info("Foreman: ignoring hunt %s on client %s: was started "
                          "here before", client_id, action.hunt_id)
           else:
@@ -549,7 +848,8 @@ class GRRForeman(aff4.AFF4Object):
                          action.hunt_id, client_id)
 
             flow_cls = flow.GRRFlow.classes[action.hunt_name]
-            flow_cls.StartClients(action.hunt_id, [client_id])
+            self._QueueHuntAssignment(flow_cls, action.hunt_id, client_id)
+            assigned_hunt_ids.add(action.hunt_id)
             actions_count += 1
         else:
           flow.GRRFlow.StartFlow(
@@ -577,58 +877,89 @@ class GRRForeman(aff4.AFF4Object):
     """
     client_id = rdf_client.ClientURN(client_id)
 
-    rules = self.Get(self.Schema.RULES)
-    if not rules:
+    # Polls drive the flushing of hunt assignments buffered by earlier polls.
+    self._MaybeFlushHuntAssignments()
+
+    index = self.GetRuleIndex()
+    if not index:
       return 0
 
     client = aff4.FACTORY.Open(client_id, mode="rw", token=self.token)
     try:
-      last_foreman_run = client.Get(client.Schema.LAST_FOREMAN_TIME) or 0
+      last_foreman_run = int(client.Get(client.Schema.LAST_FOREMAN_TIME) or 0)
     except AttributeError:
       last_foreman_run = 0
 
-    latest_rule = max(rule.created for rule in rules)
+    # Rules checked by an earlier poll whose assignments are still buffered.
+    with self._pending_lock:
+      last_foreman_run = max(last_foreman_run,
+                             self._pending_foreman_times.get(client_id, 0))
 
-    if latest_rule <= int(last_foreman_run):
+    if index.latest_created <= last_foreman_run:
       return 0
 
-    # Update the latest checked rule on the client.
-    client.Set(client.Schema.LAST_FOREMAN_TIME(latest_rule))
-    client.Close()
+    start_time = time.time()
+    now = time.time() * 1e6
+
+    # Only rules the client has the labels or operating system for can match.
+    candidates = [
+        position
+        for position in index.GetCandidates(
+            client, created_after=last_foreman_run)
+        if index.rules[position].expires >= now
+    ]
+    stats.STATS.IncrementCounter(
+        "foreman_rules_evaluated", delta=len(candidates))
 
     # For efficiency we collect all the objects we want to open first and then
     # open them all in one round trip.
     object_urns = {}
-    relevant_rules = []
-    expired_rules = False
-
-    now = time.time() * 1e6
-
-    for rule in rules:
-      if rule.expires < now:
-        expired_rules = True
-        continue
-      if rule.created <= int(last_foreman_run):
-        continue
-
-      relevant_rules.append(rule)
-
-      for path in rule.client_rule_set.GetPathsToCheck():
-        aff4_object = client_id.Add(path)
+    for path in index.GetPathsToCheck(candidates):
+      aff4_object = client_id.Add(path)
+      if aff4_object != client_id:
         object_urns[str(aff4_object)] = aff4_object
 
     # Retrieve all aff4 objects we need.
-    objects = {}
+    objects = {client_id: client}
     for fd in aff4.FACTORY.MultiOpen(object_urns, token=self.token):
       objects[fd.urn] = fd
 
+    matching_rules = [
+        index.rules[position]
+        for position in candidates
+        if index.Evaluate(position, objects, client_id)
+    ]
+    stats.STATS.RecordEvent("foreman_rule_evaluation_latency",
+                            time.time() - start_time)
+
+    hunt_ids = set(action.hunt_id
+                   for rule in matching_rules
+                   for action in rule.actions
+                   if action.HasField("hunt_id"))
+    if hunt_ids:
+      assigned_hunt_ids = self._GetAssignedHuntIds(client_id, hunt_ids)
+    else:
+      assigned_hunt_ids = set()
+
+    num_assigned = len(assigned_hunt_ids)
     actions_count = 0
-    for rule in relevant_rules:
-      if self._EvaluateRules(objects, rule, client_id):
-        actions_count += self._RunActions(rule, client_id)
+    for rule in matching_rules:
+      actions_count += self._RunActions(rule, client_id, assigned_hunt_ids)
 
-    if expired_rules:
-      self.ExpireRules()
+    # Update the latest checked rule on the client. If hunt assignments for
+    # the client are buffered, this is left to FlushHuntAssignments so the
+    # client is matched again should the buffer get lost.
+    with self._pending_lock:
+      deferred = (len(assigned_hunt_ids) > num_assigned or
+                  client_id in self._pending_foreman_times)
+      if deferred:
+        self._pending_foreman_times[client_id] = index.latest_created
+
+    if not deferred:
+      client.Set(client.Schema.LAST_FOREMAN_TIME(index.latest_created))
+      client.Flush()
+
+    self._MaybeFlushHuntAssignments()
 
     return actions_count
 
@@ -639,12 +970,21 @@ class GRRAFF4Init(registry.InitHook):
   # Must run after the AFF4 subsystem is ready.
   pre = ["AFF4InitHook"]
 
+  def RunOnce(self):
+    """Register foreman stats."""
+    stats.STATS.RegisterEventMetric("foreman_rule_evaluation_latency")
+    stats.STATS.RegisterCounterMetric("foreman_rules_evaluated")
+    stats.STATS.RegisterCounterMetric("foreman_rule_index_compilations")
+
   def Run(self):
     try:
       # Make the foreman
       with aff4.FACTORY.Create(
-          "aff4:/foreman", GRRForeman, token=aff4.FACTORY.root_token):
-        pass
+          "aff4:/foreman",
+          GRRForeman,
+          mode="rw",
+          token=aff4.FACTORY.root_token) as foreman:
+        foreman.MigrateLegacyRules()
     except access_control.UnauthorizedAccess:
       pass
 
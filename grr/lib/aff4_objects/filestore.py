@@ -8,16 +8,26 @@ under aff4:/files to handle new file hash and new file creations.
 import hashlib
 
 import logging
+import math
+import struct
+import threading
+import time
+import zlib
 
 from grr.lib import fingerprint
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import rdfvalue
 from grr.lib import registry
+from grr.lib import stats
+from grr.lib import utils
 from grr.lib.aff4_objects import aff4_grr
 from grr.lib.aff4_objects import standard as aff4_standard
 from grr.lib.rdfvalues import nsrl as rdf_nsrl
+from grr.lib.rdfvalues import structs as rdf_structs
+from grr.proto import jobs_pb2
 
 
 class FileStore(aff4.AFF4Volume):
@@ -261,6 +271,74 @@ class FileStoreHash(rdfvalue.RDFURN):
     self.fingerprint_type, self.hash_type, self.hash_value = relative_path
 
 
+class FileStoreHashFilter(rdf_structs.RDFProtoStruct):
+  """The serialized form of a HashFilter."""
+  protobuf = jobs_pb2.FileStoreHashFilter
+
+
+class HashFilter(object):
+  """A bloom filter over hex encoded hash digests.
+
+  Items which were added to the filter are always reported as present. Items
+  which were never added are reported as present with a probability close to
+  the error rate the filter was sized for, so a negative answer is definite.
+  """
+
+  def __init__(self, capacity=1000, error_rate=0.001):
+    capacity = max(capacity, 1)
+    self.num_bits = max(
+        int(math.ceil(-capacity * math.log(error_rate) / math.log(2)**2)), 8)
+    self.num_hashes = max(
+        int(round(self.num_bits / float(capacity) * math.log(2))), 1)
+    self.num_items = 0
+    self.build_time = None
+    self.bits = bytearray((self.num_bits + 7) // 8)
+
+  def _Positions(self, item):
+    # Double hashing: all bit positions are derived from a single digest.
+    h1, h2 = struct.unpack("<QQ", hashlib.md5(utils.SmartStr(item)).digest())
+    for i in xrange(self.num_hashes):
+      yield (h1 + i * h2) % self.num_bits
+
+  def Add(self, item):
+    for position in self._Positions(item):
+      self.bits[position >> 3] |= 1 << (position & 7)
+    self.num_items += 1
+
+  def __contains__(self, item):
+    for position in self._Positions(item):
+      if not self.bits[position >> 3] & (1 << (position & 7)):
+        return False
+    return True
+
+  @property
+  def false_positive_rate(self):
+    """The expected false positive rate for the items added so far."""
+    fill = 1 - math.exp(-self.num_hashes * self.num_items /
+                        float(self.num_bits))
+    return fill**self.num_hashes
+
+  def ToRDFValue(self):
+    return FileStoreHashFilter(
+        bits=zlib.compress(str(self.bits)),
+        num_bits=self.num_bits,
+        num_hashes=self.num_hashes,
+        num_items=self.num_items,
+        build_time=self.build_time)
+
+  @classmethod
+  def FromRDFValue(cls, value):
+    result = cls.__new__(cls)
+    result.num_bits = value.num_bits
+    result.num_hashes = value.num_hashes
+    result.num_items = value.num_items
+    result.build_time = value.build_time
+    result.bits = bytearray(zlib.decompress(value.bits))
+    if len(result.bits) * 8 < result.num_bits:
+      raise ValueError("Hash filter is truncated.")
+    return result
+
+
 class HashFileStore(FileStore):
   """FileStore that stores files referenced by hash."""
 
@@ -273,6 +351,26 @@ class HashFileStore(FileStore):
   }
   FILE_HASH_TYPE = FileStoreHash
 
+  # Data store attributes of the filestore subject holding the hash filter.
+  # These are outside of the aff4 column families so they are not read every
+  # time the filestore object is opened.
+  HASH_FILTER_ATTRIBUTE = "filestore:hash_filter"
+  HASH_FILTER_BUILT_ATTRIBUTE = "filestore:hash_filter_built"
+  HASH_FILTER_RECENT_PREFIX = "filestore:hash_filter_recent:"
+
+  # Hashes recorded within this time before a rebuild started are kept, in
+  # case the files were not yet visible to the rebuild scan.
+  HASH_FILTER_RECENT_MARGIN = rdfvalue.Duration("10m")
+  HASH_FILTER_MIN_CAPACITY = 100000
+
+  # In-memory hash filters by filestore urn: (refresh time, HashFilter).
+  _hash_filters = {}
+  _hash_filters_lock = threading.RLock()
+
+  def _HashFilterScanPath(self):
+    """The path under which all the filtered hashes live."""
+    return self.urn.Add("generic/sha256")
+
   def CheckHashes(self, hashes):
     """Check hashes against the filestore.
 
@@ -292,9 +390,224 @@ class HashFileStore(FileStore):
         hash_map[aff4.ROOT_URN.Add("files/hash/generic/sha256").Add(
             str(hsh.sha256))] = hsh
 
-    for metadata in aff4.FACTORY.Stat(list(hash_map), token=self.token):
+    for urn, hsh in self._StatHashUrns(hash_map):
+      yield urn, hsh
+
+  def _StatHashUrns(self, hash_map):
+    """Stats hash urns, skipping the ones the hash filter rules out.
+
+    Args:
+      hash_map: A dict mapping hash urns to Hash objects.
+
+    Yields:
+      Tuples of (RDFURN, hash object) that exist in the store.
+    """
+    urns = list(hash_map)
+    hash_filter = self.GetHashFilter()
+    if hash_filter is not None:
+      misses = [urn for urn in urns if urn.Basename() not in hash_filter]
+      urns = [urn for urn in urns if urn.Basename() in hash_filter]
+      if misses:
+        urns.extend(self._FindRecentHashFilterAdditions(hash_filter, misses))
+
+    found = 0
+    for metadata in aff4.FACTORY.Stat(urns, token=self.token):
+      found += 1
       yield metadata["urn"], hash_map[metadata["urn"]]
 
+    if hash_filter is not None:
+      store_name = self.__class__.__name__
+      stats.STATS.IncrementCounter(
+          "filestore_hash_filter_lookups",
+          delta=len(hash_map) - len(urns),
+          fields=[store_name, "definite_miss"])
+      stats.STATS.IncrementCounter(
+          "filestore_hash_filter_lookups",
+          delta=found,
+          fields=[store_name, "hit"])
+      stats.STATS.IncrementCounter(
+          "filestore_hash_filter_lookups",
+          delta=len(urns) - found,
+          fields=[store_name, "false_positive"])
+
+  def _FindRecentHashFilterAdditions(self, hash_filter, urns):
+    """Finds the hash urns which were added since the filter was refreshed.
+
+    Hashes added by other processes only reach the in-memory filter on its next
+    refresh, so until then a filter miss is checked against the recently added
+    hashes in the data store. This is a single read of the filestore subject.
+
+    Args:
+      hash_filter: The in-memory HashFilter the urns were missing from.
+      urns: The hash urns which are not in the filter.
+
+    Returns:
+      The urns whose hashes were recently added to the store.
+    """
+    urns_by_attribute = dict(
+        (self.HASH_FILTER_RECENT_PREFIX + urn.Basename(), urn) for urn in urns)
+
+    result = []
+    for attribute, recent_hash, _ in data_store.DB.ResolveMulti(
+        self.urn,
+        list(urns_by_attribute),
+        timestamp=data_store.DB.NEWEST_TIMESTAMP,
+        token=self.token):
+      result.append(urns_by_attribute[attribute])
+      with self._hash_filters_lock:
+        hash_filter.Add(recent_hash)
+
+    return result
+
+  def GetHashFilter(self):
+    """Returns the in-memory hash filter of this store.
+
+    The filter is shared by all instances of the store in this process and is
+    refreshed from the data store every FileStore.hash_filter_refresh_interval
+    seconds. Until then it does not contain hashes added by other processes,
+    so misses have to be confirmed with _FindRecentHashFilterAdditions.
+
+    Returns:
+      A HashFilter, or None if filters are disabled or were never built.
+    """
+    if not config_lib.CONFIG["FileStore.hash_filter_enabled"]:
+      return None
+
+    key = utils.SmartStr(self.urn)
+    now = time.time()
+    with self._hash_filters_lock:
+      refresh_time, hash_filter = self._hash_filters.get(key, (0, None))
+      if (now - refresh_time >
+          config_lib.CONFIG["FileStore.hash_filter_refresh_interval"]):
+        hash_filter = self._RefreshHashFilter(hash_filter)
+        self._hash_filters[key] = (now, hash_filter)
+
+    return hash_filter
+
+  def _ReadHashFilter(self):
+    serialized, _ = data_store.DB.Resolve(
+        self.urn, self.HASH_FILTER_ATTRIBUTE, token=self.token)
+    if not serialized:
+      return None
+
+    return HashFilter.FromRDFValue(
+        FileStoreHashFilter.FromSerializedString(serialized))
+
+  def _RefreshHashFilter(self, hash_filter):
+    """Brings an in-memory hash filter up to date with the data store."""
+    build_time, _ = data_store.DB.Resolve(
+        self.urn, self.HASH_FILTER_BUILT_ATTRIBUTE, token=self.token)
+    if not build_time:
+      return None
+
+    # Only read the whole filter if it was rebuilt since we last loaded it.
+    if hash_filter is None or int(hash_filter.build_time) != int(build_time):
+      hash_filter = self._ReadHashFilter()
+      if hash_filter is None:
+        return None
+
+      stats.STATS.SetGaugeValue(
+          "filestore_hash_filter_false_positive_rate",
+          hash_filter.false_positive_rate,
+          fields=[self.__class__.__name__])
+
+    for _, recent_hash, _ in data_store.DB.ResolvePrefix(
+        self.urn, self.HASH_FILTER_RECENT_PREFIX, token=self.token):
+      if recent_hash not in hash_filter:
+        hash_filter.Add(recent_hash)
+
+    return hash_filter
+
+  def AddToHashFilter(self, hash_value):
+    """Records a hash added to the store since the hash filter was built.
+
+    Args:
+      hash_value: The hex encoded hash the hash filter is keyed on.
+    """
+    if not config_lib.CONFIG["FileStore.hash_filter_enabled"]:
+      return
+
+    data_store.DB.Set(
+        self.urn,
+        self.HASH_FILTER_RECENT_PREFIX + hash_value,
+        hash_value,
+        token=self.token,
+        sync=False)
+
+    with self._hash_filters_lock:
+      _, hash_filter = self._hash_filters.get(
+          utils.SmartStr(self.urn), (0, None))
+      if hash_filter is not None:
+        hash_filter.Add(hash_value)
+
+  def ListHashFilterKeys(self):
+    """Yields the hex encoded hashes of all the files in this store."""
+    for subject, _, _ in data_store.DB.ScanAttribute(
+        self._HashFilterScanPath(),
+        "aff4:type",
+        token=self.token,
+        relaxed_order=True):
+      yield rdfvalue.RDFURN(subject).Basename()
+
+  def RebuildHashFilter(self, progress_callback=None):
+    """Builds a new hash filter for this store and writes it to the data store.
+
+    Args:
+      progress_callback: If set, called periodically during the rebuild.
+
+    Returns:
+      The new HashFilter.
+    """
+    start_time = rdfvalue.RDFDatetime.Now()
+
+    previous = self._ReadHashFilter()
+    capacity = self.HASH_FILTER_MIN_CAPACITY
+    if previous is not None:
+      capacity = max(capacity, previous.num_items * 2)
+
+    while True:
+      hash_filter = HashFilter(
+          capacity=capacity,
+          error_rate=config_lib.CONFIG["FileStore.hash_filter_error_rate"])
+      for hash_value in self.ListHashFilterKeys():
+        hash_filter.Add(hash_value)
+        if progress_callback and hash_filter.num_items % 10000 == 0:
+          progress_callback()
+
+      if hash_filter.num_items <= capacity:
+        break
+
+      # The store grew beyond what we sized the filter for, try again with
+      # enough headroom.
+      capacity = hash_filter.num_items * 2
+
+    hash_filter.build_time = start_time
+    data_store.DB.MultiSet(
+        self.urn, {
+            self.HASH_FILTER_ATTRIBUTE: [hash_filter.ToRDFValue()],
+            self.HASH_FILTER_BUILT_ATTRIBUTE: [int(start_time)]
+        },
+        token=self.token)
+
+    recent = [
+        attribute
+        for attribute, _, _ in data_store.DB.ResolvePrefix(
+            self.urn, self.HASH_FILTER_RECENT_PREFIX, token=self.token)
+    ]
+    if recent:
+      data_store.DB.DeleteAttributes(
+          self.urn,
+          recent,
+          end=int(start_time - self.HASH_FILTER_RECENT_MARGIN),
+          token=self.token)
+
+    stats.STATS.SetGaugeValue(
+        "filestore_hash_filter_false_positive_rate",
+        hash_filter.false_positive_rate,
+        fields=[self.__class__.__name__])
+
+    return hash_filter
+
   def _GetHashers(self, hash_types):
     return [
         getattr(hashlib, hash_type) for hash_type in hash_types
@@ -431,6 +744,8 @@ class HashFileStore(FileStore):
       file_store_fd.Set(hashes)
       file_store_fd.Close(sync=sync)
 
+    self.AddToHashFilter(str(hashes.sha256))
+
     # We do not want to be externally written here.
     return None
 
@@ -648,6 +963,9 @@ class NSRLFileStore(HashFileStore):
   def ListHashes(token=None, age=aff4.NEWEST_TIME):
     return
 
+  def _HashFilterScanPath(self):
+    return self.urn
+
   def CheckHashes(self, hashes, unused_external=True):
     """Checks a list of hashes for presence in the store.
 
@@ -668,17 +986,43 @@ class NSRLFileStore(HashFileStore):
         logging.info("Checking URN %s", str(hash_urn))
         hash_map[hash_urn] = hsh
 
-    for metadata in aff4.FACTORY.Stat(list(hash_map), token=self.token):
-      yield metadata["urn"], hash_map[metadata["urn"]]
+    for urn, hsh in self._StatHashUrns(hash_map):
+      yield urn, hsh
 
-  def AddHash(self, sha1, md5, crc, file_name, file_size, product_code_list,
-              op_system_code_list, special_code):
+  @classmethod
+  def BuildNSRLInformation(cls, sha1, md5, crc, file_name, file_size,
+                           product_code_list, op_system_code_list,
+                           special_code):
+    """Returns the NSRLInformation for a row of the NSRL hash database."""
+    return rdf_nsrl.NSRLInformation(
+        sha1=sha1.decode("hex"),
+        md5=md5.decode("hex"),
+        crc32=crc,
+        file_name=file_name,
+        file_size=file_size,
+        product_code=product_code_list,
+        op_system_code=op_system_code_list,
+        file_type=cls.FILE_TYPES.get(special_code, cls.FILE_TYPES[""]))
+
+  def AddHash(self,
+              sha1,
+              md5,
+              crc,
+              file_name,
+              file_size,
+              product_code_list,
+              op_system_code_list,
+              special_code,
+              mutation_pool=None):
     """Adds a new file from the NSRL hash database.
 
     We create a new subject in:
       aff4:/files/nsrl/<sha1>
     with all the other arguments as attributes.
 
+    Hashes added here are not recorded for the hash filter since imports add
+    millions of them, the filter needs to be rebuilt after an import instead.
+
     Args:
       sha1: SHA1 digest as a hex encoded string.
       md5: MD5 digest as a hex encoded string.
@@ -688,23 +1032,50 @@ class NSRLFileStore(HashFileStore):
       product_code_list: List of products this file is part of.
       op_system_code_list: List of operating systems this file is part of.
       special_code: Special code (malicious/special/normal file).
+      mutation_pool: An optional MutationPool object to write to, the caller
+                     has to flush it.
     """
     file_store_urn = self.PATH.Add(sha1)
 
-    special_code = self.FILE_TYPES.get(special_code, self.FILE_TYPES[""])
-
     with aff4.FACTORY.Create(
-        file_store_urn, NSRLFile, mode="w", token=self.token) as fd:
-      fd.Set(
-          fd.Schema.NSRL(
-              sha1=sha1.decode("hex"),
-              md5=md5.decode("hex"),
-              crc32=crc,
-              file_name=file_name,
-              file_size=file_size,
-              product_code=product_code_list,
-              op_system_code=op_system_code_list,
-              file_type=special_code))
+        file_store_urn,
+        NSRLFile,
+        mode="w",
+        mutation_pool=mutation_pool,
+        token=self.token) as fd:
+      fd.Set(fd.Schema.NSRL,
+             self.BuildNSRLInformation(sha1, md5, crc, file_name, file_size,
+                                       product_code_list,
+                                       op_system_code_list, special_code))
+
+  def AddSerializedHashes(self, hashes, mutation_pool):
+    """Adds files from the NSRL hash database in bulk.
+
+    This writes the same attributes as AddHash but does not instantiate an
+    NSRLFile object per hash, which dominates the cost of large imports. The
+    NSRLInformation is expected to be serialized already so this can be done
+    in parallel by the caller.
+
+    Args:
+      hashes: An iterable of (sha1, serialized NSRLInformation) tuples where
+              sha1 is a hex encoded string.
+      mutation_pool: The MutationPool object to write to, the caller has to
+                     flush it.
+    """
+    now = rdfvalue.RDFDatetime.Now()
+    type_name = utils.SmartUnicode(NSRLFile.__name__)
+    schema = NSRLFile.SchemaCls
+
+    for sha1, serialized_nsrl in hashes:
+      mutation_pool.MultiSet(
+          self.PATH.Add(sha1), {
+              schema.TYPE: [type_name],
+              schema.NSRL: [serialized_nsrl],
+              schema.LAST: [now.SerializeToDataStore()]
+          },
+          timestamp=now,
+          replace=False,
+          to_delete=[schema.LAST])
 
   def FindFile(self, fd):
     """Hash an AFF4Stream and find the RDFURN with the same hash.
@@ -767,6 +1138,16 @@ class FileStoreInit(registry.InitHook):
 
   pre = ["GRRAFF4Init"]
 
+  def RunOnce(self):
+    """Register filestore stats."""
+    stats.STATS.RegisterCounterMetric(
+        "filestore_hash_filter_lookups",
+        fields=[("filestore", str), ("result", str)])
+    stats.STATS.RegisterGaugeMetric(
+        "filestore_hash_filter_false_positive_rate",
+        float,
+        fields=[("filestore", str)])
+
   def Run(self):
     """Create FileStore and HashFileStore namespaces."""
     try:
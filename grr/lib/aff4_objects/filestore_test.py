@@ -20,6 +20,7 @@ from grr.lib.aff4_objects import filestore
 # Needed for GetFile pylint: disable=unused-import
 from grr.lib.flows.general import transfer
 # pylint: enable=unused-import
+from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
 
@@ -434,6 +435,187 @@ class HashFileStoreTest(test_lib.AFF4ObjectTest):
     return res
 
 
+class HashFilterTest(test_lib.GRRBaseTest):
+  """Tests for the filestore hash filter."""
+
+  def testAddedItemsAreAlwaysFound(self):
+    hash_filter = filestore.HashFilter(capacity=1000, error_rate=0.01)
+    hashes = [hashlib.sha256(str(i)).hexdigest() for i in range(1000)]
+    for hash_value in hashes:
+      hash_filter.Add(hash_value)
+
+    for hash_value in hashes:
+      self.assertTrue(hash_value in hash_filter)
+    self.assertEqual(hash_filter.num_items, 1000)
+
+  def testFalsePositiveRate(self):
+    hash_filter = filestore.HashFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+      hash_filter.Add(hashlib.sha256(str(i)).hexdigest())
+
+    false_positives = sum(1 for i in range(1000, 11000)
+                          if hashlib.sha256(str(i)).hexdigest() in hash_filter)
+    self.assertLess(false_positives, 300)
+    self.assertAlmostEqual(hash_filter.false_positive_rate, 0.01, delta=0.005)
+
+  def testRDFValueRoundTrip(self):
+    hash_filter = filestore.HashFilter(capacity=100, error_rate=0.01)
+    hash_filter.Add("aaaa")
+    hash_filter.build_time = rdfvalue.RDFDatetime.Now()
+
+    serialized = hash_filter.ToRDFValue().SerializeToString()
+    restored = filestore.HashFilter.FromRDFValue(
+        filestore.FileStoreHashFilter.FromSerializedString(serialized))
+
+    self.assertTrue("aaaa" in restored)
+    self.assertEqual(restored.bits, hash_filter.bits)
+    self.assertEqual(restored.num_hashes, hash_filter.num_hashes)
+    self.assertEqual(restored.num_items, 1)
+    self.assertEqual(restored.build_time, hash_filter.build_time)
+
+
+class HashFileStoreFilterTest(test_lib.AFF4ObjectTest):
+  """Tests for hash filter lookups in the hash file stores."""
+
+  def setUp(self):
+    super(HashFileStoreFilterTest, self).setUp()
+    self.config_overrider = test_lib.ConfigOverrider({
+        "FileStore.hash_filter_enabled": True,
+        "FileStore.hash_filter_refresh_interval": 0
+    })
+    self.config_overrider.Start()
+    filestore.HashFileStore._hash_filters.clear()
+
+    self.existing = [hashlib.sha256(str(i)).digest() for i in range(10)]
+    for digest in self.existing:
+      self._AddHashToStore(digest)
+
+    self.hash_store = aff4.FACTORY.Open(
+        filestore.HashFileStore.PATH,
+        filestore.HashFileStore,
+        token=self.token)
+
+  def tearDown(self):
+    filestore.HashFileStore._hash_filters.clear()
+    self.config_overrider.Stop()
+    super(HashFileStoreFilterTest, self).tearDown()
+
+  def _AddHashToStore(self, digest):
+    aff4.FACTORY.Create(
+        filestore.HashFileStore.PATH.Add("generic/sha256").Add(
+            digest.encode("hex")),
+        filestore.FileStoreImage,
+        token=self.token).Close()
+
+  def _CheckHashes(self, digests):
+    stat_calls = []
+    original_stat = aff4.FACTORY.Stat
+
+    def RecordingStat(urns, token=None):
+      stat_calls.extend(urns)
+      return original_stat(urns, token=token)
+
+    with utils.Stubber(aff4.FACTORY, "Stat", RecordingStat):
+      found = list(
+          self.hash_store.CheckHashes(
+              [rdf_crypto.Hash(sha256=digest) for digest in digests]))
+
+    return [hsh.sha256 for _, hsh in found], stat_calls
+
+  def testNoFilterFallsBackToDataStore(self):
+    missing = hashlib.sha256("missing").digest()
+    found, stat_calls = self._CheckHashes(self.existing[:2] + [missing])
+
+    self.assertItemsEqual(found, self.existing[:2])
+    self.assertEqual(len(stat_calls), 3)
+
+  def testDefiniteMissesAreNotLookedUp(self):
+    self.hash_store.RebuildHashFilter()
+
+    missing = [hashlib.sha256("missing%d" % i).digest() for i in range(20)]
+    found, stat_calls = self._CheckHashes(self.existing + missing)
+
+    self.assertItemsEqual(found, self.existing)
+    # Only false positives from the filter are looked up.
+    self.assertLess(len(stat_calls), len(self.existing) + 5)
+
+  def testRecentAdditionsAreVisibleToOtherProcesses(self):
+    self.hash_store.RebuildHashFilter()
+
+    new_digest = hashlib.sha256("new").digest()
+    self._AddHashToStore(new_digest)
+    self.hash_store.AddToHashFilter(new_digest.encode("hex"))
+
+    # Simulate a process which loaded the filter before the addition.
+    filestore.HashFileStore._hash_filters.clear()
+    self.hash_store.GetHashFilter()
+
+    found, _ = self._CheckHashes([new_digest])
+    self.assertEqual(found, [new_digest])
+
+  def testAdditionsByOtherProcessesAreFoundBeforeRefresh(self):
+    self.hash_store.RebuildHashFilter()
+
+    with test_lib.ConfigOverrider({
+        "FileStore.hash_filter_refresh_interval": 3600
+    }):
+      self.hash_store.GetHashFilter()
+
+      # Another process adds a hash, our filter is not refreshed.
+      new_digest = hashlib.sha256("new").digest()
+      self._AddHashToStore(new_digest)
+      data_store.DB.Set(
+          self.hash_store.urn,
+          filestore.HashFileStore.HASH_FILTER_RECENT_PREFIX +
+          new_digest.encode("hex"),
+          new_digest.encode("hex"),
+          token=self.token)
+
+      missing = [hashlib.sha256("missing%d" % i).digest() for i in range(20)]
+      found, stat_calls = self._CheckHashes([new_digest] + missing)
+
+    self.assertEqual(found, [new_digest])
+    self.assertLess(len(stat_calls), 5)
+
+  def testRebuildDropsOldRecentAdditions(self):
+    with test_lib.FakeTime(1000):
+      self.hash_store.AddToHashFilter("aaaa")
+
+    with test_lib.FakeTime(5000):
+      self.hash_store.AddToHashFilter("bbbb")
+      self.hash_store.RebuildHashFilter()
+
+    recent = [
+        value
+        for _, value, _ in data_store.DB.ResolvePrefix(
+            self.hash_store.urn,
+            filestore.HashFileStore.HASH_FILTER_RECENT_PREFIX,
+            token=self.token)
+    ]
+    self.assertEqual(recent, ["bbbb"])
+
+  def testNSRLFileStoreUsesSha1Filter(self):
+    nsrl_store = aff4.FACTORY.Open(
+        filestore.NSRLFileStore.PATH,
+        filestore.NSRLFileStore,
+        mode="rw",
+        token=self.token)
+    sha1 = hashlib.sha1("nsrl").hexdigest()
+    nsrl_store.AddHash(sha1, hashlib.md5("nsrl").hexdigest(), 0, "nsrl.exe",
+                       4, [1], ["1"], "")
+
+    hash_filter = nsrl_store.RebuildHashFilter()
+    self.assertTrue(sha1 in hash_filter)
+    self.assertEqual(hash_filter.num_items, 1)
+
+    hashes = [
+        rdf_crypto.Hash(sha1=sha1.decode("hex")),
+        rdf_crypto.Hash(sha1=hashlib.sha1("other").digest())
+    ]
+    found = [hsh for _, hsh in nsrl_store.CheckHashes(hashes)]
+    self.assertEqual(found, hashes[:1])
+
+
 def main(argv):
   # Run the full test suite
   test_lib.GrrTestProgram(argv=argv)
@@ -3,7 +3,12 @@
 """AFF4 stats objects."""
 
 
+import zlib
+
 from grr.lib import aff4
+from grr.lib import data_store
+from grr.lib import rdfvalue
+from grr.lib import utils
 from grr.lib.aff4_objects import standard
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import stats
@@ -44,6 +49,74 @@ class ClientFleetStats(aff4.AFF4Object):
                                               "Last contacted time")
 
 
+class ClientFleetStatsIndex(aff4.AFF4Object):
+  """An index of the client attributes the fleet statistics are built from.
+
+  Clients update their record whenever one of the attributes changes, so the
+  fleet statistics cron jobs can read these records instead of opening every
+  client. The records are spread over a fixed number of shard subjects.
+  """
+
+  INDEX_URN = rdfvalue.RDFURN("aff4:/index/client_fleet_stats")
+
+  INDEX_PREFIX = "fleet_stats:"
+  INDEX_COLUMN_FORMAT = INDEX_PREFIX + "%s"
+
+  SHARDS = 64
+
+  class SchemaCls(aff4.AFF4Object.SchemaCls):
+    LAST_RECONCILED = aff4.Attribute(
+        "aff4:fleet_stats/last_reconciled",
+        rdfvalue.RDFDatetime,
+        "When the records were last rebuilt from the client objects.",
+        versioned=False,
+        creates_new_object_version=False)
+
+  def _ShardURN(self, client_id):
+    shard = zlib.crc32(utils.SmartStr(client_id)) % self.SHARDS
+    return self.urn.Add("%02d" % shard)
+
+  def _ShardURNs(self):
+    return [self.urn.Add("%02d" % shard) for shard in xrange(self.SHARDS)]
+
+  def _Column(self, client_id):
+    return self.INDEX_COLUMN_FORMAT % rdf_client.ClientURN(client_id).Basename()
+
+  def UpdateRecords(self, records, mutation_pool=None):
+    """Writes the records of some clients.
+
+    Args:
+      records: An iterable of ClientFleetStatsRecords.
+      mutation_pool: An optional MutationPool to queue the writes in. If not
+          given, the records are written right away.
+    """
+    if mutation_pool is None:
+      with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+        self.UpdateRecords(records, mutation_pool=mutation_pool)
+      return
+
+    for record in records:
+      mutation_pool.Set(
+          self._ShardURN(record.client_id),
+          self._Column(record.client_id),
+          record.SerializeToString(),
+          replace=True)
+
+  def DeleteRecords(self, client_ids):
+    """Removes the records of some clients."""
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      for client_id in client_ids:
+        mutation_pool.DeleteAttributes(
+            self._ShardURN(client_id), [self._Column(client_id)])
+
+  def ReadRecords(self):
+    """Yields the records of all clients."""
+    for _, values in data_store.DB.MultiResolvePrefix(
+        self._ShardURNs(), self.INDEX_PREFIX, token=self.token):
+      for _, value, _ in values:
+        yield stats.ClientFleetStatsRecord.FromSerializedString(value)
+
+
 class FilestoreStats(aff4.AFF4Object):
   """AFF4 object for storing filestore statistics."""
 
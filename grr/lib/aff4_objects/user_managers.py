@@ -481,6 +481,8 @@ class FullAccessControlManager(access_control.AccessControlManager):
 
     # Administrators are allowed to see current set of foreman rules.
     h.Allow("aff4:/foreman", self._UserHasAdminLabel)
+    h.Allow("aff4:/foreman/rules", self._UserHasAdminLabel)
+    h.Allow("aff4:/foreman/rules/*", self._UserHasAdminLabel)
 
     # Querying is not allowed for the blob namespace. Blobs are stored by hashes
     # as filename. If the user already knows the hash, they can access the blob,
@@ -603,6 +605,10 @@ class FullAccessControlManager(access_control.AccessControlManager):
     h.Allow(self.CLIENT_URN_PATTERN)
     h.Allow(self.CLIENT_URN_PATTERN + "/*")
 
+    # Administrators are allowed to list the foreman rules.
+    h.Allow("aff4:/foreman/rules", self._UserHasAdminLabel)
+    h.Allow("aff4:/foreman/rules/*", self._UserHasAdminLabel)
+
     # Namespace for indexes. Client index is stored there and users need to
     # query the index for searching clients.
     h.Allow("aff4:/index")
@@ -632,8 +632,8 @@ class FullAccessControlManagerIntegrationTest(test_lib.GRRBaseTest):
 
       fd.SetLabels("admin", owner="GRR")
 
-    # Now we are allowed.
-    aff4.FACTORY.Open("aff4:/foreman", token=token)
+    # Now we are allowed, also to read the rules.
+    aff4.FACTORY.Open("aff4:/foreman", token=token).ReadRules()
 
   def testFlowAccess(self):
     """Tests access to flows."""
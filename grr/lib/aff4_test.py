@@ -2029,11 +2029,11 @@ class ForemanTests(test_lib.AFF4ObjectTest):
           flow_name="Test Flow", argv=rdf_protodict.Dict(foo="bar"))
 
       # Clear the rule set and add the new rule to it.
-      rule_set = foreman.Schema.RULES()
+      rule_set = rdf_foreman.ForemanRules()
       rule_set.Append(rule)
 
       # Assign it to the foreman
-      foreman.Set(foreman.Schema.RULES, rule_set)
+      foreman.SetRules(rule_set)
       foreman.Close()
 
       self.clients_launched = []
@@ -2112,7 +2112,7 @@ class ForemanTests(test_lib.AFF4ObjectTest):
           flow_name=old_flow, argv=rdf_protodict.Dict(dict(foo="bar")))
 
       # Clear the rule set and add the new rule to it.
-      rule_set = foreman.Schema.RULES()
+      rule_set = rdf_foreman.ForemanRules()
       rule_set.Append(rule)
 
       # Make a new rule
@@ -2160,7 +2160,7 @@ class ForemanTests(test_lib.AFF4ObjectTest):
       rule_set.Append(rule)
 
       # Assign it to the foreman
-      foreman.Set(foreman.Schema.RULES, rule_set)
+      foreman.SetRules(rule_set)
       foreman.Close()
 
       self.clients_launched = []
@@ -2216,7 +2216,7 @@ class ForemanTests(test_lib.AFF4ObjectTest):
       fd.Close()
 
       # Clear the rule set and add the new rules to it.
-      rule_set = foreman.Schema.RULES()
+      rule_set = rdf_foreman.ForemanRules()
       for rule in rules:
         # Add some regex that does not match the client.
         rule.client_rule_set = rdf_foreman.ForemanClientRuleSet(rules=[
@@ -2227,20 +2227,160 @@ class ForemanTests(test_lib.AFF4ObjectTest):
                     attribute_regex="XXX"))
         ])
         rule_set.Append(rule)
-      foreman.Set(foreman.Schema.RULES, rule_set)
+      foreman.SetRules(rule_set)
       foreman.Close()
 
-    fd = aff4.FACTORY.Create(client_id, aff4_grr.VFSGRRClient, token=self.token)
     for now, num_rules in [(1000, 4), (1250, 3), (1350, 2), (1600, 0)]:
       with test_lib.FakeTime(now):
-        fd.Set(fd.Schema.LAST_FOREMAN_TIME(100))
-        fd.Flush()
         foreman = aff4.FACTORY.Open(
             "aff4:/foreman", mode="rw", token=self.token)
-        foreman.AssignTasksToClient(client_id)
-        rules = foreman.Get(foreman.Schema.RULES)
+        foreman.ExpireRules()
+        rules = foreman.ReadRules()
         self.assertEqual(len(rules), num_rules)
 
+  def testExpiredRulesAreNotEvaluated(self):
+    client_id = rdf_client.ClientURN("C.0000000000000022")
+    with aff4.FACTORY.Create(
+        client_id, aff4_grr.VFSGRRClient, mode="rw", token=self.token) as fd:
+      fd.Set(fd.Schema.SYSTEM, rdfvalue.RDFString("Windows 7"))
+
+    with test_lib.FakeTime(1000):
+      self._SetRules(
+          rdf_foreman.ForemanClientRuleSet(rules=[self._OsRule(
+              os_windows=True)]))
+
+    self.clients_launched = []
+    with utils.Stubber(flow.GRRFlow, "StartFlow", self.StartFlow):
+      with test_lib.FakeTime(1000 + 7200):
+        foreman = aff4.FACTORY.Open(
+            "aff4:/foreman", mode="rw", token=self.token)
+        self.assertEqual(foreman.AssignTasksToClient(client_id), 0)
+
+    self.assertEqual(self.clients_launched, [])
+    # Expired rules are only removed by ExpireRules.
+    self.assertEqual(len(foreman.ReadRules()), 1)
+
+  def testLegacyRulesAreMigrated(self):
+    rule = rdf_foreman.ForemanRule(
+        created=int(time.time() * 1e6),
+        expires=int((time.time() + 3600) * 1e6),
+        description="Legacy rule")
+    with aff4.FACTORY.Open(
+        "aff4:/foreman", mode="rw", token=self.token) as foreman:
+      foreman.SetRules([])
+      foreman.Set(foreman.Schema.RULES, rdf_foreman.ForemanRules([rule]))
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    foreman.MigrateLegacyRules()
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    self.assertFalse(foreman.Get(foreman.Schema.RULES))
+    rules = foreman.ReadRules()
+    self.assertEqual(len(rules), 1)
+    self.assertEqual(rules[0].description, "Legacy rule")
+    self.assertEqual(len(foreman.GetRuleIndex()), 1)
+
+  def _LabelRule(self, *label_names):
+    return rdf_foreman.ForemanClientRule(
+        rule_type=rdf_foreman.ForemanClientRule.Type.LABEL,
+        label=rdf_foreman.ForemanLabelClientRule(label_names=label_names))
+
+  def _OsRule(self, **kwargs):
+    return rdf_foreman.ForemanClientRule(
+        rule_type=rdf_foreman.ForemanClientRule.Type.OS,
+        os=rdf_foreman.ForemanOsClientRule(**kwargs))
+
+  def _SetRules(self, *client_rule_sets):
+    now = time.time() * 1e6
+    expires = (time.time() + 3600) * 1e6
+    rule_set = rdf_foreman.ForemanRules()
+    for i, client_rule_set in enumerate(client_rule_sets):
+      rule = rdf_foreman.ForemanRule(
+          created=int(now),
+          expires=int(expires),
+          description="Test rule %d" % i,
+          client_rule_set=client_rule_set)
+      rule.actions.Append(
+          flow_name="Test flow %d" % i, argv=rdf_protodict.Dict(foo="bar"))
+      rule_set.Append(rule)
+
+    with aff4.FACTORY.Open(
+        "aff4:/foreman", mode="rw", token=self.token) as foreman:
+      foreman.SetRules(rule_set)
+
+  def testRuleIndexOnlyEvaluatesPossiblyMatchingRules(self):
+    client_id = rdf_client.ClientURN("C.0000000000000031")
+    with aff4.FACTORY.Create(
+        client_id, aff4_grr.VFSGRRClient, mode="rw", token=self.token) as fd:
+      fd.Set(fd.Schema.SYSTEM, rdfvalue.RDFString("Windows 7"))
+      fd.AddLabels("foo")
+
+    match_any = rdf_foreman.ForemanClientRuleSet.MatchMode.MATCH_ANY
+    self._SetRules(
+        # Requires the label.
+        rdf_foreman.ForemanClientRuleSet(rules=[self._LabelRule("foo")]),
+        # Requires another label.
+        rdf_foreman.ForemanClientRuleSet(rules=[self._LabelRule("bar")]),
+        # Requires Linux and the label.
+        rdf_foreman.ForemanClientRuleSet(
+            rules=[self._OsRule(os_linux=True), self._LabelRule("foo")]),
+        # Requires Linux or Darwin.
+        rdf_foreman.ForemanClientRuleSet(
+            match_mode=match_any,
+            rules=[self._OsRule(os_linux=True), self._OsRule(os_darwin=True)]),
+        # Can't be indexed.
+        rdf_foreman.ForemanClientRuleSet(rules=[
+            rdf_foreman.ForemanClientRule(
+                rule_type=rdf_foreman.ForemanClientRule.Type.REGEX,
+                regex=rdf_foreman.ForemanRegexClientRule(
+                    attribute_name="System", attribute_regex="Windows"))
+        ]))
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    index = foreman.GetRuleIndex()
+    self.assertEqual(index.indexed_keys,
+                     set([("label", "foo"), ("label", "bar"), ("os", "Linux"),
+                          ("os", "Darwin")]))
+
+    client = aff4.FACTORY.Open(client_id, token=self.token)
+    self.assertEqual(index.GetCandidates(client), [0, 4])
+
+    evaluated = []
+    evaluate = index.Evaluate
+
+    def RecordingEvaluate(position, objects, client_id):
+      evaluated.append(position)
+      return evaluate(position, objects, client_id)
+
+    self.clients_launched = []
+    with utils.Stubber(index, "Evaluate", RecordingEvaluate):
+      with utils.Stubber(flow.GRRFlow, "StartFlow", self.StartFlow):
+        self.assertEqual(foreman.AssignTasksToClient(client_id), 2)
+
+    self.assertEqual(evaluated, [0, 4])
+    self.assertEqual(self.clients_launched, [(client_id, "Test flow 0"),
+                                             (client_id, "Test flow 4")])
+
+  def testRuleIndexIsCompiledOncePerRuleChange(self):
+    self._SetRules(
+        rdf_foreman.ForemanClientRuleSet(rules=[self._LabelRule("foo")]))
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", token=self.token)
+    index = foreman.GetRuleIndex()
+    self.assertIs(foreman.GetRuleIndex(), index)
+
+    # Reopening the foreman with unchanged rules reuses the index.
+    foreman = aff4.FACTORY.Open("aff4:/foreman", token=self.token)
+    self.assertIs(foreman.GetRuleIndex(), index)
+
+    self._SetRules(
+        rdf_foreman.ForemanClientRuleSet(rules=[self._LabelRule("bar")]))
+    foreman = aff4.FACTORY.Open("aff4:/foreman", token=self.token)
+    new_index = foreman.GetRuleIndex()
+    self.assertIsNot(new_index, index)
+    self.assertNotEqual(new_index.version, index.version)
+    self.assertEqual(new_index.indexed_keys, set([("label", "bar")]))
+
 
 def main(argv):
   # Run the full test suite
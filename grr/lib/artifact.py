@@ -8,6 +8,7 @@ from grr.lib import artifact_registry
 from grr.lib import artifact_utils
 from grr.lib import config_lib
 from grr.lib import flow
+from grr.lib import parser_pool
 from grr.lib import parsers
 from grr.lib import rdfvalue
 from grr.lib import registry
@@ -187,8 +188,9 @@ class CollectArtifactDependencies(flow.GRRFlow):
     # We exclude the original artifacts since we're just fulfilling
     # dependencies, the original flow will collect the artifacts once the
     # dependencies are ready.
-    self.state.awaiting_deps_artifacts = list(name_deps - no_deps_names -
-                                              artifact_set)
+    self.state.awaiting_deps_artifacts = (
+        artifact_registry.REGISTRY.GetArtifactNamesInDependencyOrder(
+            name_deps - no_deps_names - artifact_set))
     return no_deps_names
 
   def InitializeKnowledgeBase(self):
@@ -204,10 +206,10 @@ class CollectArtifactDependencies(flow.GRRFlow):
 
   def _ScheduleCollection(self):
     # Schedule any new artifacts for which we have now fulfilled dependencies.
+    graph = artifact_registry.REGISTRY.GetDependencyGraph()
     for artifact_name in self.state.awaiting_deps_artifacts:
-      artifact_obj = artifact_registry.REGISTRY.GetArtifact(artifact_name)
-      deps = artifact_obj.GetArtifactPathDependencies()
-      if set(deps).issubset(self.state.fulfilled_deps):
+      deps = graph.path_dependencies[artifact_name]
+      if deps.issubset(self.state.fulfilled_deps):
         self.state.in_flight_artifacts.append(artifact_name)
         self.state.awaiting_deps_artifacts.remove(artifact_name)
         self.CallFlow(
@@ -425,7 +427,9 @@ class KnowledgeBaseInitializationFlow(CollectArtifactDependencies):
 
     # We're going to collect everything that doesn't have a dependency first.
     # Anything else we're waiting on a dependency before we can collect.
-    self.state.awaiting_deps_artifacts = list(name_deps - no_deps_names)
+    self.state.awaiting_deps_artifacts = (
+        artifact_registry.REGISTRY.GetArtifactNamesInDependencyOrder(
+            name_deps - no_deps_names))
 
     return no_deps_names
 
@@ -448,11 +452,14 @@ def ApplyParserToResponses(processor_obj, responses, source, flow_obj, token):
   Args:
     processor_obj: A Processor object that inherits from Parser.
     responses: A list of, or single response depending on the processors
-       process_together setting.
+       process_together and process_in_batch settings.
     source: The source responsible for producing the responses.
     flow_obj: An artifact collection flow.
     token: The token used in an artifact collection flow.
 
+  When the parser pool is enabled, responses are parsed in a pool process
+  where possible.
+
   Raises:
     RuntimeError: On bad parser.
 
@@ -474,54 +481,80 @@ def ApplyParserToResponses(processor_obj, responses, source, flow_obj, token):
       # handling by the parser. This is used when multiple responses need to
       # be combined to parse successfully. E.g parsing passwd and shadow files
       # together.
-      parse_method = processor_obj.ParseMultiple
+      method_name = "ParseMultiple"
+    elif processor_obj.process_in_batch:
+      method_name = "ParseBatch"
     else:
-      parse_method = processor_obj.Parse
-
-    state = flow_obj.state
-    if isinstance(processor_obj, parsers.CommandParser):
-      # Command processor only supports one response at a time.
-      response = responses
-      result_iterator = parse_method(
-          cmd=response.request.cmd,
-          args=response.request.args,
-          stdout=response.stdout,
-          stderr=response.stderr,
-          return_val=response.exit_status,
-          time_taken=response.time_used,
-          knowledge_base=state.knowledge_base)
-
-    elif isinstance(processor_obj, parsers.WMIQueryParser):
-      query = source["attributes"]["query"]
-      result_iterator = parse_method(query, responses, state.knowledge_base)
-
-    elif isinstance(processor_obj, parsers.FileParser):
-      if processor_obj.process_together:
-        file_objects = [
-            aff4.FACTORY.Open(
-                r.aff4path, token=token) for r in responses
-        ]
-        result_iterator = parse_method(responses, file_objects,
-                                       state.knowledge_base)
-      else:
-        fd = aff4.FACTORY.Open(responses.aff4path, token=token)
-        result_iterator = parse_method(responses, fd, state.knowledge_base)
+      method_name = "Parse"
 
-    elif isinstance(processor_obj,
-                    (parsers.RegistryParser, parsers.RekallPluginParser,
-                     parsers.RegistryValueParser, parsers.GenericResponseParser,
-                     parsers.GrepParser)):
-      result_iterator = parse_method(responses, state.knowledge_base)
+    args, kwargs = _GetParseArguments(processor_obj, responses, source,
+                                      flow_obj, token)
 
-    elif isinstance(processor_obj, (parsers.ArtifactFilesParser)):
-      result_iterator = parse_method(responses, state.knowledge_base,
-                                     flow_obj.GetPathType())
+    result_iterator = None
+    if parser_pool.POOL.enabled:
+      result_iterator = parser_pool.POOL.Parse(processor_obj, method_name,
+                                               args, kwargs)
+    if result_iterator is None:
+      result_iterator = getattr(processor_obj, method_name)(*args, **kwargs)
 
-    else:
-      raise RuntimeError("Unsupported parser detected %s" % processor_obj)
   return result_iterator
 
 
+def _GetParseArguments(processor_obj, responses, source, flow_obj, token):
+  """Returns the (args, kwargs) to call the parse method of a processor with.
+
+  Args:
+    processor_obj: A Processor object that inherits from Parser.
+    responses: A list of, or single response depending on the processors
+       process_together and process_in_batch settings.
+    source: The source responsible for producing the responses.
+    flow_obj: An artifact collection flow.
+    token: The token used in an artifact collection flow.
+
+  Raises:
+    RuntimeError: On bad parser.
+  """
+  state = flow_obj.state
+  if isinstance(processor_obj, parsers.CommandParser):
+    # Command processor only supports one response at a time.
+    response = responses
+    return [], dict(
+        cmd=response.request.cmd,
+        args=response.request.args,
+        stdout=response.stdout,
+        stderr=response.stderr,
+        return_val=response.exit_status,
+        time_taken=response.time_used,
+        knowledge_base=state.knowledge_base)
+
+  elif isinstance(processor_obj, parsers.WMIQueryParser):
+    query = source["attributes"]["query"]
+    return [query, responses, state.knowledge_base], {}
+
+  elif isinstance(processor_obj, parsers.FileParser):
+    if processor_obj.process_together:
+      file_objects = [
+          aff4.FACTORY.Open(
+              r.aff4path, token=token) for r in responses
+      ]
+      return [responses, file_objects, state.knowledge_base], {}
+    else:
+      fd = aff4.FACTORY.Open(responses.aff4path, token=token)
+      return [responses, fd, state.knowledge_base], {}
+
+  elif isinstance(processor_obj,
+                  (parsers.RegistryParser, parsers.RekallPluginParser,
+                   parsers.RegistryValueParser, parsers.GenericResponseParser,
+                   parsers.GrepParser)):
+    return [responses, state.knowledge_base], {}
+
+  elif isinstance(processor_obj, (parsers.ArtifactFilesParser)):
+    return [responses, state.knowledge_base, flow_obj.GetPathType()], {}
+
+  else:
+    raise RuntimeError("Unsupported parser detected %s" % processor_obj)
+
+
 def UploadArtifactYamlFile(file_content,
                            base_urn=None,
                            token=None,
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Central registry for artifacts."""
 
+import hashlib
 import json
 import os
 import re
@@ -11,6 +12,7 @@ import logging
 from grr.lib import access_control
 from grr.lib import aff4
 from grr.lib import artifact_utils
+from grr.lib import config_lib
 from grr.lib import objectfilter
 from grr.lib import parsers
 from grr.lib import rdfvalue
@@ -44,6 +46,10 @@ class ArtifactRegistry(object):
   _artifacts = {}
   _sources = {"dirs": set(), "files": set(), "datastores": set()}
   _dirty = False
+  _dependency_graph = None
+
+  # Changing this invalidates all existing registry snapshots.
+  SNAPSHOT_VERSION = 1
 
   def _LoadArtifactsFromDatastore(self,
                                   source_urns=None,
@@ -142,6 +148,86 @@ class ArtifactRegistry(object):
     for artifact_value in loaded_artifacts:
       artifact_value.Validate()
 
+    return loaded_artifacts
+
+  def _FingerprintFiles(self, file_paths):
+    """Hashes the names and contents of artifact files."""
+    fingerprint = hashlib.sha256(str(self.SNAPSHOT_VERSION))
+    for file_path in sorted(file_paths):
+      fingerprint.update(utils.SmartStr(file_path) + "\0")
+      try:
+        with open(file_path, mode="rb") as fh:
+          fingerprint.update(hashlib.sha256(fh.read(1000000)).digest())
+      except (IOError, OSError):
+        fingerprint.update("\0")
+    return fingerprint.hexdigest()
+
+  def _LoadArtifactsFromSnapshot(self, snapshot_path, fingerprint):
+    """Load artifacts from a registry snapshot.
+
+    Args:
+      snapshot_path: The path of the snapshot.
+      fingerprint: The fingerprint of the artifact files the snapshot has to
+        be taken from.
+
+    Returns:
+      True if the artifacts were loaded, False if the snapshot is missing or
+      out of date.
+    """
+    try:
+      with open(snapshot_path, mode="rb") as fh:
+        snapshot = ArtifactRegistrySnapshot.FromSerializedString(fh.read())
+      if snapshot.fingerprint != fingerprint:
+        return False
+      entries = list(snapshot.artifacts)
+    except (IOError, OSError):
+      return False
+    except Exception as e:  # pylint: disable=broad-except
+      logging.warn("Invalid artifact registry snapshot %s: %s", snapshot_path,
+                   e)
+      return False
+
+    # The snapshot holds validated artifacts, so only the parts of validation
+    # which depend on code instead of the artifact files are repeated.
+    names = set(utils.SmartUnicode(entry.artifact.name) for entry in entries)
+    valid_provides = set(rdf_client.KnowledgeBase().GetKbFieldNames())
+    for entry in entries:
+      if (not names.issuperset(entry.dependencies) or
+          not valid_provides.issuperset(entry.path_dependencies) or
+          not valid_provides.issuperset(entry.artifact.provides)):
+        logging.info("Artifact registry snapshot %s is out of date.",
+                     snapshot_path)
+        return False
+
+    for entry in entries:
+      self.RegisterArtifact(
+          entry.artifact, source=entry.loaded_from, overwrite_if_exists=True)
+    logging.debug("Loaded %d artifacts from snapshot %s", len(entries),
+                  snapshot_path)
+    return True
+
+  def _WriteSnapshot(self, snapshot_path, fingerprint, artifacts):
+    """Writes artifacts loaded from files to a registry snapshot."""
+    snapshot = ArtifactRegistrySnapshot(fingerprint=fingerprint)
+    for artifact_value in artifacts:
+      snapshot.artifacts.Append(
+          artifact=artifact_value,
+          loaded_from=artifact_value.loaded_from,
+          dependencies=sorted(artifact_value.GetArtifactDependencies()),
+          path_dependencies=sorted(
+              artifact_value.GetArtifactSourcePathDependencies()))
+
+    # Other processes may load the snapshot at the same time, so it is
+    # replaced atomically.
+    tmp_path = "%s.%d.tmp" % (snapshot_path, os.getpid())
+    try:
+      with open(tmp_path, mode="wb") as fh:
+        fh.write(snapshot.SerializeToString())
+      os.rename(tmp_path, snapshot_path)
+    except (IOError, OSError) as e:
+      logging.warn("Unable to write artifact registry snapshot %s: %s",
+                   snapshot_path, e)
+
   def ClearSources(self):
     self._sources = {"dirs": set(), "files": set(), "datastores": set()}
     self._dirty = True
@@ -191,20 +277,24 @@ class ArtifactRegistry(object):
     # Clear any stale errors.
     artifact_rdfvalue.error_message = None
     self._artifacts[artifact_rdfvalue.name] = artifact_rdfvalue
+    self._dependency_graph = None
 
   def UnregisterArtifact(self, artifact_name):
     try:
       del self._artifacts[artifact_name]
     except KeyError:
       raise ValueError("Artifact %s unknown." % artifact_name)
+    self._dependency_graph = None
 
   def ClearRegistry(self):
     self._artifacts = {}
+    self._dependency_graph = None
     self._dirty = True
 
   def _ReloadArtifacts(self):
     """Load artifacts from all sources."""
     self._artifacts = {}
+    self._dependency_graph = None
     files_to_load = set()
     for dir_path in self._sources.get("dirs", set()):
       try:
@@ -215,8 +305,17 @@ class ArtifactRegistry(object):
       except (IOError, OSError):
         logging.warn("Artifact directory not found: %s", dir_path)
     files_to_load |= self._sources.get("files", set())
-    logging.debug("Loading artifacts from: %s", files_to_load)
-    self._LoadArtifactsFromFiles(files_to_load)
+
+    snapshot_path = config_lib.CONFIG["Artifacts.registry_snapshot"]
+    if snapshot_path:
+      fingerprint = self._FingerprintFiles(files_to_load)
+      if not self._LoadArtifactsFromSnapshot(snapshot_path, fingerprint):
+        logging.debug("Loading artifacts from: %s", files_to_load)
+        loaded_artifacts = self._LoadArtifactsFromFiles(files_to_load)
+        self._WriteSnapshot(snapshot_path, fingerprint, loaded_artifacts)
+    else:
+      logging.debug("Loading artifacts from: %s", files_to_load)
+      self._LoadArtifactsFromFiles(files_to_load)
 
     self.ReloadDatastoreArtifacts()
 
@@ -228,6 +327,8 @@ class ArtifactRegistry(object):
         to_remove.append(name)
     for key in to_remove:
       self._artifacts.pop(key)
+    if to_remove:
+      self._dependency_graph = None
 
   def ReloadDatastoreArtifacts(self):
     # Make sure artifacts deleted by the UI don't reappear.
@@ -320,6 +421,23 @@ class ArtifactRegistry(object):
   def GetArtifactNames(self, *args, **kwargs):
     return set([a.name for a in self.GetArtifacts(*args, **kwargs)])
 
+  def GetDependencyGraph(self):
+    """Returns the dependency graph of the registered artifacts.
+
+    The graph is built on first use and discarded whenever artifacts are
+    registered or unregistered. Artifacts that are modified in place must be
+    registered again for the change to be picked up.
+
+    Returns:
+      An ArtifactDependencyGraph.
+    """
+    self._CheckDirty()
+    graph = self._dependency_graph
+    if graph is None:
+      graph = ArtifactDependencyGraph(self._artifacts.values())
+      self._dependency_graph = graph
+    return graph
+
   def SearchDependencies(self,
                          os_name,
                          artifact_name_list,
@@ -334,42 +452,26 @@ class ArtifactRegistry(object):
     Args:
       os_name: operating system string
       artifact_name_list: list of artifact names to find dependencies for.
-      existing_artifact_deps: existing dependencies to add to, for recursion,
+      existing_artifact_deps: existing dependencies to add to,
         e.g. set(["WindowsRegistryProfiles", "WinPathEnvironmentVariable"])
-      existing_expansion_deps: existing expansion dependencies to add to, for
-        recursion, e.g. set(["users.userprofile", "users.homedir"])
+      existing_expansion_deps: existing expansion dependencies to add to,
+        e.g. set(["users.userprofile", "users.homedir"])
     Returns:
       (artifact_names, expansion_names): a tuple of sets, one with artifact
           names, the other expansion names
     """
-    artifact_deps = existing_artifact_deps or set()
-    expansion_deps = existing_expansion_deps or set()
-
-    artifact_objs = self.GetArtifacts(
-        os_name=os_name, name_list=artifact_name_list)
-    artifact_deps = artifact_deps.union([a.name for a in artifact_objs])
-
-    for artifact in artifact_objs:
-      expansions = artifact.GetArtifactPathDependencies()
-      if expansions:
-        expansion_deps = expansion_deps.union(set(expansions))
-        # Get the names of the artifacts that provide those expansions
-        new_artifact_names = self.GetArtifactNames(
-            os_name=os_name, provides=expansions)
-        missing_artifacts = new_artifact_names - artifact_deps
-
-        if missing_artifacts:
-          # Add those artifacts and any child dependencies
-          new_artifacts, new_expansions = self.SearchDependencies(
-              os_name,
-              new_artifact_names,
-              existing_artifact_deps=artifact_deps,
-              existing_expansion_deps=expansion_deps)
-          artifact_deps = artifact_deps.union(new_artifacts)
-          expansion_deps = expansion_deps.union(new_expansions)
-
+    artifact_deps, expansion_deps = self.GetDependencyGraph().SearchDependencies(
+        os_name, artifact_name_list)
+    if existing_artifact_deps:
+      artifact_deps.update(existing_artifact_deps)
+    if existing_expansion_deps:
+      expansion_deps.update(existing_expansion_deps)
     return artifact_deps, expansion_deps
 
+  def GetArtifactNamesInDependencyOrder(self, artifact_name_list):
+    """Orders artifact names so that providers precede their dependents."""
+    return self.GetDependencyGraph().TopologicalOrder(artifact_name_list)
+
   def DumpArtifactsToYaml(self, sort_by_os=True):
     """Dump a list of artifacts into a yaml string."""
     artifact_list = self.GetArtifacts()
@@ -394,6 +496,157 @@ class ArtifactRegistry(object):
 REGISTRY = ArtifactRegistry()
 
 
+class ArtifactDependencyGraph(object):
+  """Precomputed dependencies between a fixed set of artifacts.
+
+  Artifacts depend on other artifacts in two ways: artifact groups name the
+  artifacts they collect, and sources interpolate knowledge base attributes
+  that other artifacts provide. Both are computed once when the graph is built
+  and the transitive results are memoized, so the graph must be rebuilt when
+  the artifacts change.
+  """
+
+  MAX_DEPTH = 10
+
+  def __init__(self, artifacts):
+    # Artifact name to the names of the artifacts it collects.
+    self.dependencies = {}
+    # Artifact name to the knowledge base attributes it needs.
+    self.path_dependencies = {}
+    # Knowledge base attribute to the names of the artifacts providing it.
+    self.providers = {}
+    self.supported_os = {}
+
+    for artifact in artifacts:
+      name = artifact.name
+      self.dependencies[name] = artifact.GetArtifactDependencies()
+      self.path_dependencies[name] = artifact.GetArtifactPathDependencies()
+      self.supported_os[name] = set(artifact.supported_os)
+      for provide in artifact.provides:
+        self.providers.setdefault(provide, set()).add(name)
+
+    self._closures = {}
+    self._searches = {}
+
+  def _Supports(self, name, os_name):
+    # An empty supported_os matches all OSes.
+    supported_os = self.supported_os[name]
+    return not os_name or not supported_os or os_name in supported_os
+
+  def GetDependencies(self, artifact_name):
+    """Returns the names of all artifacts an artifact collects, recursively.
+
+    Args:
+      artifact_name: The artifact name.
+
+    Returns:
+      A frozenset of artifact names.
+
+    Raises:
+      ArtifactNotRegisteredError: If a dependency is not in the graph.
+      RuntimeError: If the dependencies are circular or nested too deeply.
+    """
+    return self._GetDependencies(artifact_name, ())
+
+  def _GetDependencies(self, artifact_name, path):
+    try:
+      return self._closures[artifact_name]
+    except KeyError:
+      pass
+
+    if artifact_name in path or len(path) >= self.MAX_DEPTH:
+      raise RuntimeError("Max artifact recursion depth reached.")
+    try:
+      direct_deps = self.dependencies[artifact_name]
+    except KeyError:
+      raise ArtifactNotRegisteredError(
+          "Artifact %s missing from registry." % artifact_name)
+
+    path += (artifact_name,)
+    deps = set(direct_deps)
+    for dep in direct_deps:
+      deps.update(self._GetDependencies(dep, path))
+
+    result = frozenset(deps)
+    self._closures[artifact_name] = result
+    return result
+
+  def SearchDependencies(self, os_name, artifact_name_list):
+    """Finds the artifacts providing the attributes the artifacts need.
+
+    Args:
+      os_name: operating system string.
+      artifact_name_list: list of artifact names to find dependencies for. If
+        empty, all artifacts are searched.
+
+    Returns:
+      (artifact_names, expansion_names): a tuple of sets. The artifact names
+      include the supported artifacts from artifact_name_list.
+    """
+    key = (os_name, frozenset(artifact_name_list or ()))
+    try:
+      artifact_deps, expansion_deps = self._searches[key]
+    except KeyError:
+      artifact_deps, expansion_deps = self._Search(os_name, key[1])
+      self._searches[key] = (artifact_deps, expansion_deps)
+
+    return set(artifact_deps), set(expansion_deps)
+
+  def _Search(self, os_name, artifact_names):
+    if artifact_names:
+      to_visit = [name for name in artifact_names if name in self.dependencies]
+    else:
+      to_visit = list(self.dependencies)
+    to_visit = [name for name in to_visit if self._Supports(name, os_name)]
+
+    artifact_deps = set(to_visit)
+    expansion_deps = set()
+    while to_visit:
+      name = to_visit.pop()
+      for expansion in self.path_dependencies[name]:
+        expansion_deps.add(expansion)
+        for provider in self.providers.get(expansion, ()):
+          if provider not in artifact_deps and self._Supports(provider,
+                                                              os_name):
+            artifact_deps.add(provider)
+            to_visit.append(provider)
+
+    return frozenset(artifact_deps), frozenset(expansion_deps)
+
+  def TopologicalOrder(self, artifact_name_list):
+    """Orders artifact names so that their dependencies come first.
+
+    An artifact depends on the artifacts it collects and on the artifacts
+    providing the knowledge base attributes it needs. Only dependencies within
+    artifact_name_list are considered and cycles between them are broken
+    arbitrarily but deterministically.
+
+    Args:
+      artifact_name_list: The artifact names to order.
+
+    Returns:
+      A list of artifact names.
+    """
+    names = set(artifact_name_list)
+    ordered = []
+    visited = set()
+
+    def Visit(name):
+      if name in visited:
+        return
+      visited.add(name)
+      deps = set(self.dependencies.get(name, ()))
+      for expansion in self.path_dependencies.get(name, ()):
+        deps.update(self.providers.get(expansion, ()))
+      for dep in sorted(deps & names):
+        Visit(dep)
+      ordered.append(name)
+
+    for name in sorted(names):
+      Visit(name)
+    return ordered
+
+
 class ArtifactSource(structs.RDFProtoStruct):
   """An ArtifactSource."""
   protobuf = artifact_pb2.ArtifactSource
@@ -609,17 +862,17 @@ class Artifact(structs.RDFProtoStruct):
 
     # Convert proto enum to simple strings so they get rendered in the GUI
     # properly
-    for source in artifact_dict["sources"]:
+    for source in artifact_dict.get("sources", []):
       if "type" in source:
         source["type"] = str(source["type"])
-      if "key_value_pairs" in source["attributes"]:
+      if "key_value_pairs" in source.get("attributes", {}):
         outarray = []
         for indict in source["attributes"]["key_value_pairs"]:
           outarray.append(dict(indict.items()))
         source["attributes"]["key_value_pairs"] = outarray
 
     # Repeated fields that have not been set should return as empty lists.
-    for field in self.required_repeated_fields:
+    for field in self.required_repeated_fields + ["sources"]:
       if field not in artifact_dict:
         artifact_dict[field] = []
     return artifact_dict
@@ -674,12 +927,11 @@ class Artifact(structs.RDFProtoStruct):
     yaml_str = yaml.safe_dump(artifact_dict, allow_unicode=True, width=80)
     return "name: %s\n%s\n%s" % (name, doc_str, yaml_str)
 
-  def GetArtifactDependencies(self, recursive=False, depth=1):
+  def GetArtifactDependencies(self, recursive=False):
     """Return a set of artifact dependencies.
 
     Args:
       recursive: If True recurse into dependencies to find their dependencies.
-      depth: Used for limiting recursion depth.
 
     Returns:
       A set of strings containing the dependent artifact names.
@@ -697,16 +949,13 @@ class Artifact(structs.RDFProtoStruct):
         if source.attributes.GetItem("names"):
           deps.update(source.attributes.GetItem("names"))
 
-    if depth > 10:
-      raise RuntimeError("Max artifact recursion depth reached.")
-
     deps_set = set(deps)
     if recursive:
+      graph = REGISTRY.GetDependencyGraph()
       for dep in deps:
-        artifact_obj = REGISTRY.GetArtifact(dep)
-        new_dep = artifact_obj.GetArtifactDependencies(True, depth=depth + 1)
-        if new_dep:
-          deps_set.update(new_dep)
+        deps_set.update(graph.GetDependencies(dep))
+      if self.name in deps_set:
+        raise RuntimeError("Max artifact recursion depth reached.")
 
     return deps_set
 
@@ -730,6 +979,17 @@ class Artifact(structs.RDFProtoStruct):
       A set of strings for the required kb objects e.g.
       ["users.appdata", "systemroot"]
     """
+    deps = self.GetArtifactSourcePathDependencies()
+    deps.update(self.GetArtifactParserDependencies())
+    return deps
+
+  def GetArtifactSourcePathDependencies(self):
+    """Return the set of knowledgebase path dependencies of the sources.
+
+    Returns:
+      A set of strings for the kb objects interpolated into the sources e.g.
+      ["users.appdata", "systemroot"]
+    """
     deps = set()
     for source in self.sources:
       for arg, value in source.attributes.items():
@@ -744,7 +1004,6 @@ class Artifact(structs.RDFProtoStruct):
         for path in paths:
           for match in artifact_utils.INTERPOLATED_REGEX.finditer(path):
             deps.add(match.group()[2:-2])  # Strip off %%.
-    deps.update(self.GetArtifactParserDependencies())
     return deps
 
   def ValidateSyntax(self):
@@ -836,3 +1095,15 @@ class ArtifactDescriptor(structs.RDFProtoStruct):
   """Includes artifact, its JSON source, processors and additional info."""
 
   protobuf = artifact_pb2.ArtifactDescriptor
+
+
+class ArtifactSnapshotEntry(structs.RDFProtoStruct):
+  """An artifact stored in a registry snapshot."""
+
+  protobuf = artifact_pb2.ArtifactSnapshotEntry
+
+
+class ArtifactRegistrySnapshot(structs.RDFProtoStruct):
+  """The artifacts loaded from a set of artifact files."""
+
+  protobuf = artifact_pb2.ArtifactRegistrySnapshot
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""Benchmark tests for loading the artifact registry."""
+
+
+import os
+
+from grr.lib import artifact
+from grr.lib import artifact_registry
+from grr.lib import artifact_utils
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.rdfvalues import client as rdf_client
+
+ARTIFACT_TEMPLATE = """name: BenchmarkArtifact%(index)d
+doc: Benchmark artifact %(index)d.
+sources:
+- type: FILE
+  attributes:
+    paths: ['%%%%users.homedir%%%%/.config/file%(index)d',
+            '%%%%environ_systemroot%%%%\\\\System32\\\\file%(index)d.dll']
+labels: [System]
+supported_os: [Windows, Linux]
+urls: ['https://example.com/artifact%(index)d']
+"""
+
+GROUP_TEMPLATE = """name: BenchmarkGroup%(index)d
+doc: Benchmark artifact group %(index)d.
+sources:
+- type: ARTIFACT_GROUP
+  attributes:
+    names: [%(names)s]
+supported_os: [Windows, Linux]
+"""
+
+
+class ArtifactRegistryBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare loading artifacts from files and from a registry snapshot."""
+
+  REPEATS = 3
+
+  FILE_COUNT = 10
+  ARTIFACTS_PER_FILE = 50
+
+  def setUp(self):
+    super(ArtifactRegistryBenchmarks, self).setUp()
+    self.artifact_dir = os.path.join(self.temp_dir, "artifacts")
+    os.mkdir(self.artifact_dir)
+
+    index = 0
+    for file_index in xrange(self.FILE_COUNT):
+      definitions = []
+      for _ in xrange(self.ARTIFACTS_PER_FILE):
+        definitions.append(ARTIFACT_TEMPLATE % dict(index=index))
+        index += 1
+      names = ", ".join("BenchmarkArtifact%d" % i
+                        for i in xrange(index - self.ARTIFACTS_PER_FILE, index))
+      definitions.append(GROUP_TEMPLATE % dict(index=file_index, names=names))
+
+      with open(
+          os.path.join(self.artifact_dir, "benchmark%d.yaml" % file_index),
+          "wb") as fd:
+        fd.write("---\n".join(definitions))
+
+  def tearDown(self):
+    artifact_registry.REGISTRY.ClearRegistry()
+    artifact.ArtifactLoader().RunOnce()
+    super(ArtifactRegistryBenchmarks, self).tearDown()
+
+  def _Benchmark(self, name, snapshot_path):
+    artifact_count = self.FILE_COUNT * (self.ARTIFACTS_PER_FILE + 1)
+
+    def Reload():
+      artifact_registry.REGISTRY.ClearRegistry()
+      artifact_registry.REGISTRY.ClearSources()
+      artifact_registry.REGISTRY.AddDirSource(self.artifact_dir)
+      return len(artifact_registry.REGISTRY.GetArtifacts())
+
+    with test_lib.ConfigOverrider({
+        "Artifacts.registry_snapshot": snapshot_path
+    }):
+      # Writes the snapshot, if there is one.
+      self.assertEqual(Reload(), artifact_count)
+      self.TimeIt(Reload, name="%s: %d artifacts" % (name, artifact_count))
+
+  def testLoadFromFiles(self):
+    self._Benchmark("Files", "")
+
+  def testLoadFromSnapshot(self):
+    self._Benchmark("Snapshot",
+                    os.path.join(self.temp_dir, "artifacts.snapshot"))
+
+
+class ArtifactDependencyBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare recomputing dependencies and expansions with reusing them."""
+
+  REPEATS = 3
+
+  FLOW_COUNT = 100
+  USER_COUNT = 20
+
+  def setUp(self):
+    super(ArtifactDependencyBenchmarks, self).setUp()
+    artifact_registry.REGISTRY.ClearSources()
+    artifact_registry.REGISTRY.AddFileSource(
+        os.path.join(self.base_path, "artifacts", "test_artifacts.json"))
+
+    knowledge_base = rdf_client.KnowledgeBase(os="Windows")
+    for i in xrange(self.USER_COUNT):
+      knowledge_base.users.Append(
+          username="user%d" % i,
+          homedir="C:\\Users\\user%d" % i,
+          appdata="C:\\Users\\user%d\\AppData\\Roaming" % i)
+    self.serialized_kb = knowledge_base.SerializeToString()
+    self.patterns = []
+    for i in xrange(20):
+      self.patterns.append("%%%%users.homedir%%%%\\file%d" % i)
+      self.patterns.append("%%%%users.appdata%%%%\\file%d" % i)
+
+  def tearDown(self):
+    artifact_registry.REGISTRY.ClearRegistry()
+    artifact_registry.REGISTRY.ClearSources()
+    artifact.ArtifactLoader().RunOnce()
+    super(ArtifactDependencyBenchmarks, self).tearDown()
+
+  def testSearchDependencies(self):
+    registry = artifact_registry.REGISTRY
+    artifact_names = [u"TestAggregationArtifactDeps", u"DepsParent"]
+
+    def Search(rebuild):
+      for _ in xrange(self.FLOW_COUNT):
+        if rebuild:
+          graph = artifact_registry.ArtifactDependencyGraph(
+              registry.GetArtifacts())
+        else:
+          graph = registry.GetDependencyGraph()
+        graph.SearchDependencies("Windows", artifact_names)
+
+    self.TimeIt(
+        Search,
+        name="Rebuilt graph: %d searches" % self.FLOW_COUNT,
+        rebuild=True)
+    self.TimeIt(
+        Search, name="Cached graph: %d searches" % self.FLOW_COUNT,
+        rebuild=False)
+
+  def testInterpolation(self):
+
+    def Uncached():
+      for _ in xrange(self.FLOW_COUNT):
+        knowledge_base = rdf_client.KnowledgeBase.FromSerializedString(
+            self.serialized_kb)
+        for pattern in self.patterns:
+          list(artifact_utils.InterpolateKbAttributes(pattern, knowledge_base))
+
+    def Cached():
+      for _ in xrange(self.FLOW_COUNT):
+        knowledge_base = rdf_client.KnowledgeBase.FromSerializedString(
+            self.serialized_kb)
+        fingerprint = artifact_utils.GetKnowledgeBaseFingerprint(knowledge_base)
+        for pattern in self.patterns:
+          artifact_utils.InterpolateKbAttributesCached(
+              pattern, knowledge_base, fingerprint=fingerprint)
+
+    self.TimeIt(Uncached, name="Uncached: %d flows" % self.FLOW_COUNT)
+    self.TimeIt(Cached, name="Cached: %d flows" % self.FLOW_COUNT)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -21,6 +21,7 @@ from grr.lib import artifact_registry
 from grr.lib import config_lib
 from grr.lib import flags
 from grr.lib import flow_runner
+from grr.lib import parser_pool
 from grr.lib import parsers
 from grr.lib import rdfvalue
 from grr.lib import server_stubs
@@ -297,6 +298,82 @@ supported_os: [Linux]
     with self.assertRaises(artifact_registry.ArtifactDefinitionError):
       artifact.UploadArtifactYamlFile(content, token=self.token)
 
+  def _ReloadRegistry(self, file_path):
+    artifact_registry.REGISTRY.ClearRegistry()
+    artifact_registry.REGISTRY.ClearSources()
+    artifact_registry.REGISTRY.AddFileSource(file_path)
+    return dict((utils.SmartStr(a.name), a)
+                for a in artifact_registry.REGISTRY.GetArtifacts())
+
+  def testRegistrySnapshot(self):
+    test_artifacts_file = os.path.join(self.temp_dir, "test_artifacts.json")
+    with open(test_artifacts_file, "wb") as fd:
+      fd.write(
+          open(
+              os.path.join(config_lib.CONFIG["Test.data_dir"], "artifacts",
+                           "test_artifacts.json"), "rb").read())
+    snapshot_path = os.path.join(self.temp_dir, "artifacts.snapshot")
+
+    def FailToLoadFiles(*_, **__):
+      raise AssertionError("Artifact files were loaded.")
+
+    try:
+      with test_lib.ConfigOverrider({
+          "Artifacts.registry_snapshot": snapshot_path
+      }):
+        # The first load parses the files and writes the snapshot.
+        from_files = self._ReloadRegistry(test_artifacts_file)
+        self.assertEqual(len(from_files), 18)
+        self.assertTrue(os.path.exists(snapshot_path))
+
+        # As long as the files don't change, the snapshot is used instead.
+        with utils.Stubber(artifact_registry.REGISTRY,
+                           "_LoadArtifactsFromFiles", FailToLoadFiles):
+          from_snapshot = self._ReloadRegistry(test_artifacts_file)
+        self.assertItemsEqual(from_files, from_snapshot)
+        for name, artifact_obj in from_snapshot.iteritems():
+          self.assertEqual(artifact_obj.ToYaml(), from_files[name].ToYaml())
+          self.assertEqual(artifact_obj.loaded_from,
+                           from_files[name].loaded_from)
+          self.assertEqual(
+              artifact_obj.GetArtifactPathDependencies(),
+              from_files[name].GetArtifactPathDependencies())
+
+        # Changed files are loaded again.
+        with open(test_artifacts_file, "ab") as fd:
+          fd.write("\n")
+        with utils.Stubber(artifact_registry.REGISTRY,
+                           "_LoadArtifactsFromFiles", FailToLoadFiles):
+          self.assertRaises(AssertionError, self._ReloadRegistry,
+                            test_artifacts_file)
+        self.assertItemsEqual(self._ReloadRegistry(test_artifacts_file),
+                              from_files)
+    finally:
+      artifact_registry.REGISTRY.ClearRegistry()
+      artifact.ArtifactLoader().RunOnce()
+
+  def testRegistrySnapshotIsValidatedAgainstCode(self):
+    test_artifacts_file = os.path.join(config_lib.CONFIG["Test.data_dir"],
+                                       "artifacts", "test_artifacts.json")
+    snapshot_path = os.path.join(self.temp_dir, "artifacts.snapshot")
+    try:
+      with test_lib.ConfigOverrider({
+          "Artifacts.registry_snapshot": snapshot_path
+      }):
+        self._ReloadRegistry(test_artifacts_file)
+
+        # KnowledgeBase fields the artifacts depend on are defined by code, so
+        # they are checked when the snapshot is loaded.
+        with utils.Stubber(rdf_client.KnowledgeBase, "GetKbFieldNames",
+                           lambda _: []):
+          with utils.Stubber(artifact_registry.REGISTRY,
+                             "_LoadArtifactsFromFiles",
+                             lambda *_, **__: []):
+            self.assertFalse(self._ReloadRegistry(test_artifacts_file))
+    finally:
+      artifact_registry.REGISTRY.ClearRegistry()
+      artifact.ArtifactLoader().RunOnce()
+
   def testCommandArgumentOrderIsPreserved(self):
     content = """name: CommandOrder
 doc: here's the doc
@@ -365,6 +442,31 @@ class ArtifactFlowLinuxTest(ArtifactTest):
       self.assertEqual(len(anomaly_coll), 1)
       self.assertTrue("gremlin" in anomaly_coll[0].symptom)
 
+  def testCmdArtifactInParserPool(self):
+    """Check command output can be parsed in the parser pool."""
+    client_mock = self.MockClient(
+        standard.ExecuteCommand, client_id=self.client_id)
+    try:
+      with test_lib.ConfigOverrider({"Artifacts.parser_pool_size": 1}):
+        with utils.Stubber(subprocess, "Popen", test_lib.Popen):
+          for _ in test_lib.TestFlowHelper(
+              "ArtifactCollectorFlow",
+              client_mock,
+              client_id=self.client_id,
+              store_results_in_aff4=True,
+              use_tsk=False,
+              artifact_list=["TestCmdArtifact"],
+              token=self.token):
+            pass
+    finally:
+      parser_pool.POOL.Stop()
+
+    urn = self.client_id.Add("info/software")
+    fd = aff4.FACTORY.Open(urn, token=self.token)
+    packages = fd.Get(fd.Schema.INSTALLED_PACKAGES)
+    self.assertEqual(len(packages), 2)
+    self.assertEqual(packages[0].__class__.__name__, "SoftwarePackage")
+
   def testFilesArtifact(self):
     """Check GetFiles artifacts."""
     with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.OS,
@@ -392,6 +494,20 @@ class ArtifactFlowLinuxTest(ArtifactTest):
           self.assertEqual(user.shell, u"/bin/sh")
           self.assertEqual(user.uid, 46)
 
+  def testLinuxPasswdHomedirsArtifactInParserPool(self):
+    """Check files can be parsed in the parser pool."""
+    try:
+      with test_lib.ConfigOverrider({"Artifacts.parser_pool_size": 1}):
+        with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.OS,
+                                   test_lib.FakeTestDataVFSHandler):
+          fd = self.RunCollectorAndGetCollection(
+              ["LinuxPasswdHomedirs"], client_mock=self.client_mock)
+    finally:
+      parser_pool.POOL.Stop()
+
+    self.assertItemsEqual([x.username for x in fd],
+                          [u"exomemory", u"gevulot", u"gogol"])
+
   def testArtifactOutput(self):
     """Check we can run command based artifacts."""
     with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.OS,
@@ -5,11 +5,13 @@ This file contains non-GRR specific pieces of artifact processing and is
 intended to end up as an independent library.
 """
 
+import hashlib
 import itertools
 import logging
 import re
 
 from grr.lib import objectfilter
+from grr.lib import utils
 from grr.lib.rdfvalues import structs
 from grr.proto import flows_pb2
 
@@ -119,6 +121,55 @@ def InterpolateKbAttributes(pattern, knowledge_base, ignore_errors=False):
     yield "".join(vector)
 
 
+def GetKnowledgeBaseFingerprint(knowledge_base):
+  """Returns a digest identifying the contents of a knowledge base."""
+  return hashlib.sha256(knowledge_base.SerializeToString()).digest()
+
+
+# Recent interpolation results, keyed by pattern, knowledge base fingerprint
+# and whether errors were ignored.
+_INTERPOLATION_CACHE = utils.FastStore(max_size=10000)
+
+
+def InterpolateKbAttributesCached(pattern,
+                                  knowledge_base,
+                                  ignore_errors=False,
+                                  fingerprint=None):
+  """Interpolate all knowledgebase attributes in pattern, caching the results.
+
+  Knowledge bases are fingerprinted by their contents, so the same expansions
+  are reused by every flow that interpolates a pattern against an equal
+  knowledge base.
+
+  Args:
+    pattern: A string with potential interpolation markers.
+    knowledge_base: The knowledge_base to interpolate parameters from.
+    ignore_errors: Set this to true to log errors instead of raising.
+    fingerprint: The knowledge base fingerprint as returned by
+      GetKnowledgeBaseFingerprint, if it is already known.
+
+  Returns:
+    A list of all unique strings generated by expanding the pattern.
+  """
+  if not INTERPOLATED_REGEX.search(pattern):
+    return [pattern]
+
+  if fingerprint is None:
+    fingerprint = GetKnowledgeBaseFingerprint(knowledge_base)
+
+  key = (pattern, fingerprint, ignore_errors)
+  try:
+    return list(_INTERPOLATION_CACHE.Get(key))
+  except KeyError:
+    pass
+
+  results = tuple(
+      InterpolateKbAttributes(
+          pattern, knowledge_base, ignore_errors=ignore_errors))
+  _INTERPOLATION_CACHE.Put(key, results)
+  return list(results)
+
+
 def GetWindowsEnvironmentVariablesMap(knowledge_base):
   """Return a dictionary of environment variables and their values.
 
@@ -225,9 +276,8 @@ def CheckCondition(condition, check_object):
     ConditionError: If condition is bad.
   """
   try:
-    of = objectfilter.Parser(condition).Parse()
-    compiled_filter = of.Compile(objectfilter.BaseFilterImplementation)
-    return compiled_filter.Matches(check_object)
+    compiled_filter = objectfilter.CompileFilter(condition)
+    return compiled_filter.GetMatcher()(check_object)
   except objectfilter.Error as e:
     raise ConditionError(e)
 
@@ -153,6 +153,61 @@ class ArtifactHandlingTest(test_lib.GRRBaseTest):
         "Darwin", [u"TestCmdArtifact", u"TestFileArtifact"])
     self.assertItemsEqual(names, [])
 
+  def testDependencyGraphIsRebuiltWhenArtifactsChange(self):
+    registry = artifact_registry.REGISTRY
+    graph = registry.GetDependencyGraph()
+    self.assertIs(graph, registry.GetDependencyGraph())
+
+    names, _ = registry.SearchDependencies("Windows", [u"DepsParent"])
+    self.assertNotIn(u"DepsHomedir3", names)
+
+    homedir_artifact = registry.ArtifactsFromYaml("""
+name: DepsHomedir3
+doc: Another provider of users.homedir.
+sources:
+- type: COMMAND
+  attributes:
+    cmd: /usr/bin/dpkg
+    args: ["--list"]
+provides: [users.homedir]
+supported_os: [Windows]
+""")[0]
+    registry.RegisterArtifact(homedir_artifact)
+    try:
+      self.assertIsNot(graph, registry.GetDependencyGraph())
+      names, _ = registry.SearchDependencies("Windows", [u"DepsParent"])
+      self.assertIn(u"DepsHomedir3", names)
+    finally:
+      registry.UnregisterArtifact(u"DepsHomedir3")
+
+    names, _ = registry.SearchDependencies("Windows", [u"DepsParent"])
+    self.assertNotIn(u"DepsHomedir3", names)
+
+  def testSearchDependenciesResultsCanBeModified(self):
+    registry = artifact_registry.REGISTRY
+    names, expansions = registry.SearchDependencies("Windows", [u"DepsParent"])
+    names.add("Modified")
+    expansions.add("modified")
+
+    names, expansions = registry.SearchDependencies("Windows", [u"DepsParent"])
+    self.assertNotIn("Modified", names)
+    self.assertNotIn("modified", expansions)
+
+  def testArtifactNamesInDependencyOrder(self):
+    registry = artifact_registry.REGISTRY
+    names, _ = registry.SearchDependencies(
+        "Windows", [u"TestAggregationArtifactDeps", u"DepsParent"])
+    ordered = registry.GetArtifactNamesInDependencyOrder(names)
+    self.assertItemsEqual(ordered, names)
+
+    # Providers of the attributes an artifact interpolates come first.
+    for provider, dependent in [(u"DepsControlSet", u"DepsWindir"),
+                                (u"DepsWindir", u"DepsHomedir"),
+                                (u"DepsDesktop", u"DepsParent")]:
+      self.assertLess(ordered.index(provider), ordered.index(dependent))
+    self.assertEqual(ordered, registry.GetArtifactNamesInDependencyOrder(
+        reversed(ordered)))
+
   def testArtifactConversion(self):
     for art_obj in artifact_registry.REGISTRY.GetArtifacts():
       # Exercise conversions to ensure we can move back and forth between the
@@ -242,6 +297,40 @@ class ArtifactKBTest(test_lib.GRRBaseTest):
                           ["C:\\Users\\jason\\AppData\\Local\\Temp\\abcd"])
 
 
+  def testCachedInterpolation(self):
+    kb = rdf_client.KnowledgeBase()
+    kb.users.Append(rdf_client.User(username="joe", uid=1))
+    kb.users.Append(rdf_client.User(username="jim", uid=2))
+
+    pattern = "test%%users.username%%test"
+    paths = artifact_utils.InterpolateKbAttributesCached(pattern, kb)
+    self.assertItemsEqual(paths, ["testjoetest", "testjimtest"])
+    self.assertItemsEqual(
+        paths, artifact_utils.InterpolateKbAttributesCached(pattern, kb))
+
+    # A knowledge base with the same contents reuses the cached expansions.
+    same_kb = rdf_client.KnowledgeBase.FromSerializedString(
+        kb.SerializeToString())
+    with utils.Stubber(artifact_utils, "InterpolateKbAttributes", None):
+      self.assertItemsEqual(
+          paths, artifact_utils.InterpolateKbAttributesCached(pattern, same_kb))
+
+    # Changing the knowledge base changes the expansions.
+    kb.users.Append(rdf_client.User(username="jason", uid=3))
+    self.assertItemsEqual(
+        artifact_utils.InterpolateKbAttributesCached(pattern, kb),
+        ["testjoetest", "testjimtest", "testjasontest"])
+
+    # Errors are raised every time.
+    for _ in range(2):
+      self.assertRaises(artifact_utils.KnowledgeBaseInterpolationError,
+                        artifact_utils.InterpolateKbAttributesCached,
+                        "%%nonexistent%%\\a", kb)
+    self.assertEqual(
+        artifact_utils.InterpolateKbAttributesCached(
+            "%%nonexistent%%\\a", kb, ignore_errors=True), [])
+
+
 class ArtifactParserTest(test_lib.GRRBaseTest):
 
   def testParsersRetrieval(self):
@@ -2,6 +2,7 @@
 """The blob store abstraction."""
 
 from grr.lib import registry
+from grr.lib import utils
 
 
 class Blobstore(object):
@@ -51,3 +52,29 @@ class Blobstore(object):
     Returns:
       A dict mapping each identifier to a boolean value indicating existence.
     """
+
+
+def CopyBlobs(source, target, digests, batch_size=100, token=None):
+  """Copies blobs from one blob store to another.
+
+  Args:
+    source: The Blobstore to read blobs from.
+    target: The Blobstore to write blobs to.
+    digests: An iterable of identifiers of the blobs to copy.
+    batch_size: Number of blobs read and written at a time.
+    token: Data store token.
+
+  Yields:
+    The identifiers of the blobs as they are copied. Blobs which already exist
+    in the target store or are missing in the source store are skipped.
+  """
+  for batch in utils.Grouper(digests, batch_size):
+    existing = target.BlobsExist(batch, token=token)
+    to_copy = [digest for digest in batch if not existing[digest]]
+    if not to_copy:
+      continue
+
+    blobs = source.ReadBlobs(to_copy, token=token)
+    contents = [blobs[digest] for digest in to_copy if blobs[digest] is not None]
+    for digest in target.StoreBlobs(contents, token=token):
+      yield digest
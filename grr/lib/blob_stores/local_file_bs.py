@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""A blob store keeping blobs as files in a local directory tree.
+
+Blobs are content addressed by their sha256 digest and sharded into
+subdirectories named after the leading characters of the digest, e.g.:
+
+  <root_path>/ab/cd/abcdef0123...
+
+Blobs are written to a temporary file in their shard directory first and then
+renamed into place so readers never see partially written blobs.
+"""
+
+import errno
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+
+import logging
+
+from grr.lib import blob_store
+from grr.lib import config_lib
+
+
+class LocalFileBlobstore(blob_store.Blobstore):
+  """A blob store based on files in a sharded directory tree."""
+
+  DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+  # Suffix of blobs which are stored zlib compressed.
+  COMPRESSED_SUFFIX = ".z"
+
+  def __init__(self, root_path=None, shard_levels=None, compress=None):
+    super(LocalFileBlobstore, self).__init__()
+    if root_path is None:
+      root_path = config_lib.CONFIG["LocalFileBlobstore.root_path"]
+    if shard_levels is None:
+      shard_levels = config_lib.CONFIG["LocalFileBlobstore.shard_levels"]
+    if compress is None:
+      compress = config_lib.CONFIG["LocalFileBlobstore.compress"]
+
+    self.root_path = root_path
+    self.shard_levels = shard_levels
+    self.compress = compress
+
+  def _BlobPath(self, digest):
+    """Returns the path of the (uncompressed) blob file for a digest."""
+    if not self.DIGEST_RE.match(digest):
+      raise ValueError("Invalid blob identifier: %r" % digest)
+
+    shards = [digest[i * 2:i * 2 + 2] for i in xrange(self.shard_levels)]
+    return os.path.join(self.root_path, *(shards + [digest]))
+
+  def _ExistingBlobPath(self, digest):
+    """Returns the path of the stored blob or None if it doesn't exist."""
+    path = self._BlobPath(digest)
+    for candidate in (path, path + self.COMPRESSED_SUFFIX):
+      if os.path.exists(candidate):
+        return candidate
+
+  def _WriteBlob(self, digest, content):
+    path = self._BlobPath(digest)
+    if self.compress:
+      path += self.COMPRESSED_SUFFIX
+      content = zlib.compress(content)
+
+    directory = os.path.dirname(path)
+    try:
+      os.makedirs(directory)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+    # Write to a temporary file on the same filesystem and rename it into
+    # place, which is atomic on POSIX systems.
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as out:
+        out.write(content)
+      os.rename(temp_path, path)
+    except:
+      try:
+        os.unlink(temp_path)
+      except OSError:
+        pass
+      raise
+
+  def StoreBlobs(self, contents, token=None):
+    """Creates or overwrites blobs."""
+    _ = token
+
+    digests = []
+    for content in contents:
+      digest = hashlib.sha256(content).hexdigest()
+      digests.append(digest)
+
+      if self._ExistingBlobPath(digest) is not None:
+        logging.debug("Blob %s already stored.", digest)
+        continue
+
+      self._WriteBlob(digest, content)
+      logging.debug("Got blob %s (length %s)", digest, len(content))
+
+    return digests
+
+  def ReadBlobs(self, digests, token=None):
+    _ = token
+
+    res = {}
+    for digest in digests:
+      res[digest] = None
+
+      path = self._ExistingBlobPath(digest)
+      if path is None:
+        continue
+
+      try:
+        with open(path, "rb") as fd:
+          content = fd.read()
+      except IOError as e:
+        # The blob may have been removed after we found it.
+        if e.errno != errno.ENOENT:
+          raise
+        continue
+
+      if path.endswith(self.COMPRESSED_SUFFIX):
+        content = zlib.decompress(content)
+      res[digest] = content
+
+    return res
+
+  def BlobsExist(self, digests, token=None):
+    """Check if blobs for the given digests already exist."""
+    _ = token
+    return {
+        digest: self._ExistingBlobPath(digest) is not None
+        for digest in digests
+    }
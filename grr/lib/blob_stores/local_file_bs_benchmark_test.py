@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Benchmark tests for the blob stores."""
+
+import os
+
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.blob_stores import local_file_bs
+from grr.lib.blob_stores import memory_stream_bs
+
+
+class BlobstoreBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare blob throughput of the memory stream and local file stores."""
+
+  REPEATS = 5
+
+  # Number and size of blobs written and read in each iteration. The size is
+  # the chunk size used by file transfers.
+  BLOB_COUNT = 50
+  BLOB_SIZE = 512 * 1024
+
+  def setUp(self):
+    super(BlobstoreBenchmarks, self).setUp()
+    # Half random data, half repeated data, so compression has something to do.
+    self.random_data = os.urandom(self.BLOB_SIZE / 2)
+
+  def _Blobs(self, iteration):
+    return [
+        self.random_data + "%08d" % (iteration * 1000 + i) *
+        (self.BLOB_SIZE / 16) for i in range(self.BLOB_COUNT)
+    ]
+
+  def _Benchmark(self, name, blob_store):
+    iteration = [0]
+    digests = []
+
+    blobs = [self._Blobs(i) for i in range(self.REPEATS)]
+
+    def Store():
+      digests[:] = blob_store.StoreBlobs(
+          blobs[iteration[0]], token=self.token)
+      iteration[0] += 1
+      return len(digests)
+
+    def Read():
+      return len(blob_store.ReadBlobs(digests, token=self.token))
+
+    def Exist():
+      return len(blob_store.BlobsExist(digests, token=self.token))
+
+    self.TimeIt(Store, name="%s: store %d blobs" % (name, self.BLOB_COUNT))
+    self.TimeIt(Read, name="%s: read %d blobs" % (name, self.BLOB_COUNT))
+    self.TimeIt(Exist, name="%s: check %d blobs" % (name, self.BLOB_COUNT))
+
+  def testMemoryStreamBlobstore(self):
+    self._Benchmark("MemoryStream", memory_stream_bs.MemoryStreamBlobstore())
+
+  def testLocalFileBlobstore(self):
+    self._Benchmark("LocalFile",
+                    local_file_bs.LocalFileBlobstore(
+                        root_path=os.path.join(self.temp_dir, "blobs"),
+                        compress=False))
+
+  def testCompressedLocalFileBlobstore(self):
+    self._Benchmark("LocalFile (zlib)",
+                    local_file_bs.LocalFileBlobstore(
+                        root_path=os.path.join(self.temp_dir, "blobs"),
+                        compress=True))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
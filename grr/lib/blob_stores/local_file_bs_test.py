@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Tests for the local file blob store."""
+
+import hashlib
+import os
+
+from grr.lib import blob_store
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.blob_stores import local_file_bs
+from grr.lib.blob_stores import memory_stream_bs
+
+
+class LocalFileBlobstoreTest(test_lib.GRRBaseTest):
+  """Tests for LocalFileBlobstore."""
+
+  def setUp(self):
+    super(LocalFileBlobstoreTest, self).setUp()
+    self.root_path = os.path.join(self.temp_dir, "blobs")
+    self.blob_store = local_file_bs.LocalFileBlobstore(
+        root_path=self.root_path, shard_levels=2, compress=False)
+
+  def _ListFiles(self):
+    result = []
+    for root, _, files in os.walk(self.root_path):
+      for filename in files:
+        result.append(
+            os.path.relpath(os.path.join(root, filename), self.root_path))
+    return sorted(result)
+
+  def testStoreAndReadBlobs(self):
+    digests = self.blob_store.StoreBlobs(["foo", "bar"], token=self.token)
+    self.assertEqual(digests, [
+        hashlib.sha256("foo").hexdigest(), hashlib.sha256("bar").hexdigest()
+    ])
+
+    missing = hashlib.sha256("missing").hexdigest()
+    blobs = self.blob_store.ReadBlobs(digests + [missing], token=self.token)
+    self.assertEqual(blobs, {digests[0]: "foo", digests[1]: "bar", missing: None})
+
+    self.assertEqual(
+        self.blob_store.BlobsExist(digests + [missing], token=self.token),
+        {digests[0]: True,
+         digests[1]: True,
+         missing: False})
+
+  def testBlobsAreSharded(self):
+    digest = self.blob_store.StoreBlob("foo", token=self.token)
+    self.assertEqual(self._ListFiles(),
+                     [os.path.join(digest[0:2], digest[2:4], digest)])
+
+  def testDuplicateBlobsAreStoredOnce(self):
+    self.blob_store.StoreBlobs(["foo", "foo"], token=self.token)
+    self.blob_store.StoreBlob("foo", token=self.token)
+    self.assertEqual(len(self._ListFiles()), 1)
+
+  def testCompressedBlobs(self):
+    compressing_store = local_file_bs.LocalFileBlobstore(
+        root_path=self.root_path, shard_levels=2, compress=True)
+    content = "A" * 1024 * 1024
+    digest = compressing_store.StoreBlob(content, token=self.token)
+
+    (path,) = self._ListFiles()
+    self.assertTrue(path.endswith(".z"))
+    self.assertLess(os.path.getsize(os.path.join(self.root_path, path)), 10000)
+
+    self.assertEqual(compressing_store.ReadBlob(digest, token=self.token),
+                     content)
+    # Stores with compression turned off still read compressed blobs.
+    self.assertEqual(self.blob_store.ReadBlob(digest, token=self.token),
+                     content)
+    self.assertTrue(self.blob_store.BlobExists(digest, token=self.token))
+
+  def testInvalidIdentifiersAreRejected(self):
+    for identifier in ["../../etc/passwd", "ABCD", ""]:
+      self.assertRaises(ValueError, self.blob_store.ReadBlob, identifier)
+      self.assertRaises(ValueError, self.blob_store.BlobExists, identifier)
+
+  def testCopyBlobsFromMemoryStreamBlobstore(self):
+    source = memory_stream_bs.MemoryStreamBlobstore()
+    digests = source.StoreBlobs(["foo", "bar", "baz"], token=self.token)
+    self.blob_store.StoreBlob("bar", token=self.token)
+
+    self.assertItemsEqual(source.ListBlobs(token=self.token), digests)
+
+    copied = list(
+        blob_store.CopyBlobs(
+            source,
+            self.blob_store,
+            source.ListBlobs(token=self.token),
+            batch_size=2,
+            token=self.token))
+    self.assertItemsEqual(copied, [
+        hashlib.sha256("foo").hexdigest(), hashlib.sha256("baz").hexdigest()
+    ])
+
+    self.assertEqual(
+        self.blob_store.ReadBlobs(digests, token=self.token),
+        source.ReadBlobs(digests, token=self.token))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
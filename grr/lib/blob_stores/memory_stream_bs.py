@@ -13,8 +13,16 @@ from grr.lib import rdfvalue
 class MemoryStreamBlobstore(blob_store.Blobstore):
   """A blob store based on memory streams for backwards compatibility."""
 
+  BLOBS_URN = rdfvalue.RDFURN("aff4:/blobs")
+
   def _BlobUrn(self, digest):
-    return rdfvalue.RDFURN("aff4:/blobs").Add(digest)
+    return self.BLOBS_URN.Add(digest)
+
+  def ListBlobs(self, token=None):
+    """Yields the digests of all the blobs in this store."""
+    for subject, _, _ in data_store.DB.ScanAttribute(
+        self.BLOBS_URN, "aff4:type", token=token, relaxed_order=True):
+      yield rdfvalue.RDFURN(subject).Basename()
 
   def StoreBlobs(self, contents, token=None):
     """Creates or overwrites blobs."""
@@ -5,3 +5,6 @@
 
 # The memory stream object based blob store.
 from grr.lib.blob_stores import memory_stream_bs
+
+# Blobs stored as files on a local filesystem.
+from grr.lib.blob_stores import local_file_bs
@@ -4,6 +4,8 @@ import collections
 import glob
 import itertools
 import os
+import Queue
+import time
 
 import yaml
 
@@ -11,11 +13,15 @@ import logging
 
 from grr.lib import config_lib
 from grr.lib import registry
+from grr.lib import stats
+from grr.lib import threadpool
+from grr.lib import utils
 from grr.lib.aff4_objects import collects as collections_aff4
 from grr.lib.checks import filters
 from grr.lib.checks import hints
 from grr.lib.checks import triggers
 from grr.lib.rdfvalues import anomaly as rdf_anomaly
+from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import protodict as rdf_protodict
 from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import anomaly_pb2
@@ -517,6 +523,13 @@ class CheckRegistry(object):
   """
   checks = {}
 
+  # The number of hosts per thread handed to the threadpool at a time.
+  BATCH_FACTOR = 4
+
+  # Maps trigger conditions to check ids. This is defined before triggers, as
+  # that shadows the module name here.
+  trigger_index = triggers.TriggerIndex()
+
   triggers = triggers.Triggers()
 
   @classmethod
@@ -524,6 +537,7 @@ class CheckRegistry(object):
     """Remove all checks and triggers from the registry."""
     cls.checks = {}
     cls.triggers = triggers.Triggers()
+    cls.trigger_index = triggers.TriggerIndex()
 
   @classmethod
   def RegisterCheck(cls, check, source="unknown", overwrite_if_exists=False):
@@ -535,6 +549,7 @@ class CheckRegistry(object):
     check.loaded_from = source
     cls.checks[check.check_id] = check
     cls.triggers.Update(check.triggers, check)
+    cls.trigger_index.Add(check.check_id, check.triggers.conditions)
 
   @staticmethod
   def _AsList(arg):
@@ -595,14 +610,11 @@ class CheckRegistry(object):
       the check_ids that apply.
     """
     check_ids = set()
-    conditions = list(cls.Conditions(artifact, os_name, cpe, labels))
-    for chk_id, chk in cls.checks.iteritems():
-      if restrict_checks and chk_id not in restrict_checks:
-        continue
-      for condition in conditions:
-        if chk.triggers.Match(*condition):
-          check_ids.add(chk_id)
-          break  # No need to keep checking other conditions.
+    for condition in cls.Conditions(artifact, os_name, cpe, labels):
+      check_ids.update(cls.trigger_index.FindChecks(*condition))
+
+    if restrict_checks:
+      check_ids.intersection_update(restrict_checks)
     return check_ids
 
   @classmethod
@@ -624,13 +636,56 @@ class CheckRegistry(object):
     """
     results = set()
     for condition in cls.Conditions(None, os_name, cpe, labels):
-      trigger = condition[1:]
-      for chk in cls.checks.values():
-        if restrict_checks and chk.check_id not in restrict_checks:
-          continue
-        results.update(chk.triggers.Artifacts(*trigger))
+      results.update(
+          cls.trigger_index.Artifacts(
+              *condition[1:], check_ids=restrict_checks or None))
     return results
 
+  @classmethod
+  def _SelectHostChecks(cls,
+                        artifacts,
+                        os_name=None,
+                        cpe=None,
+                        labels=None,
+                        exclude_checks=None,
+                        restrict_checks=None):
+    """Identifies the checks to run on a host, and the conditions to run them.
+
+    Args:
+      artifacts: The names of the artifacts collected from the host.
+      os_name: 0+ OS names.
+      cpe: 0+ CPE identifiers.
+      labels: 0+ GRR labels.
+      exclude_checks: A list of check ids not to run.
+      restrict_checks: A list of check ids that may be run, if appropriate.
+
+    Returns:
+      A tuple of the sorted check ids to run and the host's conditions.
+    """
+    check_ids = cls.FindChecks(artifacts, os_name, cpe, labels)
+    if exclude_checks:
+      check_ids.difference_update(exclude_checks)
+    if restrict_checks:
+      check_ids.intersection_update(restrict_checks)
+    conditions = list(cls.Conditions(artifacts, os_name, cpe, labels))
+    return sorted(check_ids), conditions
+
+  @classmethod
+  def _RunChecks(cls, check_ids, conditions, host_data):
+    """Runs the given checks over the host data, timing every check."""
+    for check_id in check_ids:
+      chk = cls.checks[check_id]
+      start_time = time.time()
+      try:
+        result = chk.Parse(conditions, host_data)
+      except ProcessingError as e:
+        logging.warn("Check ID %s raised: %s", check_id, e)
+        result = None
+      stats.STATS.RecordEvent(
+          "checks_evaluation_time", time.time() - start_time, fields=[check_id])
+      if result is not None:
+        yield result
+
   @classmethod
   def Process(cls,
               host_data,
@@ -654,20 +709,105 @@ class CheckRegistry(object):
       A CheckResult message for each check that was performed.
     """
     # All the conditions that apply to this host.
-    artifacts = host_data.keys()
-    check_ids = cls.FindChecks(artifacts, os_name, cpe, labels)
-    conditions = list(cls.Conditions(artifacts, os_name, cpe, labels))
-    for check_id in check_ids:
-      # skip if check in list of excluded checks
-      if exclude_checks and check_id in exclude_checks:
-        continue
-      if restrict_checks and check_id not in restrict_checks:
-        continue
+    check_ids, conditions = cls._SelectHostChecks(
+        host_data.keys(),
+        os_name=os_name,
+        cpe=cpe,
+        labels=labels,
+        exclude_checks=exclude_checks,
+        restrict_checks=restrict_checks)
+    for result in cls._RunChecks(check_ids, conditions, host_data):
+      yield result
+
+  @classmethod
+  def ProcessHosts(cls,
+                   hosts,
+                   exclude_checks=None,
+                   restrict_checks=None,
+                   threadpool_size=0):
+    """Runs checks over the data of many hosts.
+
+    The checks are shared by all hosts, so every filter pipeline is only
+    compiled once. Hosts with the same artifacts, OS, CPE and labels also
+    share the selection of checks to run.
+
+    Args:
+      hosts: An iterable of (host_data, os_name, cpe, labels) tuples. As for
+        CheckHost, os_name defaults to the OS in the host's KnowledgeBase.
+      exclude_checks: A list of check ids not to run. A check id in this list
+                      will not get run even if included in restrict_checks.
+      restrict_checks: A list of check ids that may be run, if appropriate.
+      threadpool_size: If set, hosts are evaluated in a threadpool of this
+        size. Evaluation is CPU bound, so this only helps when hosts wait on
+        other work, and hosts are evaluated serially by default.
+
+    Yields:
+      A CheckResults message for each host, in the order of the hosts.
+    """
+    selections = {}
+
+    def EvaluateHost(host_data, os_name, cpe, labels):
+      """Runs the checks that apply to a single host."""
+      kb = host_data.get("KnowledgeBase")
+      if os_name is None and kb is not None:
+        os_name = kb.os
+      artifacts = host_data.keys()
+      key = (frozenset(artifacts), tuple(cls._AsList(os_name)),
+             tuple(cls._AsList(cpe)), tuple(cls._AsList(labels)))
+      selection = selections.get(key)
+      if selection is None:
+        selection = cls._SelectHostChecks(
+            artifacts,
+            os_name=os_name,
+            cpe=cpe,
+            labels=labels,
+            exclude_checks=exclude_checks,
+            restrict_checks=restrict_checks)
+        selections[key] = selection
+
+      host_results = CheckResults()
+      if isinstance(kb, rdf_client.KnowledgeBase):
+        host_results.kb = kb
+      host_results.result = list(cls._RunChecks(selection[0], selection[1],
+                                                host_data))
+      return host_results
+
+    if not threadpool_size:
+      for host in hosts:
+        yield EvaluateHost(*host)
+      return
+
+    # Every call gets its own unnamed pool. A shared pool could be stopped by
+    # another call while it is still in use, and would keep its first size.
+    pool = threadpool.ThreadPool(None, threadpool_size)
+    pool.Start()
+
+    finished = Queue.Queue()
+
+    def EvaluateHostTask(index, host):
       try:
-        chk = cls.checks[check_id]
-        yield chk.Parse(conditions, host_data)
-      except ProcessingError as e:
-        logging.warn("Check ID %s raised: %s", check_id, e)
+        finished.put((index, EvaluateHost(*host), None))
+      except Exception as e:  # pylint: disable=broad-except
+        finished.put((index, None, e))
+
+    # Hosts are handed to the pool in batches, so results can be streamed in
+    # order without holding the results of all hosts.
+    try:
+      for batch in utils.Grouper(hosts, cls.BATCH_FACTOR * threadpool_size):
+        for index, host in enumerate(batch):
+          pool.AddTask(EvaluateHostTask, (index, host), name="CheckHost")
+
+        results = [None] * len(batch)
+        for _ in batch:
+          index, host_results, error = finished.get()
+          if error is not None:
+            raise error
+          results[index] = host_results
+
+        for host_results in results:
+          yield host_results
+    finally:
+      pool.Stop()
 
 
 def CheckHost(host_data,
@@ -724,6 +864,31 @@ def CheckHost(host_data,
       exclude_checks=exclude_checks)
 
 
+def CheckHosts(hosts, exclude_checks=None, restrict_checks=None,
+               threadpool_size=0):
+  """Perform all checks on many hosts using acquired artifacts.
+
+  This is the batch version of CheckHost, for running checks across a fleet.
+
+  Args:
+    hosts: An iterable of (host_data, os_name, cpe, labels) tuples, with the
+      same meaning as the arguments of CheckHost.
+    exclude_checks: A list of check ids not to run. A check id in this list
+                    will not get run even if included in restrict_checks.
+    restrict_checks: A list of check ids that may be run, if appropriate.
+    threadpool_size: If set, hosts are evaluated in a threadpool of this size.
+      Hosts are evaluated serially by default.
+
+  Returns:
+    A generator of CheckResults objects, one for every host, in order.
+  """
+  return CheckRegistry.ProcessHosts(
+      hosts,
+      exclude_checks=exclude_checks,
+      restrict_checks=restrict_checks,
+      threadpool_size=threadpool_size)
+
+
 def LoadConfigsFromFile(file_path):
   """Loads check definitions from a file."""
   with open(file_path) as data:
@@ -771,6 +936,14 @@ def LoadChecksFromDirs(dir_paths, overwrite_if_exists=True):
   return loaded
 
 
+class ChecksStatsInit(registry.InitHook):
+  """Registers the stats of the check subsystem."""
+
+  def RunOnce(self):
+    stats.STATS.RegisterEventMetric(
+        "checks_evaluation_time", fields=[("check_id", str)])
+
+
 class CheckLoader(registry.InitHook):
   """Loads checks from the filesystem."""
 
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""Benchmark tests for selecting and running checks."""
+
+
+import os
+import random
+
+from grr.lib import config_lib
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.checks import checks
+from grr.lib.checks import checks_test_lib
+from grr.parsers import config_file as config_file_parsers
+
+
+def LinearFindChecks(artifact=None, os_name=None, cpe=None, labels=None):
+  """Finds checks by matching the conditions of every registered check."""
+  check_ids = set()
+  conditions = list(
+      checks.CheckRegistry.Conditions(artifact, os_name, cpe, labels))
+  for chk_id, chk in checks.CheckRegistry.checks.iteritems():
+    for condition in conditions:
+      if chk.triggers.Match(*condition):
+        check_ids.add(chk_id)
+        break
+  return check_ids
+
+
+def LinearSelectArtifacts(os_name=None, cpe=None, labels=None):
+  """Selects artifacts by matching the conditions of every registered check."""
+  results = set()
+  for condition in checks.CheckRegistry.Conditions(None, os_name, cpe, labels):
+    for chk in checks.CheckRegistry.checks.values():
+      results.update(chk.triggers.Artifacts(*condition[1:]))
+  return results
+
+
+class CheckRegistryBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare the trigger index with matching every check's conditions."""
+
+  REPEATS = 3
+
+  CHECK_COUNT = 3000
+  HOST_COUNT = 200
+
+  OS_NAMES = ["Linux", "Windows", "Darwin"]
+  ARTIFACTS = ["Artifact%d" % i for i in range(100)]
+  LABELS = ["label%d" % i for i in range(20)]
+
+  def setUp(self):
+    super(CheckRegistryBenchmarks, self).setUp()
+    rand = random.Random(42)
+
+    self.old_checks = checks.CheckRegistry.checks
+    self.old_triggers = checks.CheckRegistry.triggers
+    self.old_trigger_index = checks.CheckRegistry.trigger_index
+    checks.CheckRegistry.Clear()
+
+    for i in range(self.CHECK_COUNT):
+      target = {"os": [rand.choice(self.OS_NAMES)]}
+      if rand.random() < 0.3:
+        target["label"] = [rand.choice(self.LABELS)]
+      probes = [{
+          "artifact": artifact
+      } for artifact in rand.sample(self.ARTIFACTS, 2)]
+      check = checks.Check(
+          check_id="CHECK-%d" % i,
+          method=[{
+              "target": target,
+              "probe": probes,
+              "match": "ANY"
+          }])
+      checks.CheckRegistry.RegisterCheck(check)
+
+    self.hosts = []
+    for _ in range(self.HOST_COUNT):
+      self.hosts.append(
+          dict(
+              artifact=rand.sample(self.ARTIFACTS, 20),
+              os_name=rand.choice(self.OS_NAMES),
+              labels=rand.sample(self.LABELS, 2)))
+
+  def tearDown(self):
+    checks.CheckRegistry.checks = self.old_checks
+    checks.CheckRegistry.triggers = self.old_triggers
+    checks.CheckRegistry.trigger_index = self.old_trigger_index
+    super(CheckRegistryBenchmarks, self).tearDown()
+
+  def testFindChecks(self):
+    for host in self.hosts[:10]:
+      self.assertEqual(
+          checks.CheckRegistry.FindChecks(**host), LinearFindChecks(**host))
+
+    def Indexed():
+      for host in self.hosts:
+        checks.CheckRegistry.FindChecks(**host)
+
+    def Linear():
+      for host in self.hosts[:10]:
+        LinearFindChecks(**host)
+
+    self.TimeIt(
+        Indexed,
+        name="Index: find checks for %d hosts" % len(self.hosts))
+    self.TimeIt(Linear, name="Linear: find checks for 10 hosts")
+
+  def testSelectArtifacts(self):
+    for host in self.hosts[:10]:
+      self.assertEqual(
+          checks.CheckRegistry.SelectArtifacts(host["os_name"],
+                                               labels=host["labels"]),
+          LinearSelectArtifacts(host["os_name"], labels=host["labels"]))
+
+    def Indexed():
+      for host in self.hosts:
+        checks.CheckRegistry.SelectArtifacts(
+            host["os_name"], labels=host["labels"])
+
+    def Linear():
+      for host in self.hosts[:10]:
+        LinearSelectArtifacts(host["os_name"], labels=host["labels"])
+
+    self.TimeIt(
+        Indexed,
+        name="Index: select artifacts for %d hosts" % len(self.hosts))
+    self.TimeIt(Linear, name="Linear: select artifacts for 10 hosts")
+
+
+class CheckHostsBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare checking hosts one by one and in batches."""
+
+  REPEATS = 3
+
+  HOST_COUNT = 500
+
+  def setUp(self):
+    super(CheckHostsBenchmarks, self).setUp()
+    checks.LoadChecksFromDirs(config_lib.CONFIG["Checks.config_dir"])
+
+    parser = config_file_parsers.SshdConfigParser()
+    with open(
+        os.path.join(config_lib.CONFIG["Test.data_dir"],
+                     "VFSFixture/etc/ssh/sshd_config"), "rb") as fd:
+      sshd_config = list(parser.Parse(None, fd, None))
+
+    host_check = checks_test_lib.HostCheckTest
+    self.hosts = []
+    for i in range(self.HOST_COUNT):
+      host_data = host_check.SetKnowledgeBase("host%d.example.org" % i,
+                                              "Linux")
+      host_data["SshdConfigFile"] = {
+          "ANOMALY": [],
+          "PARSER": sshd_config,
+          "RAW": []
+      }
+      self.hosts.append((host_data, None, None, None))
+
+  def testCheckHosts(self):
+
+    def OneByOne():
+      for host_data, _, _, _ in self.hosts:
+        list(checks.CheckHost(host_data))
+
+    def Batch(threadpool_size):
+      list(checks.CheckHosts(self.hosts, threadpool_size=threadpool_size))
+
+    self.TimeIt(OneByOne, name="CheckHost: %d hosts" % len(self.hosts))
+    self.TimeIt(
+        Batch,
+        name="CheckHosts: %d hosts" % len(self.hosts),
+        threadpool_size=0)
+    self.TimeIt(
+        Batch,
+        name="CheckHosts, 4 threads: %d hosts" % len(self.hosts),
+        threadpool_size=4)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -2,12 +2,15 @@
 # -*- coding: utf-8 -*-
 """Tests for checks."""
 import os
+import sys
 
 import yaml
 
 from grr.lib import config_lib
 from grr.lib import flags
+from grr.lib import stats
 from grr.lib import test_lib
+from grr.lib import threadpool
 from grr.lib.checks import checks
 from grr.lib.checks import checks_test_lib
 from grr.lib.checks import filters
@@ -368,6 +371,96 @@ class ProcessHostDataTests(checks_test_lib.HostCheckTest):
     self.assertRanChecks(["SSHD-CHECK"], results)
     self.assertResultEqual(self.sshd, results["SSHD-CHECK"])
 
+  def _CheckHosts(self, threadpool_size):
+    hosts = []
+    for i, host_os in enumerate(["Linux", "Windows", "Darwin"] * 5):
+      host_data = self.SetKnowledgeBase("host%d.example.org" % i, host_os,
+                                        dict(self.data))
+      hosts.append((host_data, None, None, None))
+    return list(checks.CheckHosts(hosts, threadpool_size=threadpool_size))
+
+  def testProcessHosts(self):
+    """Batches of hosts get the same results as single hosts, in order."""
+    for threadpool_size in [0, 2]:
+      results = self._CheckHosts(threadpool_size)
+      self.assertEqual(len(results), 15)
+      for i, host_results in enumerate(results):
+        self.assertEqual(host_results.kb.hostname, "host%d.example.org" % i)
+        found = {r.check_id: r for r in host_results.result}
+        expected = self.RunChecks(self.SetKnowledgeBase(
+            host_results.kb.hostname, host_results.kb.os, dict(self.data)))
+        self.assertItemsEqual(expected, found)
+        for check_id, result in expected.iteritems():
+          self.assertResultEqual(result, found[check_id])
+        if host_results.kb.os == "Windows":
+          self.assertResultEqual(self.windows, found["SW-CHECK"])
+          self.assertChecksNotRun(["SSHD-CHECK"], found)
+        else:
+          self.assertResultEqual(self.sshd, found["SSHD-CHECK"])
+
+  def testProcessHostsWithDifferentData(self):
+    """Hosts evaluated concurrently don't see each other's data."""
+    hosts = []
+    for i, host_os in enumerate(["Linux", "Windows", "Darwin"] * 10):
+      data = {
+          "WMIInstalledSoftware":
+              self.SetArtifactData(parsed=GetWMIData()[:i % 4]),
+          "DebianPackagesStatus":
+              self.SetArtifactData(parsed=GetDPKGData()[i % 5:]),
+          "SshdConfigFile":
+              self.SetArtifactData(parsed=GetSSHDConfig()[:i % 2])
+      }
+      hosts.append((self.SetKnowledgeBase("host%d.example.org" % i, host_os,
+                                          data), None, None, None))
+
+    # Switch threads as often as possible, so that hosts are interleaved.
+    check_interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      results = list(checks.CheckHosts(hosts, threadpool_size=4))
+    finally:
+      sys.setcheckinterval(check_interval)
+    self.assertEqual(len(results), len(hosts))
+    for (host_data, _, _, _), host_results in zip(hosts, results):
+      self.assertEqual(host_results.kb, host_data["KnowledgeBase"])
+      found = {r.check_id: r for r in host_results.result}
+      expected = self.RunChecks(host_data)
+      self.assertItemsEqual(expected, found)
+      for check_id, result in expected.iteritems():
+        self.assertResultEqual(result, found[check_id])
+
+  def testProcessHostsConcurrently(self):
+    """Calls running at the same time use their own threadpools."""
+    hosts = []
+    for i, host_os in enumerate(["Linux", "Windows", "Darwin"] * 4):
+      host_data = self.SetKnowledgeBase("host%d.example.org" % i, host_os,
+                                        dict(self.data))
+      hosts.append((host_data, None, None, None))
+
+    with test_lib.Instrument(threadpool.ThreadPool, "Start") as instrument:
+      first = checks.CheckHosts(hosts, threadpool_size=2)
+      first_results = [next(first)]
+      second_results = list(checks.CheckHosts(hosts, threadpool_size=3))
+      # The second call didn't stop the pool of the first.
+      self.assertTrue(instrument.args[0][0].started)
+      first_results.extend(first)
+
+    pools = [args[0] for args in instrument.args]
+    self.assertEqual([pool.max_threads for pool in pools], [2, 3])
+    self.assertFalse(any(pool.started for pool in pools))
+    self.assertEqual(first_results, second_results)
+    self.assertEqual([r.kb.hostname for r in first_results],
+                     ["host%d.example.org" % i for i in range(len(hosts))])
+
+  def testProcessHostsRecordsCheckTimes(self):
+    before = stats.STATS.GetMetricValue(
+        "checks_evaluation_time", fields=["SW-CHECK"]).count
+    self._CheckHosts(0)
+    after = stats.STATS.GetMetricValue(
+        "checks_evaluation_time", fields=["SW-CHECK"]).count
+    # SW-CHECK runs on the Linux and Windows hosts.
+    self.assertEqual(after - before, 10)
+
 
 class ChecksTestBase(test_lib.GRRBaseTest):
   pass
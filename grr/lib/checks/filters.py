@@ -92,13 +92,15 @@ class ParallelHandler(BaseHandler):
     Returns:
       A list of rdf values that matched at least one filter.
     """
-    self.results = set()
+    # Results are kept local, the same handler may process data for several
+    # hosts at once.
+    results = set()
     if not self.filters:
-      self.results.update(raw_data)
+      results.update(raw_data)
     else:
       for f in self.filters:
-        self.results.update(f.Parse(raw_data))
-    return list(self.results)
+        results.update(f.Parse(raw_data))
+    return list(results)
 
 
 class SerialHandler(BaseHandler):
@@ -115,10 +117,10 @@ class SerialHandler(BaseHandler):
     Returns:
       A list of rdf values that matched all filters.
     """
-    self.results = raw_data
+    results = raw_data
     for f in self.filters:
-      self.results = f.Parse(self.results)
-    return self.results
+      results = f.Parse(results)
+    return results
 
 
 class Filter(object):
@@ -220,12 +222,22 @@ class AttrFilter(Filter):
 class ObjectFilter(Filter):
   """An objectfilter result processor that accepts runtime parameters."""
 
+  def __init__(self):
+    super(ObjectFilter, self).__init__()
+    # Compiled filters by expression, so evaluating a check over many hosts
+    # doesn't have to go back to the shared filter cache for every host.
+    self._compiled = {}
+
   def _Compile(self, expression):
-    try:
-      of = objectfilter.Parser(expression).Parse()
-      return of.Compile(objectfilter.LowercaseAttributeFilterImplementation)
-    except objectfilter.Error as e:
-      raise DefinitionError(e)
+    compiled = self._compiled.get(expression)
+    if compiled is None:
+      try:
+        compiled = objectfilter.CompileFilter(
+            expression, objectfilter.LowercaseAttributeFilterImplementation)
+      except objectfilter.Error as e:
+        raise DefinitionError(e)
+      self._compiled[expression] = compiled
+    return compiled
 
   def ParseObjs(self, objs, expression):
     """Parse one or more objects using an objectfilter expression."""
@@ -326,6 +338,21 @@ class StatFilter(Filter):
       "SYMLINK": stat.S_ISLNK
   }
 
+  def __init__(self):
+    super(StatFilter, self).__init__()
+    # Matchers by expression. Each entry is built by a separate filter which
+    # is never changed again, so hosts can be evaluated concurrently.
+    self._compiled = {}
+
+  def _Compile(self, expression):
+    matchers = self._compiled.get(expression)
+    if matchers is None:
+      compiled = self.__class__()
+      compiled.Validate(expression)
+      matchers = compiled.matchers
+      self._compiled[expression] = matchers
+    return matchers
+
   def _MatchFile(self, stat_entry):
     filename = os.path.basename(stat_entry.pathspec.path)
     return self.file_re.search(filename)
@@ -442,12 +469,12 @@ class StatFilter(Filter):
     Yields:
       matching objects.
     """
-    self.Validate(expression)
+    matchers = self._Compile(expression)
     for obj in objs:
       if not isinstance(obj, rdf_client.StatEntry):
         continue
       # If all match conditions pass, yield the object.
-      for match in self.matchers:
+      for match in matchers:
         if not match(obj):
           break
       else:
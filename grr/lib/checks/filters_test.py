@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 """Tests for grr.lib.checks.filters."""
 import collections
+import threading
+
 from grr.lib import flags
 from grr.lib import test_lib
+from grr.lib import utils
 from grr.lib.checks import checks
 from grr.lib.checks import filters
 from grr.lib.rdfvalues import anomaly
@@ -272,6 +275,19 @@ class StatFilterTests(test_lib.GRRBaseTest):
     results = filt.Parse(objs, "file_re:^pass")
     self.assertItemsEqual([obj1], results)
 
+  def testParseReusesValidatedExpression(self):
+    """Expressions are only parsed again if they changed."""
+    filt = filters.StatFilter()
+    obj1 = self._GenStat(path="/etc/passwd")
+    obj2 = self._GenStat(path="/etc/alternatives/ssh-askpass")
+    objs = [obj1, obj2]
+    self.assertItemsEqual([obj1], filt.Parse(objs, "file_re:^pass"))
+    with utils.Stubber(filters.StatFilter, "Validate", None):
+      self.assertItemsEqual([obj1], filt.Parse(objs, "file_re:^pass"))
+    # A failed validation doesn't affect the matchers in use.
+    self.assertRaises(filters.DefinitionError, filt.Validate, "file_re:[")
+    self.assertItemsEqual([obj1], filt.Parse(objs, "file_re:^pass"))
+
   def testPathREParse(self):
     """Path regexes operate successfully."""
     filt = filters.StatFilter()
@@ -398,6 +414,21 @@ class FilterRegistryTests(test_lib.GRRBaseTest):
     self.assertRaises(filters.DefinitionError, filters.Filter.GetFilter, "???")
 
 
+class BlockingFilter(object):
+  """A filter which holds up parsing of one data set until it is released."""
+
+  def __init__(self, blocked_data):
+    self.blocked_data = blocked_data
+    self.entered = threading.Event()
+    self.released = threading.Event()
+
+  def Parse(self, raw_data):
+    if raw_data is self.blocked_data:
+      self.entered.set()
+      self.released.wait(10)
+    return list(raw_data)
+
+
 class HandlerTests(test_lib.GRRBaseTest):
   """Test handler operations."""
 
@@ -453,6 +484,29 @@ class HandlerTests(test_lib.GRRBaseTest):
     self.assertItemsEqual(expected, handler.Parse(self.all))
 
 
+  def testHandlersAreReentrant(self):
+    """Data sets parsed concurrently by one handler are kept apart."""
+    first, second = self.all[:2], self.all[2:]
+    for mode in ["PARALLEL", "SERIAL"]:
+      filt = BlockingFilter(first)
+      handler = filters.GetHandler(mode)("Data")
+      handler.filters = [filt]
+      results = {}
+
+      def ParseFirst(handler=handler):
+        results["first"] = handler.Parse(first)
+
+      thread = threading.Thread(target=ParseFirst)
+      thread.start()
+      # Parse the second data set while the first one is inside the filter.
+      self.assertTrue(filt.entered.wait(10))
+      results["second"] = handler.Parse(second)
+      filt.released.set()
+      thread.join()
+      self.assertItemsEqual(first, results["first"])
+      self.assertItemsEqual(second, results["second"])
+
+
 def main(argv):
   test_lib.main(argv)
 
@@ -112,15 +112,23 @@ class Condition(object):
 class Triggers(object):
   """Triggers inventory the conditions where a check applies."""
 
+  # The number of distinct host conditions to remember the calls of.
+  MAX_CACHED_CALLS = 100
+
   def __init__(self):
     self.conditions = set()
     self._registry = {}
+    # Maps host conditions to the callbacks they trigger. Hosts with the same
+    # attributes share conditions, so checks running over many hosts don't
+    # have to match the conditions again for every host.
+    self._calls = {}
 
   def __len__(self):
     return len(self.conditions)
 
   def _Register(self, conditions, callback):
     """Map functions that should be called if the condition applies."""
+    self._calls = {}
     for condition in conditions:
       registered = self._registry.setdefault(condition, [])
       if callback and callback not in registered:
@@ -217,10 +225,119 @@ class Triggers(object):
     Returns:
       A list of methods that evaluate the data.
     """
-    results = set()
     if conditions is None:
       conditions = [None]
-    for condition in conditions:
-      for c in self.Match(*condition):
-        results.update(self._registry.get(c, []))
+    key = tuple(conditions)
+    results = self._calls.get(key)
+    if results is None:
+      results = set()
+      for condition in conditions:
+        for c in self.Match(*condition):
+          results.update(self._registry.get(c, []))
+      if len(self._calls) >= self.MAX_CACHED_CALLS:
+        self._calls = {}
+      self._calls[key] = results
+    return results
+
+
+class TriggerIndex(object):
+  """An inverted index from trigger conditions to the checks they trigger.
+
+  Empty condition values match any host value, so a host value can only match
+  conditions which have the same value or none at all. Lookups therefore only
+  need to visit the conditions stored under these keys, instead of evaluating
+  the conditions of every check.
+  """
+
+  def __init__(self):
+    # Maps (artifact, os_name, cpe, label) keys to sets of check ids.
+    self._checks = {}
+    # Maps (os_name, cpe, label) keys to {artifact: set of check ids}.
+    self._artifacts = {}
+    # Maps check ids to the condition keys they were added with.
+    self._keys = {}
+
+  def __len__(self):
+    return len(self._keys)
+
+  @staticmethod
+  def _Key(artifact, os_name, cpe, label):
+    # Empty values of any kind are treated the same.
+    return (artifact or None, os_name or None, cpe or None, label or None)
+
+  @staticmethod
+  def _CandidateKeys(artifact, os_name, cpe, label):
+    """Yields all the keys of conditions which match the host values."""
+    values = [(value, None) if value else (None,)
+              for value in (os_name, cpe, label)]
+    for host_key in itertools.product(*values):
+      yield (artifact or None,) + host_key
+
+  def Add(self, check_id, conditions):
+    """Indexes the conditions which trigger a check.
+
+    Args:
+      check_id: The id of the check.
+      conditions: An iterable of Condition objects.
+    """
+    self.Remove(check_id)
+
+    keys = set(self._Key(*condition.attr) for condition in conditions)
+    for key in keys:
+      self._checks.setdefault(key, set()).add(check_id)
+      artifacts = self._artifacts.setdefault(key[1:], {})
+      artifacts.setdefault(key[0], set()).add(check_id)
+    self._keys[check_id] = keys
+
+  def Remove(self, check_id):
+    """Removes a check from the index."""
+    for key in self._keys.pop(check_id, ()):
+      check_ids = self._checks[key]
+      check_ids.discard(check_id)
+      if not check_ids:
+        del self._checks[key]
+
+      artifacts = self._artifacts[key[1:]]
+      check_ids = artifacts[key[0]]
+      check_ids.discard(check_id)
+      if not check_ids:
+        del artifacts[key[0]]
+        if not artifacts:
+          del self._artifacts[key[1:]]
+
+  def FindChecks(self, artifact=None, os_name=None, cpe=None, label=None):
+    """Returns the ids of the checks triggered by host data.
+
+    Args:
+      artifact: An artifact name.
+      os_name: An OS string.
+      cpe: A CPE string.
+      label: A label string.
+
+    Returns:
+      A set of check ids.
+    """
+    results = set()
+    for key in self._CandidateKeys(artifact, os_name, cpe, label):
+      results.update(self._checks.get(key, ()))
+    return results
+
+  def Artifacts(self, os_name=None, cpe=None, label=None, check_ids=None):
+    """Returns the artifacts the checks need for a host.
+
+    Args:
+      os_name: An OS string.
+      cpe: A CPE string.
+      label: A label string.
+      check_ids: If set, only artifacts of these checks are returned.
+
+    Returns:
+      A set of artifact names.
+    """
+    results = set()
+    for key in self._CandidateKeys(None, os_name, cpe, label):
+      for artifact, artifact_check_ids in self._artifacts.get(key[1:],
+                                                              {}).iteritems():
+        if check_ids is None or not artifact_check_ids.isdisjoint(check_ids):
+          results.add(artifact)
     return results
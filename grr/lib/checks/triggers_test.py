@@ -94,6 +94,74 @@ class TriggersTest(test_lib.GRRBaseTest):
     self.assertItemsEqual([callback_3], meta_t.Calls([t800]))
     self.assertItemsEqual([callback_3], meta_t.Calls([t1000]))
 
+  def testTriggerRegistryCachesCalls(self):
+    t = triggers.Triggers()
+    callback_1 = lambda: 1
+    callback_2 = lambda: 2
+    t.Add("BadAI", target_2, callback_1)
+    calls = t.Calls([t800, t1000])
+    self.assertItemsEqual([callback_1], calls)
+    self.assertIs(calls, t.Calls([t800, t1000]))
+    # New triggers invalidate the cached calls.
+    t.Add("BadAI", target_1, callback_2)
+    self.assertItemsEqual([callback_1, callback_2], t.Calls([t800, t1000]))
+
+
+class TriggerIndexTest(test_lib.GRRBaseTest):
+  """Test the index of conditions to checks."""
+
+  def _Conditions(self, artifact, target):
+    t = triggers.Triggers()
+    t.Add(artifact, target)
+    return t.conditions
+
+  def testIndexAgreesWithConditionMatch(self):
+    checks = {
+        "GOOD": self._Conditions("GoodAI", target_1),
+        "BAD": self._Conditions("BadAI", target_2),
+        "ANY_BAD": self._Conditions("BadAI", target_1),
+    }
+    index = triggers.TriggerIndex()
+    for check_id, conditions in checks.iteritems():
+      index.Add(check_id, conditions)
+
+    queries = [bad_ai, good_ai, termos, t800, t1000,
+               ("BadAI", "TermOS", None, "t800"), ("BadAI", "", "", ""),
+               (None, "TermOS", None, None)]
+    for query in queries:
+      expected = set(
+          check_id for check_id, conditions in checks.iteritems()
+          if any(c.Match(*query) for c in conditions))
+      self.assertEqual(index.FindChecks(*query), expected, query)
+
+  def testIndexArtifacts(self):
+    index = triggers.TriggerIndex()
+    index.Add("GOOD", self._Conditions("GoodAI", target_1))
+    index.Add("BAD", self._Conditions("BadAI", target_2))
+
+    self.assertEqual(index.Artifacts(), set(["GoodAI"]))
+    self.assertEqual(index.Artifacts(*t800[1:]), set(["GoodAI", "BadAI"]))
+    self.assertEqual(index.Artifacts(*termos[1:]), set(["GoodAI"]))
+    self.assertEqual(
+        index.Artifacts(*t800[1:], check_ids=["BAD"]), set(["BadAI"]))
+    self.assertEqual(index.Artifacts(*t800[1:], check_ids=[]), set())
+
+  def testReAddingAndRemovingChecks(self):
+    index = triggers.TriggerIndex()
+    index.Add("CHECK", self._Conditions("BadAI", target_2))
+    self.assertEqual(index.FindChecks(*t800), set(["CHECK"]))
+
+    # Adding a check again replaces its conditions.
+    index.Add("CHECK", self._Conditions("GoodAI", target_1))
+    self.assertEqual(index.FindChecks(*t800), set())
+    self.assertEqual(index.FindChecks(*good_ai), set(["CHECK"]))
+    self.assertEqual(len(index), 1)
+
+    index.Remove("CHECK")
+    self.assertEqual(index.FindChecks(*good_ai), set())
+    self.assertEqual(index.Artifacts(), set())
+    self.assertEqual(len(index), 0)
+
 
 def main(argv):
   test_lib.main(argv)
@@ -25,6 +25,9 @@ class ClientIndex(keyword_index.AFF4KeywordIndex):
   END_TIME_PREFIX = "end_date:"
   END_TIME_PREFIX_LEN = len(END_TIME_PREFIX)
 
+  # Keywords like labels or operating systems match large parts of the fleet.
+  PACKED_POSTING_LISTS = True
+
   # We accept and return client URNs, but store client ids,
   # e.g. "C.00aaeccbb45f33a3".
 
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""Filestore hash filter crons."""
+
+from grr.lib import aff4
+from grr.lib import config_lib
+from grr.lib import flow
+from grr.lib import rdfvalue
+
+from grr.lib.aff4_objects import cronjobs
+from grr.lib.aff4_objects import filestore
+
+
+class RebuildFileStoreHashFiltersCronFlow(cronjobs.SystemCronFlow):
+  """Rebuild the bloom filters used for filestore hash lookups."""
+  frequency = rdfvalue.Duration("6h")
+  lifetime = rdfvalue.Duration("6h")
+
+  FILESTORES = [filestore.HashFileStore, filestore.NSRLFileStore]
+
+  @flow.StateHandler()
+  def Start(self):
+    if not config_lib.CONFIG["FileStore.hash_filter_enabled"]:
+      return
+
+    for filestore_cls in self.FILESTORES:
+      store = aff4.FACTORY.Open(
+          filestore_cls.PATH, filestore_cls, mode="r", token=self.token)
+      hash_filter = store.RebuildHashFilter(progress_callback=self.HeartBeat)
+      self.Log("Rebuilt hash filter for %s with %d hashes.", store.urn,
+               hash_filter.num_items)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Tests for grr.lib.flows.cron.filestore_filters."""
+
+from grr.lib import aff4
+from grr.lib import data_store
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.aff4_objects import filestore as aff4_filestore
+# pylint: disable=unused-import
+from grr.lib.flows.cron import filestore_filters
+# pylint: enable=unused-import
+
+
+class RebuildFileStoreHashFiltersCronFlowTest(test_lib.FlowTestsBaseclass):
+
+  def setUp(self):
+    super(RebuildFileStoreHashFiltersCronFlowTest, self).setUp()
+
+    for i in range(0, 10):
+      aff4.FACTORY.Create(
+          "aff4:/files/hash/generic/sha256/%064x" % i,
+          aff4_filestore.FileStoreImage,
+          token=self.token).Close()
+
+  def _ReadFilter(self, filestore_cls):
+    store = aff4.FACTORY.Open(
+        filestore_cls.PATH, filestore_cls, token=self.token)
+    return store._ReadHashFilter()  # pylint: disable=protected-access
+
+  def testFiltersAreNotBuiltWhenDisabled(self):
+    for _ in test_lib.TestFlowHelper(
+        "RebuildFileStoreHashFiltersCronFlow", token=self.token):
+      pass
+
+    self.assertIsNone(self._ReadFilter(aff4_filestore.HashFileStore))
+
+  def testFiltersAreBuilt(self):
+    with test_lib.ConfigOverrider({"FileStore.hash_filter_enabled": True}):
+      for _ in test_lib.TestFlowHelper(
+          "RebuildFileStoreHashFiltersCronFlow", token=self.token):
+        pass
+
+    hash_filter = self._ReadFilter(aff4_filestore.HashFileStore)
+    self.assertEqual(hash_filter.num_items, 10)
+    for i in range(0, 10):
+      self.assertTrue("%064x" % i in hash_filter)
+
+    built, _ = data_store.DB.Resolve(
+        aff4_filestore.HashFileStore.PATH,
+        aff4_filestore.HashFileStore.HASH_FILTER_BUILT_ATTRIBUTE,
+        token=self.token)
+    self.assertEqual(built, int(hash_filter.build_time))
+
+    hash_filter = self._ReadFilter(aff4_filestore.NSRLFileStore)
+    self.assertEqual(hash_filter.num_items, 0)
+
+
+def main(argv):
+  # Run the full test suite
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -6,5 +6,6 @@
 # These imports populate the Flow registry
 from grr.lib.flows.cron import compactors
 from grr.lib.flows.cron import data_retention
+from grr.lib.flows.cron import filestore_filters
 from grr.lib.flows.cron import filestore_stats
 from grr.lib.flows.cron import system
@@ -91,28 +91,47 @@ class _ActiveCounter(object):
       # pylint: enable=protected-access
 
 
+def _ClientFleetStatsRecords(cron_flow):
+  """Yields fleet statistics records built from every client in the system."""
+  root = aff4.FACTORY.Open(aff4.ROOT_URN, token=cron_flow.token)
+  children_urns = list(root.ListChildren())
+  logging.debug("Found %d children.", len(children_urns))
+
+  for child in aff4.FACTORY.MultiOpen(
+      children_urns, mode="r", token=cron_flow.token, age=aff4.NEWEST_TIME):
+    if isinstance(child, aff4_grr.VFSGRRClient):
+      yield child.GetFleetStatsRecord()
+
+    # This flow is not dead: we don't want to run out of lease time.
+    cron_flow.HeartBeat()
+
+
 class AbstractClientStatsCronFlow(cronjobs.SystemCronFlow):
-  """A cron job which opens every client in the system.
+  """A cron job which processes the fleet statistics record of every client.
 
-  We feed all the client objects to the AbstractClientStatsCollector instances.
+  The records are read from the ClientFleetStatsIndex, which clients keep up
+  to date. Until ReconcileClientFleetStatsIndex has run for the first time the
+  records are built by opening every client instead.
   """
 
   CLIENT_STATS_URN = rdfvalue.RDFURN("aff4:/stats/ClientFleetStats")
 
+  # Reading the index is cheap, so the statistics can be kept fresh.
+  frequency = rdfvalue.Duration("15m")
+
   def BeginProcessing(self):
     pass
 
-  def ProcessClient(self, client):
+  def ProcessClient(self, record):
     raise NotImplementedError()
 
   def FinishProcessing(self):
     pass
 
-  def GetClientLabelsList(self, client):
+  def GetClientLabelsList(self, record):
     """Get set of labels applied to this client."""
     client_labels = [aff4_grr.ALL_CLIENTS_LABEL]
-    label_set = client.GetLabelsNames(owner="GRR")
-    client_labels.extend(label_set)
+    client_labels.extend(record.labels)
     return client_labels
 
   def _StatsForLabel(self, label):
@@ -124,28 +143,33 @@ class AbstractClientStatsCronFlow(cronjobs.SystemCronFlow):
           token=self.token)
     return self.stats[label]
 
+  def _ClientRecords(self):
+    index = aff4.FACTORY.Create(
+        aff4_stats.ClientFleetStatsIndex.INDEX_URN,
+        aff4_stats.ClientFleetStatsIndex,
+        mode="r",
+        token=self.token)
+
+    if index.Get(index.Schema.LAST_RECONCILED):
+      return index.ReadRecords()
+
+    logging.info("%s: client fleet stats index was never reconciled, opening "
+                 "all clients.", self.__class__.__name__)
+    return _ClientFleetStatsRecords(self)
+
   @flow.StateHandler()
   def Start(self):
-    """Retrieve all the clients for the AbstractClientStatsCollectors."""
+    """Feed the record of every client to the ProcessClient method."""
     try:
 
       self.stats = {}
 
       self.BeginProcessing()
 
-      root = aff4.FACTORY.Open(aff4.ROOT_URN, token=self.token)
-      children_urns = list(root.ListChildren())
-      logging.debug("Found %d children.", len(children_urns))
-
       processed_count = 0
-      for child in aff4.FACTORY.MultiOpen(
-          children_urns, mode="r", token=self.token, age=aff4.NEWEST_TIME):
-        if isinstance(child, aff4_grr.VFSGRRClient):
-          self.ProcessClient(child)
-          processed_count += 1
-
-        # This flow is not dead: we don't want to run out of lease time.
-        self.HeartBeat()
+      for record in self._ClientRecords():
+        self.ProcessClient(record)
+        processed_count += 1
 
       self.FinishProcessing()
       for fd in self.stats.values():
@@ -158,11 +182,51 @@ class AbstractClientStatsCronFlow(cronjobs.SystemCronFlow):
       raise
 
 
+class ReconcileClientFleetStatsIndex(cronjobs.SystemCronFlow):
+  """Rebuilds the client fleet stats index from all client objects.
+
+  Clients keep their records up to date, but records of deleted clients and
+  clients which were not written since the index was introduced are only
+  fixed by this job.
+  """
+
+  # Number of records written in one batch.
+  BATCH_SIZE = 1000
+
+  @flow.StateHandler()
+  def Start(self):
+    """Rewrite the records of all clients and remove stale ones."""
+    start_time = rdfvalue.RDFDatetime.Now()
+
+    index = aff4.FACTORY.Create(
+        aff4_stats.ClientFleetStatsIndex.INDEX_URN,
+        aff4_stats.ClientFleetStatsIndex,
+        mode="rw",
+        token=self.token)
+
+    stale_client_ids = set(record.client_id for record in index.ReadRecords())
+
+    records = []
+    for record in _ClientFleetStatsRecords(self):
+      stale_client_ids.discard(record.client_id)
+      records.append(record)
+      if len(records) >= self.BATCH_SIZE:
+        index.UpdateRecords(records)
+        records = []
+
+    index.UpdateRecords(records)
+    index.DeleteRecords(stale_client_ids)
+
+    index.Set(index.Schema.LAST_RECONCILED(start_time))
+    index.Close()
+
+    logging.info("Removed %d stale client fleet stats records.",
+                 len(stale_client_ids))
+
+
 class GRRVersionBreakDown(AbstractClientStatsCronFlow):
   """Records relative ratios of GRR versions in 7 day actives."""
 
-  frequency = rdfvalue.Duration("4h")
-
   def BeginProcessing(self):
     self.counter = _ActiveCounter(
         aff4_stats.ClientFleetStats.SchemaCls.GRRVERSION_HISTOGRAM)
@@ -170,18 +234,10 @@ class GRRVersionBreakDown(AbstractClientStatsCronFlow):
   def FinishProcessing(self):
     self.counter.Save(self)
 
-  def ProcessClient(self, client):
-    ping = client.Get(client.Schema.PING)
-    c_info = client.Get(client.Schema.CLIENT_INFO)
-
-    if c_info and ping:
-      category = " ".join([
-          c_info.client_description or c_info.client_name,
-          str(c_info.client_version)
-      ])
-
-      for label in self.GetClientLabelsList(client):
-        self.counter.Add(category, label, ping)
+  def ProcessClient(self, record):
+    if record.grr_version and record.last_ping:
+      for label in self.GetClientLabelsList(record):
+        self.counter.Add(record.grr_version, label, record.last_ping)
 
 
 class OSBreakDown(AbstractClientStatsCronFlow):
@@ -198,21 +254,18 @@ class OSBreakDown(AbstractClientStatsCronFlow):
     for counter in self.counters:
       counter.Save(self)
 
-  def ProcessClient(self, client):
+  def ProcessClient(self, record):
     """Update counters for system, version and release attributes."""
-    ping = client.Get(client.Schema.PING)
-    if not ping:
+    if not record.last_ping:
       return
-    system = client.Get(client.Schema.SYSTEM, "Unknown")
-    uname = client.Get(client.Schema.UNAME, "Unknown")
 
-    for label in self.GetClientLabelsList(client):
+    for label in self.GetClientLabelsList(record):
       # Windows, Linux, Darwin
-      self.counters[0].Add(system, label, ping)
+      self.counters[0].Add(record.system, label, record.last_ping)
 
       # Windows-2008ServerR2-6.1.7601SP1, Linux-Ubuntu-12.04,
       # Darwin-OSX-10.9.3
-      self.counters[1].Add(uname, label, ping)
+      self.counters[1].Add(record.uname, label, record.last_ping)
 
 
 class LastAccessStats(AbstractClientStatsCronFlow):
@@ -242,12 +295,12 @@ class LastAccessStats(AbstractClientStatsCronFlow):
 
       self._StatsForLabel(label).AddAttribute(graph)
 
-  def ProcessClient(self, client):
+  def ProcessClient(self, record):
     now = rdfvalue.RDFDatetime.Now()
 
-    ping = client.Get(client.Schema.PING)
+    ping = record.last_ping
     if ping:
-      for label in self.GetClientLabelsList(client):
+      for label in self.GetClientLabelsList(record):
         time_ago = now - ping
         pos = bisect.bisect(self._bins, time_ago.microseconds)
 
@@ -297,6 +350,24 @@ class InterrogateClientsCronFlow(cronjobs.SystemCronFlow):
       runner.Start()
 
 
+class ExpireForemanRulesCronFlow(cronjobs.SystemCronFlow):
+  """Removes expired rules from the foreman."""
+
+  frequency = rdfvalue.Duration("5m")
+
+  @flow.StateHandler()
+  def Start(self):
+    with aff4.FACTORY.Open(
+        "aff4:/foreman",
+        aff4_type=aff4_grr.GRRForeman,
+        mode="rw",
+        token=self.token) as foreman:
+      expired = foreman.ExpireRules()
+
+    if expired:
+      self.Log("Removed %d expired foreman rules.", expired)
+
+
 class PurgeClientStats(cronjobs.SystemCronFlow):
   """Deletes outdated client statistics."""
 
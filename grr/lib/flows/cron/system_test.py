@@ -8,6 +8,7 @@ from grr.lib import aff4
 from grr.lib import client_fixture
 from grr.lib import flags
 from grr.lib import flow
+from grr.lib import rdfvalue
 from grr.lib import test_lib
 from grr.lib import utils
 from grr.lib.aff4_objects import aff4_grr
@@ -17,6 +18,8 @@ from grr.lib.flows.general import endtoend as endtoend_flows
 from grr.lib.flows.general import endtoend_test
 from grr.lib.rdfvalues import client as client_rdf
 from grr.lib.rdfvalues import flows
+from grr.lib.rdfvalues import stats as stats_rdf
+from grr.server import foreman as rdf_foreman
 
 
 class SystemCronFlowTest(test_lib.FlowTestsBaseclass):
@@ -176,6 +179,103 @@ class SystemCronFlowTest(test_lib.FlowTestsBaseclass):
     # All our clients appeared at the same time but this label is only half.
     self._CheckAccessStats("Label2", count=10L)
 
+  def _FleetStatsRecords(self):
+    index = aff4.FACTORY.Create(
+        aff4_stats.ClientFleetStatsIndex.INDEX_URN,
+        aff4_stats.ClientFleetStatsIndex,
+        mode="r",
+        token=self.token)
+    return dict((record.client_id, record) for record in index.ReadRecords())
+
+  def testClientsUpdateFleetStatsIndex(self):
+    records = self._FleetStatsRecords()
+    self.assertEqual(len(records), 20)
+
+    record = records[client_rdf.ClientURN("C.0000000000000000")]
+    self.assertEqual(record.system, "Windows")
+    self.assertEqual(record.grr_version, "GRR Monitor 1")
+    self.assertItemsEqual(record.labels, ["Label1", "Label2"])
+    self.assertEqual(records[client_rdf.ClientURN("C.1000000000000000")].system,
+                     "Linux")
+
+    with aff4.FACTORY.Open(
+        "C.1000000000000000", mode="rw", token=self.token) as client:
+      client.AddLabels("Label3", owner="GRR")
+
+    record = self._FleetStatsRecords()[client_rdf.ClientURN(
+        "C.1000000000000000")]
+    self.assertEqual(list(record.labels), ["Label3"])
+
+  def testFleetStatsIndexOnlyRecordsPingChangesAboveResolution(self):
+    client_id = client_rdf.ClientURN("C.0000000000000000")
+    client = aff4.FACTORY.Open(client_id, mode="rw", token=self.token)
+
+    with test_lib.ConfigOverrider({"ClientFleetStats.ping_resolution": 600}):
+      for now, expected in [(1000, 1000), (1300, 1000), (1700, 1700)]:
+        with test_lib.FakeTime(now):
+          client.Set(client.Schema.PING, rdfvalue.RDFDatetime.Now())
+          client.Flush()
+
+        record = self._FleetStatsRecords()[client_id]
+        self.assertEqual(record.last_ping.AsSecondsFromEpoch(), expected)
+
+  def testReconcileClientFleetStatsIndex(self):
+    index = aff4.FACTORY.Create(
+        aff4_stats.ClientFleetStatsIndex.INDEX_URN,
+        aff4_stats.ClientFleetStatsIndex,
+        mode="rw",
+        token=self.token)
+
+    # A deleted client and a client whose record was lost.
+    index.UpdateRecords([
+        stats_rdf.ClientFleetStatsRecord(
+            client_id="C.2000000000000000", system="Windows")
+    ])
+    index.DeleteRecords(["C.0000000000000001"])
+
+    for _ in test_lib.TestFlowHelper(
+        "ReconcileClientFleetStatsIndex", token=self.token):
+      pass
+
+    records = self._FleetStatsRecords()
+    self.assertEqual(len(records), 20)
+    self.assertIn(client_rdf.ClientURN("C.0000000000000001"), records)
+    self.assertNotIn(client_rdf.ClientURN("C.2000000000000000"), records)
+
+    index = aff4.FACTORY.Open(
+        aff4_stats.ClientFleetStatsIndex.INDEX_URN, token=self.token)
+    self.assertTrue(index.Get(index.Schema.LAST_RECONCILED))
+
+  def testClientStatsUseReconciledIndex(self):
+    for _ in test_lib.TestFlowHelper(
+        "ReconcileClientFleetStatsIndex", token=self.token):
+      pass
+
+    def FailingMultiOpen(*unused_args, **unused_kwargs):
+      raise AssertionError("Clients should not be opened.")
+
+    with utils.Stubber(aff4.FACTORY, "MultiOpen", FailingMultiOpen):
+      for flow_name in ["GRRVersionBreakDown", "OSBreakDown",
+                        "LastAccessStats"]:
+        for _ in test_lib.TestFlowHelper(flow_name, token=self.token):
+          pass
+
+    histogram = aff4_stats.ClientFleetStats.SchemaCls.GRRVERSION_HISTOGRAM
+    self._CheckVersionStats("All", histogram, [0, 0, 20, 20])
+    self._CheckVersionStats("Label1", histogram, [0, 0, 10, 10])
+
+    histogram = aff4_stats.ClientFleetStats.SchemaCls.OS_HISTOGRAM
+    self._CheckOSStats("All", histogram, [0, 0, {
+        "Linux": 10,
+        "Windows": 10
+    }, {
+        "Linux": 10,
+        "Windows": 10
+    }])
+
+    self._CheckAccessStats("All", count=20L)
+    self._CheckAccessStats("Label1", count=10L)
+
   def testPurgeClientStats(self):
     max_age = system.PurgeClientStats.MAX_AGE
 
@@ -205,6 +305,26 @@ class SystemCronFlowTest(test_lib.FlowTestsBaseclass):
     self.assertEqual(len(stat_entries), 1)
     self.assertTrue(max_age not in [e.RSS_size for e in stat_entries])
 
+  def testExpireForemanRules(self):
+    with aff4.FACTORY.Open(
+        "aff4:/foreman", mode="rw", token=self.token) as foreman:
+      foreman.SetRules([
+          rdf_foreman.ForemanRule(
+              created=1000 * 1000000,
+              expires=expires * 1000000,
+              description="Test rule") for expires in [1500, 2000]
+      ])
+
+    with test_lib.FakeTime(1800):
+      for _ in test_lib.TestFlowHelper(
+          system.ExpireForemanRulesCronFlow.__name__, token=self.token):
+        pass
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", token=self.token)
+    rules = foreman.ReadRules()
+    self.assertEqual([rule.expires for rule in rules],
+                     [rdfvalue.RDFDatetime(2000 * 1000000)])
+
   def _SetSummaries(self, client_id):
     client = aff4.FACTORY.Create(
         client_id, aff4_grr.VFSGRRClient, mode="rw", token=self.token)
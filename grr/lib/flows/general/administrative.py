@@ -381,6 +381,10 @@ class Foreman(flow.WellKnownFlow):
     with self.lock:
       if (self.foreman_cache is None or
           now > self.foreman_cache.age + self.cache_refresh_time):
+        if self.foreman_cache is not None:
+          # Don't lose hunt assignments buffered by the old foreman.
+          self.foreman_cache.FlushHuntAssignments()
+
         self.foreman_cache = aff4.FACTORY.Open(
             "aff4:/foreman", mode="rw", token=self.token)
         self.foreman_cache.age = now
@@ -81,7 +81,7 @@ class CheckRunner(flow.GRRFlow):
     Args:
       processor: A processor method to use.
       responses: One or more response items, depending on whether the processor
-        uses Parse or ParseMultiple.
+        uses Parse, ParseMultiple or ParseBatch.
       artifact_name: The name of the artifact.
       source: The origin of the data, if specified.
     """
@@ -122,7 +122,7 @@ class CheckRunner(flow.GRRFlow):
       if processors:
         for processor_cls in processors:
           processor = processor_cls()
-          if processor.process_together:
+          if processor.process_together or processor.process_in_batch:
             # Store the response until we have them all.
             processor_name = processor.__class__.__name__
             saved_responses.setdefault(processor_name, []).append(response)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Flows for handling the collection for artifacts."""
 
+import collections
 import logging
 from grr.client import actions
 from grr.client.client_actions import standard as standard_actions
@@ -25,6 +26,7 @@ from grr.lib.flows.general import memory as _
 from grr.lib.flows.general import transfer
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import paths
+from grr.lib.rdfvalues import protodict as rdf_protodict
 from grr.lib.rdfvalues import structs as rdf_structs
 # For various parsers use by artifacts. pylint: disable=unused-import
 from grr.parsers import registry_init
@@ -68,6 +70,12 @@ class ArtifactCollectorFlow(flow.GRRFlow):
   args_type = artifact_utils.ArtifactCollectorFlowArgs
   behaviours = flow.GRRFlow.behaviours + "BASIC"
 
+  # Path types whose results can be attributed to the coalesced requests they
+  # came from by their path.
+  COALESCED_PATHTYPES = [
+      paths.PathSpec.PathType.OS, paths.PathSpec.PathType.REGISTRY
+  ]
+
   def GetPathType(self):
     if self.args.use_tsk:
       return paths.PathSpec.PathType.TSK
@@ -130,6 +138,9 @@ class ArtifactCollectorFlow(flow.GRRFlow):
       self.state.knowledge_base = artifact.GetArtifactKnowledgeBase(
           self.client, allow_uninitialized=True)
 
+    if config_lib.CONFIG["Artifacts.coalesce_collection_requests"]:
+      self._coalesced_requests = collections.OrderedDict()
+
     for artifact_name in self.args.artifact_list:
       artifact_obj = self._GetArtifactFromName(artifact_name)
 
@@ -140,6 +151,8 @@ class ArtifactCollectorFlow(flow.GRRFlow):
 
       self.Collect(artifact_obj)
 
+    self._CallCoalescedRequests()
+
   def ConvertSupportedOSToConditions(self, src_object, filter_list):
     """Turn supported_os into a condition."""
     if src_object.supported_os:
@@ -234,16 +247,22 @@ class ArtifactCollectorFlow(flow.GRRFlow):
     new_path_list = []
     for path in source.attributes["paths"]:
       # Interpolate any attributes from the knowledgebase.
-      new_path_list.extend(
-          artifact_utils.InterpolateKbAttributes(
-              path,
-              self.state.knowledge_base,
-              ignore_errors=self.args.ignore_interpolation_errors))
+      new_path_list.extend(self._InterpolateKbAttributes(path))
 
     action = file_finder.FileFinderAction(
         action_type=file_finder.FileFinderAction.Action.DOWNLOAD,
         download=file_finder.FileFinderDownloadActionOptions(max_size=max_size))
 
+    if self._CoalesceRequest(
+        "FileFinder",
+        source,
+        new_path_list,
+        "ProcessFileFinderResults",
+        pathtype=path_type,
+        action=action,
+        file_size=max_size):
+      return
+
     self.CallFlow(
         "FileFinder",
         paths=new_path_list,
@@ -269,9 +288,14 @@ class ArtifactCollectorFlow(flow.GRRFlow):
 
   def Glob(self, source, pathtype):
     """Glob paths, return StatEntry objects."""
+    glob_paths = self.InterpolateList(source.attributes.get("paths", []))
+    if self._CoalesceRequest(
+        "Glob", source, glob_paths, "ProcessCollected", pathtype=pathtype):
+      return
+
     self.CallFlow(
         "Glob",
-        paths=self.InterpolateList(source.attributes.get("paths", [])),
+        paths=glob_paths,
         pathtype=pathtype,
         request_data={
             "artifact_name": self.current_artifact_name,
@@ -329,9 +353,18 @@ class ArtifactCollectorFlow(flow.GRRFlow):
         next_state="ProcessCollected")
 
   def GetRegistryKey(self, source):
+    keys = self.InterpolateList(source.attributes.get("keys", []))
+    if self._CoalesceRequest(
+        "Glob",
+        source,
+        keys,
+        "ProcessCollected",
+        pathtype=paths.PathSpec.PathType.REGISTRY):
+      return
+
     self.CallFlow(
         "Glob",
-        paths=self.InterpolateList(source.attributes.get("keys", [])),
+        paths=keys,
         pathtype=paths.PathSpec.PathType.REGISTRY,
         request_data={
             "artifact_name": self.current_artifact_name,
@@ -357,13 +390,17 @@ class ArtifactCollectorFlow(flow.GRRFlow):
         # we do here.
         path = kvdict["key"]
 
-      expanded_paths = artifact_utils.InterpolateKbAttributes(
-          path,
-          self.state.knowledge_base,
-          ignore_errors=self.args.ignore_interpolation_errors)
-      new_paths.update(expanded_paths)
+      new_paths.update(self._InterpolateKbAttributes(path))
 
     if has_glob:
+      if self._CoalesceRequest(
+          "Glob",
+          source,
+          list(new_paths),
+          "ProcessCollected",
+          pathtype=paths.PathSpec.PathType.REGISTRY):
+        return
+
       self.CallFlow(
           "Glob",
           paths=new_paths,
@@ -389,6 +426,183 @@ class ArtifactCollectorFlow(flow.GRRFlow):
             },
             next_state="ProcessCollectedRegistryStatEntry")
 
+  def _CoalesceRequest(self, flow_name, source, request_paths, next_state,
+                       **kwargs):
+    """Defers a flow over paths so it can be merged with compatible ones.
+
+    Sources collected by the same flow with the same arguments are merged into
+    a single flow over all their paths when the collection has been planned.
+    Fewer flows walk the client filesystem and shared path prefixes are only
+    listed once.
+
+    Args:
+      flow_name: The flow to call, Glob or FileFinder.
+      source: The artifact source the paths belong to.
+      request_paths: The interpolated paths for the flow.
+      next_state: The state processing the results of this source.
+      **kwargs: Arguments for the flow, except paths.
+
+    Returns:
+      True if the request was deferred, False if it has to be called now.
+    """
+    coalesced_requests = getattr(self, "_coalesced_requests", None)
+    if coalesced_requests is None:
+      return False
+
+    if kwargs["pathtype"] not in self.COALESCED_PATHTYPES:
+      return False
+
+    # Character classes are not supported when attributing results to paths.
+    if any("[" in path for path in request_paths):
+      return False
+
+    key = (flow_name, next_state, kwargs["pathtype"], kwargs.get("file_size"))
+    request = coalesced_requests.setdefault(key, dict(
+        flow_name=flow_name,
+        next_state=next_state,
+        flow_args=kwargs,
+        members=[]))
+    request["members"].append(
+        dict(
+            artifact_name=self.current_artifact_name,
+            source=source.ToPrimitiveDict(),
+            paths=list(request_paths)))
+    return True
+
+  def _GetGlobPatterns(self, request_paths):
+    """Returns the patterns the Glob of request_paths is built from."""
+    patterns = set()
+    for path in request_paths:
+      path = utils.NormalizePath(path.replace("\\", "/"))
+      patterns.update(paths.GlobExpression(path).InterpolateGrouping(path))
+    return patterns
+
+  def _SplitCoalescedMembers(self, members):
+    """Splits coalesced sources into groups collected by the same flow.
+
+    Glob merges all patterns into a single tree of path components. A path
+    which is both a leaf and the parent of another path in that tree is never
+    reported, so sources with such paths are collected by separate flows.
+
+    Args:
+      members: The sources deferred for one flow.
+
+    Returns:
+      A list of lists of sources.
+    """
+    groups = []
+    for member in members:
+      member_patterns = self._GetGlobPatterns(member["paths"])
+      for group_members, group_patterns in groups:
+        if not any(
+            pattern.startswith(other + "/") or other.startswith(pattern + "/")
+            for pattern in member_patterns for other in group_patterns):
+          group_members.append(member)
+          group_patterns.update(member_patterns)
+          break
+      else:
+        groups.append(([member], member_patterns))
+
+    return [group_members for group_members, _ in groups]
+
+  def _CallCoalescedRequests(self):
+    """Calls the flows deferred by _CoalesceRequest."""
+    coalesced_requests = getattr(self, "_coalesced_requests", None)
+    if not coalesced_requests:
+      return
+
+    for request in coalesced_requests.itervalues():
+      for members in self._SplitCoalescedMembers(request["members"]):
+        if len(members) == 1:
+          self.CallFlow(
+              request["flow_name"],
+              paths=members[0]["paths"],
+              request_data={
+                  "artifact_name": members[0]["artifact_name"],
+                  "source": members[0]["source"]
+              },
+              next_state=request["next_state"],
+              **request["flow_args"])
+          continue
+
+        request_paths = []
+        seen = set()
+        for member in members:
+          for path in member["paths"]:
+            if path not in seen:
+              seen.add(path)
+              request_paths.append(path)
+
+        self.CallFlow(
+            request["flow_name"],
+            paths=request_paths,
+            request_data={
+                "members": members,
+                "next_state": request["next_state"]
+            },
+            next_state="ProcessCoalescedResults",
+            **request["flow_args"])
+
+    self._coalesced_requests = None
+
+  def _GetResultPath(self, response):
+    if isinstance(response, file_finder.FileFinderResult):
+      response = response.stat_entry
+    return utils.NormalizePath(
+        response.pathspec.CollapsePath().replace("\\", "/"))
+
+  @flow.StateHandler()
+  def ProcessCoalescedResults(self, responses):
+    """Hands the results of a coalesced flow to the sources they belong to.
+
+    Each result is matched against the paths of every source the flow was
+    called for, so results are processed as if each source had called the
+    flow on its own.
+
+    Args:
+      responses: Responses from the coalesced Glob or FileFinder flow.
+    """
+    members = responses.request_data["members"]
+    next_state = responses.request_data["next_state"]
+
+    member_regexes = []
+    for member in members:
+      member_regexes.append([
+          paths.GlobExpression(pattern).AsRegEx()
+          for pattern in self._GetGlobPatterns(member["paths"])
+      ])
+
+    member_responses = [[] for _ in members]
+    seen = set()
+    for response in responses:
+      result_path = self._GetResultPath(response)
+      # Glob reports paths reached through the patterns of several sources
+      # once for each of them.
+      if result_path in seen:
+        continue
+      seen.add(result_path)
+
+      matched = False
+      for regexes, matching_responses in zip(member_regexes,
+                                             member_responses):
+        if any(regex.Match(result_path) for regex in regexes):
+          matching_responses.append(response)
+          matched = True
+
+      if not matched:
+        self.Log("Result %s does not match any collected source.", result_path)
+
+    for member, matching_responses in zip(members, member_responses):
+      member_request_data = rdf_protodict.Dict(
+          artifact_name=member["artifact_name"],
+          source=member["source"].ToDict())
+      member_responses_obj = flow.FakeResponses(matching_responses,
+                                                member_request_data)
+      member_responses_obj.success = responses.success
+      member_responses_obj.status = responses.status
+      self.CallStateInline(
+          next_state=next_state, responses=member_responses_obj)
+
   def _StartSubArtifactCollector(self, artifact_list, source, next_state):
     self.CallFlow(
         "ArtifactCollectorFlow",
@@ -433,10 +647,7 @@ class ArtifactCollectorFlow(flow.GRRFlow):
   def WMIQuery(self, source):
     """Run a Windows WMI Query."""
     query = source.attributes["query"]
-    queries = artifact_utils.InterpolateKbAttributes(
-        query,
-        self.state.knowledge_base,
-        ignore_errors=self.args.ignore_interpolation_errors)
+    queries = self._InterpolateKbAttributes(query)
     base_object = source.attributes.get("base_object")
     for query in queries:
       self.CallClient(
@@ -468,12 +679,27 @@ class ArtifactCollectorFlow(flow.GRRFlow):
         },
         next_state="ProcessCollected")
 
+  def _InterpolateKbAttributes(self, pattern):
+    """Interpolates pattern with the knowledge base, reusing past results."""
+    if not artifact_utils.INTERPOLATED_REGEX.search(pattern):
+      return [pattern]
+
+    knowledge_base = self.state.knowledge_base
+    # The knowledge base does not change while it is being interpolated, so it
+    # is only fingerprinted once.
+    if getattr(self, "_fingerprinted_kb", None) is not knowledge_base:
+      self._kb_fingerprint = artifact_utils.GetKnowledgeBaseFingerprint(
+          knowledge_base)
+      self._fingerprinted_kb = knowledge_base
+
+    return artifact_utils.InterpolateKbAttributesCached(
+        pattern,
+        knowledge_base,
+        ignore_errors=self.args.ignore_interpolation_errors,
+        fingerprint=self._kb_fingerprint)
+
   def _GetSingleExpansion(self, value):
-    results = list(
-        artifact_utils.InterpolateKbAttributes(
-            value,
-            self.state.knowledge_base,
-            ignore_errors=self.args.ignore_interpolation_errors))
+    results = self._InterpolateKbAttributes(value)
     if len(results) > 1:
       raise ValueError("Interpolation generated multiple results, use a"
                        " list for multi-value expansions. %s yielded: %s" %
@@ -509,12 +735,7 @@ class ArtifactCollectorFlow(flow.GRRFlow):
     new_args = []
     for value in input_list:
       if isinstance(value, basestring):
-        results = list(
-            artifact_utils.InterpolateKbAttributes(
-                value,
-                self.state.knowledge_base,
-                ignore_errors=self.args.ignore_interpolation_errors))
-        new_args.extend(results)
+        new_args.extend(self._InterpolateKbAttributes(value))
       else:
         new_args.extend(value)
     return new_args
@@ -601,7 +822,7 @@ class ArtifactCollectorFlow(flow.GRRFlow):
       if processors and self.args.apply_parsers:
         for processor in processors:
           processor_obj = processor()
-          if processor_obj.process_together:
+          if processor_obj.process_together or processor_obj.process_in_batch:
             # Store the response until we have them all.
             saved_responses.setdefault(processor.__name__, []).append(response)
           else:
@@ -735,7 +956,7 @@ class ArtifactCollectorFlow(flow.GRRFlow):
     Args:
       processor_obj: A Processor object that inherits from Parser.
       responses: A list of, or single response depending on the processors
-         process_together setting.
+         process_together and process_in_batch settings.
       responses_obj: The responses object itself.
       artifact_name: Name of the artifact that generated the responses.
       source: The source responsible for producing the responses.
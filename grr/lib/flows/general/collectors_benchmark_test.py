@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Benchmark tests for collecting many file artifacts at once."""
+
+
+from grr.lib import action_mocks
+from grr.lib import aff4
+from grr.lib import artifact
+from grr.lib import artifact_registry
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib import utils
+# pylint: disable=unused-import
+from grr.lib.flows.general import collectors
+# pylint: enable=unused-import
+from grr.lib.flows.general import filesystem
+from grr.lib.rdfvalues import paths as rdf_paths
+
+
+class ArtifactCollectorBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare collecting file sources separately and coalesced."""
+
+  REPEATS = 3
+
+  ARTIFACT_COUNT = 20
+
+  # Paths in the test data VFS fixture, collected by the benchmark artifacts.
+  PATHS = [
+      "/etc/passwd", "/etc/lsb-release", "/etc/netgroup", "/etc/ssh/*",
+      "/var/log/*"
+  ]
+
+  def setUp(self):
+    super(ArtifactCollectorBenchmarks, self).setUp()
+    test_registry = artifact_registry.ArtifactRegistry()
+    test_registry.ClearRegistry()
+    test_registry._dirty = False  # pylint: disable=protected-access
+    self.registry_stubber = utils.Stubber(artifact_registry, "REGISTRY",
+                                          test_registry)
+    self.registry_stubber.Start()
+
+    self.artifact_list = []
+    for i in range(self.ARTIFACT_COUNT):
+      name = "BenchmarkFiles%d" % i
+      source = artifact_registry.ArtifactSource(
+          type=artifact_registry.ArtifactSource.SourceType.DIRECTORY,
+          attributes={
+              "paths": [self.PATHS[i % len(self.PATHS)],
+                        self.PATHS[(i + 1) % len(self.PATHS)]]
+          })
+      test_registry.RegisterArtifact(
+          artifact_registry.Artifact(
+              name=name,
+              doc="Benchmark artifact.",
+              sources=[source],
+              supported_os=["Linux"]))
+      self.artifact_list.append(name)
+
+    self.client_id = self.SetupClients(1, system="Linux")[0]
+    with aff4.FACTORY.Open(self.client_id, token=self.token, mode="rw") as fd:
+      kb = fd.Schema.KNOWLEDGE_BASE()
+      artifact.SetCoreGRRKnowledgeBaseValues(kb, fd)
+      fd.Set(kb)
+
+    self.vfs_overrider = test_lib.VFSOverrider(
+        rdf_paths.PathSpec.PathType.OS, test_lib.FakeTestDataVFSHandler)
+    self.vfs_overrider.Start()
+
+  def tearDown(self):
+    self.vfs_overrider.Stop()
+    self.registry_stubber.Stop()
+    super(ArtifactCollectorBenchmarks, self).tearDown()
+
+  def _Collect(self):
+    """Runs the collection, returning the number of client round trips."""
+    client_mock = action_mocks.FileFinderClientMock()
+    round_trips = 0
+    for _ in test_lib.TestFlowHelper(
+        "ArtifactCollectorFlow",
+        client_mock,
+        artifact_list=self.artifact_list,
+        token=self.token,
+        client_id=self.client_id):
+      round_trips += 1
+    return round_trips
+
+  def _Benchmark(self, coalesce):
+    with test_lib.ConfigOverrider({
+        "Artifacts.coalesce_collection_requests": coalesce
+    }):
+      with test_lib.Instrument(filesystem.Glob, "Start") as glob_instrument:
+        round_trips = self._Collect()
+
+      name = "Coalesced" if coalesce else "Separate"
+      self.TimeIt(
+          self._Collect,
+          name="%s: %d artifacts, %d Glob flows, %d round trips" %
+          (name, self.ARTIFACT_COUNT, glob_instrument.call_count, round_trips))
+
+    return glob_instrument.call_count
+
+  def testCollectSeparately(self):
+    self.assertEqual(self._Benchmark(False), self.ARTIFACT_COUNT)
+
+  def testCollectCoalesced(self):
+    self.assertLess(self._Benchmark(True), self.ARTIFACT_COUNT)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -11,6 +11,7 @@ import os
 import mock
 import psutil
 
+from grr.client.client_actions import searching
 from grr.client.client_actions import standard
 from grr.lib import action_mocks
 from grr.lib import aff4
@@ -27,6 +28,7 @@ from grr.lib.aff4_objects import sequential_collection
 from grr.lib.flows.general import artifact_fallbacks
 from grr.lib.flows.general import collectors
 # pylint: enable=unused-import
+from grr.lib.flows.general import filesystem
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import paths as rdf_paths
 
@@ -429,6 +431,162 @@ class TestArtifactCollectors(test_lib.FlowTestsBaseclass):
     return fd
 
 
+class CoalescedCollectionTest(test_lib.FlowTestsBaseclass):
+  """Test sources of several artifacts collected by shared flows."""
+
+  def setUp(self):
+    super(CoalescedCollectionTest, self).setUp()
+    # The artifacts are registered directly, so these tests don't need the
+    # artifact repo.
+    test_registry = artifact_registry.ArtifactRegistry()
+    test_registry.ClearRegistry()
+    test_registry._dirty = False  # pylint: disable=protected-access
+    self.registry_stubber = utils.Stubber(artifact_registry, "REGISTRY",
+                                          test_registry)
+    self.registry_stubber.Start()
+
+    for name in ["FakeArtifact", "FakeArtifact2"]:
+      test_registry.RegisterArtifact(
+          artifact_registry.Artifact(
+              name=name, doc="Test artifact.", supported_os=["Linux"]))
+    self.fakeartifact = test_registry.GetArtifact("FakeArtifact")
+    self.fakeartifact2 = test_registry.GetArtifact("FakeArtifact2")
+
+    self.config_overrider = test_lib.ConfigOverrider({
+        "Artifacts.coalesce_collection_requests": True
+    })
+    self.config_overrider.Start()
+
+    with aff4.FACTORY.Open(self.client_id, token=self.token, mode="rw") as fd:
+      fd.Set(fd.Schema.SYSTEM("Linux"))
+      kb = fd.Schema.KNOWLEDGE_BASE()
+      artifact.SetCoreGRRKnowledgeBaseValues(kb, fd)
+      fd.Set(kb)
+
+  def tearDown(self):
+    self.config_overrider.Stop()
+    self.registry_stubber.Stop()
+    super(CoalescedCollectionTest, self).tearDown()
+
+  def _RunSplitArtifacts(self, client_mock, artifact_list):
+    for s in test_lib.TestFlowHelper(
+        "ArtifactCollectorFlow",
+        client_mock,
+        artifact_list=artifact_list,
+        token=self.token,
+        client_id=self.client_id,
+        split_output_by_artifact=True):
+      session_id = s
+
+    results = {}
+    for artifact_name in artifact_list:
+      fd = aff4.FACTORY.Open(
+          session_id.Add("%s_%s" % (flow_runner.RESULTS_SUFFIX,
+                                    artifact_name)),
+          token=self.token)
+      results[artifact_name] = sorted(
+          x.pathspec.CollapsePath() for x in fd)
+    return results
+
+  def testCoalescedSourcesAreSplitByArtifact(self):
+    """Test sources collected by one flow get their own results."""
+    self.fakeartifact.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.DIRECTORY,
+            attributes={"paths": ["/etc/passwd", "/etc/ssh/*"]}))
+    self.fakeartifact2.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.DIRECTORY,
+            attributes={"paths": [r"\var\log\*", "/etc/{lsb-release,*id}"]}))
+    self.fakeartifact2.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.FILE,
+            attributes={"paths": ["/etc/passwd"]}))
+
+    client_mock = action_mocks.FileFinderClientMock()
+    with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.OS,
+                               test_lib.FakeTestDataVFSHandler):
+      with test_lib.Instrument(filesystem.Glob, "Start") as glob_instrument:
+        results = self._RunSplitArtifacts(
+            client_mock, ["FakeArtifact", "FakeArtifact2"])
+
+    # Both directory sources were globbed by a single flow.
+    self.assertEqual(glob_instrument.call_count, 1)
+    self.assertEqual(results["FakeArtifact"],
+                     ["/etc/passwd", "/etc/ssh/sshd_config"])
+    self.assertEqual(results["FakeArtifact2"], [
+        "/etc/lsb-release", "/etc/passwd", "/var/log/auth.log", "/var/log/wtmp"
+    ])
+
+    # Without coalescing, every source calls its own flow.
+    with test_lib.ConfigOverrider({
+        "Artifacts.coalesce_collection_requests": False
+    }):
+      with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.OS,
+                                 test_lib.FakeTestDataVFSHandler):
+        with test_lib.Instrument(filesystem.Glob, "Start") as glob_instrument:
+          self.assertEqual(
+              self._RunSplitArtifacts(client_mock,
+                                      ["FakeArtifact", "FakeArtifact2"]),
+              results)
+    self.assertEqual(glob_instrument.call_count, 2)
+
+  def testCoalescedSourcesWithParentPaths(self):
+    """Test a path is not globbed together with paths below it."""
+    self.fakeartifact.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.DIRECTORY,
+            attributes={"paths": ["/etc/ssh/*"]}))
+    self.fakeartifact2.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.DIRECTORY,
+            attributes={"paths": ["/etc/ssh"]}))
+
+    client_mock = action_mocks.FileFinderClientMock()
+    with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.OS,
+                               test_lib.FakeTestDataVFSHandler):
+      with test_lib.Instrument(filesystem.Glob, "Start") as glob_instrument:
+        results = self._RunSplitArtifacts(
+            client_mock, ["FakeArtifact", "FakeArtifact2"])
+
+    self.assertEqual(glob_instrument.call_count, 2)
+    self.assertEqual(results["FakeArtifact"], ["/etc/ssh/sshd_config"])
+    self.assertEqual(results["FakeArtifact2"], ["/etc/ssh"])
+
+  def testCoalescedRegistrySources(self):
+    """Test registry keys of different artifacts are globbed together."""
+    self.fakeartifact.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.REGISTRY_KEY,
+            attributes={
+                "keys": [r"HKEY_LOCAL_MACHINE\SOFTWARE\ListingTest\*"]
+            }))
+    self.fakeartifact2.sources.append(
+        artifact_registry.ArtifactSource(
+            type=artifact_registry.ArtifactSource.SourceType.REGISTRY_VALUE,
+            attributes={
+                "key_value_pairs": [{
+                    "key": r"HKEY_LOCAL_MACHINE\SOFTWARE\Listing*",
+                    "value": "Value2"
+                }]
+            }))
+
+    client_mock = action_mocks.ActionMock(searching.Find, standard.StatFile)
+    with test_lib.VFSOverrider(rdf_paths.PathSpec.PathType.REGISTRY,
+                               test_lib.FakeRegistryVFSHandler):
+      with test_lib.Instrument(filesystem.Glob, "Start") as glob_instrument:
+        results = self._RunSplitArtifacts(
+            client_mock, ["FakeArtifact", "FakeArtifact2"])
+
+    self.assertEqual(glob_instrument.call_count, 1)
+    self.assertEqual(results["FakeArtifact"], [
+        "/HKEY_LOCAL_MACHINE/SOFTWARE/ListingTest/Value1",
+        "/HKEY_LOCAL_MACHINE/SOFTWARE/ListingTest/Value2"
+    ])
+    self.assertEqual(results["FakeArtifact2"],
+                     ["/HKEY_LOCAL_MACHINE/SOFTWARE/ListingTest/Value2"])
+
+
 def main(argv):
   # Run the full test suite
   test_lib.GrrTestProgram(argv=argv)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Benchmark tests for adding clients to hunts."""
+
+
+from grr.lib import aff4
+from grr.lib import flags
+from grr.lib import flow
+from grr.lib import hunts
+from grr.lib import test_lib
+from grr.lib.hunts import standard
+from grr.lib.rdfvalues import client as rdf_client
+
+
+class BenchmarkHunt(standard.GenericHunt):
+  """A hunt which doesn't do anything on its clients."""
+
+  @flow.StateHandler()
+  def RunClient(self, responses):
+    pass
+
+
+class HuntClientAdmissionBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare adding clients to a hunt one by one and in batches."""
+
+  CLIENT_COUNT = 2000
+
+  def _Benchmark(self, batch_size):
+    client_ids = [
+        rdf_client.ClientURN("C.%016X" % i) for i in xrange(self.CLIENT_COUNT)
+    ]
+    hunt_ids = []
+
+    def StartHunt():
+      with hunts.GRRHunt.StartHunt(
+          hunt_name=BenchmarkHunt.__name__,
+          client_rate=0,
+          client_limit=0,
+          token=self.token) as hunt:
+        hunt.GetRunner().Start()
+      hunt_ids.append(hunt.session_id)
+
+    def StartClients():
+      hunts.GRRHunt.StartClients(hunt_ids[-1], client_ids, token=self.token)
+
+    def ProcessClients():
+      test_lib.MockWorker(token=self.token.SetUID()).Simulate()
+
+    with test_lib.ConfigOverrider({
+        "Hunt.client_admission_batch_size": batch_size
+    }):
+      self.TimeIt(
+          StartClients,
+          name="Queue %d clients, batch size %d" % (self.CLIENT_COUNT,
+                                                    batch_size),
+          pre=StartHunt,
+          repetitions=1)
+      self.TimeIt(
+          ProcessClients,
+          name="Add %d clients, batch size %d" % (self.CLIENT_COUNT,
+                                                  batch_size),
+          repetitions=1)
+
+    hunt = aff4.FACTORY.Open(hunt_ids[-1], token=self.token)
+    self.assertEqual(int(hunt.Get(hunt.Schema.CLIENT_COUNT)), self.CLIENT_COUNT)
+
+  def testAddClientsOneByOne(self):
+    self._Benchmark(1)
+
+  def testAddClientsInBatches(self):
+    self._Benchmark(1000)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -12,6 +12,7 @@ from grr.lib import flow
 
 # These imports populate the GRRHunt registry.
 from grr.lib import hunts
+from grr.lib import queue_manager
 from grr.lib import queues
 from grr.lib import rdfvalue
 from grr.lib import test_lib
@@ -70,13 +71,13 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       # Clean up the foreman to remove any rules.
       with aff4.FACTORY.Open(
           "aff4:/foreman", mode="rw", token=self.token) as foreman:
-        foreman.Set(foreman.Schema.RULES())
+        foreman.SetRules([])
 
     DummyHunt.client_ids = []
 
   def testRuleAdding(self):
     foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-    rules = foreman.Get(foreman.Schema.RULES)
+    rules = foreman.ReadRules()
     # Make sure there are no rules yet in the foreman.
     self.assertEqual(len(rules), 0)
 
@@ -105,7 +106,7 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       hunt.GetRunner().Start()
 
     foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-    rules = foreman.Get(foreman.Schema.RULES)
+    rules = foreman.ReadRules()
 
     # Make sure they were written correctly.
     self.assertEqual(len(rules), 1)
@@ -121,24 +122,21 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       hunt.GetRunner().Start()
 
     foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-    rules = foreman.Get(foreman.Schema.RULES)
+    rules = foreman.ReadRules()
 
     # Still just one rule.
     self.assertEqual(len(rules), 1)
 
   def AddForemanRules(self, to_add):
     foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-    rules = foreman.Get(foreman.Schema.RULES, default=foreman.Schema.RULES())
     for rule in to_add:
-      rules.Append(rule)
-    foreman.Set(foreman.Schema.RULES, rules)
-    foreman.Close()
+      foreman.AddRule(rule)
 
   def testStopping(self):
     """Tests if we can stop a hunt."""
 
     foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-    rules = foreman.Get(foreman.Schema.RULES)
+    rules = foreman.ReadRules()
 
     # Make sure there are no rules yet.
     self.assertEqual(len(rules), 0)
@@ -187,7 +185,7 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       self.AddForemanRules(rules)
 
       foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-      rules = foreman.Get(foreman.Schema.RULES)
+      rules = foreman.ReadRules()
       self.assertEqual(len(rules), 5)
 
       # It should be running.
@@ -197,7 +195,7 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       hunt.Stop()
 
     foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
-    rules = foreman.Get(foreman.Schema.RULES)
+    rules = foreman.ReadRules()
     # The rule for this hunt should be deleted but the rest should be there.
     self.assertEqual(len(rules), 4)
 
@@ -224,7 +222,7 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       runner = hunt.GetRunner()
       self.assertRaises(ValueError, runner.Start)
 
-  def Callback(self, hunt_id, client_id):
+  def Callback(self, hunt_id, client_id, **_):
     self.called.append((hunt_id, client_id))
 
   def testCallback(self, client_limit=None):
@@ -262,6 +260,141 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       self.assertEqual(len(self.called), 1)
       self.assertEqual(self.called[0][1], [client.urn])
 
+  def _StartMonitorHunt(self):
+    client_rule_set = rdf_foreman.ForemanClientRuleSet(rules=[
+        rdf_foreman.ForemanClientRule(
+            rule_type=rdf_foreman.ForemanClientRule.Type.REGEX,
+            regex=rdf_foreman.ForemanRegexClientRule(
+                attribute_name="GRR client", attribute_regex="GRR"))
+    ])
+
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt",
+        client_rule_set=client_rule_set,
+        client_rate=0,
+        token=self.token) as hunt:
+      hunt.GetRunner().Start()
+
+    return hunt.session_id
+
+  def testForemanChecksHuntAssignmentsInOneRoundTrip(self):
+    hunt_ids = [self._StartMonitorHunt() for _ in range(3)]
+    client_ids = self.SetupClients(1)
+
+    stat_calls = []
+    stat = aff4.FACTORY.Stat
+
+    def RecordingStat(urns, token=None):
+      stat_calls.append(list(urns))
+      return stat(urns, token=token)
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    with utils.Stubber(hunts.SampleHunt, "StartClients", self.Callback):
+      with utils.Stubber(aff4.FACTORY, "Stat", RecordingStat):
+        self.called = []
+        foreman.AssignTasksToClient(client_ids[0])
+
+    self.assertEqual(len(stat_calls), 1)
+    self.assertEqual(len(stat_calls[0]), 3)
+    self.assertItemsEqual([hunt_id for hunt_id, _ in self.called], hunt_ids)
+
+  def testForemanBatchesHuntAssignments(self):
+    hunt_id = self._StartMonitorHunt()
+    client_ids = self.SetupClients(5)
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    with test_lib.ConfigOverrider({
+        "Foreman.hunt_assignment_batch_size": 3,
+        "Foreman.hunt_assignment_flush_interval": 3600
+    }):
+      with utils.Stubber(hunts.SampleHunt, "StartClients", self.Callback):
+        self.called = []
+        for client_id in client_ids[:2]:
+          foreman.AssignTasksToClient(client_id)
+        self.assertEqual(self.called, [])
+
+        # The third assignment fills the batch.
+        foreman.AssignTasksToClient(client_ids[2])
+        self.assertEqual(self.called, [(hunt_id, client_ids[:3])])
+
+        self.called = []
+        foreman.AssignTasksToClient(client_ids[3])
+        self.assertEqual(self.called, [])
+        self.assertEqual(foreman.FlushHuntAssignments(), 1)
+        self.assertEqual(self.called, [(hunt_id, client_ids[3:4])])
+
+  def testForemanFlushesHuntAssignmentsAfterInterval(self):
+    hunt_id = self._StartMonitorHunt()
+    client_ids = self.SetupClients(2)
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    with test_lib.ConfigOverrider({
+        "Foreman.hunt_assignment_batch_size": 100,
+        "Foreman.hunt_assignment_flush_interval": 10
+    }):
+      self.called = []
+      with utils.Stubber(hunts.SampleHunt, "StartClients", self.Callback):
+        with test_lib.FakeTime(1000):
+          foreman.AssignTasksToClient(client_ids[0])
+          # A buffered assignment counts as assigned.
+          foreman.AssignTasksToClient(client_ids[0])
+        self.assertEqual(self.called, [])
+
+        with test_lib.FakeTime(1011):
+          foreman.AssignTasksToClient(client_ids[1])
+        self.assertEqual(self.called, [(hunt_id, client_ids[:1])])
+
+  def testLostHuntAssignmentsAreAssignedAgain(self):
+    hunt_id = self._StartMonitorHunt()
+    client_ids = self.SetupClients(2)
+
+    with test_lib.ConfigOverrider({
+        "Foreman.hunt_assignment_batch_size": 3,
+        "Foreman.hunt_assignment_flush_interval": 3600
+    }):
+      self.called = []
+      with utils.Stubber(hunts.SampleHunt, "StartClients", self.Callback):
+        # The foreman is dropped with the assignment still buffered.
+        foreman = aff4.FACTORY.Open(
+            "aff4:/foreman", mode="rw", token=self.token)
+        foreman.AssignTasksToClient(client_ids[0])
+        del foreman
+        self.assertEqual(self.called, [])
+
+        foreman = aff4.FACTORY.Open(
+            "aff4:/foreman", mode="rw", token=self.token)
+        foreman.AssignTasksToClient(client_ids[0])
+        foreman.AssignTasksToClient(client_ids[1])
+        self.assertEqual(foreman.FlushHuntAssignments(), 2)
+        self.assertEqual(self.called, [(hunt_id, client_ids)])
+
+        # Once scheduled, the clients are not assigned again.
+        self.called = []
+        foreman = aff4.FACTORY.Open(
+            "aff4:/foreman", mode="rw", token=self.token)
+        for client_id in client_ids:
+          foreman.AssignTasksToClient(client_id)
+        self.assertEqual(foreman.FlushHuntAssignments(), 0)
+        self.assertEqual(self.called, [])
+
+  def testBatchedHuntAssignmentsStartClients(self):
+    hunt_id = self._StartMonitorHunt()
+    client_ids = self.SetupClients(3)
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    with test_lib.ConfigOverrider({"Foreman.hunt_assignment_batch_size": 3}):
+      for client_id in client_ids:
+        foreman.AssignTasksToClient(client_id)
+
+    test_lib.TestHuntHelper(None, client_ids, False, self.token)
+
+    for client_id in client_ids:
+      flows = list(
+          aff4.FACTORY.Open(
+              client_id.Add("flows"), token=self.token).ListChildren())
+      self.assertEqual(len(flows), 1)
+      self.assertIn(hunt_id.Basename(), str(flows[0]))
+
   def testStartClients(self):
     with hunts.GRRHunt.StartHunt(
         hunt_name="SampleHunt", client_rate=0, token=self.token) as hunt:
@@ -286,6 +419,45 @@ class HuntTest(test_lib.FlowTestsBaseclass):
     self.assertEqual(len(flows), 1)
     self.assertIn(hunt.session_id.Basename(), str(flows[0]))
 
+  def testStartClientsQueuesOneRequestPerBatch(self):
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt", client_rate=0, token=self.token) as hunt:
+      hunt.GetRunner().Start()
+
+    client_ids = self.SetupClients(5)
+    with test_lib.ConfigOverrider({"Hunt.client_admission_batch_size": 2}):
+      hunts.GRRHunt.StartClients(hunt.session_id, client_ids)
+
+    manager = queue_manager.QueueManager(token=self.token)
+    requests = list(manager.FetchRequestsAndResponses(hunt.session_id))
+    self.assertEqual(len(requests), 3)
+    for request, responses in requests:
+      self.assertEqual(request.next_state, "AddClients")
+      self.assertEqual(len(responses), 2)
+
+    test_lib.TestHuntHelper(None, client_ids, False, self.token)
+
+    hunt_obj = aff4.FACTORY.Open(
+        hunt.session_id, age=aff4.ALL_TIMES, token=self.token)
+    self.assertEqual(hunt_obj.Get(hunt_obj.Schema.CLIENT_COUNT), 5)
+    self.assertItemsEqual(hunt_obj.GetClients(), client_ids)
+
+  def testClientLimitIsEnforcedWithinABatch(self):
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt", client_rate=0, client_limit=3,
+        token=self.token) as hunt:
+      hunt.GetRunner().Start()
+
+    client_ids = self.SetupClients(5)
+    hunts.GRRHunt.StartClients(hunt.session_id, client_ids)
+    test_lib.TestHuntHelper(None, client_ids, False, self.token)
+
+    hunt_obj = aff4.FACTORY.Open(
+        hunt.session_id, age=aff4.ALL_TIMES, token=self.token)
+    self.assertEqual(hunt_obj.Get(hunt_obj.Schema.CLIENT_COUNT), 3)
+    self.assertItemsEqual(hunt_obj.GetClients(), client_ids[:3])
+    self.assertEqual(hunt_obj.Get(hunt_obj.Schema.STATE), "PAUSED")
+
   def testProcessing(self):
     """This tests running the hunt on some clients."""
 
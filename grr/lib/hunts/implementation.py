@@ -6,6 +6,7 @@ of clients, managing these flows, collecting and presenting the combined results
 of all these flows.
 """
 
+import hashlib
 import threading
 import traceback
 
@@ -64,6 +65,29 @@ class PluginStatusCollection(sequential_collection.IndexedSequentialCollection):
   RDF_TYPE = output_plugin_lib.OutputPluginBatchProcessingStatus
 
 
+class ClientResourcesCollection(sequential_collection.SequentialCollection):
+  RDF_TYPE = rdf_client.ClientResources
+
+
+class HuntResourceUsageStats(aff4.AFF4Object):
+  """Client resource usage of a hunt, aggregated from its usage log."""
+
+  class SchemaCls(aff4.AFF4Object.SchemaCls):
+    """AFF4 schema for HuntResourceUsageStats."""
+
+    USAGE_STATS = aff4.Attribute(
+        "aff4:usage_stats",
+        rdf_stats.ClientResourcesStats,
+        "Aggregated client resource usage.",
+        versioned=False)
+
+    PROCESSED_UNTIL = aff4.Attribute(
+        "aff4:usage_processed_until",
+        rdfvalue.RDFDatetime,
+        "Usage log entries up to this time are aggregated.",
+        versioned=False)
+
+
 class HuntRunnerError(Exception):
   """Raised when there is an error during state transitions."""
 
@@ -504,54 +528,69 @@ class HuntRunner(object):
     """Flows can call this method to set a status message visible to users."""
     self.Log(format_str, *args)
 
-  def _AddClient(self, client_id):
-    next_client_due = self.hunt_obj.context.next_client_due
+  def _AddClients(self, client_ids):
+    """Registers clients with the hunt and runs them."""
     if self.runner_args.client_rate > 0:
-      self.hunt_obj.context.next_client_due = (
-          next_client_due + 60.0 / self.runner_args.client_rate)
-      self.CallState(
-          messages=[client_id],
-          next_state="RegisterClient",
-          client_id=client_id,
-          start_time=next_client_due)
+      for client_id in client_ids:
+        next_client_due = self.hunt_obj.context.next_client_due
+        self.hunt_obj.context.next_client_due = (
+            next_client_due + 60.0 / self.runner_args.client_rate)
+        self.CallState(
+            messages=[client_id],
+            next_state="RegisterClient",
+            client_id=client_id,
+            start_time=next_client_due)
     else:
-      self._RegisterAndRunClient(client_id)
+      self.hunt_obj.RegisterClients(client_ids)
+      for client_id in client_ids:
+        self.RunStateMethod("RunClient", direct_response=[client_id])
 
   def _RegisterAndRunClient(self, client_id):
     self.hunt_obj.RegisterClient(client_id)
     self.RunStateMethod("RunClient", direct_response=[client_id])
 
-  def _Process(self, request, responses, thread_pool=None, events=None):
-    """Hunts process all responses concurrently in a threadpool."""
-    # This function is called and runs within the main processing thread. We do
-    # not need to lock the hunt object while running in this method.
-    if request.next_state == "AddClient":
-      if not self.IsHuntStarted():
-        logging.debug(
-            "Unable to start client %s on hunt %s which is in state %s",
-            request.client_id, self.session_id,
-            self.hunt_obj.Get(self.hunt_obj.Schema.STATE))
-        return
-
-      # Get the client count.
-      client_count = int(
-          self.hunt_obj.Get(self.hunt_obj.Schema.CLIENT_COUNT, 0))
+  def _AdmitClients(self, client_ids):
+    """Adds clients to the hunt as long as the client limit allows."""
+    if not self.IsHuntStarted():
+      logging.debug("Unable to start %d clients on hunt %s which is in state %s",
+                    len(client_ids), self.session_id,
+                    self.hunt_obj.Get(self.hunt_obj.Schema.STATE))
+      return
 
-      # Stop the hunt if we exceed the client limit.
-      if 0 < self.runner_args.client_limit <= client_count:
-        # Remove our rules from the foreman so we dont get more clients sent to
-        # this hunt. Hunt will be paused.
-        self.Pause()
+    # Get the client count.
+    client_count = int(self.hunt_obj.Get(self.hunt_obj.Schema.CLIENT_COUNT, 0))
 
-        # Ignore this client since it had gone over the limit.
-        return
+    admitted = client_ids
+    if self.runner_args.client_limit > 0:
+      admitted = client_ids[:max(
+          0, self.runner_args.client_limit - client_count)]
 
+    if admitted:
       # Update the client count.
-      self.hunt_obj.Set(self.hunt_obj.Schema.CLIENT_COUNT(client_count + 1))
+      self.hunt_obj.Set(
+          self.hunt_obj.Schema.CLIENT_COUNT(client_count + len(admitted)))
 
-      # Add client to list of clients and optionally run it
+      # Add clients to list of clients and optionally run them
       # (if client_rate == 0).
-      self._AddClient(request.client_id)
+      self._AddClients(admitted)
+
+    # Stop the hunt if we exceed the client limit.
+    if len(admitted) < len(client_ids):
+      # Remove our rules from the foreman so we dont get more clients sent to
+      # this hunt. Hunt will be paused. The clients over the limit are ignored.
+      self.Pause()
+
+  def _Process(self, request, responses, thread_pool=None, events=None):
+    """Hunts process all responses concurrently in a threadpool."""
+    # This function is called and runs within the main processing thread. We do
+    # not need to lock the hunt object while running in this method.
+    if request.next_state == "AddClients":
+      self._AdmitClients(list(responses[0].payload.client_ids))
+      return
+
+    if request.next_state == "AddClient":
+      # Requests for single clients, as queued by older versions.
+      self._AdmitClients([request.client_id])
       return
 
     if request.next_state == "RegisterClient":
@@ -636,6 +675,7 @@ class HuntRunner(object):
         expires=args.expiry_time.Expiry(),
         start_time=rdfvalue.RDFDatetime.Now(),
         usage_stats=rdf_stats.ClientResourcesStats(),
+        client_stats=rdf_hunts.HuntClientStats(),
         remaining_cpu_quota=args.cpu_limit,)
 
     return context
@@ -711,19 +751,15 @@ class HuntRunner(object):
         mode="rw",
         token=self.token,
         aff4_type=aff4_grr.GRRForeman) as foreman:
-      foreman_rules = foreman.Get(foreman.Schema.RULES,
-                                  default=foreman.Schema.RULES())
-      foreman_rules.Append(foreman_rule)
-      foreman.Set(foreman_rules)
+      foreman.AddRule(foreman_rule)
 
   def _RemoveForemanRule(self):
     with aff4.FACTORY.Open(
-        "aff4:/foreman", mode="rw", token=self.token) as foreman:
-      aff4_rules = foreman.Get(foreman.Schema.RULES)
-      aff4_rules = foreman.Schema.RULES(
-          # Remove those rules which fire off this hunt id.
-          [r for r in aff4_rules if r.hunt_id != self.session_id])
-      foreman.Set(aff4_rules)
+        "aff4:/foreman",
+        mode="rw",
+        token=self.token,
+        aff4_type=aff4_grr.GRRForeman) as foreman:
+      foreman.RemoveHuntRules(self.session_id)
 
   def _Complete(self):
     """Marks the hunt as completed."""
@@ -934,6 +970,9 @@ class GRRHunt(flow.FlowBase):
 
   args_type = None
 
+  # Usage log entries younger than this are not aggregated yet.
+  RESOURCE_USAGE_SAFETY_MARGIN = rdfvalue.Duration("1m")
+
   def Initialize(self):
     super(GRRHunt, self).Initialize()
     # Hunts run in multiple threads so we need to protect access.
@@ -977,6 +1016,14 @@ class GRRHunt(flow.FlowBase):
   def clients_errors_collection_urn(self):
     return self.urn.Add("ErrorClients")
 
+  @property
+  def resource_usage_collection_urn(self):
+    return self.urn.Add("ResourceUsage")
+
+  @property
+  def resource_usage_stats_urn(self):
+    return self.urn.Add("ResourceUsageStats")
+
   @property
   def clients_with_results_collection_urn(self):
     return self.urn.Add("ClientsWithResults")
@@ -1009,8 +1056,9 @@ class GRRHunt(flow.FlowBase):
   def creator(self):
     return self.context.creator
 
-  def _AddURNToCollection(self, urn, collection_urn):
-    ClientUrnCollection.StaticAdd(collection_urn, self.token, urn)
+  def _AddURNToCollection(self, urn, collection_urn, mutation_pool=None):
+    ClientUrnCollection.StaticAdd(
+        collection_urn, self.token, urn, mutation_pool=mutation_pool)
 
   def _AddHuntErrorToCollection(self, error, collection_urn):
     HuntErrorCollection.StaticAdd(collection_urn, self.token, error)
@@ -1023,11 +1071,40 @@ class GRRHunt(flow.FlowBase):
     return client_id.Add("flows").Add("%s:hunt" % (self.urn.Basename()))
 
   def RegisterClient(self, client_urn):
-    self._AddURNToCollection(client_urn, self.all_clients_collection_urn)
+    self.RegisterClients([client_urn])
+
+  def GetClientStats(self):
+    """Returns the hunt's client counters and histograms.
+
+    Returns:
+      A HuntClientStats object or None for hunts created before client stats
+      were maintained.
+    """
+    if self.context is not None and self.context.HasField("client_stats"):
+      return self.context.client_stats
+
+  def RegisterClients(self, client_urns):
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      for client_urn in client_urns:
+        self._AddURNToCollection(
+            client_urn,
+            self.all_clients_collection_urn,
+            mutation_pool=mutation_pool)
+
+    client_stats = self.GetClientStats()
+    if client_stats is not None and client_urns:
+      with self.lock:
+        client_stats.RegisterStartedClients(
+            rdfvalue.RDFDatetime.Now(), count=len(client_urns))
 
   def RegisterCompletedClient(self, client_urn):
     self._AddURNToCollection(client_urn, self.completed_clients_collection_urn)
 
+    client_stats = self.GetClientStats()
+    if client_stats is not None:
+      with self.lock:
+        client_stats.RegisterCompletedClients(rdfvalue.RDFDatetime.Now())
+
   def RegisterClientWithResults(self, client_urn):
     self._AddURNToCollection(client_urn,
                              self.clients_with_results_collection_urn)
@@ -1039,6 +1116,96 @@ class GRRHunt(flow.FlowBase):
 
     self._AddHuntErrorToCollection(error, self.clients_errors_collection_urn)
 
+    client_stats = self.GetClientStats()
+    if client_stats is not None:
+      with self.lock:
+        client_stats.clients_errors_count += 1
+
+  def RegisterClientResources(self, client_resources):
+    """Appends a client's resource usage to the hunt's usage log.
+
+    The log is aggregated by AggregateResourceUsage, so registering usage
+    doesn't modify the hunt object.
+
+    Args:
+      client_resources: A ClientResources object.
+    """
+    ClientResourcesCollection.StaticAdd(self.resource_usage_collection_urn,
+                                        self.token, client_resources)
+
+  def _RegisterLoggedResources(self, usage_stats, after=None, until=None):
+    """Registers usage log entries written in (after, until] with stats."""
+    collection = aff4.FACTORY.Create(
+        self.resource_usage_collection_urn,
+        ClientResourcesCollection,
+        mode="r",
+        token=self.token)
+
+    after_timestamp = None
+    if after is not None:
+      after_timestamp = after.AsMicroSecondsFromEpoch()
+
+    for (timestamp, _), client_resources in collection.Scan(
+        after_timestamp=after_timestamp, include_suffix=True):
+      if until is not None and timestamp > until.AsMicroSecondsFromEpoch():
+        break
+      # Worst performers are reported like the usage was never stored.
+      client_resources.age = 0
+      usage_stats.RegisterResources(client_resources)
+
+  def AggregateResourceUsage(self):
+    """Aggregates new usage log entries into the hunt's usage stats.
+
+    Entries younger than RESOURCE_USAGE_SAFETY_MARGIN are left for the next
+    run, so entries still being written are not skipped.
+
+    Raises:
+      aff4.LockError: if the usage stats are being aggregated elsewhere.
+    """
+    until = rdfvalue.RDFDatetime.Now() - self.RESOURCE_USAGE_SAFETY_MARGIN
+    with aff4.FACTORY.OpenWithLock(
+        self.resource_usage_stats_urn,
+        blocking=False,
+        lease_time=600,
+        token=self.token) as stats_obj:
+      if not isinstance(stats_obj, HuntResourceUsageStats):
+        # Hunts created before usage was logged have no usage log.
+        return
+
+      usage_stats = stats_obj.Get(stats_obj.Schema.USAGE_STATS)
+      if usage_stats is None:
+        usage_stats = self.context.usage_stats.Copy()
+
+      self._RegisterLoggedResources(
+          usage_stats,
+          after=stats_obj.Get(stats_obj.Schema.PROCESSED_UNTIL),
+          until=until)
+
+      stats_obj.Set(stats_obj.Schema.USAGE_STATS(usage_stats))
+      stats_obj.Set(stats_obj.Schema.PROCESSED_UNTIL(until))
+
+  def GetClientResourcesStats(self):
+    """Returns the client resource usage stats of this hunt.
+
+    Usage log entries not aggregated yet are included in the result.
+
+    Returns:
+      A ClientResourcesStats object.
+    """
+    stats_obj = aff4.FACTORY.Open(
+        self.resource_usage_stats_urn, mode="r", token=self.token)
+    if not isinstance(stats_obj, HuntResourceUsageStats):
+      # Hunts created before usage was logged keep their stats in the context.
+      return self.context.usage_stats
+
+    usage_stats = stats_obj.Get(stats_obj.Schema.USAGE_STATS)
+    if usage_stats is None:
+      usage_stats = self.context.usage_stats.Copy()
+
+    self._RegisterLoggedResources(
+        usage_stats, after=stats_obj.Get(stats_obj.Schema.PROCESSED_UNTIL))
+    return usage_stats
+
   def OnDelete(self, deletion_pool=None):
     super(GRRHunt, self).OnDelete(deletion_pool=deletion_pool)
 
@@ -1133,7 +1300,7 @@ class GRRHunt(flow.FlowBase):
     return hunt_obj
 
   @classmethod
-  def StartClients(cls, hunt_id, client_ids, token=None):
+  def StartClients(cls, hunt_id, client_ids, token=None, flow_manager=None):
     """This method is called by the foreman for each client it discovers.
 
     Note that this function is performance sensitive since it is called by the
@@ -1143,36 +1310,53 @@ class GRRHunt(flow.FlowBase):
       hunt_id: The hunt to schedule.
       client_ids: List of clients that should be added to the hunt.
       token: An optional access token to use.
+      flow_manager: An optional QueueManager to queue the requests in. If
+          given, the caller is responsible for flushing it, so clients of
+          several hunts can be scheduled in one transaction.
     """
-    token = token or access_control.ACLToken(username="Hunt", reason="hunting")
-
-    with queue_manager.QueueManager(token=token) as flow_manager:
-      for client_id in client_ids:
-        # Now we construct a special response which will be sent to the hunt
-        # flow. Randomize the request_id so we do not overwrite other messages
-        # in the queue.
-        state = rdf_flows.RequestState(
-            id=utils.PRNG.GetULong(),
-            session_id=hunt_id,
-            client_id=client_id,
-            next_state="AddClient")
-
-        # Queue the new request.
-        flow_manager.QueueRequest(hunt_id, state)
-
-        # Send a response.
-        msg = rdf_flows.GrrMessage(
-            session_id=hunt_id,
-            request_id=state.id,
-            response_id=1,
-            auth_state=rdf_flows.GrrMessage.AuthorizationState.AUTHENTICATED,
-            type=rdf_flows.GrrMessage.Type.STATUS,
-            payload=rdf_flows.GrrStatus())
-
-        flow_manager.QueueResponse(hunt_id, msg)
+    if flow_manager is None:
+      token = token or access_control.ACLToken(
+          username="Hunt", reason="hunting")
+      with queue_manager.QueueManager(token=token) as flow_manager:
+        cls.StartClients(hunt_id, client_ids, flow_manager=flow_manager)
+      return
 
-        # And notify the worker about it.
-        flow_manager.QueueNotification(session_id=hunt_id)
+    batch_size = config_lib.CONFIG["Hunt.client_admission_batch_size"]
+    for batch in utils.Grouper(client_ids, max(batch_size, 1)):
+      # Now we construct a special request which will be processed by the
+      # hunt. Randomize the request_id so we do not overwrite other messages
+      # in the queue.
+      state = rdf_flows.RequestState(
+          id=utils.PRNG.GetULong(), session_id=hunt_id, next_state="AddClients")
+
+      # Queue the new request.
+      flow_manager.QueueRequest(hunt_id, state)
+
+      # The clients are sent as the single response to the request, followed
+      # by the status.
+      flow_manager.QueueResponse(hunt_id,
+                                 rdf_flows.GrrMessage(
+                                     session_id=hunt_id,
+                                     request_id=state.id,
+                                     response_id=1,
+                                     auth_state=rdf_flows.GrrMessage.
+                                     AuthorizationState.AUTHENTICATED,
+                                     type=rdf_flows.GrrMessage.Type.MESSAGE,
+                                     payload=rdf_hunts.HuntClientBatch(
+                                         client_ids=batch)))
+      flow_manager.QueueResponse(hunt_id,
+                                 rdf_flows.GrrMessage(
+                                     session_id=hunt_id,
+                                     request_id=state.id,
+                                     response_id=2,
+                                     auth_state=rdf_flows.GrrMessage.
+                                     AuthorizationState.AUTHENTICATED,
+                                     type=rdf_flows.GrrMessage.Type.STATUS,
+                                     payload=rdf_flows.GrrStatus()))
+
+    # And notify the worker about it.
+    if client_ids:
+      flow_manager.QueueNotification(session_id=hunt_id)
 
   def Run(self):
     """A shortcut method for starting the hunt."""
@@ -1186,6 +1370,22 @@ class GRRHunt(flow.FlowBase):
     """A shortcut method for stopping the hunt."""
     self.GetRunner().Stop()
 
+  def GetResultFingerprint(self, payload):
+    """Returns the fingerprint used to deduplicate a result payload.
+
+    Results with equal fingerprints are stored only once when the hunt runs
+    with deduplicate_results set. Hunts can override this to treat results
+    differing only in irrelevant fields as duplicates.
+
+    Args:
+      payload: The RDFValue returned by a client.
+
+    Returns:
+      A string which is safe to use as an urn component.
+    """
+    return hashlib.sha256(
+        payload.__class__.__name__ + payload.SerializeToString()).hexdigest()
+
   def AddResultsToCollection(self, responses, client_id):
     if responses.success:
       with self.lock:
@@ -1196,13 +1396,21 @@ class GRRHunt(flow.FlowBase):
                 payload=response, source=client_id) for response in responses
         ]
 
-        for msg in msgs:
-          hunts_results.HuntResultCollection.StaticAdd(
-              self.results_collection_urn, self.token, msg)
-
-        for msg in msgs:
-          multi_type_collection.MultiTypeCollection.StaticAdd(
-              self.multi_type_output_urn, self.token, msg)
+        if self.runner_args.deduplicate_results:
+          # Full payloads are not kept per type, otherwise every result would
+          # still be stored once per client.
+          for msg in msgs:
+            hunts_results.HuntResultCollection.StaticAddPayloadReference(
+                self.results_collection_urn, self.token, msg,
+                self.GetResultFingerprint(msg.payload))
+        else:
+          for msg in msgs:
+            hunts_results.HuntResultCollection.StaticAdd(
+                self.results_collection_urn, self.token, msg)
+
+          for msg in msgs:
+            multi_type_collection.MultiTypeCollection.StaticAdd(
+                self.multi_type_output_urn, self.token, msg)
 
         if responses:
           self.RegisterClientWithResults(client_id)
@@ -1312,6 +1520,14 @@ class GRRHunt(flow.FlowBase):
       state = self._SetupOutputPluginState()
       results_metadata.Set(results_metadata.Schema.OUTPUT_PLUGINS(state))
 
+    with aff4.FACTORY.Create(
+        self.resource_usage_stats_urn,
+        HuntResourceUsageStats,
+        mutation_pool=mutation_pool,
+        mode="w",
+        token=self.token):
+      pass
+
     for urn, collection_type in [
         # Collection for results.
         (self.results_collection_urn, hunts_results.HuntResultCollection),
@@ -1330,6 +1546,9 @@ class GRRHunt(flow.FlowBase):
         # Collection for errors.
         (self.clients_errors_collection_urn, HuntErrorCollection),
 
+        # Collection for per-client resource usage.
+        (self.resource_usage_collection_urn, ClientResourcesCollection),
+
         # Collections for PluginStatus messages.
         (self.output_plugins_status_collection_urn, PluginStatusCollection),
         (self.output_plugins_errors_collection_urn, PluginStatusCollection),
@@ -1368,6 +1587,11 @@ class GRRHunt(flow.FlowBase):
     """
 
   def GetClientsCounts(self):
+    client_stats = self.GetClientStats()
+    if client_stats is not None:
+      return (client_stats.clients_count, client_stats.completed_clients_count,
+              client_stats.clients_errors_count)
+
     collections = aff4.FACTORY.MultiOpen(
         [
             self.all_clients_collection_urn,
@@ -3,12 +3,14 @@
 """
 
 import logging
+import threading
 
 from grr.lib import aff4
 from grr.lib import flow
 from grr.lib import output_plugin
 from grr.lib import rdfvalue
 from grr.lib import stats
+from grr.lib import threadpool
 from grr.lib import utils
 
 from grr.lib.aff4_objects import cronjobs
@@ -57,6 +59,7 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
   args_type = ProcessHuntResultCollectionsCronFlowArgs
 
   DEFAULT_BATCH_SIZE = 5000
+  DEFAULT_MAX_RESULTS_PER_HUNT = 50000
 
   def CheckIfRunningTooLong(self):
     if self.args.max_running_time:
@@ -100,8 +103,9 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
       except Exception as e:  # pylint: disable=broad-except
         logging.exception("Error processing hunt results: hunt %s, "
                           "plugin %s", hunt_urn, utils.SmartStr(plugin))
-        self.Log("Error processing hunt results (hunt %s, "
-                 "plugin %s): %s" % (hunt_urn, utils.SmartStr(plugin), e))
+        with self.processing_lock:
+          self.Log("Error processing hunt results (hunt %s, "
+                   "plugin %s): %s" % (hunt_urn, utils.SmartStr(plugin), e))
         stats.STATS.IncrementCounter(
             "hunt_output_plugin_errors", fields=[plugin_def.plugin_name])
 
@@ -124,18 +128,53 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
             mode="w",
             token=self.token).Add(plugin_status)
 
-  def ProcessOneHunt(self, exceptions_by_hunt):
-    """Reads results for one hunt and process them."""
+  def ClaimHuntResults(self, exclude_collections=None):
+    """Claims unprocessed results of one hunt.
+
+    Args:
+      exclude_collections: Result collections of hunts which shouldn't be
+        picked.
+
+    Returns:
+      A pair (collection, results) as returned by
+      HuntResultQueue.ClaimNotificationsForCollection.
+    """
     hunt_results_urn, results = (
         hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
             start_time=self.args.start_processing_time,
             token=self.token,
-            lease_time=self.lifetime))
+            lease_time=self.lifetime,
+            exclude_collections=exclude_collections,
+            limit=self._MaxResultsPerHunt()))
     logging.debug("Found %d results for hunt %s",
                   len(results), hunt_results_urn)
-    if not results:
-      return 0
 
+    if results:
+      oldest = min(timestamp for _, timestamp, _ in results)
+      lag = rdfvalue.RDFDatetime.Now().AsMicroSecondsFromEpoch() - oldest
+      stats.STATS.SetGaugeValue(
+          "hunt_results_processing_lag",
+          lag / 1e6,
+          fields=[self._HuntId(hunt_results_urn)])
+
+    return hunt_results_urn, results
+
+  def _HuntId(self, hunt_results_urn):
+    return rdfvalue.RDFURN(hunt_results_urn.Dirname()).Basename()
+
+  def _MaxResultsPerHunt(self):
+    return self.args.max_results_per_hunt or self.DEFAULT_MAX_RESULTS_PER_HUNT
+
+  def ProcessHuntResults(self, hunt_results_urn, results):
+    """Runs the output plugins of a hunt on claimed results.
+
+    Args:
+      hunt_results_urn: The urn of the hunt's result collection.
+      results: A list of claimed results as returned by ClaimHuntResults.
+
+    Returns:
+      A dict mapping plugin descriptors to lists of exceptions they raised.
+    """
     hunt_urn = rdfvalue.RDFURN(hunt_results_urn.Dirname())
     batch_size = self.args.batch_size or self.DEFAULT_BATCH_SIZE
     metadata_urn = hunt_urn.Add("ResultsMetadata")
@@ -152,16 +191,18 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
         num_processed = int(
             metadata_obj.Get(metadata_obj.Schema.NUM_PROCESSED_RESULTS))
         for batch in utils.Grouper(results, batch_size):
-          results = list(
+          batch_results = list(
               collection_obj.MultiResolve([(ts, suffix)
                                            for (_, ts, suffix) in batch]))
-          self.RunPlugins(hunt_urn, used_plugins, results, exceptions_by_plugin)
+          self.RunPlugins(hunt_urn, used_plugins, batch_results,
+                          exceptions_by_plugin)
 
           hunts_results.HuntResultQueue.DeleteNotifications(
               [record_id for (record_id, _, _) in batch], token=self.token)
           num_processed += len(batch)
           num_processed_for_hunt += len(batch)
-          self.HeartBeat()
+          with self.processing_lock:
+            self.HeartBeat()
           collection_obj.UpdateLease(600)
           metadata_obj.Set(
               metadata_obj.Schema.NUM_PROCESSED_RESULTS(num_processed))
@@ -174,27 +215,112 @@ class ProcessHuntResultCollectionsCronFlow(cronjobs.SystemCronFlow):
         metadata_obj.Set(
             metadata_obj.Schema.NUM_PROCESSED_RESULTS(num_processed))
 
-    if exceptions_by_plugin:
-      for plugin, exceptions in exceptions_by_plugin.items():
-        exceptions_by_hunt.setdefault(hunt_urn, {}).setdefault(
-            plugin, []).extend(exceptions)
+    # All results the hunt had when they were claimed are processed now.
+    if num_processed_for_hunt < self._MaxResultsPerHunt():
+      stats.STATS.SetGaugeValue(
+          "hunt_results_processing_lag", 0.0, fields=[hunt_urn.Basename()])
 
     logging.debug("Processed %d results.", num_processed_for_hunt)
-    return len(results)
+    return exceptions_by_plugin
 
   @flow.StateHandler()
   def Start(self):
+    """Processes hunt results until all are processed or time runs out.
+
+    Hunts are served round robin: every hunt with results gets at most
+    max_results_per_hunt results processed before any hunt is served again.
+    With a threadpool_size, up to that many hunts are processed in parallel
+    and no further results are claimed while all threads are busy.
+    """
     self.start_time = rdfvalue.RDFDatetime.Now()
+    self.processing_lock = threading.RLock()
 
     exceptions_by_hunt = {}
     if not self.args.max_running_time:
       self.args.max_running_time = rdfvalue.Duration("%ds" % int(
           ProcessHuntResultCollectionsCronFlow.lifetime.seconds * 0.6))
 
-    while not self.CheckIfRunningTooLong():
-      count = self.ProcessOneHunt(exceptions_by_hunt)
-      if not count:
-        break
+    threadpool_size = self.args.threadpool_size
+    pool = None
+    if threadpool_size:
+      # Every run gets its own unnamed pool. A shared pool could be stopped by
+      # an overlapping run while it is still in use, and would keep the size
+      # of whichever run created it.
+      pool = threadpool.ThreadPool(None, threadpool_size)
+      pool.Start()
+
+    # Result collections being processed and collections which had their turn
+    # in the current round.
+    in_flight = set()
+    served = set()
+    processed = set()
+    finished = threading.Condition(self.processing_lock)
+
+    def ProcessHunt(hunt_results_urn, results):
+      try:
+        exceptions_by_plugin = self.ProcessHuntResults(hunt_results_urn,
+                                                       results)
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception("Error processing results of %s", hunt_results_urn)
+        exceptions_by_plugin = {None: [e]}
+
+      with finished:
+        hunt_urn = rdfvalue.RDFURN(hunt_results_urn.Dirname())
+        for plugin, exceptions in exceptions_by_plugin.items():
+          exceptions_by_hunt.setdefault(hunt_urn, {}).setdefault(
+              plugin, []).extend(exceptions)
+
+        in_flight.discard(hunt_results_urn)
+        finished.notify()
+
+    try:
+      while not self.CheckIfRunningTooLong():
+        with finished:
+          while len(in_flight) >= max(threadpool_size, 1):
+            finished.wait()
+          exclude_collections = in_flight | served
+
+        hunt_results_urn, results = self.ClaimHuntResults(
+            exclude_collections=exclude_collections)
+        if not results:
+          if not exclude_collections:
+            # All results are processed.
+            for hunt_results_urn in processed:
+              stats.STATS.SetGaugeValue(
+                  "hunt_results_processing_lag",
+                  0.0,
+                  fields=[self._HuntId(hunt_results_urn)])
+            break
+
+          if served - in_flight:
+            # Every hunt had its turn, start the next round.
+            served.clear()
+            continue
+
+          # Only hunts being processed have results left, wait for one of
+          # them to finish.
+          with finished:
+            while in_flight and exclude_collections <= in_flight:
+              finished.wait()
+            served &= in_flight
+          continue
+
+        served.add(hunt_results_urn)
+        processed.add(hunt_results_urn)
+        with finished:
+          in_flight.add(hunt_results_urn)
+
+        if pool:
+          pool.AddTask(
+              target=ProcessHunt,
+              args=(hunt_results_urn, results),
+              name="process_%s" % hunt_results_urn,
+              inline=False)
+        else:
+          ProcessHunt(hunt_results_urn, results)
+    finally:
+      if pool:
+        pool.Stop()
 
     if exceptions_by_hunt:
       e = ResultsProcessingError()
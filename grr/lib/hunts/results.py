@@ -4,10 +4,13 @@
 
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import rdfvalue
 from grr.lib import registry
+from grr.lib import utils
 from grr.lib.aff4_objects import queue as aff4_queue
 from grr.lib.aff4_objects import sequential_collection
+from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import jobs_pb2
 
@@ -16,6 +19,10 @@ class HuntResultNotification(rdf_structs.RDFProtoStruct):
   protobuf = jobs_pb2.HuntResultNotification
 
 
+class HuntResultPayloadReference(rdf_structs.RDFProtoStruct):
+  protobuf = jobs_pb2.HuntResultPayloadReference
+
+
 RESULT_NOTIFICATION_QUEUE = rdfvalue.RDFURN("aff4:/hunt_results_queue")
 
 
@@ -28,7 +35,9 @@ class HuntResultQueue(aff4_queue.Queue):
                                       token=None,
                                       start_time=None,
                                       lease_time=200,
-                                      collection=None):
+                                      collection=None,
+                                      exclude_collections=None,
+                                      limit=100000):
     """Return unclaimed hunt result notifications for collection.
 
     Args:
@@ -43,6 +52,11 @@ class HuntResultQueue(aff4_queue.Queue):
       collection: The urn of the collection to find notifications for. If unset,
         the earliest (unclaimed) notification will determine the collection.
 
+      exclude_collections: A collection of collection urns to skip when the
+        collection is determined by the earliest notification.
+
+      limit: The maximum number of notifications to claim.
+
     Returns:
       A pair (collection, results) where collection is the collection that
       notifications were retrieved for and results is a list of tuples (id,
@@ -54,15 +68,19 @@ class HuntResultQueue(aff4_queue.Queue):
 
     class CollectionFilter(object):
 
-      def __init__(self, collection):
+      def __init__(self, collection, exclude_collections):
         self.collection = collection
+        self.exclude_collections = exclude_collections
 
       def FilterRecord(self, notification):
         if self.collection is None:
+          if notification.result_collection_urn in self.exclude_collections:
+            return True
           self.collection = notification.result_collection_urn
         return self.collection != notification.result_collection_urn
 
-    f = CollectionFilter(collection)
+    exclude_collections = set(exclude_collections or [])
+    f = CollectionFilter(collection, exclude_collections)
     results = []
     with aff4.FACTORY.OpenWithLock(
         RESULT_NOTIFICATION_QUEUE,
@@ -76,7 +94,10 @@ class HuntResultQueue(aff4_queue.Queue):
           record_filter=f.FilterRecord,
           start_time=start_time,
           timeout=lease_time,
-          limit=100000):
+          limit=limit,
+          # Notifications of excluded collections might come first, so we
+          # look through all records the scan reads.
+          max_filtered=0 if exclude_collections else 1000):
         results.append((record_id, value.timestamp, value.suffix))
     return (f.collection, results)
 
@@ -90,7 +111,116 @@ class HuntResultQueue(aff4_queue.Queue):
 
 
 class HuntResultCollection(sequential_collection.GrrMessageCollection):
-  """Sequential HuntResultCollection."""
+  """Sequential HuntResultCollection.
+
+  Results can be added with their payload replaced by a
+  HuntResultPayloadReference (see StaticAddPayloadReference). The payload is
+  then stored only once per fingerprint and references are transparently
+  resolved when the collection is read.
+  """
+
+  # The attribute the deduplicated payloads are stored in.
+  PAYLOAD_ATTRIBUTE = "aff4:hunt_result_payload"
+
+  # Number of results whose payload references are resolved together.
+  RESOLVE_BATCH_SIZE = 1000
+
+  # Payload urns which were recently written by this process, so that
+  # repeated payloads are not written again.
+  written_payloads = utils.FastStore(max_size=10000)
+
+  # Recently resolved payloads, keyed by payload urn. Payloads never change
+  # once stored, so this can be shared between collections.
+  resolved_payloads = utils.FastStore(max_size=10000)
+
+  @staticmethod
+  def PayloadURN(collection_urn, fingerprint):
+    return rdfvalue.RDFURN(collection_urn).Add("Payloads").Add(fingerprint)
+
+  @classmethod
+  def StaticAddPayloadReference(cls, collection_urn, token, rdf_value,
+                                fingerprint, **kwargs):
+    """Adds a result, storing its payload only once per fingerprint.
+
+    Args:
+      collection_urn: The urn of the collection to add to.
+      token: The database access token to write with.
+      rdf_value: The GrrMessage to add to the collection.
+      fingerprint: A string identifying the payload of rdf_value. Results
+        with the same fingerprint share a single stored payload.
+      **kwargs: Keyword arguments to pass through to StaticAdd.
+
+    Returns:
+      The pair (timestamp, suffix) which identifies the value within the
+      collection.
+    """
+    payload_urn = cls.PayloadURN(collection_urn, fingerprint)
+    if payload_urn not in cls.written_payloads:
+      # Writing the same payload again is harmless, so there is no need to
+      # check whether another worker has already stored it.
+      data_store.DB.Set(
+          payload_urn,
+          cls.PAYLOAD_ATTRIBUTE,
+          rdf_flows.GrrMessage(payload=rdf_value.payload).SerializeToString(),
+          replace=True,
+          token=token)
+      cls.written_payloads.Put(payload_urn, True)
+
+    reference = rdf_value.Copy()
+    reference.payload = HuntResultPayloadReference(fingerprint=fingerprint)
+    return cls.StaticAdd(collection_urn, token, reference, **kwargs)
+
+  def _ResolvePayloads(self, messages):
+    """Replaces payload references in messages with the stored payloads."""
+    references = []
+    for message in messages:
+      if message.args_rdf_name == HuntResultPayloadReference.__name__:
+        references.append(
+            (message, self.PayloadURN(self.urn, message.payload.fingerprint)))
+
+    if not references:
+      return
+
+    to_read = set(urn for _, urn in references
+                  if urn not in self.resolved_payloads)
+    if to_read:
+      for subject, values in data_store.DB.MultiResolvePrefix(
+          to_read, self.PAYLOAD_ATTRIBUTE, token=self.token):
+        stored = rdf_flows.GrrMessage.FromSerializedString(values[0][1])
+        self.resolved_payloads.Put(
+            rdfvalue.RDFURN(subject), (stored.args_rdf_name,
+                                       stored.Get("args")))
+
+    for message, urn in references:
+      try:
+        args_rdf_name, args = self.resolved_payloads.Get(urn)
+      except KeyError:
+        # The payload is missing, we leave the reference in place.
+        continue
+      message.args_rdf_name = args_rdf_name
+      message.Set("args", args)
+
+  def Scan(self, **kwargs):
+    results = super(HuntResultCollection, self).Scan(**kwargs)
+    for batch in utils.Grouper(results, self.RESOLVE_BATCH_SIZE):
+      self._ResolvePayloads([message for _, message in batch])
+      for item in batch:
+        yield item
+
+  def MultiResolve(self, timestamps):
+    results = super(HuntResultCollection, self).MultiResolve(timestamps)
+    for batch in utils.Grouper(results, self.RESOLVE_BATCH_SIZE):
+      self._ResolvePayloads(batch)
+      for message in batch:
+        yield message
+
+  def OnDelete(self, deletion_pool=None):
+    pool = data_store.DB.GetMutationPool(self.token)
+    for subject, _, _ in data_store.DB.ScanAttribute(
+        self.urn.Add("Payloads"), self.PAYLOAD_ATTRIBUTE, token=self.token):
+      pool.DeleteSubject(subject)
+    pool.Flush()
+    super(HuntResultCollection, self).OnDelete(deletion_pool=deletion_pool)
 
   @classmethod
   def StaticAdd(cls,
@@ -3,10 +3,12 @@
 
 
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import rdfvalue
 from grr.lib import test_lib
 from grr.lib.hunts import results as hunts_results
+from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import flows as rdf_flows
 
 
@@ -87,6 +89,38 @@ class ResultTest(test_lib.AFF4ObjectTest):
           token=self.token)
     self.assertEqual(results_3, results_1)
 
+  def testClaimNotificationsSkipsExcludedCollections(self):
+    collection_urns = [
+        rdfvalue.RDFURN("aff4:/testClaimNotificationsSkips/collection%d" % i)
+        for i in range(2)
+    ]
+    for collection_urn in collection_urns:
+      with aff4.FACTORY.Create(
+          collection_urn,
+          aff4_type=hunts_results.HuntResultCollection,
+          mode="w",
+          token=self.token):
+        pass
+
+    for collection_urn in collection_urns:
+      for i in range(5):
+        hunts_results.HuntResultCollection.StaticAdd(
+            collection_urn, self.token, rdf_flows.GrrMessage(request_id=i))
+
+    collection, results = (
+        hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+            token=self.token,
+            exclude_collections=[collection_urns[0]],
+            limit=3))
+    self.assertEqual(collection, collection_urns[1])
+    self.assertEqual(len(results), 3)
+
+    collection, results = (
+        hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+            token=self.token))
+    self.assertEqual(collection, collection_urns[0])
+    self.assertEqual(len(results), 5)
+
   def testDelete(self):
     collection_urn = "aff4:/testDelete/collection"
     with aff4.FACTORY.Create(
@@ -167,6 +201,49 @@ class ResultTest(test_lib.AFF4ObjectTest):
         values_read.append(message.request_id)
     self.assertEqual(sorted(values_read), range(100, 200))
 
+  def testPayloadReferencesAreResolved(self):
+    collection_urn = rdfvalue.RDFURN(
+        "aff4:/testPayloadReferencesAreResolved/collection")
+    with aff4.FACTORY.Create(
+        collection_urn,
+        aff4_type=hunts_results.HuntResultCollection,
+        mode="w",
+        token=self.token):
+      pass
+
+    for i in range(10):
+      payload = rdf_client.StatEntry(st_size=i % 2)
+      hunts_results.HuntResultCollection.StaticAddPayloadReference(
+          collection_urn,
+          self.token,
+          rdf_flows.GrrMessage(
+              payload=payload, source="aff4:/C.%016X" % i),
+          "size%d" % (i % 2))
+
+    # Only the distinct payloads are stored.
+    stored = list(
+        data_store.DB.ScanAttribute(
+            collection_urn.Add("Payloads"),
+            hunts_results.HuntResultCollection.PAYLOAD_ATTRIBUTE,
+            token=self.token))
+    self.assertEqual(len(stored), 2)
+
+    hunts_results.HuntResultCollection.resolved_payloads.Flush()
+    collection = aff4.FACTORY.Open(collection_urn, token=self.token)
+    messages = list(collection)
+    self.assertEqual(len(messages), 10)
+    for message in messages:
+      self.assertIsInstance(message.payload, rdf_client.StatEntry)
+      i = int(message.source.Basename()[2:], 16)
+      self.assertEqual(message.payload.st_size, i % 2)
+
+    results = hunts_results.HuntResultQueue.ClaimNotificationsForCollection(
+        token=self.token)
+    self.assertEqual(len(results[1]), 10)
+    for message in collection.MultiResolve(
+        [(ts, suffix) for (_, ts, suffix) in results[1]]):
+      self.assertIsInstance(message.payload, rdf_client.StatEntry)
+
 
 def main(argv):
   test_lib.main(argv)
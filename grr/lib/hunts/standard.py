@@ -487,6 +487,35 @@ class VerifyHuntOutputPluginsCronFlow(cronjobs.SystemCronFlow):
       self._WriteVerificationResults(hunt_urn, results)
 
 
+class AggregateHuntResourceUsageCronFlow(cronjobs.SystemCronFlow):
+  """Aggregates the client resource usage logs of active hunts."""
+
+  frequency = rdfvalue.Duration("10m")
+  lifetime = rdfvalue.Duration("30m")
+
+  @flow.StateHandler()
+  def Start(self):
+    hunts_root = aff4.FACTORY.Open("aff4:/hunts", token=self.token)
+
+    # Usage is logged while hunts are processed, so only hunts written to
+    # since the previous runs can have usage left to aggregate.
+    check_range = rdfvalue.Duration(
+        "%ds" % int(self.__class__.frequency.seconds * 2))
+    range_end = rdfvalue.RDFDatetime.Now()
+    range_start = range_end - check_range
+
+    children_urns = list(hunts_root.ListChildren(age=(range_start, range_end)))
+    for hunt in hunts_root.OpenChildren(children_urns):
+      if not isinstance(hunt, implementation.GRRHunt):
+        continue
+
+      try:
+        hunt.AggregateResourceUsage()
+      except aff4.LockError:
+        self.Log("Resource usage of %s is being aggregated elsewhere.",
+                 hunt.urn)
+
+
 class GenericHuntArgs(rdf_structs.RDFProtoStruct):
   """Arguments to the generic hunt."""
   protobuf = flows_pb2.GenericHuntArgs
@@ -618,7 +647,7 @@ class GenericHunt(implementation.GRRHunt):
     resources.cpu_usage.user_cpu_time = status.cpu_time_used.user_cpu_time
     resources.cpu_usage.system_cpu_time = status.cpu_time_used.system_cpu_time
     resources.network_bytes_sent = status.network_bytes_sent
-    self.context.usage_stats.RegisterResources(resources)
+    self.RegisterClientResources(resources)
 
   @flow.StateHandler()
   def MarkDone(self, responses):
@@ -699,5 +728,7 @@ class StandardHuntInitHook(registry.InitHook):
         "hunt_output_plugin_errors", fields=[("plugin", str)])
     stats.STATS.RegisterCounterMetric(
         "hunt_results_ran_through_plugin", fields=[("plugin", str)])
+    stats.STATS.RegisterGaugeMetric(
+        "hunt_results_processing_lag", float, fields=[("hunt", str)])
     stats.STATS.RegisterCounterMetric("hunt_results_compacted")
     stats.STATS.RegisterCounterMetric("hunt_results_compaction_locking_errors")
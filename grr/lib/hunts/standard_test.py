@@ -21,6 +21,7 @@ from grr.lib import output_plugin
 from grr.lib import rdfvalue
 from grr.lib import stats
 from grr.lib import test_lib
+from grr.lib import threadpool
 from grr.lib import utils
 from grr.lib.aff4_objects import aff4_grr
 from grr.lib.aff4_objects import user_managers
@@ -28,6 +29,7 @@ from grr.lib.flows.general import administrative
 from grr.lib.flows.general import transfer
 from grr.lib.hunts import implementation
 from grr.lib.hunts import process_results
+from grr.lib.hunts import results as hunts_results
 from grr.lib.hunts import standard
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import flows as rdf_flows
@@ -235,7 +237,7 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
       # Clean up the foreman to remove any rules.
       with aff4.FACTORY.Open(
           "aff4:/foreman", mode="rw", token=self.token) as foreman:
-        foreman.Set(foreman.Schema.RULES())
+        foreman.SetRules([])
 
     self.old_logging_error = logging.error
     logging.error = self.AssertNoCollectionCorruption
@@ -364,6 +366,56 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
       self.assertListEqual(per_type_collection.ListStoredTypes(),
                            [rdf_client.StatEntry.__name__])
 
+  def testDeduplicatedResultsAreStoredOnce(self):
+    # All clients return the same file, fingerprint results by its path only.
+    with mock.patch.object(
+        implementation.GRRHunt,
+        "GetResultFingerprint",
+        lambda _, payload: payload.pathspec.Basename()):
+      hunt_urn = self.StartHunt(deduplicate_results=True)
+      self.AssignTasksToClients()
+      self.RunHunt()
+    self.StopHunt(hunt_urn)
+
+    hunt_obj = aff4.FACTORY.Open(hunt_urn, token=self.token)
+    stored_payloads = list(
+        data_store.DB.ScanAttribute(
+            hunt_obj.results_collection_urn.Add("Payloads"),
+            hunts_results.HuntResultCollection.PAYLOAD_ATTRIBUTE,
+            token=self.token))
+    self.assertEqual(len(stored_payloads), 1)
+
+    collection = aff4.FACTORY.Open(
+        hunt_obj.results_collection_urn, mode="r", token=self.token)
+    self.assertEqual(len(collection), 5)
+    for x in collection:
+      self.assertEqual(x.payload.__class__, rdf_client.StatEntry)
+      self.assertEqual(x.payload.aff4path.Split(2)[-1], "fs/os/tmp/evil.txt")
+
+    # Full payloads are not written to the per type collection.
+    per_type_collection = aff4.FACTORY.Open(
+        hunt_obj.multi_type_output_urn, mode="r", token=self.token)
+    self.assertListEqual(per_type_collection.ListStoredTypes(), [])
+
+  def testClientCountsAreMaintainedInHuntContext(self):
+    hunt_urn = self.StartHunt()
+    self.AssignTasksToClients()
+    self.RunHunt()
+    self.StopHunt(hunt_urn)
+
+    hunt_obj = aff4.FACTORY.Open(hunt_urn, token=self.token)
+    client_stats = hunt_obj.GetClientStats()
+    self.assertEqual(client_stats.clients_count, 10)
+    self.assertEqual(client_stats.completed_clients_count, 10)
+    self.assertEqual(client_stats.clients_errors_count, 5)
+    self.assertEqual(sum(client_stats.started_histogram), 10)
+    self.assertEqual(sum(client_stats.completed_histogram), 10)
+
+    # Counts of hunts without client stats are read from the collections.
+    hunt_obj.context.client_stats = None
+    self.assertIsNone(hunt_obj.GetClientStats())
+    self.assertEqual(hunt_obj.GetClientsCounts(), (10, 10, 5))
+
   def testHuntWithoutForemanRules(self):
     """Check no foreman rules are created if we pass add_foreman_rules=False."""
     hunt_urn = self.StartHunt(add_foreman_rules=False)
@@ -372,8 +424,7 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
         mode="r",
         token=self.token,
         aff4_type=aff4_grr.GRRForeman) as foreman:
-      foreman_rules = foreman.Get(foreman.Schema.RULES,
-                                  default=foreman.Schema.RULES())
+      foreman_rules = foreman.ReadRules()
       self.assertFalse(foreman_rules)
 
     self.AssignTasksToClients()
@@ -811,6 +862,96 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
       # In normal conditions, there should be 10 results generated.
       self.assertEqual(LongRunningDummyHuntOutputPlugin.num_calls, 10)
 
+  def _StartTwoHuntsWithResults(self):
+    hunt_urns = []
+    for _ in range(2):
+      hunt_urns.append(
+          self.StartHunt(output_plugins=[
+              output_plugin.OutputPluginDescriptor(
+                  plugin_name="DummyHuntOutputPlugin")
+          ]))
+    self.AssignTasksToClients()
+    self.RunHunt(failrate=-1)
+    return hunt_urns
+
+  def _NumProcessedResults(self, hunt_urn):
+    metadata = aff4.FACTORY.Open(
+        hunt_urn.Add("ResultsMetadata"), token=self.token)
+    return metadata.Get(metadata.Schema.NUM_PROCESSED_RESULTS)
+
+  def testHuntResultsAreProcessedInParallel(self):
+    hunt_urns = self._StartTwoHuntsWithResults()
+
+    self.ProcessHuntOutputPlugins(threadpool_size=2, batch_size=3)
+
+    self.assertEqual(DummyHuntOutputPlugin.num_responses, 20)
+    for hunt_urn in hunt_urns:
+      self.assertEqual(self._NumProcessedResults(hunt_urn), 10)
+
+  def testEachProcessingRunUsesItsOwnThreadpool(self):
+    self._StartTwoHuntsWithResults()
+
+    with test_lib.Instrument(threadpool.ThreadPool, "Start") as instrument:
+      self.ProcessHuntOutputPlugins(threadpool_size=2, batch_size=3)
+      self.ProcessHuntOutputPlugins(threadpool_size=3, batch_size=3)
+
+    pools = [args[0] for args in instrument.args]
+    self.assertEqual(len(set(pools)), 2)
+    self.assertEqual([pool.max_threads for pool in pools], [2, 3])
+    self.assertFalse(any(pool.started for pool in pools))
+    self.assertEqual(DummyHuntOutputPlugin.num_responses, 20)
+
+  def testHuntsGetTheirTurnWhenProcessingResults(self):
+    hunt_urns = self._StartTwoHuntsWithResults()
+
+    processed = []
+    process_hunt_results = (
+        process_results.ProcessHuntResultCollectionsCronFlow.ProcessHuntResults)
+
+    def ProcessHuntResults(cron_flow, hunt_results_urn, results):
+      processed.append(rdfvalue.RDFURN(hunt_results_urn.Dirname()))
+      return process_hunt_results(cron_flow, hunt_results_urn, results)
+
+    with utils.Stubber(process_results.ProcessHuntResultCollectionsCronFlow,
+                       "ProcessHuntResults", ProcessHuntResults):
+      self.ProcessHuntOutputPlugins(max_results_per_hunt=3)
+
+    # Every hunt gets at most 3 results processed per round.
+    self.assertEqual(len(processed), 8)
+    for i in range(0, 8, 2):
+      self.assertItemsEqual(processed[i:i + 2], hunt_urns)
+    for hunt_urn in hunt_urns:
+      self.assertEqual(self._NumProcessedResults(hunt_urn), 10)
+
+  def testHuntResultsProcessingLagIsReported(self):
+    with test_lib.FakeTime(100):
+      hunt_urn = self.StartHunt(output_plugins=[
+          output_plugin.OutputPluginDescriptor(
+              plugin_name="DummyHuntOutputPlugin")
+      ])
+      self.AssignTasksToClients()
+      self.RunHunt(failrate=-1)
+
+    lags = []
+    process_hunt_results = (
+        process_results.ProcessHuntResultCollectionsCronFlow.ProcessHuntResults)
+
+    def ProcessHuntResults(cron_flow, hunt_results_urn, results):
+      lags.append(
+          stats.STATS.GetMetricValue(
+              "hunt_results_processing_lag", fields=[hunt_urn.Basename()]))
+      return process_hunt_results(cron_flow, hunt_results_urn, results)
+
+    with test_lib.FakeTime(160):
+      with utils.Stubber(process_results.ProcessHuntResultCollectionsCronFlow,
+                         "ProcessHuntResults", ProcessHuntResults):
+        self.ProcessHuntOutputPlugins(max_results_per_hunt=5)
+
+    self.assertEqual(lags, [60, 60])
+    self.assertEqual(
+        stats.STATS.GetMetricValue(
+            "hunt_results_processing_lag", fields=[hunt_urn.Basename()]), 0)
+
   def testHuntResultsArrivingWhileOldResultsAreProcessedAreHandled(self):
     self.StartHunt(output_plugins=[
         output_plugin.OutputPluginDescriptor(
@@ -1060,7 +1201,7 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
     started, _, _ = hunt_obj.GetClientsCounts()
     self.assertEqual(started, 10)
 
-  def testResourceUsageStats(self):
+  def _RunResourceUsageHunt(self):
     client_ids = self.SetupClients(10)
 
     with hunts.GRRHunt.StartHunt(
@@ -1088,12 +1229,15 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
     client_mock = test_lib.SampleHuntMock()
     test_lib.TestHuntHelper(client_mock, client_ids, False, self.token)
 
-    hunt = aff4.FACTORY.Open(
+    return aff4.FACTORY.Open(
         hunt.urn, aff4_type=standard.GenericHunt, token=self.token)
 
+  def testResourceUsageStats(self):
+    hunt = self._RunResourceUsageHunt()
+
     # This is called once for each state method. Each flow above runs the
     # Start and the StoreResults methods.
-    usage_stats = hunt.context.usage_stats
+    usage_stats = hunt.GetClientResourcesStats()
     self.assertEqual(usage_stats.user_cpu_stats.num, 10)
     self.assertTrue(math.fabs(usage_stats.user_cpu_stats.mean - 5.5) < 1e-7)
     self.assertTrue(
@@ -1123,6 +1267,46 @@ class StandardHuntTest(test_lib.FlowTestsBaseclass, StandardHuntTestMixin):
           p.cpu_usage.user_cpu_time + p.cpu_usage.system_cpu_time)
       prev = p
 
+    self.assertEqual(usage_stats.GetPercentile("user_cpu_sample", 50), 5)
+    self.assertEqual(usage_stats.GetPercentile("system_cpu_sample", 100), 20)
+
+  def testResourceUsageIsNotWrittenToHuntContext(self):
+    hunt = self._RunResourceUsageHunt()
+    self.assertEqual(hunt.context.usage_stats.user_cpu_stats.num, 0)
+
+  def testResourceUsageIsAggregatedByCronFlow(self):
+    hunt = self._RunResourceUsageHunt()
+
+    # Usage logged less than a minute ago is left for later runs.
+    flow_urn = flow.GRRFlow.StartFlow(
+        flow_name=standard.AggregateHuntResourceUsageCronFlow.__name__,
+        token=self.token)
+    for _ in test_lib.TestFlowHelper(flow_urn, token=self.token):
+      pass
+
+    stats_obj = aff4.FACTORY.Open(
+        hunt.resource_usage_stats_urn, token=self.token)
+    self.assertEqual(
+        stats_obj.Get(stats_obj.Schema.USAGE_STATS).user_cpu_stats.num, 0)
+
+    with test_lib.FakeTime(time.time() + 120):
+      flow_urn = flow.GRRFlow.StartFlow(
+          flow_name=standard.AggregateHuntResourceUsageCronFlow.__name__,
+          token=self.token)
+      for _ in test_lib.TestFlowHelper(flow_urn, token=self.token):
+        pass
+
+    stats_obj = aff4.FACTORY.Open(
+        hunt.resource_usage_stats_urn, token=self.token)
+    aggregated_stats = stats_obj.Get(stats_obj.Schema.USAGE_STATS)
+    self.assertEqual(aggregated_stats.user_cpu_stats.num, 10)
+    self.assertEqual(len(aggregated_stats.worst_performers), 10)
+
+    # Aggregated usage is not counted twice.
+    usage_stats = hunt.GetClientResourcesStats()
+    self.assertEqual(usage_stats.user_cpu_stats.num, 10)
+    self.assertTrue(math.fabs(usage_stats.user_cpu_stats.mean - 5.5) < 1e-7)
+
   def testHuntCollectionLogging(self):
     """This tests running the hunt on some clients."""
     with hunts.GRRHunt.StartHunt(
@@ -4,12 +4,193 @@
 An aff4 keyword index class which associates keywords with names and makes it
 possible to search for those names which match all keywords.
 
+Every (keyword, name) pair is a column in the keyword's row. Indexes with
+PACKED_POSTING_LISTS set also keep large posting lists packed into a single
+compressed column, which is read instead of the individual columns written
+before the list was packed.
 """
 
 
+import bisect
+import zlib
+
 from grr.lib import aff4
 from grr.lib import data_store
 from grr.lib import rdfvalue
+from grr.lib import utils
+from grr.lib.rdfvalues import structs as rdf_structs
+
+
+class PackedPostingList(object):
+  """A posting list stored as sorted, compressed blocks of names.
+
+  Each block holds up to BLOCK_SIZE names in sorted order together with the
+  latest timestamp the name was added to the keyword at. Names are prefix
+  compressed against their predecessor and the blocks are zlib compressed.
+  The header records the first name of every block so single names can be
+  looked up by only decompressing the block that might hold them.
+  """
+
+  BLOCK_SIZE = 1024
+
+  def __init__(self, header, blob):
+    self.blob = blob
+    self._blocks = {}
+
+    self.version, pos = rdf_structs.VarintReader(header, 0)
+    self.packed_until, pos = rdf_structs.VarintReader(header, pos)
+    self.count, pos = rdf_structs.VarintReader(header, pos)
+    block_count, pos = rdf_structs.VarintReader(header, pos)
+
+    self.first_names = []
+    self.block_ranges = []
+    for _ in xrange(block_count):
+      length, pos = rdf_structs.VarintReader(header, pos)
+      self.first_names.append(header[pos:pos + length])
+      pos += length
+      offset, pos = rdf_structs.VarintReader(header, pos)
+      length, pos = rdf_structs.VarintReader(header, pos)
+      self.block_ranges.append((offset, length))
+
+  @classmethod
+  def Pack(cls, entries, version, packed_until):
+    """Packs a posting list.
+
+    Args:
+      entries: A dict mapping names to the latest timestamp they were added at.
+      version: An integer identifying this packed list.
+      packed_until: All entries up to this timestamp are in the list.
+
+    Returns:
+      A (header, blob) tuple of strings.
+    """
+    entries = sorted((utils.SmartStr(name), ts) for name, ts in entries.items())
+
+    blocks = []
+    for start in xrange(0, len(entries), cls.BLOCK_SIZE):
+      blocks.append(entries[start:start + cls.BLOCK_SIZE])
+
+    header = [
+        rdf_structs.VarintEncode(version),
+        rdf_structs.VarintEncode(packed_until),
+        rdf_structs.VarintEncode(len(entries)),
+        rdf_structs.VarintEncode(len(blocks))
+    ]
+    blob = []
+    offset = 0
+    for block in blocks:
+      data = cls._EncodeBlock(block)
+      first_name = block[0][0]
+      header.extend([
+          rdf_structs.VarintEncode(len(first_name)), first_name,
+          rdf_structs.VarintEncode(offset), rdf_structs.VarintEncode(len(data))
+      ])
+      blob.append(data)
+      offset += len(data)
+
+    return "".join(header), "".join(blob)
+
+  @staticmethod
+  def _EncodeBlock(entries):
+    result = []
+    previous = ""
+    for name, ts in entries:
+      shared = 0
+      for a, b in zip(previous, name):
+        if a != b:
+          break
+        shared += 1
+
+      result.extend([
+          rdf_structs.VarintEncode(shared),
+          rdf_structs.VarintEncode(len(name) - shared), name[shared:],
+          rdf_structs.VarintEncode(ts)
+      ])
+      previous = name
+
+    return zlib.compress("".join(result))
+
+  def _Block(self, index):
+    """Returns the names and timestamps of a block, decoding it if needed."""
+    try:
+      return self._blocks[index]
+    except KeyError:
+      pass
+
+    offset, length = self.block_ranges[index]
+    data = zlib.decompress(self.blob[offset:offset + length])
+
+    names = []
+    timestamps = []
+    previous = ""
+    pos = 0
+    while pos < len(data):
+      shared, pos = rdf_structs.VarintReader(data, pos)
+      length, pos = rdf_structs.VarintReader(data, pos)
+      name = previous[:shared] + data[pos:pos + length]
+      pos += length
+      ts, pos = rdf_structs.VarintReader(data, pos)
+      names.append(name)
+      timestamps.append(ts)
+      previous = name
+
+    self._blocks[index] = (names, timestamps)
+    return names, timestamps
+
+  def __len__(self):
+    return self.count
+
+  def Get(self, name):
+    """Returns the timestamp of name or None if it is not in the list."""
+    name = utils.SmartStr(name)
+    index = bisect.bisect_right(self.first_names, name) - 1
+    if index < 0:
+      return None
+
+    names, timestamps = self._Block(index)
+    pos = bisect.bisect_left(names, name)
+    if pos < len(names) and names[pos] == name:
+      return timestamps[pos]
+
+  def iteritems(self):
+    for index in xrange(len(self.block_ranges)):
+      names, timestamps = self._Block(index)
+      for name, ts in zip(names, timestamps):
+        yield utils.SmartUnicode(name), ts
+
+
+class _PostingList(object):
+  """A posting list read from a packed list and the columns written since."""
+
+  def __init__(self, packed, recent, start_time):
+    self.packed = packed
+    self.recent = recent
+    self.start_time = start_time
+
+  def __len__(self):
+    return len(self.packed or ()) + len(self.recent)
+
+  def Get(self, name):
+    """Returns the latest timestamp of name or None if it is not listed."""
+    ts = self.recent.get(name)
+    if self.packed is not None:
+      ts = max(ts, self.packed.Get(name))
+
+    if ts is not None and ts >= self.start_time:
+      return ts
+
+  def iteritems(self):
+    seen = set()
+    if self.packed is not None:
+      for name, ts in self.packed.iteritems():
+        seen.add(name)
+        ts = max(ts, self.recent.get(name))
+        if ts >= self.start_time:
+          yield name, ts
+
+    for name, ts in self.recent.iteritems():
+      if name not in seen and ts >= self.start_time:
+        yield name, ts
 
 
 class AFF4KeywordIndex(aff4.AFF4Object):
@@ -23,24 +204,56 @@ class AFF4KeywordIndex(aff4.AFF4Object):
   FIRST_TIMESTAMP = 0
   LAST_TIMESTAMP = (2**63) - 2  # maxint64 - 1
 
+  # Keep large posting lists packed, see PackedPostingList.
+  PACKED_POSTING_LISTS = False
+
+  PACKED_HEADER_COLUMN = "kw_packed:header"
+  PACKED_BLOB_COLUMN = "kw_packed:blob"
+
+  # Lists are packed once they have this many names and repacked once the
+  # names added since then reach this fraction of the packed list.
+  PACK_MIN_SIZE = 1000
+  REPACK_FRACTION = 0.1
+
+  # Columns written less than this many microseconds before a list was packed
+  # are still read individually.
+  PACK_SAFETY_MARGIN = 60 * 1000000
+
+  # Decoded packed posting lists shared by all indexes in this process. Lists
+  # are keyed by their version, so repacked lists are never read from here.
+  posting_list_cache = utils.FastStore(max_size=32)
+
   def _KeywordToURN(self, keyword):
     return self.urn.Add(keyword)
 
-  def Lookup(self, keywords, **kwargs):
+  def Lookup(self,
+             keywords,
+             start_time=FIRST_TIMESTAMP,
+             end_time=LAST_TIMESTAMP,
+             last_seen_map=None):
     """Finds objects associated with keywords.
 
     Find the names related to all keywords.
 
     Args:
       keywords: A collection of keywords that we are interested in.
-      **kwargs: Additional arguments to be passed to the underlying call to
-        ReadPostingLists
+      start_time: Only considers keywords added at or after this point in time.
+      end_time: Only considers keywords at or before this point in time.
+      last_seen_map: If present, is treated as a dict and populated to map pairs
+        (keyword, name) to the timestamp of the latest connection found. For
+        packed posting lists only the matching names are recorded.
     Returns:
       A set of potentially relevant names.
 
     """
+    if self._UsePackedPostingLists(end_time):
+      return self._LookupPacked(keywords, start_time, end_time, last_seen_map)
 
-    posting_lists = self.ReadPostingLists(keywords, **kwargs)
+    posting_lists = self.ReadPostingLists(
+        keywords,
+        start_time=start_time,
+        end_time=end_time,
+        last_seen_map=last_seen_map)
 
     results = posting_lists.values()
     relevant_set = results[0]
@@ -53,6 +266,31 @@ class AFF4KeywordIndex(aff4.AFF4Object):
 
     return relevant_set
 
+  def _LookupPacked(self, keywords, start_time, end_time, last_seen_map):
+    """Intersects the posting lists without materializing all of them."""
+    posting_lists = self._ReadPackedPostingLists(keywords, start_time, end_time)
+
+    # Walk the shortest list and look its names up in the others, which only
+    # decodes the blocks of the other lists which might hold these names.
+    ordered = sorted(set(keywords), key=lambda kw: len(posting_lists[kw]))
+
+    relevant_set = set()
+    for name, ts in posting_lists[ordered[0]].iteritems():
+      matches = [(ordered[0], ts)]
+      for keyword in ordered[1:]:
+        keyword_ts = posting_lists[keyword].Get(name)
+        if keyword_ts is None:
+          break
+        matches.append((keyword, keyword_ts))
+      else:
+        relevant_set.add(name)
+        if last_seen_map is not None:
+          for keyword, keyword_ts in matches:
+            last_seen_map[(keyword, name)] = max(
+                last_seen_map.get((keyword, name), -1), keyword_ts)
+
+    return relevant_set
+
   def ReadPostingLists(self,
                        keywords,
                        start_time=FIRST_TIMESTAMP,
@@ -70,6 +308,18 @@ class AFF4KeywordIndex(aff4.AFF4Object):
       A dict mapping each keyword to a set of relevant names.
 
     """
+    if self._UsePackedPostingLists(end_time):
+      result = {}
+      for kw, posting_list in self._ReadPackedPostingLists(
+          keywords, start_time, end_time).iteritems():
+        result[kw] = set()
+        for name, ts in posting_list.iteritems():
+          result[kw].add(name)
+          if last_seen_map is not None:
+            last_seen_map[(kw, name)] = max(
+                last_seen_map.get((kw, name), -1), ts)
+      return result
+
     keyword_urns = {self._KeywordToURN(k): k for k in keywords}
     result = {}
     for kw in keywords:
@@ -89,6 +339,142 @@ class AFF4KeywordIndex(aff4.AFF4Object):
 
     return result
 
+  def _UsePackedPostingLists(self, end_time):
+    # Packed lists only keep the latest timestamp of every name, so they can't
+    # answer queries about the past.
+    return self.PACKED_POSTING_LISTS and end_time >= self.LAST_TIMESTAMP
+
+  def _ReadColumns(self, keyword_urns, start_time, end_time):
+    """Reads the individual (keyword, name) columns of some keywords.
+
+    Args:
+      keyword_urns: A dict mapping keyword urns to keywords.
+      start_time: Only read columns written at or after this time.
+      end_time: Only read columns written at or before this time.
+
+    Returns:
+      A dict mapping keywords to dicts of name: latest timestamp.
+    """
+    result = dict((kw, {}) for kw in keyword_urns.itervalues())
+    if not keyword_urns:
+      return result
+
+    for keyword_urn, values in data_store.DB.MultiResolvePrefix(
+        keyword_urns.keys(),
+        self.INDEX_PREFIX,
+        timestamp=(start_time, end_time + 1),
+        token=self.token):
+      names = result[keyword_urns[keyword_urn]]
+      for column, _, ts in values:
+        name = column[self.INDEX_PREFIX_LEN:]
+        names[name] = max(names.get(name, -1), ts)
+
+    return result
+
+  def _ReadPackedPostingLists(self, keywords, start_time, end_time):
+    """Reads posting lists, packing those which grew large.
+
+    Args:
+      keywords: A collection of keywords that we are interested in.
+      start_time: Only considers keywords added at or after this point in time.
+      end_time: Only considers keywords at or before this point in time.
+
+    Returns:
+      A dict mapping keywords to _PostingList objects.
+    """
+    keyword_urns = dict((self._KeywordToURN(k), k) for k in keywords)
+
+    packed = {}
+    for keyword_urn, values in data_store.DB.MultiResolvePrefix(
+        keyword_urns.keys(), self.PACKED_HEADER_COLUMN, token=self.token):
+      for _, header, _ in values:
+        packed[keyword_urns[keyword_urn]] = self._GetPackedPostingList(
+            keyword_urn, header)
+
+    # Only the columns written after a list was packed need to be read.
+    packed_urns = dict(
+        (urn, kw) for urn, kw in keyword_urns.iteritems() if kw in packed)
+    unpacked_urns = dict(
+        (urn, kw) for urn, kw in keyword_urns.iteritems() if kw not in packed)
+
+    recent = self._ReadColumns(unpacked_urns, start_time, end_time)
+    if packed:
+      packed_until = min(p.packed_until for p in packed.itervalues())
+      recent.update(
+          self._ReadColumns(packed_urns, max(start_time, packed_until),
+                            end_time))
+
+    result = {}
+    for keyword_urn, kw in keyword_urns.iteritems():
+      packed_list = packed.get(kw)
+      if packed_list is None:
+        needs_packing = len(recent[kw]) >= self.PACK_MIN_SIZE
+      else:
+        needs_packing = len(recent[kw]) >= max(
+            self.PACK_MIN_SIZE, len(packed_list) * self.REPACK_FRACTION)
+
+      if needs_packing:
+        packed_list = self._PackPostingList(keyword_urn)
+        recent[kw] = {}
+
+      result[kw] = _PostingList(packed_list, recent[kw], start_time)
+
+    return result
+
+  def _GetPackedPostingList(self, keyword_urn, header):
+    """Returns the packed posting list described by header."""
+    version, _ = rdf_structs.VarintReader(header, 0)
+    key = (utils.SmartStr(keyword_urn), version)
+    try:
+      return self.posting_list_cache.Get(key)
+    except KeyError:
+      pass
+
+    blob, _ = data_store.DB.Resolve(
+        keyword_urn, self.PACKED_BLOB_COLUMN, token=self.token)
+    packed_list = PackedPostingList(header, blob or "")
+    self.posting_list_cache.Put(key, packed_list)
+    return packed_list
+
+  def _PackPostingList(self, keyword_urn):
+    """Packs all columns of a keyword into a packed posting list."""
+    now = rdfvalue.RDFDatetime.Now().AsMicroSecondsFromEpoch()
+    # Columns written with a slightly older timestamp might still be on their
+    # way to the data store, so they are read from the columns as well.
+    packed_until = max(0, now - self.PACK_SAFETY_MARGIN)
+
+    entries = self._ReadColumns({
+        keyword_urn: None
+    }, self.FIRST_TIMESTAMP, self.LAST_TIMESTAMP)[None]
+
+    version = utils.PRNG.GetULong()
+    header, blob = PackedPostingList.Pack(entries, version, packed_until)
+    data_store.DB.MultiSet(
+        keyword_urn, {
+            self.PACKED_HEADER_COLUMN: [header],
+            self.PACKED_BLOB_COLUMN: [blob]
+        },
+        replace=True,
+        token=self.token)
+
+    packed_list = PackedPostingList(header, blob)
+    self.posting_list_cache.Put((utils.SmartStr(keyword_urn), version),
+                                packed_list)
+    return packed_list
+
+  def _InvalidatePackedPostingLists(self, keywords, mutation_pool=None):
+    """Drops packed posting lists, they are rebuilt on the next read."""
+    if not self.PACKED_POSTING_LISTS:
+      return
+
+    columns = [self.PACKED_HEADER_COLUMN, self.PACKED_BLOB_COLUMN]
+    for keyword in set(keywords):
+      if mutation_pool:
+        mutation_pool.DeleteAttributes(self._KeywordToURN(keyword), columns)
+      else:
+        data_store.DB.DeleteAttributes(
+            self._KeywordToURN(keyword), columns, token=self.token, sync=False)
+
   def AddKeywordsForName(self,
                          name,
                          keywords,
@@ -108,6 +494,10 @@ class AFF4KeywordIndex(aff4.AFF4Object):
     """
     if timestamp is None:
       timestamp = rdfvalue.RDFDatetime.Now().AsMicroSecondsFromEpoch()
+    else:
+      # Packed posting lists don't see columns written in their past.
+      self._InvalidatePackedPostingLists(keywords)
+
     if sync:
       with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
         for keyword in set(keywords):
@@ -139,7 +529,10 @@ class AFF4KeywordIndex(aff4.AFF4Object):
         for keyword in set(keywords):
           mutation_pool.DeleteAttributes(
               self._KeywordToURN(keyword), [self.INDEX_COLUMN_FORMAT % name])
+        self._InvalidatePackedPostingLists(
+            keywords, mutation_pool=mutation_pool)
     else:
+      self._InvalidatePackedPostingLists(keywords)
       for keyword in set(keywords):
         data_store.DB.DeleteAttributes(
             self._KeywordToURN(keyword), [self.INDEX_COLUMN_FORMAT % name],
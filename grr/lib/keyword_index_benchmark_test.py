@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Benchmark tests for the keyword index."""
+
+
+from grr.lib import aff4
+from grr.lib import data_store
+from grr.lib import flags
+from grr.lib import keyword_index
+from grr.lib import test_lib
+
+
+class BenchmarkPackedKeywordIndex(keyword_index.AFF4KeywordIndex):
+  """A keyword index keeping packed posting lists."""
+
+  PACKED_POSTING_LISTS = True
+
+
+class KeywordIndexBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare lookups on column and packed posting lists."""
+
+  REPEATS = 5
+
+  # Number of names in the index. Every name has the "all" keyword, every
+  # tenth name the "tenth" keyword and every hundredth the "hundredth" one.
+  NAME_COUNT = 20000
+
+  def _FillIndex(self, index_cls):
+    index = aff4.FACTORY.Create(
+        "aff4:/index/%s" % index_cls.__name__,
+        aff4_type=index_cls,
+        mode="rw",
+        token=self.token)
+
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      for i in xrange(self.NAME_COUNT):
+        keywords = ["all"]
+        if i % 10 == 0:
+          keywords.append("tenth")
+        if i % 100 == 0:
+          keywords.append("hundredth")
+
+        for keyword in keywords:
+          mutation_pool.Set(
+              index.urn.Add(keyword),
+              index.INDEX_COLUMN_FORMAT % ("C.%016X" % i),
+              "",
+              timestamp=1000000)
+
+    return index
+
+  def _Benchmark(self, name, index_cls):
+    index = self._FillIndex(index_cls)
+    # Packs the posting lists, if the index does that.
+    index.ReadPostingLists(["all", "tenth", "hundredth"])
+
+    def Lookup(keywords):
+      return len(index.Lookup(keywords))
+
+    self.TimeIt(Lookup, name="%s: all" % name, keywords=["all"])
+    self.TimeIt(
+        Lookup, name="%s: all, tenth" % name, keywords=["all", "tenth"])
+    self.TimeIt(
+        Lookup,
+        name="%s: all, tenth, hundredth" % name,
+        keywords=["all", "tenth", "hundredth"])
+
+  def testColumnPostingLists(self):
+    self._Benchmark("Columns", keyword_index.AFF4KeywordIndex)
+
+  def testPackedPostingLists(self):
+    self._Benchmark("Packed", BenchmarkPackedKeywordIndex)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -3,6 +3,7 @@
 
 
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import keyword_index
 from grr.lib import test_lib
@@ -11,11 +12,12 @@ from grr.lib import test_lib
 class KeywordIndexTest(test_lib.AFF4ObjectTest):
 
   sync = True
+  index_cls = keyword_index.AFF4KeywordIndex
 
   def testKeywordIndex(self):
     index = aff4.FACTORY.Create(
         "aff4:/index1/",
-        aff4_type=keyword_index.AFF4KeywordIndex,
+        aff4_type=self.index_cls,
         mode="rw",
         token=self.token)
 
@@ -47,7 +49,7 @@ class KeywordIndexTest(test_lib.AFF4ObjectTest):
   def testKeywordIndexTimestamps(self):
     index = aff4.FACTORY.Create(
         "aff4:/index2/",
-        aff4_type=keyword_index.AFF4KeywordIndex,
+        aff4_type=self.index_cls,
         mode="rw",
         token=self.token)
     for i in range(50):
@@ -72,7 +74,7 @@ class KeywordIndexTest(test_lib.AFF4ObjectTest):
   def testKeywordIndexLastSeen(self):
     index = aff4.FACTORY.Create(
         "aff4:/index2/",
-        aff4_type=keyword_index.AFF4KeywordIndex,
+        aff4_type=self.index_cls,
         mode="rw",
         token=self.token)
     for i in range(5):
@@ -96,6 +98,129 @@ class AsyncKeywordIndexTest(KeywordIndexTest):
   sync = False
 
 
+class PackedKeywordIndex(keyword_index.AFF4KeywordIndex):
+  """A keyword index packing even small posting lists."""
+
+  PACKED_POSTING_LISTS = True
+  PACK_MIN_SIZE = 10
+
+
+class PackedKeywordIndexTest(KeywordIndexTest):
+
+  index_cls = PackedKeywordIndex
+
+  def setUp(self):
+    super(PackedKeywordIndexTest, self).setUp()
+    self.index = aff4.FACTORY.Create(
+        "aff4:/packed_index/",
+        aff4_type=PackedKeywordIndex,
+        mode="rw",
+        token=self.token)
+
+  def _PackedCount(self, keyword):
+    header, _ = data_store.DB.Resolve(
+        self.index.urn.Add(keyword),
+        PackedKeywordIndex.PACKED_HEADER_COLUMN,
+        token=self.token)
+    if header is not None:
+      return len(keyword_index.PackedPostingList(header, ""))
+
+  def testPackedPostingList(self):
+    entries = dict(("C.%04d" % i, i * 10) for i in range(3000))
+    header, blob = keyword_index.PackedPostingList.Pack(
+        entries, version=1, packed_until=5)
+    packed = keyword_index.PackedPostingList(header, blob)
+
+    self.assertEqual(len(packed), 3000)
+    self.assertEqual(packed.version, 1)
+    self.assertEqual(packed.packed_until, 5)
+    self.assertEqual(len(packed.block_ranges), 3)
+    self.assertEqual(dict(packed.iteritems()), entries)
+
+    self.assertEqual(packed.Get("C.0000"), 0)
+    self.assertEqual(packed.Get("C.1024"), 10240)
+    self.assertEqual(packed.Get("C.2999"), 29990)
+    self.assertIsNone(packed.Get("B.0000"))
+    self.assertIsNone(packed.Get("C.1024x"))
+    self.assertIsNone(packed.Get("D.0000"))
+
+    # Looking up a single name only decodes the block holding it.
+    packed = keyword_index.PackedPostingList(header, blob)
+    packed.Get("C.2000")
+    self.assertEqual(packed._blocks.keys(), [1])
+
+  def _AddAt(self, timestamp, names, keyword):
+    for name in names:
+      with test_lib.FakeTime(timestamp):
+        self.index.AddKeywordsForName(name, [keyword])
+
+  def _LookupAt(self, timestamp, keywords):
+    with test_lib.FakeTime(timestamp):
+      return self.index.Lookup(keywords)
+
+  def testLargePostingListsArePacked(self):
+    self._AddAt(1000, ["C.%X" % i for i in range(5)], "keyword")
+    self.assertEqual(len(self._LookupAt(2000, ["keyword"])), 5)
+    self.assertIsNone(self._PackedCount("keyword"))
+
+    self._AddAt(1000, ["C.%X" % i for i in range(5, 20)], "keyword")
+    self.assertEqual(len(self._LookupAt(2000, ["keyword"])), 20)
+    self.assertEqual(self._PackedCount("keyword"), 20)
+
+    # Names added after packing are merged from the individual columns.
+    self._AddAt(3000, ["C.%X" % i for i in range(20, 25)], "keyword")
+    self.assertEqual(len(self._LookupAt(4000, ["keyword"])), 25)
+    self.assertEqual(self._PackedCount("keyword"), 20)
+
+    # Once enough names were added the list is packed again.
+    self._AddAt(5000, ["C.%X" % i for i in range(25, 40)], "keyword")
+    self.assertEqual(len(self._LookupAt(6000, ["keyword"])), 40)
+    self.assertEqual(self._PackedCount("keyword"), 40)
+
+    # Names added just before packing are read from their columns as well.
+    self._AddAt(6000, ["C.%X" % i for i in range(40, 42)], "keyword")
+    self.assertEqual(len(self._LookupAt(6000, ["keyword"])), 42)
+
+  def testRemovingNamesInvalidatesPackedLists(self):
+    for i in range(20):
+      self.index.AddKeywordsForName("C.%X" % i, ["keyword1", "keyword2"])
+    self.assertEqual(len(self.index.Lookup(["keyword1", "keyword2"])), 20)
+    self.assertEqual(self._PackedCount("keyword1"), 20)
+
+    self.index.RemoveKeywordsForName("C.0", ["keyword1"], sync=self.sync)
+    self.assertIsNone(self._PackedCount("keyword1"))
+    self.assertEqual(self._PackedCount("keyword2"), 20)
+
+    results = self.index.Lookup(["keyword1", "keyword2"])
+    self.assertEqual(len(results), 19)
+    self.assertNotIn("C.0", results)
+    self.assertEqual(self._PackedCount("keyword1"), 19)
+
+  def testLookupIntersectsPackedLists(self):
+    for i in range(100):
+      keywords = ["all"]
+      if i % 2 == 0:
+        keywords.append("even")
+      if i % 3 == 0:
+        keywords.append("by_three")
+      with test_lib.FakeTime(1000 + i):
+        self.index.AddKeywordsForName("C.%02d" % i, keywords)
+
+    # Pack all lists.
+    self.index.ReadPostingLists(["all", "even", "by_three"])
+
+    ls_map = {}
+    results = self.index.Lookup(
+        ["all", "even", "by_three"], last_seen_map=ls_map)
+    self.assertEqual(results, set("C.%02d" % i for i in range(0, 100, 6)))
+    self.assertEqual(ls_map[("all", "C.06")], 1006 * 1000000)
+    self.assertEqual(ls_map[("even", "C.06")], 1006 * 1000000)
+
+    results = self.index.Lookup(
+        ["all", "even"], start_time=1050 * 1000000)
+    self.assertEqual(results, set("C.%02d" % i for i in range(50, 100, 2)))
+
+
 def main(argv):
   test_lib.main(argv)
 
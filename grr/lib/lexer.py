@@ -3,6 +3,8 @@
 
 
 import re
+import sre_constants
+import sre_parse
 
 import logging
 
@@ -38,10 +40,150 @@ class Token(object):
 
     self.next_state = next_state
 
+    # Regexes looking at the start of the input or behind the current point
+    # have to be matched against the remaining input, not at an offset.
+    self.match_remainder = _LooksBehind(sre_parse.parse(regex, flags))
+
+  def Match(self, data, position):
+    """Matches the token at position in data.
+
+    Args:
+      data: The input string.
+      position: The offset in data to match at.
+
+    Returns:
+      A tuple of the match object and the offset in data where it ends, or
+      (None, None).
+    """
+    if self.match_remainder:
+      m = self.regex.match(data[position:])
+      if m:
+        return m, position + m.end()
+    else:
+      m = self.regex.match(data, position)
+      if m:
+        return m, m.end()
+
+    return None, None
+
   def Action(self, lexer):
     """Method is called when the token matches."""
 
 
+def _LooksBehind(parsed):
+  """Checks a parsed regex for anchors at the start or lookbehinds."""
+  if isinstance(parsed, sre_parse.SubPattern):
+    for op, av in parsed:
+      if op == sre_constants.AT and av in (sre_constants.AT_BEGINNING,
+                                           sre_constants.AT_BEGINNING_STRING):
+        return True
+      if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT) and av[0] < 0:
+        return True
+      if _LooksBehind(av):
+        return True
+
+  elif isinstance(parsed, (list, tuple)):
+    for item in parsed:
+      if _LooksBehind(item):
+        return True
+
+  return False
+
+
+class TokenScanner(object):
+  """Finds the first of a list of tokens matching the input.
+
+  The regexes of the tokens are combined into alternations, so the input is
+  scanned once instead of once for each token. Alternatives are tried in
+  order, so the token found is the same one trying each token in turn would
+  find.
+  """
+
+  # Python's re module supports at most 100 groups per regex.
+  MAX_GROUPS = 99
+
+  # Backreferences and inline flags change their meaning in a combined regex.
+  UNCOMBINABLE_REGEX = re.compile(r"\\[1-9]|\(\?P=|\(\?[iLmsux]+\)")
+
+  def __init__(self, tokens):
+    self.tokens = tokens
+    # A list of (combined regex, {group index: token}) or (None, token).
+    self.scanners = []
+
+    alternatives = []
+    for token in tokens:
+      if (token.match_remainder or
+          self.UNCOMBINABLE_REGEX.search(token.re_str) or
+          token.regex.groups + 1 > self.MAX_GROUPS):
+        self._AddScanner(alternatives)
+        alternatives = []
+        self.scanners.append((None, token))
+        continue
+
+      if alternatives and (
+          alternatives[0].regex.flags != token.regex.flags or
+          sum(t.regex.groups + 1 for t in alternatives) + token.regex.groups +
+          1 > self.MAX_GROUPS):
+        self._AddScanner(alternatives)
+        alternatives = []
+
+      alternatives.append(token)
+
+    self._AddScanner(alternatives)
+
+  def _AddScanner(self, tokens):
+    """Adds a scanner for the alternation of the regexes of tokens."""
+    if not tokens:
+      return
+
+    if len(tokens) == 1:
+      self.scanners.append((None, tokens[0]))
+      return
+
+    groups = {}
+    group = 1
+    for token in tokens:
+      groups[group] = token
+      group += token.regex.groups + 1
+
+    try:
+      regex = re.compile("|".join("(%s)" % token.re_str for token in tokens),
+                         tokens[0].regex.flags)
+    except (re.error, AssertionError):
+      # Named groups can clash between tokens.
+      self.scanners.extend((None, token) for token in tokens)
+      return
+
+    self.scanners.append((regex, groups))
+
+  def Match(self, data, position):
+    """Finds the first token matching data at position.
+
+    Args:
+      data: The input string.
+      position: The offset in data to match at.
+
+    Returns:
+      A tuple of the token, its match object and the offset in data where the
+      match ends, or (None, None, None).
+    """
+    for regex, tokens in self.scanners:
+      if regex is None:
+        m, end = tokens.Match(data, position)
+        if m:
+          return tokens, m, end
+        continue
+
+      m = regex.match(data, position)
+      if m:
+        # The group of the alternative is the outermost, so it closes last.
+        token = tokens[m.lastindex]
+        m, end = token.Match(data, position)
+        return token, m, end
+
+    return None, None, None
+
+
 class Error(Exception):
   """Module exception."""
 
@@ -51,7 +193,12 @@ class ParseError(Error):
 
 
 class Lexer(object):
-  """A generic feed lexer."""
+  """A generic feed lexer.
+
+  The input is kept in a single string and consumed by advancing an offset
+  into it, so lexing is linear in the size of the input. The unconsumed input
+  is still available as the buffer attribute.
+  """
   # A list of Token() instances.
   tokens = []
   # Regex flags
@@ -71,49 +218,99 @@ class Lexer(object):
     self.state = "INITIAL"
     self.state_stack = []
 
-    # The buffer we are parsing now
-    self.buffer = ""
+    # The data we are parsing now, and the offset of the next character to
+    # process in it.
+    self._data = ""
+    self._position = 0
+    # Processed data which is no longer part of self._data.
+    self._processed_chunks = []
     self.error = 0
     self.verbose = 0
 
-    # The index into the buffer where we are currently pointing
+    # The number of characters processed so far.
     self.processed = 0
-    self.processed_buffer = ""
+
+    # Token scanners by state.
+    self._scanners = {}
+    self._scanned_tokens = None
+
+  @property
+  def buffer(self):
+    """The input which has not been processed yet."""
+    return self._data[self._position:]
+
+  @buffer.setter
+  def buffer(self, data):
+    self._processed_chunks.append(self._data[:self._position])
+    self._data = data
+    self._position = 0
+
+  @property
+  def processed_buffer(self):
+    """The input which has been processed already."""
+    return "".join(self._processed_chunks) + self._data[:self._position]
+
+  @processed_buffer.setter
+  def processed_buffer(self, data):
+    self._processed_chunks = [data]
+    self._data = self._data[self._position:]
+    self._position = 0
+
+  def _GetScanner(self, state):
+    """Returns the scanner for the tokens considered in state."""
+    # Tokens can be added or replaced at any time.
+    tokens = (id(self._tokens), len(self._tokens))
+    if tokens != self._scanned_tokens:
+      self._scanners = {}
+      self._scanned_tokens = tokens
+
+    try:
+      return self._scanners[state]
+    except KeyError:
+      scanner = TokenScanner([
+          token for token in self._tokens
+          if not token.state_regex or token.state_regex.match(state)
+      ])
+      self._scanners[state] = scanner
+      return scanner
+
+  def _MatchVerbose(self):
+    """Matches the tokens in turn, logging every attempt."""
+    for token in self._GetScanner(self.state).tokens:
+      logging.debug("%s: Trying to match %r with %r", self.state,
+                    self._data[self._position:self._position + 10],
+                    token.re_str)
+      m, end = token.Match(self._data, self._position)
+      if m:
+        return token, m, end
+
+    return None, None, None
 
   def NextToken(self):
     """Fetch the next token by trying to match any of the regexes in order."""
     # Nothing in the input stream - no token can match.
-    if not self.buffer:
+    if self.Empty():
       return
 
-    current_state = self.state
-    for token in self._tokens:
-      # Does the rule apply to us?
-      if token.state_regex and not token.state_regex.match(current_state):
-        continue
-
-      if self.verbose:
-        logging.debug("%s: Trying to match %r with %r", self.state,
-                      self.buffer[:10], token.re_str)
-
-      # Try to match the rule
-      m = token.regex.match(self.buffer)
-      if not m:
-        continue
+    if self.verbose:
+      token, m, end = self._MatchVerbose()
+    else:
+      token, m, end = self._GetScanner(self.state).Match(self._data,
+                                                         self._position)
 
+    if token is not None:
       if self.verbose:
         logging.debug("%s matched %s", token.re_str, m.group(0))
 
       # A token matched the empty string. We can not consume the token from the
       # input stream.
-      if m.end() == 0:
+      if end == self._position:
         raise RuntimeError("Lexer bug! Token can not match the empty string.")
 
       # The match consumes the data off the buffer (the handler can put it back
       # if it likes)
-      self.processed_buffer += self.buffer[:m.end()]
-      self.buffer = self.buffer[m.end():]
-      self.processed += m.end()
+      self.processed += end - self._position
+      self._position = end
 
       next_state = token.next_state
       for action in token.actions:
@@ -143,15 +340,20 @@ class Lexer(object):
     # Check that we are making progress - if we are too full, we assume we are
     # stuck.
     self.Error("Lexer stuck at state %s" % (self.state))
-    self.processed_buffer += self.buffer[:1]
-    self.buffer = self.buffer[1:]
+    self._position += 1
     return "Error"
 
   def Feed(self, data):
-    self.buffer += data
+    # Drop the processed data, so feeding a little at a time does not copy
+    # all of it again.
+    if self._position:
+      self._processed_chunks.append(self._data[:self._position])
+      self._data = self._data[self._position:]
+      self._position = 0
+    self._data += data
 
   def Empty(self):
-    return not self.buffer
+    return self._position >= len(self._data)
 
   def Default(self, **kwarg):
     logging.debug("Default handler: %s", kwarg)
@@ -180,13 +382,20 @@ class Lexer(object):
 
   def PushBack(self, string="", **_):
     """Push the match back on the stream."""
-    self.buffer = string + self.buffer
-    self.processed_buffer = self.processed_buffer[:-len(string)]
+    start = self._position - len(string)
+    if start >= 0 and self._data.startswith(string, start):
+      # The usual case: the data just processed is pushed back.
+      self._position = start
+    else:
+      processed_buffer = self.processed_buffer[:-len(string)]
+      self._data = string + self.buffer
+      self._position = 0
+      self._processed_chunks = [processed_buffer]
 
   def Close(self):
     """A convenience function to force us to parse all the data."""
     while self.NextToken():
-      if not self.buffer:
+      if self.Empty():
         return
 
 
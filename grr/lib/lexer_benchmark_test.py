@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Benchmark tests for lexers on large inputs."""
+
+
+from grr.lib import flags
+from grr.lib import lexer
+from grr.lib import objectfilter
+from grr.lib import test_lib
+from grr.parsers import config_file
+
+
+class LexerBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Time lexer based parsers on inputs of increasing size."""
+
+  REPEATS = 3
+
+  LINE_COUNTS = [1000, 4000, 8000]
+
+  def _FieldData(self, line_count):
+    return "\n".join("user%d:x:%d:%d:User %d:/home/user%d:/bin/sh  # comment" %
+                     (i, i, i, i, i) for i in xrange(line_count))
+
+  def _KeyValueData(self, line_count):
+    return "\n".join("Option%d = \"value %d\" 'more values'" % (i, i)
+                     for i in xrange(line_count))
+
+  def _Query(self, term_count):
+    return " or ".join("name is 'file%d'" % i for i in xrange(term_count))
+
+  def testFieldParser(self):
+    parser = config_file.FieldParser(sep=":", comments="#")
+    for line_count in self.LINE_COUNTS:
+      data = self._FieldData(line_count)
+      self.assertEqual(len(parser.ParseEntries(data)), line_count)
+      self.TimeIt(
+          parser.ParseEntries,
+          name="FieldParser: %d lines" % line_count,
+          data=data)
+
+  def testKeyValueParser(self):
+    parser = config_file.KeyValueParser()
+    for line_count in self.LINE_COUNTS:
+      data = self._KeyValueData(line_count)
+      self.assertEqual(len(parser.ParseToOrderedDict(data)), line_count)
+      self.TimeIt(
+          parser.ParseToOrderedDict,
+          name="KeyValueParser: %d lines" % line_count,
+          data=data)
+
+  def testSearchParser(self):
+    for term_count in [100, 400, 1600]:
+      query = self._Query(term_count)
+
+      def Parse(parser_cls, query=query):
+        return parser_cls(query).Parse()
+
+      self.TimeIt(
+          Parse,
+          name="SearchParser: %d terms" % term_count,
+          parser_cls=lexer.SearchParser)
+      self.TimeIt(
+          Parse,
+          name="objectfilter.Parser: %d terms" % term_count,
+          parser_cls=objectfilter.Parser)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
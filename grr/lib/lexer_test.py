@@ -69,6 +69,94 @@ or 'file name' contains "foo" and date before "2011-10" """).Parse()
       parser = lexer.SearchParser(expression)
       self.assertRaises(lexer.ParseError, parser.Parse)
 
+  def testTokenOrder(self):
+    """Test that the first matching token wins, not the longest."""
+
+    class TestLexer(lexer.Lexer):
+      tokens = [
+          lexer.Token("INITIAL", r"ab", "Short", None),
+          lexer.Token("INITIAL", r"abc", "Long", None),
+          lexer.Token("INITIAL", r"(c)", "Single", None),
+      ]
+
+      def __init__(self, data):
+        super(TestLexer, self).__init__(data)
+        self.matches = []
+
+      def Short(self, string=None, **_):
+        self.matches.append(("Short", string))
+
+      def Long(self, string=None, **_):
+        self.matches.append(("Long", string))
+
+      def Single(self, match=None, **_):
+        self.matches.append(("Single", match.group(1)))
+
+    parser = TestLexer("abcab")
+    parser.Close()
+    self.assertEqual(parser.matches, [("Short", "ab"), ("Single", "c"),
+                                      ("Short", "ab")])
+
+  def testBuffers(self):
+    """Test the buffers while feeding data and pushing it back."""
+
+    class TestLexer(lexer.Lexer):
+      tokens = [
+          lexer.Token("INITIAL", r"\w+", None, None),
+          lexer.Token("INITIAL", r"\s+", None, None),
+      ]
+
+    parser = TestLexer("hello ")
+    parser.NextToken()
+    self.assertEqual(parser.buffer, " ")
+    self.assertEqual(parser.processed_buffer, "hello")
+
+    parser.Feed("world")
+    self.assertEqual(parser.buffer, " world")
+    self.assertEqual(parser.processed_buffer, "hello")
+
+    parser.NextToken()
+    parser.NextToken()
+    self.assertTrue(parser.Empty())
+    self.assertEqual(parser.processed, 11)
+    self.assertEqual(parser.processed_buffer, "hello world")
+
+    parser.PushBack("world")
+    self.assertEqual(parser.buffer, "world")
+    self.assertEqual(parser.processed_buffer, "hello ")
+
+    # Pushing back data which was not processed puts it in front.
+    parser.PushBack("big ")
+    self.assertEqual(parser.buffer, "big world")
+    self.assertEqual(parser.processed_buffer, "he")
+
+    parser.buffer = "new"
+    self.assertEqual(parser.buffer, "new")
+    self.assertEqual(parser.processed_buffer, "he")
+    parser.NextToken()
+    self.assertTrue(parser.Empty())
+
+  def testAnchoredTokens(self):
+    """Test tokens looking at the start of the remaining input."""
+
+    class TestLexer(lexer.Lexer):
+      tokens = [
+          lexer.Token("INITIAL", r"^x", "Start", None),
+          lexer.Token("INITIAL", r".", None, None),
+      ]
+
+      def __init__(self, data):
+        super(TestLexer, self).__init__(data)
+        self.starts = 0
+
+      def Start(self, **_):
+        self.starts += 1
+
+    parser = TestLexer("xxax")
+    parser.Close()
+    # ^ matches at the start of the remaining input, not only of the data.
+    self.assertEqual(parser.starts, 3)
+
 
 def main(argv):
   test_lib.main(argv)
@@ -84,6 +84,12 @@ filter is easy. Three basic filter implementations are given:
   attribute name, so that it only accesses attributes, not methods.
   DictFilterImplementation: search path expansion is done on dictionary access
   to the given object. So "a.b" expands the object obj to obj["a"]["b"]
+
+Matches walks the filter tree for every object. Filters can also be turned
+into a matcher function with GetMatcher, which resolves the search paths and
+operators once and is much faster when many objects are filtered. Filter uses
+the matcher. CompileFilter parses and compiles an expression and caches the
+result, so frequently used expressions are only parsed once.
 """
 
 
@@ -91,6 +97,7 @@ filter is easy. Three basic filter implementations are given:
 import abc
 import binascii
 import collections
+import operator
 import re
 
 from grr.lib import lexer
@@ -113,6 +120,12 @@ class InvalidNumberOfOperands(Error):
   """The number of operands provided to this operator is wrong."""
 
 
+def _IsOverridden(obj, base_cls, method_name):
+  """Whether the class of obj overrides the method of base_cls."""
+  method = getattr(obj.__class__, method_name).__func__
+  return method is not getattr(base_cls, method_name).__func__
+
+
 class Filter(object):
   """Base class for every filter."""
 
@@ -136,14 +149,32 @@ class Filter(object):
                     (self.value_expander_cls))
       self.value_expander = self.value_expander_cls()
     self.args = arguments or []
+    self._matcher = None
 
   @abc.abstractmethod
   def Matches(self, obj):
     """Whether object obj matches this filter."""
 
+  def MakeMatcher(self):
+    """Returns a function telling whether an object matches this filter.
+
+    Subclasses can return a function which is faster than Matches by doing
+    as much of the work as possible up front.
+
+    Returns:
+      A function taking an object and returning a boolean.
+    """
+    return self.Matches
+
+  def GetMatcher(self):
+    """Returns the (cached) result of MakeMatcher."""
+    if self._matcher is None:
+      self._matcher = self.MakeMatcher()
+    return self._matcher
+
   def Filter(self, objects):
     """Returns a list of objects that pass the filter."""
-    return filter(self.Matches, objects)
+    return filter(self.GetMatcher(), objects)
 
   def __str__(self):
     return "%s(%s)" % (self.__class__.__name__,
@@ -162,6 +193,17 @@ class AndFilter(Filter):
         return False
     return True
 
+  def MakeMatcher(self):
+    matchers = [child_filter.MakeMatcher() for child_filter in self.args]
+
+    def MatchesAll(obj):
+      for matcher in matchers:
+        if not matcher(obj):
+          return False
+      return True
+
+    return MatchesAll
+
 
 class OrFilter(Filter):
   """Performs a boolean OR of the given Filter instances as arguments.
@@ -177,6 +219,20 @@ class OrFilter(Filter):
         return True
     return False
 
+  def MakeMatcher(self):
+    if not self.args:
+      return lambda _: True
+
+    matchers = [child_filter.MakeMatcher() for child_filter in self.args]
+
+    def MatchesAny(obj):
+      for matcher in matchers:
+        if matcher(obj):
+          return True
+      return False
+
+    return MatchesAny
+
 
 class Operator(Filter):
   """Base class for all operators."""
@@ -187,6 +243,9 @@ class IdentityFilter(Operator):
   def Matches(self, _):
     return True
 
+  def MakeMatcher(self):
+    return lambda _: True
+
 
 class UnaryOperator(Operator):
   """Base class for unary operators."""
@@ -244,6 +303,30 @@ class GenericBinaryOperator(BinaryOperator):
       return True
     return False
 
+  def MakeOperate(self):
+    """Returns a function equivalent to Operate."""
+    if _IsOverridden(self, GenericBinaryOperator, "Operate"):
+      return self.Operate
+
+    operation = self.Operation
+    right_operand = self.right_operand
+
+    def Operate(values):
+      for val in values:
+        try:
+          if operation(val, right_operand):
+            return True
+        except (ValueError, TypeError):
+          continue
+      return False
+
+    return Operate
+
+  def MakeMatcher(self):
+    expand = self.value_expander.MakeExpander(self.left_operand)
+    operate = self.MakeOperate()
+    return lambda obj: operate(expand(obj))
+
 
 class Equals(GenericBinaryOperator):
   """Matches objects when the right operand equals the expanded value."""
@@ -260,6 +343,12 @@ class NotEquals(GenericBinaryOperator):
         arguments=self.args,
         value_expander=self.value_expander_cls).Operate(values)
 
+  def MakeOperate(self):
+    operate = Equals(
+        arguments=self.args,
+        value_expander=self.value_expander_cls).MakeOperate()
+    return lambda values: not operate(values)
+
 
 class Less(GenericBinaryOperator):
   """Whether the expanded value >= right_operand."""
@@ -309,6 +398,12 @@ class NotContains(GenericBinaryOperator):
         arguments=self.args,
         value_expander=self.value_expander_cls).Operate(values)
 
+  def MakeOperate(self):
+    operate = Contains(
+        arguments=self.args,
+        value_expander=self.value_expander_cls).MakeOperate()
+    return lambda values: not operate(values)
+
 
 # TODO(user): Change to an N-ary Operator?
 class InSet(GenericBinaryOperator):
@@ -341,6 +436,12 @@ class NotInSet(GenericBinaryOperator):
         arguments=self.args,
         value_expander=self.value_expander_cls).Operate(values)
 
+  def MakeOperate(self):
+    operate = InSet(
+        arguments=self.args,
+        value_expander=self.value_expander_cls).MakeOperate()
+    return lambda values: not operate(values)
+
 
 class Regexp(GenericBinaryOperator):
   """Whether the value matches the regexp in the right operand."""
@@ -435,6 +536,19 @@ class Context(Operator):
           return True
     return False
 
+  def MakeMatcher(self):
+    expand = self.value_expander.MakeExpander(self.context)
+    condition = self.condition.MakeMatcher()
+
+    def MatchesInContext(obj):
+      for object_list in expand(obj):
+        for sub_object in object_list:
+          if condition(sub_object):
+            return True
+      return False
+
+    return MatchesInContext
+
 
 OP2FN = {
     "equals": Equals,
@@ -542,6 +656,84 @@ class ValueExpander(object):
       for value in self._AtNonLeaf(attr_value, path):
         yield value
 
+  def _MakeValueGetter(self, attr_name):
+    """Returns a function equivalent to _GetValue for attr_name."""
+    return lambda obj: self._GetValue(obj, attr_name)
+
+  def MakeExpander(self, path):
+    """Returns a function equivalent to Expand for the given path.
+
+    The path is split and the attribute names are resolved only once here,
+    instead of every time an object is expanded.
+
+    Args:
+      path: A list of strings or a string with the field separator.
+
+    Returns:
+      A function taking an object and returning an iterable of values.
+    """
+    if isinstance(path, basestring):
+      path = path.split(self.FIELD_SEPARATOR)
+    path = list(path)
+
+    # Expanders which change the traversal itself are used as they are.
+    for method_name in ["Expand", "_AtLeaf", "_AtNonLeaf"]:
+      if _IsOverridden(self, ValueExpander, method_name):
+        return lambda obj: self.Expand(obj, path)
+
+    return self._MakePathExpander(path)
+
+  def _MakePathExpander(self, path):
+    """Builds the expander for a path, see Expand for the semantics."""
+    get_value = self._MakeValueGetter(self._GetAttributeName(path))
+
+    if len(path) == 1:
+      at_leaf = self._AtLeaf
+
+      def ExpandLeaf(obj):
+        attr_value = get_value(obj)
+        if attr_value is None:
+          return ()
+        return at_leaf(attr_value)
+
+      return ExpandLeaf
+
+    # Mappings are indexed with the next path element as is.
+    key = path[1]
+    expand_rest = self._MakePathExpander(path[1:])
+    if len(path) > 2:
+      expand_key_rest = self._MakePathExpander(path[2:])
+    else:
+      expand_key_rest = None
+
+    def ExpandNonLeaf(obj):
+      attr_value = get_value(obj)
+      if attr_value is None:
+        return
+
+      try:
+        if isinstance(attr_value, collections.Mapping):
+          sub_obj = attr_value.get(key)
+          if expand_key_rest is not None:
+            sub_obj = expand_key_rest(sub_obj)
+          if isinstance(sub_obj, basestring):
+            yield sub_obj
+          elif isinstance(sub_obj, collections.Mapping):
+            for k, v in sub_obj.items():
+              yield {k: v}
+          else:
+            for value in sub_obj:
+              yield value
+        else:
+          for sub_obj in attr_value:
+            for value in expand_rest(sub_obj):
+              yield value
+      except TypeError:
+        for value in expand_rest(attr_value):
+          yield value
+
+    return ExpandNonLeaf
+
 
 class AttributeValueExpander(ValueExpander):
   """An expander that gives values based on object attribute names."""
@@ -551,6 +743,40 @@ class AttributeValueExpander(ValueExpander):
       return obj.get(attr_name)
     return getattr(obj, attr_name, None)
 
+  def _MakeValueGetter(self, attr_name):
+    """Returns a _GetValue function which resolves the access per type."""
+    if _IsOverridden(self, AttributeValueExpander, "_GetValue"):
+      return super(AttributeValueExpander, self)._MakeValueGetter(attr_name)
+
+    get_attribute = operator.attrgetter(attr_name)
+
+    def GetItem(obj):
+      return obj.get(attr_name)
+
+    def GetAttribute(obj):
+      try:
+        return get_attribute(obj)
+      except AttributeError:
+        return None
+
+    # Filtered objects are mostly of a few types, so whether they are mappings
+    # is only checked once per type.
+    getters = {}
+
+    def GetValue(obj):
+      obj_type = type(obj)
+      try:
+        getter = getters[obj_type]
+      except KeyError:
+        if issubclass(obj_type, collections.Mapping):
+          getter = GetItem
+        else:
+          getter = GetAttribute
+        getters[obj_type] = getter
+      return getter(obj)
+
+    return GetValue
+
 
 class LowercaseAttributeValueExpander(AttributeValueExpander):
   """An expander that lowercases all attribute names before access."""
@@ -565,6 +791,11 @@ class DictValueExpander(ValueExpander):
   def _GetValue(self, obj, attr_name):
     return obj.get(attr_name, None)
 
+  def _MakeValueGetter(self, attr_name):
+    if _IsOverridden(self, DictValueExpander, "_GetValue"):
+      return super(DictValueExpander, self)._MakeValueGetter(attr_name)
+    return lambda obj: obj.get(attr_name, None)
+
 
 # PARSER DEFINITION
 class BasicExpression(lexer.Expression):
@@ -877,3 +1108,34 @@ class DictFilterImplementation(BaseFilterImplementation):
   FILTERS = {}
   FILTERS.update(BaseFilterImplementation.FILTERS)
   FILTERS.update({"ValueExpander": DictValueExpander})
+
+
+# Recently compiled filters, keyed by expression and filter implementation.
+_COMPILED_FILTERS = utils.FastStore(max_size=1000)
+
+
+def CompileFilter(expression, filter_implementation=BaseFilterImplementation):
+  """Parses and compiles an expression.
+
+  Compiled filters are cached, so repeatedly compiling the same expression
+  only parses it once. The returned filter is shared and must not be modified.
+
+  Args:
+    expression: The filter expression.
+    filter_implementation: The filter implementation to compile with.
+
+  Returns:
+    A Filter object.
+
+  Raises:
+    Error: The expression is invalid.
+  """
+  key = (expression, filter_implementation)
+  try:
+    return _COMPILED_FILTERS.Get(key)
+  except KeyError:
+    pass
+
+  compiled_filter = Parser(expression).Parse().Compile(filter_implementation)
+  _COMPILED_FILTERS.Put(key, compiled_filter)
+  return compiled_filter
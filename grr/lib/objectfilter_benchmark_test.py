@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Benchmark tests for objectfilter."""
+
+
+from grr.lib import flags
+from grr.lib import objectfilter
+from grr.lib import test_lib
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import paths as rdf_paths
+
+
+class ObjectFilterBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare the filter tree interpreter with compiled matchers."""
+
+  REPEATS = 5
+
+  STAT_ENTRY_COUNT = 20000
+
+  QUERIES = [
+      "st_size > 4096",
+      "st_size > 4096 and st_mode == 33261",
+      "pathspec.path contains 'bin' or st_uid inset [0, 1, 2]",
+      "st_mtime > 1400000000 and pathspec.path regexp 'lib.*\\.so$'",
+  ]
+
+  def setUp(self):
+    super(ObjectFilterBenchmarks, self).setUp()
+    self.stat_entries = []
+    for i in xrange(self.STAT_ENTRY_COUNT):
+      self.stat_entries.append(
+          rdf_client.StatEntry(
+              pathspec=rdf_paths.PathSpec(
+                  path="/usr/%s/file%d.so" % ("bin" if i % 3 else "lib", i),
+                  pathtype=rdf_paths.PathSpec.PathType.OS),
+              st_size=i,
+              st_mode=33261 if i % 2 else 33188,
+              st_uid=i % 10,
+              st_mtime=1300000000 + i * 10000))
+
+  def _Benchmark(self, query):
+    compiled_filter = objectfilter.CompileFilter(
+        query, objectfilter.LowercaseAttributeFilterImplementation)
+
+    def Interpret():
+      return len(filter(compiled_filter.Matches, self.stat_entries))
+
+    def Compiled():
+      return len(compiled_filter.Filter(self.stat_entries))
+
+    self.assertEqual(Interpret(), Compiled())
+
+    self.TimeIt(Interpret, name="Tree: %s" % query)
+    self.TimeIt(Compiled, name="Compiled: %s" % query)
+
+  def testFilterStatEntries(self):
+    for query in self.QUERIES:
+      self._Benchmark(query)
+
+  def testCompileFilter(self):
+    query = self.QUERIES[-1]
+
+    def Parse():
+      return objectfilter.Parser(query).Parse().Compile(
+          objectfilter.LowercaseAttributeFilterImplementation)
+
+    def Cached():
+      return objectfilter.CompileFilter(
+          query, objectfilter.LowercaseAttributeFilterImplementation)
+
+    self.TimeIt(Parse, name="Parse and compile", repetitions=1000)
+    self.TimeIt(Cached, name="Cached compile", repetitions=1000)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
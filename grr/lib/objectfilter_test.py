@@ -216,6 +216,16 @@ class ObjectFilterTest(unittest.TestCase):
         }
         self.assertEqual(test_unit[0], operator(**kwargs).Matches(self.file))
 
+  def testCompiledBinaryOperators(self):
+    for operator, test_data in self.operator_tests.items():
+      for test_unit in test_data:
+        kwargs = {
+            "arguments": test_unit[1],
+            "value_expander": self.value_expander
+        }
+        matcher = operator(**kwargs).GetMatcher()
+        self.assertEqual(test_unit[0], matcher(self.file))
+
   def testExpand(self):
     # Case insensitivity
     values_lowercase = self.value_expander().Expand(self.file, "size")
@@ -288,6 +298,32 @@ class ObjectFilterTest(unittest.TestCase):
     values = self.value_expander().Expand(self.file, "Callable.a")
     self.assertListEqual(list(values), [])
 
+  def testMakeExpander(self):
+    paths = [
+        "size", "Size", "mapping.string", "mapping.float", "attributes",
+        "hash.md5", "non_callable_repeated.desmond", "mapping.hashes",
+        "mapping.nested.attrs", "nonexistant", "hash.mink.boo", "hash.mink", "non_callable_leaf",
+        "Callable", "Callable.a"
+    ]
+    expander = self.value_expander()
+    for path in paths:
+      expand = expander.MakeExpander(path)
+      self.assertEqual(
+          list(expand(self.file)),
+          list(expander.Expand(self.file, path)),
+          "Different values for %s" % path)
+      # The expander can be reused.
+      self.assertEqual(
+          list(expand(self.file)), list(expander.Expand(self.file, path)))
+
+    expand = expander.MakeExpander("deferred_values")
+    self.assertListEqual([list(value) for value in expand(self.file)],
+                         [["a", "b"]])
+
+    expand = expander.MakeExpander("imported_dlls.imported_functions")
+    self.assertListEqual([list(value) for value in expand(self.file)],
+                         [["FindWindow", "CreateFileA"], ["RegQueryValueEx"]])
+
   def testGenericBinaryOperator(self):
 
     class TestBinaryOperator(objectfilter.GenericBinaryOperator):
@@ -545,5 +581,38 @@ AND @exported_symbols(name is 'inject')
     self.assertEqual(filter_.Matches(obj), False)
 
 
+  def testMatcherAgreesWithMatches(self):
+    queries = [
+        "size == 10", "size != 10", "name contains 'file'",
+        "hash.md5 inset ['123abc', '456def']", "hash.md5 notinset ['x']",
+        "size > 5 and float < 100", "size > 50 or float > 100",
+        "mapping.string regexp 'ma.e'", "attributes notcontains 'x'",
+        "@imported_dlls( imported_functions contains 'RegQueryValueEx' and "
+        "name is 'b.dll')",
+        "@imported_dlls( imported_functions contains 'RegQueryValueEx' and "
+        "name is 'a.dll')"
+    ]
+    for query in queries:
+      filter_ = objectfilter.Parser(query).Parse().Compile(self.filter_imp)
+      self.assertEqual(
+          filter_.GetMatcher()(self.file),
+          filter_.Matches(self.file), "Different results for %s" % query)
+
+  def testCompileFilterCachesFilters(self):
+    query = "something is 'Blue'"
+    filter_ = objectfilter.CompileFilter(query, self.filter_imp)
+    self.assertIs(objectfilter.CompileFilter(query, self.filter_imp), filter_)
+    self.assertIsNot(
+        objectfilter.CompileFilter(query,
+                                   objectfilter.DictFilterImplementation),
+        filter_)
+
+    objs = [DummyObject("something", "Blue"), DummyObject("something", "Red")]
+    self.assertEqual(filter_.Filter(objs), objs[:1])
+
+    self.assertRaises(objectfilter.ParseError, objectfilter.CompileFilter,
+                      "something is", self.filter_imp)
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""A pool of processes running artifact parsers.
+
+Parsers run in the worker thread processing the flow by default. CPU heavy
+parsers then hold the GIL and the flow lock for as long as they run. When
+Artifacts.parser_pool_size is set, parsing is done in separate processes
+instead: parser arguments are pickled and sent to a pool process, which
+returns the parsed RDFValues.
+"""
+
+import itertools
+import multiprocessing
+from multiprocessing import queues
+import os
+import signal
+import StringIO
+import threading
+import time
+
+from grr.lib import aff4
+from grr.lib import config_lib
+from grr.lib import parsers
+from grr.lib import registry
+from grr.lib import stats
+
+# Extra time to wait for a parser which is about to be killed for timing out.
+TIMEOUT_GRACE = 5
+
+# How often to check that the process running a parser is still alive.
+LIVENESS_CHECK_INTERVAL = 0.5
+
+# Time to wait for the result of a parser whose process has exited. Processes
+# exit after delivering the result of their last parse.
+EXIT_GRACE = 1
+
+# Pool processes are replaced after this many parses, so memory leaked or
+# fragmented by parsers is returned.
+MAX_PARSES_PER_PROCESS = 1000
+
+
+class Error(parsers.Error):
+  """Base error class."""
+
+
+class ParserTimeoutError(Error):
+  """A parser did not return in time."""
+
+
+class ParserCrashedError(Error):
+  """The process running a parser died."""
+
+
+class ParserFailedError(Error):
+  """A parser raised an exception in the pool."""
+
+
+# A queue the pool processes announce the parses they start on.
+_STARTED_QUEUE = None
+
+
+def _InitializeProcess(started_queue):
+  global _STARTED_QUEUE
+  _STARTED_QUEUE = started_queue
+  # SIGALRM kills the process when a parse times out. Handlers inherited from
+  # the parent could prevent that.
+  signal.signal(signal.SIGALRM, signal.SIG_DFL)
+  # Interrupting the parent should not interrupt parses in progress.
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _Parse(task_id, parser_cls, method_name, args, kwargs, timeout):
+  """Runs a parser in a pool process.
+
+  Args:
+    task_id: The id the parent uses to find the process running the parse.
+    parser_cls: The parser class.
+    method_name: The parse method to call, Parse, ParseMultiple or
+      ParseBatch.
+    args: Positional arguments for the parse method.
+    kwargs: Keyword arguments for the parse method.
+    timeout: Seconds after which the process is killed.
+
+  Returns:
+    A tuple (results, error, cpu_time). Results is a list of RDFValues, error
+    a string describing an exception raised by the parser, or None.
+  """
+  _STARTED_QUEUE.put((task_id, os.getpid()))
+  signal.setitimer(signal.ITIMER_REAL, timeout)
+  start_time = time.clock()
+  try:
+    results = list(getattr(parser_cls(), method_name)(*args, **kwargs) or [])
+    error = None
+  except Exception as e:  # pylint: disable=broad-except
+    results = []
+    error = "%s: %s" % (e.__class__.__name__, e)
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+
+  return results, error, time.clock() - start_time
+
+
+class ParserPool(object):
+  """Runs parsers in a pool of processes."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._pool = None
+    self._size = 0
+    self._started_queue = None
+    # Maps the ids of started parses to the pid of the process running them.
+    self._task_pids = {}
+    self._task_ids = itertools.count()
+
+  @property
+  def enabled(self):
+    return config_lib.CONFIG["Artifacts.parser_pool_size"] > 0
+
+  def _GetPool(self):
+    size = config_lib.CONFIG["Artifacts.parser_pool_size"]
+    with self._lock:
+      if self._pool is None or self._size != size:
+        if self._pool is not None:
+          self._pool.terminate()
+        # Puts on a SimpleQueue are written before they return, so they are
+        # not lost when the process dies right after.
+        self._started_queue = queues.SimpleQueue()
+        self._task_pids = {}
+        self._pool = multiprocessing.Pool(
+            processes=size,
+            initializer=_InitializeProcess,
+            initargs=(self._started_queue,),
+            maxtasksperchild=MAX_PARSES_PER_PROCESS)
+        self._size = size
+      return self._pool
+
+  def Stop(self):
+    """Terminates the pool processes."""
+    with self._lock:
+      if self._pool is not None:
+        self._pool.terminate()
+        self._pool.join()
+        self._pool = None
+
+  def _ProcessDied(self, pool, task_id):
+    """Returns True if the process which started a parse is gone."""
+    with self._lock:
+      while not self._started_queue.empty():
+        started_id, pid = self._started_queue.get()
+        self._task_pids[started_id] = pid
+      pid = self._task_pids.get(task_id)
+
+    if pid is None:
+      # No process has started the parse yet.
+      return False
+
+    # Dead processes are removed from the pool and replaced.
+    for process in pool._pool:  # pylint: disable=protected-access
+      if process.pid == pid:
+        return not process.is_alive()
+    return True
+
+  def _Wait(self, pool, async_result, task_id, timeout):
+    """Waits for a parse to finish, its process to die or the timeout.
+
+    Args:
+      pool: The pool running the parse.
+      async_result: The AsyncResult of the parse.
+      task_id: The id the parse was started with.
+      timeout: The parser timeout.
+
+    Returns:
+      The tuple returned by _Parse.
+
+    Raises:
+      ParserCrashedError: The process running the parser died.
+      multiprocessing.TimeoutError: The parser did not finish in time.
+    """
+    start_time = time.time()
+    deadline = start_time + timeout + TIMEOUT_GRACE
+    try:
+      while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          raise multiprocessing.TimeoutError()
+
+        async_result.wait(min(remaining, LIVENESS_CHECK_INTERVAL))
+        if async_result.ready():
+          return async_result.get()
+
+        if self._ProcessDied(pool, task_id):
+          async_result.wait(EXIT_GRACE)
+          if async_result.ready():
+            return async_result.get()
+          if time.time() - start_time >= timeout:
+            # The process was killed for timing out.
+            raise multiprocessing.TimeoutError()
+          raise ParserCrashedError()
+    finally:
+      with self._lock:
+        self._task_pids.pop(task_id, None)
+
+  def _ReadFile(self, fd):
+    """Reads an AFF4 stream so it can be sent to the pool."""
+    if fd.size > config_lib.CONFIG["Artifacts.parser_pool_max_file_size"]:
+      return None
+    fd.Seek(0)
+    return StringIO.StringIO(fd.Read(fd.size))
+
+  def _PrepareArgument(self, arg):
+    """Replaces AFF4 streams in arg with in memory copies.
+
+    Args:
+      arg: A parse method argument.
+
+    Returns:
+      The argument to send to the pool, or None if it can't be sent.
+    """
+    if isinstance(arg, aff4.AFF4Stream):
+      return self._ReadFile(arg)
+
+    if isinstance(arg, list) and any(
+        isinstance(item, aff4.AFF4Stream) for item in arg):
+      file_objects = [self._PrepareArgument(item) for item in arg]
+      if None in file_objects:
+        return None
+      return file_objects
+
+    return arg
+
+  def Parse(self, processor_obj, method_name, args, kwargs=None):
+    """Runs a parse method in the pool.
+
+    Args:
+      processor_obj: A Parser object.
+      method_name: The parse method to call, Parse, ParseMultiple or
+        ParseBatch.
+      args: Positional arguments for the parse method.
+      kwargs: Keyword arguments for the parse method.
+
+    Returns:
+      A list of parsed RDFValues, or None if the arguments can't be sent to
+      the pool. They should be parsed in this process then.
+
+    Raises:
+      ParserFailedError: The parser raised an exception.
+      ParserTimeoutError: The parser timed out.
+      ParserCrashedError: The process running the parser died.
+    """
+    prepared_args = []
+    for arg in args:
+      prepared_arg = self._PrepareArgument(arg)
+      if prepared_arg is None and arg is not None:
+        return None
+      prepared_args.append(prepared_arg)
+
+    parser_name = processor_obj.__class__.__name__
+    timeout = config_lib.CONFIG["Artifacts.parser_timeout"]
+    pool = self._GetPool()
+    task_id = next(self._task_ids)
+    async_result = pool.apply_async(
+        _Parse, (task_id, processor_obj.__class__, method_name, prepared_args,
+                 kwargs or {}, timeout))
+
+    try:
+      results, error, cpu_time = self._Wait(pool, async_result, task_id,
+                                            timeout)
+    except multiprocessing.TimeoutError:
+      stats.STATS.IncrementCounter(
+          "artifact_parser_timeouts", fields=[parser_name])
+      raise ParserTimeoutError("Parser %s did not finish within %d seconds." %
+                               (parser_name, timeout))
+    except ParserCrashedError:
+      stats.STATS.IncrementCounter(
+          "artifact_parser_crashes", fields=[parser_name])
+      raise ParserCrashedError("Parser %s process died." % parser_name)
+
+    stats.STATS.RecordEvent(
+        "artifact_parser_cpu_time", cpu_time, fields=[parser_name])
+    if error is not None:
+      stats.STATS.IncrementCounter(
+          "artifact_parser_errors", fields=[parser_name])
+      raise ParserFailedError("Parser %s failed: %s" % (parser_name, error))
+
+    return results
+
+
+POOL = ParserPool()
+
+
+class ParserPoolStatsInit(registry.InitHook):
+  """Registers the stats of the parser pool."""
+
+  def RunOnce(self):
+    stats.STATS.RegisterEventMetric(
+        "artifact_parser_cpu_time", fields=[("parser", str)])
+    stats.STATS.RegisterCounterMetric(
+        "artifact_parser_timeouts", fields=[("parser", str)])
+    stats.STATS.RegisterCounterMetric(
+        "artifact_parser_errors", fields=[("parser", str)])
+    stats.STATS.RegisterCounterMetric(
+        "artifact_parser_crashes", fields=[("parser", str)])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Benchmark tests for the artifact parser pool."""
+
+
+import threading
+
+from grr.lib import flags
+from grr.lib import parser_pool
+from grr.lib import parsers
+from grr.lib import rdfvalue
+from grr.lib import test_lib
+from grr.lib.rdfvalues import client as rdf_client
+
+
+class BenchmarkPasswdParser(parsers.GenericResponseParser):
+  """A CPU heavy parser of passwd style lines."""
+
+  output_types = ["RDFString"]
+
+  def Parse(self, response, knowledge_base):
+    usernames = set()
+    for line in str(response).splitlines():
+      fields = line.split(":")
+      if len(fields) == 7 and int(fields[2]) >= 1000:
+        usernames.add(fields[0])
+    yield rdfvalue.RDFString(",".join(sorted(usernames)))
+
+
+class ParserPoolBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare parsing in worker threads with parsing in the parser pool."""
+
+  REPEATS = 3
+
+  THREAD_COUNT = 4
+  PARSES_PER_THREAD = 4
+  LINE_COUNT = 100000
+
+  def setUp(self):
+    super(ParserPoolBenchmarks, self).setUp()
+    self.response = rdfvalue.RDFString("\n".join(
+        "user%d:x:%d:%d::/home/user%d:/bin/sh" % (i, i, i, i)
+        for i in xrange(self.LINE_COUNT)))
+    self.knowledge_base = rdf_client.KnowledgeBase(os="Linux")
+
+  def tearDown(self):
+    parser_pool.POOL.Stop()
+    super(ParserPoolBenchmarks, self).tearDown()
+
+  def _ParseInThreads(self, parse):
+
+    def Worker():
+      for _ in xrange(self.PARSES_PER_THREAD):
+        parse()
+
+    threads = [
+        threading.Thread(target=Worker) for _ in xrange(self.THREAD_COUNT)
+    ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+  def testParse(self):
+    parser = BenchmarkPasswdParser()
+
+    def Inline():
+      return list(parser.Parse(self.response, self.knowledge_base))
+
+    def InPool():
+      return parser_pool.POOL.Parse(parser, "Parse",
+                                    [self.response, self.knowledge_base])
+
+    parse_count = self.THREAD_COUNT * self.PARSES_PER_THREAD
+    with test_lib.ConfigOverrider({
+        "Artifacts.parser_pool_size": self.THREAD_COUNT
+    }):
+      self.assertEqual(Inline(), InPool())
+
+      self.TimeIt(
+          self._ParseInThreads,
+          name="Worker threads: %d parses" % parse_count,
+          parse=Inline)
+      self.TimeIt(
+          self._ParseInThreads,
+          name="Parser pool: %d parses" % parse_count,
+          parse=InPool)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
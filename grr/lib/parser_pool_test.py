@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Tests for the artifact parser pool."""
+
+import os
+import time
+
+from grr.lib import aff4
+from grr.lib import flags
+from grr.lib import parser_pool
+from grr.lib import parsers
+from grr.lib import rdfvalue
+from grr.lib import stats
+from grr.lib import test_lib
+from grr.lib import utils
+from grr.lib.rdfvalues import client as rdf_client
+
+
+class PoolTestParser(parsers.GenericResponseParser):
+  """Returns the process the response was parsed in."""
+
+  output_types = ["RDFString"]
+
+  def Parse(self, response, knowledge_base):
+    yield rdfvalue.RDFString("%s:%s:%d" % (response, knowledge_base.os,
+                                           os.getpid()))
+
+
+class FailingPoolTestParser(parsers.GenericResponseParser):
+
+  output_types = ["RDFString"]
+
+  def Parse(self, response, knowledge_base):
+    raise ValueError("Bad response %s" % response)
+
+
+class SlowPoolTestParser(parsers.GenericResponseParser):
+
+  output_types = ["RDFString"]
+
+  def Parse(self, response, knowledge_base):
+    time.sleep(60)
+    return []
+
+
+class CrashingPoolTestParser(parsers.GenericResponseParser):
+
+  output_types = ["RDFString"]
+
+  def Parse(self, response, knowledge_base):
+    os._exit(1)  # pylint: disable=protected-access
+
+
+class PoolTestFileParser(parsers.FileParser):
+
+  output_types = ["RDFString"]
+  process_together = True
+
+  def ParseMultiple(self, stats_entries, file_objects, knowledge_base):
+    for file_object in file_objects:
+      yield rdfvalue.RDFString(file_object.read())
+
+
+class ParserPoolTest(test_lib.GRRBaseTest):
+  """Tests for the parser pool."""
+
+  def setUp(self):
+    super(ParserPoolTest, self).setUp()
+    self.config_overrider = test_lib.ConfigOverrider({
+        "Artifacts.parser_pool_size": 2,
+        "Artifacts.parser_timeout": 1
+    })
+    self.config_overrider.Start()
+    self.knowledge_base = rdf_client.KnowledgeBase(os="Linux")
+
+  def tearDown(self):
+    parser_pool.POOL.Stop()
+    self.config_overrider.Stop()
+    super(ParserPoolTest, self).tearDown()
+
+  def _Parse(self, parser_cls, response="response"):
+    return parser_pool.POOL.Parse(parser_cls(), "Parse",
+                                  [response, self.knowledge_base])
+
+  def testParsesInPoolProcess(self):
+    self.assertTrue(parser_pool.POOL.enabled)
+    before = stats.STATS.GetMetricValue(
+        "artifact_parser_cpu_time", fields=["PoolTestParser"]).count
+
+    results = self._Parse(PoolTestParser)
+    self.assertEqual(len(results), 1)
+    self.assertIsInstance(results[0], rdfvalue.RDFString)
+    response, os_name, pid = str(results[0]).split(":")
+    self.assertEqual(response, "response")
+    self.assertEqual(os_name, "Linux")
+    self.assertNotEqual(int(pid), os.getpid())
+
+    after = stats.STATS.GetMetricValue(
+        "artifact_parser_cpu_time", fields=["PoolTestParser"]).count
+    self.assertEqual(after - before, 1)
+
+  def testParserExceptionsAreRaised(self):
+    before = stats.STATS.GetMetricValue(
+        "artifact_parser_errors", fields=["FailingPoolTestParser"])
+    with self.assertRaises(parser_pool.ParserFailedError) as e:
+      self._Parse(FailingPoolTestParser, response="foo")
+    self.assertIn("ValueError: Bad response foo", str(e.exception))
+    after = stats.STATS.GetMetricValue(
+        "artifact_parser_errors", fields=["FailingPoolTestParser"])
+    self.assertEqual(after - before, 1)
+
+  def testSlowParsersAreKilled(self):
+    before = stats.STATS.GetMetricValue(
+        "artifact_parser_timeouts", fields=["SlowPoolTestParser"])
+    with utils.Stubber(parser_pool, "TIMEOUT_GRACE", 1):
+      start = time.time()
+      self.assertRaises(parser_pool.ParserTimeoutError, self._Parse,
+                        SlowPoolTestParser)
+      self.assertLess(time.time() - start, 10)
+    after = stats.STATS.GetMetricValue(
+        "artifact_parser_timeouts", fields=["SlowPoolTestParser"])
+    self.assertEqual(after - before, 1)
+
+    # The killed process is replaced.
+    for _ in range(3):
+      self.assertEqual(len(self._Parse(PoolTestParser)), 1)
+
+  def testCrashingParsersAreIsolated(self):
+    before = stats.STATS.GetMetricValue(
+        "artifact_parser_crashes", fields=["CrashingPoolTestParser"])
+    with test_lib.ConfigOverrider({"Artifacts.parser_timeout": 300}):
+      start = time.time()
+      self.assertRaises(parser_pool.ParserCrashedError, self._Parse,
+                        CrashingPoolTestParser)
+      # The crash is noticed without waiting for the parser timeout.
+      self.assertLess(time.time() - start, 10)
+    after = stats.STATS.GetMetricValue(
+        "artifact_parser_crashes", fields=["CrashingPoolTestParser"])
+    self.assertEqual(after - before, 1)
+
+    # The crashed process is replaced.
+    for _ in range(3):
+      self.assertEqual(len(self._Parse(PoolTestParser)), 1)
+
+  def testFilesAreSentToPool(self):
+    file_objects = []
+    for i, content in enumerate(["foo", "bar"]):
+      with aff4.FACTORY.Create(
+          "aff4:/parser_pool/file%d" % i,
+          aff4.AFF4MemoryStream,
+          token=self.token) as fd:
+        fd.Write(content)
+      file_objects.append(
+          aff4.FACTORY.Open("aff4:/parser_pool/file%d" % i, token=self.token))
+
+    results = parser_pool.POOL.Parse(PoolTestFileParser(), "ParseMultiple",
+                                     [[], file_objects, self.knowledge_base])
+    self.assertEqual(results, ["foo", "bar"])
+
+    # Files that are too large are not sent to the pool.
+    with test_lib.ConfigOverrider({"Artifacts.parser_pool_max_file_size": 2}):
+      self.assertIsNone(
+          parser_pool.POOL.Parse(PoolTestFileParser(), "ParseMultiple",
+                                 [[], file_objects, self.knowledge_base]))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -48,6 +48,12 @@ class Parser(object):
   # results one at a time when this is not necessary.
   process_together = False
 
+  # If set to true all responses are passed to ParseBatch in one call. Unlike
+  # process_together, each response is still parsed on its own, the batch only
+  # allows the parser to share work between them, e.g. building the output
+  # values in bulk.
+  process_in_batch = False
+
   @classmethod
   def GetClassesByArtifact(cls, artifact_name):
     """Get the classes that support parsing a given artifact."""
@@ -113,6 +119,12 @@ class WMIQueryParser(Parser):
   def Parse(self, query, result_dict, knowledge_base):
     """Take the output of the query, and yield RDFValues."""
 
+  def ParseBatch(self, query, result_dicts, knowledge_base):
+    """Parse multiple results of the query, and yield RDFValues."""
+    for result_dict in result_dicts:
+      for result in self.Parse(query, result_dict, knowledge_base):
+        yield result
+
 
 class RegistryValueParser(Parser):
   """Abstract parser for processing Registry values."""
@@ -120,6 +132,12 @@ class RegistryValueParser(Parser):
   def Parse(self, stat, knowledge_base):
     """Take the stat, and yield RDFValues."""
 
+  def ParseBatch(self, stats, knowledge_base):
+    """Take multiple stats, and yield RDFValues."""
+    for stat in stats:
+      for result in self.Parse(stat, knowledge_base):
+        yield result
+
 
 class RegistryParser(Parser):
   """Abstract parser for processing Registry values."""
@@ -130,6 +148,12 @@ class RegistryParser(Parser):
   def Parse(self, stat, knowledge_base):
     """Take the stat, and yield RDFValues."""
 
+  def ParseBatch(self, stats, knowledge_base):
+    """Take multiple stats, and yield RDFValues."""
+    for stat in stats:
+      for result in self.Parse(stat, knowledge_base):
+        yield result
+
 
 class GenericResponseParser(Parser):
   """Abstract response parser."""
@@ -3,6 +3,7 @@
 
 
 
+from grr.lib import rdfvalue
 from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import flows_pb2
 from grr.proto import jobs_pb2
@@ -12,10 +13,96 @@ class HuntNotification(rdf_structs.RDFProtoStruct):
   protobuf = jobs_pb2.HuntNotification
 
 
+class HuntClientStats(rdf_structs.RDFProtoStruct):
+  """Client counters and start/completion histograms of a hunt.
+
+  The histograms count clients per time bucket. Buckets start out one second
+  wide; when a histogram would grow past MAX_BUCKETS, adjacent buckets are
+  merged and the bucket size doubles, so the size of these stats stays bounded
+  no matter how long the hunt runs or how many clients it has.
+  """
+  protobuf = flows_pb2.HuntClientStats
+
+  MAX_BUCKETS = 1024
+
+  def _BucketIndex(self, timestamp):
+    seconds = timestamp.AsSecondsFromEpoch()
+    if not self.HasField("histogram_start"):
+      self.histogram_start = rdfvalue.RDFDatetimeSeconds().FromSecondsFromEpoch(
+          seconds)
+
+    start = self.histogram_start.AsSecondsFromEpoch()
+    index = max(0, seconds - start) // self.bucket_size
+    while index >= self.MAX_BUCKETS:
+      self._MergeBuckets()
+      index //= 2
+
+    return index
+
+  def _MergeBuckets(self):
+    for name in ["started_histogram", "completed_histogram"]:
+      buckets = list(getattr(self, name))
+      setattr(self, name, [
+          sum(buckets[i:i + 2]) for i in xrange(0, len(buckets), 2)
+      ])
+    self.bucket_size *= 2
+
+  def _AddToHistogram(self, name, timestamp, count):
+    index = self._BucketIndex(timestamp)
+    buckets = list(getattr(self, name))
+    if len(buckets) <= index:
+      buckets.extend([0] * (index + 1 - len(buckets)))
+    buckets[index] += count
+    setattr(self, name, buckets)
+
+  def RegisterStartedClients(self, timestamp, count=1):
+    self.clients_count += count
+    self._AddToHistogram("started_histogram", timestamp, count)
+
+  def RegisterCompletedClients(self, timestamp, count=1):
+    self.completed_clients_count += count
+    self._AddToHistogram("completed_histogram", timestamp, count)
+
+  def GetCompletionDataPoints(self):
+    """Returns cumulative started and completed client counts over time.
+
+    Returns:
+      A tuple (start_stats, complete_stats) of lists of (hours, count) pairs
+      with a point for every bucket in which clients were started or completed.
+      Hours are counted from one second before the first such bucket.
+    """
+    started = list(self.started_histogram)
+    completed = list(self.completed_histogram)
+    used = [
+        i for i in xrange(max(len(started), len(completed)))
+        if (i < len(started) and started[i]) or
+        (i < len(completed) and completed[i])
+    ]
+    if not used:
+      return ([], [])
+
+    t0 = used[0] * self.bucket_size - 1
+    times = [0.0]
+    started_counts = [0]
+    completed_counts = [0]
+    for i in used:
+      times.append((i * self.bucket_size - t0) / 3600.0)
+      started_counts.append(started_counts[-1] + (started[i]
+                                                  if i < len(started) else 0))
+      completed_counts.append(completed_counts[-1] + (
+          completed[i] if i < len(completed) else 0))
+
+    return (zip(times, started_counts), zip(times, completed_counts))
+
+
 class HuntContext(rdf_structs.RDFProtoStruct):
   protobuf = flows_pb2.HuntContext
 
 
+class HuntClientBatch(rdf_structs.RDFProtoStruct):
+  protobuf = flows_pb2.HuntClientBatch
+
+
 class HuntRunnerArgs(rdf_structs.RDFProtoStruct):
   protobuf = flows_pb2.HuntRunnerArgs
 
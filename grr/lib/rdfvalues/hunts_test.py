@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Tests for hunt rdfvalues."""
+
+
+
+from grr.lib import rdfvalue
+from grr.lib.rdfvalues import hunts as rdf_hunts
+from grr.lib.rdfvalues import test_base
+
+
+def _Seconds(seconds):
+  return rdfvalue.RDFDatetime().FromSecondsFromEpoch(seconds)
+
+
+class HuntClientStatsTest(test_base.RDFValueTestCase):
+  """Test HuntClientStats."""
+
+  rdfvalue_class = rdf_hunts.HuntClientStats
+
+  def GenerateSample(self, number=0):
+    client_stats = rdf_hunts.HuntClientStats()
+    client_stats.RegisterStartedClients(_Seconds(42), count=number + 1)
+    return client_stats
+
+  def testCountsClientsInOneSecondBuckets(self):
+    client_stats = rdf_hunts.HuntClientStats()
+    client_stats.RegisterStartedClients(_Seconds(42), count=2)
+    client_stats.RegisterStartedClients(_Seconds(45))
+    client_stats.RegisterCompletedClients(_Seconds(45))
+
+    self.assertEqual(client_stats.clients_count, 3)
+    self.assertEqual(client_stats.completed_clients_count, 1)
+    self.assertEqual(client_stats.bucket_size, 1)
+    self.assertEqual(list(client_stats.started_histogram), [2, 0, 0, 1])
+    self.assertEqual(list(client_stats.completed_histogram), [0, 0, 0, 1])
+
+  def testMergesBucketsWhenHistogramGrowsTooLarge(self):
+    client_stats = rdf_hunts.HuntClientStats()
+    last = 3 * rdf_hunts.HuntClientStats.MAX_BUCKETS
+    for seconds in xrange(0, last + 1, 16):
+      client_stats.RegisterStartedClients(_Seconds(1000 + seconds))
+
+    self.assertEqual(client_stats.bucket_size, 4)
+    self.assertLessEqual(
+        len(client_stats.started_histogram),
+        rdf_hunts.HuntClientStats.MAX_BUCKETS)
+    self.assertEqual(
+        sum(client_stats.started_histogram), client_stats.clients_count)
+    self.assertEqual(client_stats.started_histogram[last // 4], 1)
+
+  def testCompletionDataPointsAreCumulative(self):
+    client_stats = rdf_hunts.HuntClientStats()
+    self.assertEqual(client_stats.GetCompletionDataPoints(), ([], []))
+
+    client_stats.RegisterStartedClients(_Seconds(42), count=2)
+    client_stats.RegisterCompletedClients(_Seconds(42))
+    client_stats.RegisterCompletedClients(_Seconds(42 + 3600))
+
+    start_stats, complete_stats = client_stats.GetCompletionDataPoints()
+    self.assertEqual(start_stats, [(0.0, 0), (1 / 3600.0, 2), (1 + 1 / 3600.0,
+                                                               2)])
+    self.assertEqual(complete_stats, [(0.0, 0), (1 / 3600.0, 1),
+                                      (1 + 1 / 3600.0, 2)])
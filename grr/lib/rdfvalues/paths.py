@@ -235,8 +235,11 @@ class GlobExpression(rdfvalue.RDFString):
     return "(" + "|".join(re.escape(s) for s in alternatives) + ")"
 
   def _ReplaceRegExPart(self, part):
-    if part == "**/":
-      return "(?:.*\\/)?"
+    if self.RECURSION_REGEX.match(part):
+      # The recursion depth is not enforced, any number of directories match.
+      if part.endswith("/"):
+        return "(?:.*\\/)?"
+      return ".*"
     elif part == "*":
       return "[^\\/]*"
     elif part == "?":
@@ -247,7 +250,7 @@ class GlobExpression(rdfvalue.RDFString):
       return re.escape(part)
 
   REGEX_SPLIT_PATTERN = re.compile("(" + "|".join(
-      ["{[^}]+,[^}]+}", "\\?", "\\*\\*\\/?", "\\*"]) + ")")
+      ["{[^}]+,[^}]+}", "\\?", "\\*\\*\\d*\\/?", "\\*"]) + ")")
 
   def AsRegEx(self):
     """Return the current glob as a simple regex.
@@ -213,6 +213,21 @@ class GlobExpressionTest(test_base.RDFValueTestCase):
     self.assertFalse(regex.Match("/foo/blah/bar.txt/res"))
     self.assertFalse(regex.Match("/foo/blah1/blah2/bar.txt2"))
 
+  def testRegExIsCorrectForGlobWithRecursionDepth(self):
+    glob_expression = rdf_paths.GlobExpression("/foo/**5/bar.txt")
+    regex = glob_expression.AsRegEx()
+
+    self.assertTrue(regex.Match("/foo/bar.txt"))
+    self.assertTrue(regex.Match("/foo/blah1/blah2/bar.txt"))
+    self.assertFalse(regex.Match("/foo/blah/bar.txt2"))
+
+    glob_expression = rdf_paths.GlobExpression("/foo/**")
+    regex = glob_expression.AsRegEx()
+
+    self.assertTrue(regex.Match("/foo/bar.txt"))
+    self.assertTrue(regex.Match("/foo/blah1/blah2/bar.txt"))
+    self.assertFalse(regex.Match("/bar/bar.txt"))
+
   def testRegExIsCorrectForComplexGlob(self):
     glob_expression = rdf_paths.GlobExpression("/foo/**/bar?/*{.txt,.exe}")
     regex = glob_expression.AsRegEx()
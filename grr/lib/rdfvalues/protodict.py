@@ -74,7 +74,8 @@ class DataBlob(rdf_structs.RDFProtoStruct):
 
   def GetValue(self, ignore_error=True):
     """Extracts and returns a single value from a DataBlob."""
-    if self.HasField("none"):
+    raw_data = self.GetRawData()
+    if "none" in raw_data:
       return None
 
     field_names = [
@@ -82,16 +83,18 @@ class DataBlob(rdf_structs.RDFProtoStruct):
         "float", "set"
     ]
 
-    values = [getattr(self, x) for x in field_names if self.HasField(x)]
+    # Only the field holding the value is decoded.
+    field_names = [x for x in field_names if x in raw_data]
 
-    if len(values) != 1:
+    if len(field_names) != 1:
       return None
 
-    if self.HasField("boolean"):
-      return bool(values[0])
+    field_name = field_names[0]
+    if field_name == "boolean":
+      return bool(self.boolean)
 
     # Unpack RDFValues.
-    if self.HasField("rdf_value"):
+    if field_name == "rdf_value":
       try:
         rdf_class = rdfvalue.RDFValue.classes[self.rdf_value.name]
         return rdf_class.FromSerializedString(
@@ -102,14 +105,14 @@ class DataBlob(rdf_structs.RDFProtoStruct):
 
         raise
 
-    elif self.HasField("list"):
+    elif field_name == "list":
       return [x.GetValue() for x in self.list.content]
 
-    elif self.HasField("set"):
+    elif field_name == "set":
       return set([x.GetValue() for x in self.set.content])
 
     else:
-      return values[0]
+      return getattr(self, field_name)
 
 
 class Dict(rdf_structs.RDFProtoStruct):
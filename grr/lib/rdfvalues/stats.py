@@ -43,6 +43,7 @@ class RunningStats(rdf_structs.RDFProtoStruct):
   protobuf = jobs_pb2.RunningStats
 
   def RegisterValue(self, value):
+    value = float(value)
     self.num += 1
     self.sum += value
     self.sum_sq += value**2
@@ -78,6 +79,13 @@ class ClientResourcesStats(rdf_structs.RDFProtoStruct):
   ]
   NUM_WORST_PERFORMERS = 10
 
+  # When the usage samples grow past this size, every other sampled client is
+  # dropped and the sample rate is halved.
+  MAX_SAMPLE_SIZE = 1000
+  SAMPLES = [
+      "user_cpu_sample", "system_cpu_sample", "network_bytes_sent_sample"
+  ]
+
   def __init__(self, initializer=None, **kwargs):
     super(ClientResourcesStats, self).__init__(
         initializer=initializer, **kwargs)
@@ -106,6 +114,43 @@ class ClientResourcesStats(rdf_structs.RDFProtoStruct):
         reverse=True)[:self.NUM_WORST_PERFORMERS]
     self.worst_performers = new_worst_performers
 
+    self._SampleResources(client_resources)
+
+  def _SampleResources(self, client_resources):
+    # The client has already been counted above.
+    if (self.user_cpu_stats.num - 1) % self.sample_rate:
+      return
+
+    self.user_cpu_sample.Append(client_resources.cpu_usage.user_cpu_time)
+    self.system_cpu_sample.Append(client_resources.cpu_usage.system_cpu_time)
+    self.network_bytes_sent_sample.Append(client_resources.network_bytes_sent)
+
+    if len(self.user_cpu_sample) > self.MAX_SAMPLE_SIZE:
+      for name in self.SAMPLES:
+        setattr(self, name, list(getattr(self, name))[::2])
+      self.sample_rate *= 2
+
+  def GetPercentile(self, sample_name, percentile):
+    """Estimates a percentile of the per-client resource usage.
+
+    Args:
+      sample_name: One of SAMPLES.
+      percentile: The percentile to estimate, between 0 and 100.
+
+    Returns:
+      The usage value at the given percentile of the sampled clients or 0 if
+      no clients were registered.
+    """
+    if sample_name not in self.SAMPLES:
+      raise ValueError("Unknown usage sample: %s" % sample_name)
+
+    sample = sorted(getattr(self, sample_name))
+    if not sample:
+      return 0
+
+    index = int(math.ceil(percentile / 100.0 * len(sample))) - 1
+    return sample[max(0, index)]
+
 
 class Sample(rdf_structs.RDFProtoStruct):
   """A Graph sample is a single data point."""
@@ -153,3 +198,8 @@ class GraphFloat(Graph):
 class GraphSeries(rdf_protodict.RDFValueArray):
   """A sequence of graphs (e.g. evolving over time)."""
   rdf_type = Graph
+
+
+class ClientFleetStatsRecord(rdf_structs.RDFProtoStruct):
+  """The client attributes the fleet statistics are computed from."""
+  protobuf = analysis_pb2.ClientFleetStatsRecord
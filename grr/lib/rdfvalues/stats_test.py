@@ -7,6 +7,7 @@ import math
 
 from grr.lib import flags
 from grr.lib import test_lib
+from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import stats as stats_rdf
 from grr.lib.rdfvalues import test_base
 
@@ -67,6 +68,40 @@ class RunningStatsTest(test_base.RDFValueTestCase):
     self.assertEqual(stats.histogram.bins[2].num, 4)
 
 
+class ClientResourcesStatsTest(test_lib.GRRBaseTest):
+  """Tests the per-client usage samples of ClientResourcesStats."""
+
+  def _RegisterClients(self, stats, count):
+    for i in range(count):
+      resources = rdf_client.ClientResources(network_bytes_sent=i)
+      resources.cpu_usage.user_cpu_time = i
+      stats.RegisterResources(resources)
+
+  def testPercentilesOfSmallSamplesAreExact(self):
+    stats = stats_rdf.ClientResourcesStats()
+    self.assertEqual(stats.GetPercentile("user_cpu_sample", 50), 0)
+
+    self._RegisterClients(stats, 100)
+    self.assertEqual(stats.sample_rate, 1)
+    self.assertEqual(stats.GetPercentile("user_cpu_sample", 50), 49)
+    self.assertEqual(stats.GetPercentile("network_bytes_sent_sample", 90), 89)
+    self.assertEqual(stats.GetPercentile("network_bytes_sent_sample", 100), 99)
+
+    self.assertRaises(ValueError, stats.GetPercentile, "foo", 50)
+
+  def testSamplesAreThinnedOut(self):
+    stats = stats_rdf.ClientResourcesStats()
+    self._RegisterClients(stats, 5000)
+
+    self.assertEqual(stats.sample_rate, 8)
+    self.assertLessEqual(
+        len(stats.user_cpu_sample),
+        stats_rdf.ClientResourcesStats.MAX_SAMPLE_SIZE)
+    self.assertEqual(list(stats.network_bytes_sent_sample[:3]), [0, 8, 16])
+    self.assertTrue(
+        math.fabs(stats.GetPercentile("user_cpu_sample", 50) - 2500) < 10)
+
+
 def main(argv):
   test_lib.GrrTestProgram(argv=argv)
 
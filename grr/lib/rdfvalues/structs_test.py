@@ -459,6 +459,42 @@ class RDFStructsTest(test_base.RDFValueTestCase):
     # old result instead.
     self.assertTrue("booo" in path.SerializeToString())
 
+  def testFromValues(self):
+    nested = TestStruct(foobar=u"nested")
+    values = dict(
+        foobar=u"unicode",
+        int=10,
+        urn=rdfvalue.RDFURN("aff4:/foo"),
+        type="SECOND",
+        float=2,
+        nested=nested,
+        repeated=["a", "b"])
+    tested = TestStruct.FromValues(values)
+
+    self.assertEqual(tested, TestStruct(**values))
+    self.assertEqual(tested.type, 2)
+    self.assertEqual(list(tested.repeated), [u"a", u"b"])
+    self.assertIs(tested.nested, nested)
+
+    # Values of other types are still validated.
+    tested = TestStruct.FromValues(dict(foobar="string", int="4", urn="aff4:/a"))
+    self.assertIsInstance(tested.foobar, unicode)
+    self.assertEqual(tested.int, 4)
+    self.assertIsInstance(tested.urn, rdfvalue.RDFURN)
+
+    # None leaves the field unset.
+    tested = TestStruct.FromValues(dict(foobar=None))
+    self.assertFalse(tested.HasField("foobar"))
+
+    # The serialized form is the same as when setting the fields one by one.
+    tested = TestStruct.FromValues(dict(foobar=u"文", int=3))
+    self.assertEqual(tested.SerializeToString(),
+                     TestStruct(foobar=u"文", int=3).SerializeToString())
+
+    self.assertRaises(AttributeError, TestStruct.FromValues, dict(unknown=1))
+    self.assertRaises(type_info.TypeValueError, TestStruct.FromValues,
+                      dict(foobar=1))
+
   def testWireFormatAccess(self):
 
     m = rdf_flows.SignedMessageList()
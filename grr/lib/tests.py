@@ -35,6 +35,7 @@ from grr.lib import ipv6_utils_test
 from grr.lib import lexer_test
 from grr.lib import objectfilter_test
 from grr.lib import output_plugin_test
+from grr.lib import parser_pool_test
 from grr.lib import parsers_test
 from grr.lib import queue_manager_test
 from grr.lib import rekall_profile_server_test
@@ -48,6 +49,7 @@ from grr.lib import utils_test
 
 from grr.lib.aff4_objects import tests
 from grr.lib.authorization import tests
+from grr.lib.blob_stores import tests
 from grr.lib.builders import tests
 from grr.lib.checks import tests
 from grr.lib.data_stores import tests
@@ -5,14 +5,153 @@
 
 
 
+import itertools
 import os
+import shutil
 import tempfile
+import threading
 
 
 from sqlite3 import dbapi2 as sqlite
 
 import logging
 
+# apsw is installed with the sqlitevfs extra of grr-response-server.
+try:
+  # pylint: disable=g-import-not-at-top
+  import apsw
+except ImportError:
+  apsw = None
+
+# Buffer size for copying databases to tempfiles.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+if apsw is not None:
+
+  class FileObjectVFS(apsw.VFS):
+    """A read-only SQLite VFS serving databases from file like objects.
+
+    Databases are registered under a unique name and opened through this VFS,
+    so SQLite reads pages straight from the file object instead of a copy.
+    Journals and write-ahead logs are never available, the database is read as
+    it was last checkpointed.
+    """
+
+    NAME = "grr-file-object"
+
+    def __init__(self):
+      # Randomness, time and sleeping are inherited from the default VFS.
+      apsw.VFS.__init__(self, self.NAME, base="")
+      self._file_objects = {}
+      self._lock = threading.Lock()
+      self._counter = itertools.count()
+
+    def Register(self, file_object):
+      """Registers a file object, returning the name to open it by."""
+      with self._lock:
+        name = "/sqlite-file-%d" % next(self._counter)
+        self._file_objects[name] = file_object
+      return name
+
+    def Unregister(self, name):
+      with self._lock:
+        self._file_objects.pop(name, None)
+
+    def xAccess(self, pathname, flags):  # pylint: disable=invalid-name
+      # Only registered databases exist, there are never any journals.
+      with self._lock:
+        return pathname in self._file_objects
+
+    def xDelete(self, filename, syncdir):  # pylint: disable=invalid-name
+      pass
+
+    def xFullPathname(self, name):  # pylint: disable=invalid-name
+      return name
+
+    def xOpen(self, name, flags):  # pylint: disable=invalid-name
+      if name is None:
+        # Temporary files for sorting and the like are left to the default VFS.
+        return apsw.VFSFile("", name, flags)
+      if isinstance(name, apsw.URIFilename):
+        name = name.filename()
+      with self._lock:
+        file_object = self._file_objects.get(name)
+      if file_object is None:
+        raise apsw.CantOpenError("%s is not a registered database." % name)
+      return FileObjectVFSFile(file_object)
+
+  class FileObjectVFSFile(object):
+    """A read-only SQLite file reading from a file like object."""
+
+    # Offset of the file format version numbers in the database header.
+    WAL_VERSION_OFFSET = 18
+
+    def __init__(self, file_object):
+      self.file_object = file_object
+      self._lock = threading.Lock()
+
+    def xRead(self, amount, offset):  # pylint: disable=invalid-name
+      with self._lock:
+        self.file_object.seek(offset)
+        data = self.file_object.read(amount)
+
+      # Databases in WAL mode can only be opened read-only when their
+      # write-ahead log and shared memory index are available. They never are
+      # here, so the database is presented as a rollback journal database.
+      version_offset = self.WAL_VERSION_OFFSET - offset
+      if 0 <= version_offset and version_offset + 2 <= len(data):
+        if data[version_offset:version_offset + 2] == "\x02\x02":
+          data = "%s\x01\x01%s" % (data[:version_offset],
+                                   data[version_offset + 2:])
+      return data
+
+    def xFileSize(self):  # pylint: disable=invalid-name
+      with self._lock:
+        self.file_object.seek(0, 2)
+        return self.file_object.tell()
+
+    def xWrite(self, data, offset):  # pylint: disable=invalid-name
+      raise apsw.ReadOnlyError("Database is read-only.")
+
+    def xTruncate(self, newsize):  # pylint: disable=invalid-name
+      raise apsw.ReadOnlyError("Database is read-only.")
+
+    def xSync(self, flags):  # pylint: disable=invalid-name
+      pass
+
+    def xLock(self, level):  # pylint: disable=invalid-name
+      pass
+
+    def xUnlock(self, level):  # pylint: disable=invalid-name
+      pass
+
+    def xCheckReservedLock(self):  # pylint: disable=invalid-name
+      return False
+
+    def xFileControl(self, op, ptr):  # pylint: disable=invalid-name
+      return False
+
+    def xSectorSize(self):  # pylint: disable=invalid-name
+      return 0
+
+    def xDeviceCharacteristics(self):  # pylint: disable=invalid-name
+      return 0
+
+    def xClose(self):  # pylint: disable=invalid-name
+      pass
+
+  _VFS_LOCK = threading.Lock()
+  _VFS = None
+
+  def GetFileObjectVFS():
+    """Returns the file object VFS, registering it with SQLite on first use."""
+    global _VFS
+    with _VFS_LOCK:
+      if _VFS is None:
+        _VFS = FileObjectVFS()
+      return _VFS
+
 
 class SQLiteFile(object):
   """Class for handling the parsing sqlite database files.
@@ -22,6 +161,10 @@ class SQLiteFile(object):
       for row in c.Query(sql_query):
         print row
 
+    Files on disk are opened directly. Other file like objects are read in
+    place through a SQLite VFS when apsw is installed, otherwise they are
+    copied to a tempfile first.
+
     The journal_mode parameter controls the "Write-Ahead Log"
     introduced in recent SQLite versions. If set to "WAL", this log is
     used to save transaction data and can bring performance
@@ -29,11 +172,16 @@ class SQLiteFile(object):
     directory the database resides in since it creates the log file
     there. This can lead to problems with unit tests so we disable by
     default since we are mostly using the database in read only mode
-    anyways.
+    anyways. Databases read through the VFS are never written to, so the
+    journal mode does not apply to them.
 
   """
 
-  def __init__(self, file_object, delete_tempfile=True, journal_mode="DELETE"):
+  def __init__(self,
+               file_object,
+               delete_tempfile=True,
+               journal_mode="DELETE",
+               use_vfs=True):
     """Init.
 
     Args:
@@ -41,27 +189,35 @@ class SQLiteFile(object):
       delete_tempfile: If we create a tempfile, should we delete it when
         we're done.
       journal_mode: If set to "WAL" a "Write-Ahead Log" is created.
+      use_vfs: If False, file like objects are always copied to a tempfile.
     """
     self.file_object = file_object
     self.journal_mode = journal_mode
+    self._delete_file = False
+    self._vfs = None
+    self._vfs_connection = None
 
-    # We want to be able to read from arbitrary file like objects
-    # but sqlite lib doesn't support this so we need to write out
-    # to a tempfile.
     if hasattr(self.file_object, "name"):
       self.name = self.file_object.name
-      self._delete_file = False
+    elif use_vfs and apsw is not None:
+      self._vfs = GetFileObjectVFS()
+      self.name = self._vfs.Register(file_object)
     else:
+      # We want to be able to read from arbitrary file like objects
+      # but sqlite lib doesn't support this so we need to write out
+      # to a tempfile.
       self._delete_file = delete_tempfile
       with tempfile.NamedTemporaryFile(delete=False) as fd:
         self.name = fd.name
-        data = file_object.read(65536)
-        while data:
-          fd.write(data)
-          data = file_object.read(65536)
+        shutil.copyfileobj(file_object, fd, COPY_BUFFER_SIZE)
 
   def __del__(self):
     """Deletes the database file."""
+    if self._vfs is not None:
+      if self._vfs_connection is not None:
+        self._vfs_connection.close()
+      self._vfs.Unregister(self.name)
+
     if self._delete_file:
       try:
         os.remove(self.name)
@@ -70,6 +226,9 @@ class SQLiteFile(object):
 
   def Query(self, sql_query):
     """Query the database file."""
+    if self._vfs is not None:
+      return self._QueryVFS(sql_query)
+
     results = {}
 
     try:
@@ -82,3 +241,20 @@ class SQLiteFile(object):
       logging.warn("SQLite error %s", error_string)
 
     return results
+
+  def _QueryVFS(self, sql_query):
+    """Query the database through the file object VFS."""
+    results = {}
+
+    try:
+      if self._vfs_connection is None:
+        self._vfs_connection = apsw.Connection(
+            self.name,
+            flags=apsw.SQLITE_OPEN_READONLY,
+            vfs=FileObjectVFS.NAME)
+      results = list(self._vfs_connection.cursor().execute(sql_query))
+
+    except apsw.Error as error_string:
+      logging.warn("SQLite error %s", error_string)
+
+    return results
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Benchmark tests for parsing sqlite database files."""
+
+
+import os
+import unittest
+
+from sqlite3 import dbapi2 as sqlite
+
+from grr.lib import aff4
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.parsers import chrome_history
+from grr.parsers import sqlite_file
+
+
+class SQLiteFileBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare reading databases in place with copying them to tempfiles."""
+
+  REPEATS = 3
+
+  URL_COUNT = 50000
+  VISITS_PER_URL = 20
+
+  def setUp(self):
+    super(SQLiteFileBenchmarks, self).setUp()
+    filename = os.path.join(self.temp_dir, "History")
+    connection = sqlite.connect(filename)
+    connection.executescript("""
+        CREATE TABLE urls (id INTEGER PRIMARY KEY, url TEXT, title TEXT,
+                           typed_count INTEGER);
+        CREATE TABLE visits (id INTEGER PRIMARY KEY, url INTEGER,
+                             visit_time INTEGER);
+        CREATE TABLE downloads (id INTEGER PRIMARY KEY, start_time INTEGER,
+                                url TEXT, full_path TEXT,
+                                received_bytes INTEGER, total_bytes INTEGER);
+        """)
+    connection.executemany(
+        "INSERT INTO urls VALUES (?, ?, ?, ?)",
+        ((i, "http://www.example%d.com/page/%d" % (i % 100, i),
+          "Example page %d" % i, i % 3) for i in xrange(self.URL_COUNT)))
+    connection.executemany(
+        "INSERT INTO visits (url, visit_time) VALUES (?, ?)",
+        ((i % self.URL_COUNT, 13000000000000000 + i * 1000000)
+         for i in xrange(self.URL_COUNT * self.VISITS_PER_URL)))
+    connection.commit()
+    connection.close()
+
+    with open(filename, "rb") as fd:
+      self.data = fd.read()
+
+    self.urn = aff4.ROOT_URN.Add("History")
+    with aff4.FACTORY.Create(
+        self.urn, aff4.AFF4Image, token=self.token) as fd:
+      fd.Write(self.data)
+
+  def _Parse(self, use_vfs):
+    fd = aff4.FACTORY.Open(self.urn, token=self.token)
+    parser = chrome_history.ChromeParser(fd, use_vfs=use_vfs)
+    return len(list(parser.Parse()))
+
+  def _ParseLatest(self, use_vfs):
+    fd = aff4.FACTORY.Open(self.urn, token=self.token)
+    parser = chrome_history.ChromeParser(fd, use_vfs=use_vfs)
+    return parser.Query("SELECT visit_time FROM visits "
+                        "WHERE id = (SELECT MAX(id) FROM visits);")
+
+  def testCopyToTempfile(self):
+    self.assertEqual(
+        self._Parse(False), self.URL_COUNT * self.VISITS_PER_URL)
+    self.TimeIt(
+        self._Parse,
+        name="Tempfile: parse %d MB" % (len(self.data) / 1024 / 1024),
+        use_vfs=False)
+    self.TimeIt(
+        self._ParseLatest, name="Tempfile: latest visit", use_vfs=False)
+
+  @unittest.skipUnless(sqlite_file.apsw, "apsw is not installed.")
+  def testReadInPlace(self):
+    self.assertEqual(self._Parse(True), self.URL_COUNT * self.VISITS_PER_URL)
+    self.assertEqual(self._ParseLatest(True), self._ParseLatest(False))
+    self.TimeIt(
+        self._Parse,
+        name="VFS: parse %d MB" % (len(self.data) / 1024 / 1024),
+        use_vfs=True)
+    self.TimeIt(self._ParseLatest, name="VFS: latest visit", use_vfs=True)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
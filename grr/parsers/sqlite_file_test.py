@@ -5,6 +5,9 @@
 
 import os
 import StringIO
+import unittest
+
+from sqlite3 import dbapi2 as sqlite
 
 from grr.lib import flags
 from grr.lib import test_lib
@@ -27,7 +30,7 @@ class SQLiteFileTest(test_lib.GRRBaseTest):
     """This should force a write to a tmp file."""
     filename = os.path.join(self.base_path, "places.sqlite")
     file_stream = StringIO.StringIO(open(filename, "rb").read())
-    database_file = sqlite_file.SQLiteFile(file_stream)
+    database_file = sqlite_file.SQLiteFile(file_stream, use_vfs=False)
     entries = [x for x in database_file.Query(self.query)]
     self.assertEqual(len(entries), 92)
 
@@ -38,6 +41,41 @@ class SQLiteFileTest(test_lib.GRRBaseTest):
     del database_file
     self.assertFalse(os.path.exists(filename))
 
+  @unittest.skipUnless(sqlite_file.apsw, "apsw is not installed.")
+  def testVFSReadsFileObjectsInPlace(self):
+    filename = os.path.join(self.base_path, "places.sqlite")
+    with open(filename, "rb") as fd:
+      data = fd.read()
+
+    database_file = sqlite_file.SQLiteFile(StringIO.StringIO(data))
+    self.assertFalse(database_file._delete_file)
+    entries = database_file.Query(self.query)
+    self.assertEqual(len(entries), 92)
+
+    copied_file = sqlite_file.SQLiteFile(
+        StringIO.StringIO(data), use_vfs=False)
+    self.assertEqual(entries, copied_file.Query(self.query))
+
+    # The connection is reused and errors are logged, not raised.
+    self.assertEqual(len(database_file.Query(self.query)), 92)
+    self.assertFalse(database_file.Query("SELECT * FROM nonexistent;"))
+
+  @unittest.skipUnless(sqlite_file.apsw, "apsw is not installed.")
+  def testVFSReadsWALDatabases(self):
+    filename = os.path.join(self.temp_dir, "wal.sqlite")
+    connection = sqlite.connect(filename)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE moz_places (url TEXT)")
+    connection.executemany("INSERT INTO moz_places VALUES (?)",
+                           [("http://example.com/%d" % i,) for i in range(10)])
+    connection.commit()
+    connection.close()
+
+    with open(filename, "rb") as fd:
+      database_file = sqlite_file.SQLiteFile(StringIO.StringIO(fd.read()))
+    entries = database_file.Query(self.query)
+    self.assertEqual(len(entries), 10)
+
 
 def main(argv):
   test_lib.main(argv)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 """Simple parsers for registry keys and values."""
 
+import posixpath
 import re
 
 import logging
@@ -152,32 +153,43 @@ class WinUserSids(parsers.RegistryParser):
   """
   output_types = ["User"]
   supported_artifacts = ["WindowsRegistryProfiles"]
+  process_in_batch = True
 
   def Parse(self, stat, knowledge_base):
+    """Parse each returned registry value."""
+    return self.ParseBatch([stat], knowledge_base)
+
+  def ParseBatch(self, stats, knowledge_base):
     """Parse each returned registry value."""
     _ = knowledge_base  # Unused.
-    sid_str = stat.pathspec.Dirname().Basename()
+    for stat in stats:
+      if stat.pathspec.HasField("nested_path"):
+        sid_str = stat.pathspec.Dirname().Basename()
+        value_name = stat.pathspec.Basename()
+      else:
+        # Splitting the path is much cheaper than copying the pathspec.
+        key_path, value_name = posixpath.split(stat.pathspec.path)
+        sid_str = posixpath.basename(key_path)
+
+      if not SID_RE.match(sid_str):
+        continue
 
-    if SID_RE.match(sid_str):
-      kb_user = rdf_client.User()
-      kb_user.sid = sid_str
-      if stat.pathspec.Basename() == "ProfileImagePath":
+      values = {"sid": sid_str}
+      if value_name == "ProfileImagePath":
         if stat.resident:
           # Support old clients.
-          kb_user.homedir = utils.SmartUnicode(stat.resident)
+          homedir = utils.SmartUnicode(stat.resident)
         else:
-          kb_user.homedir = stat.registry_data.GetValue()
+          homedir = utils.SmartUnicode(stat.registry_data.GetValue() or "")
 
-        kb_user.userprofile = kb_user.homedir
-        try:
-          # Assume username is the last component of the path. This is not
-          # robust, but other user artifacts will override it if there is a
-          # better match.
-          kb_user.username = kb_user.homedir.rsplit("\\", 1)[-1]
-        except IndexError:
-          pass
+        values["homedir"] = homedir
+        values["userprofile"] = homedir
+        # Assume username is the last component of the path. This is not
+        # robust, but other user artifacts will override it if there is a
+        # better match.
+        values["username"] = homedir.rsplit("\\", 1)[-1]
 
-      yield kb_user
+      yield rdf_client.User.FromValues(values)
 
 
 class WinUserSpecialDirs(parsers.RegistryParser):
@@ -302,10 +314,12 @@ class WinServicesParser(parsers.RegistryValueParser):
         continue
 
       service_name = self._GetServiceName(stat.pathspec.path)
-      reg_key = stat.aff4path.Dirname()
-      service_info = rdf_client.WindowsServiceInformation(
-          name=service_name, registry_key=reg_key)
-      services.setdefault(service_name, service_info)
+      if service_name not in services:
+        services[service_name] = (
+            rdf_client.WindowsServiceInformation.FromValues({
+                "name": service_name,
+                "registry_key": stat.aff4path.Dirname()
+            }))
 
       key = self._GetKeyName(stat.pathspec.path)
 
@@ -109,6 +109,34 @@ class WindowsRegistryParserTest(test_lib.FlowTestsBaseclass):
     self.assertEqual(results[0].temp, r"temp\path")
     self.assertEqual(results[0].userdomain, "GEVULOT")
 
+  def testWinUserSids(self):
+    reg_str = rdf_client.StatEntry.RegistryType.REG_SZ
+    profiles = ("HKEY_LOCAL_MACHINE/SOFTWARE/Microsoft/Windows NT/"
+                "CurrentVersion/ProfileList")
+    profile_keys = [
+        ("%s/S-1-5-21-1010-10101-1001/ProfileImagePath" % profiles,
+         r"C:\Users\user1", reg_str),
+        ("%s/S-1-5-21-1010-10101-1002/ProfileImagePath" % profiles,
+         r"C:\Users\user2", reg_str),
+        ("%s/S-1-5-21-1010-10101-1002/Flags" % profiles, "0", reg_str),
+        ("%s/NotASid/ProfileImagePath" % profiles, r"C:\Users\user3", reg_str)
+    ]
+
+    stats = [self._MakeRegStat(*x) for x in profile_keys]
+    parser = windows_registry_parser.WinUserSids()
+    results = list(parser.ParseBatch(stats, None))
+    self.assertEqual(
+        results, [result for stat in stats for result in parser.Parse(stat, None)])
+
+    self.assertEqual(len(results), 3)
+    self.assertEqual(results[0].sid, "S-1-5-21-1010-10101-1001")
+    self.assertEqual(results[0].homedir, r"C:\Users\user1")
+    self.assertEqual(results[0].userprofile, r"C:\Users\user1")
+    self.assertEqual(results[0].username, "user1")
+    self.assertEqual(results[1].username, "user2")
+    self.assertEqual(results[2].sid, "S-1-5-21-1010-10101-1002")
+    self.assertFalse(results[2].HasField("homedir"))
+
   def testWinSystemDriveParser(self):
     sysroot = (r"HKEY_LOCAL_MACHINE\SOFTWARE\Microsoft\Windows NT"
                r"\CurrentVersion\SystemRoot")
@@ -10,6 +10,7 @@ from grr.lib import rdfvalue
 from grr.lib import time_utils
 from grr.lib.rdfvalues import anomaly as rdf_anomaly
 from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import protodict as rdf_protodict
 from grr.lib.rdfvalues import wmi as rdf_wmi
 
 
@@ -68,6 +69,31 @@ def BinarySIDtoStringSID(sid):
   return "S-%s" % ("-".join([str(x) for x in str_sid_components]))
 
 
+def GetWMIValues(result, keys):
+  """Returns the values of some keys of a WMI result.
+
+  Looking up each key in the result Dict decodes all the entries before it, so
+  the keys are found in a single pass, which only decodes the values needed.
+
+  Args:
+    result: A WMI result Dict, or any other mapping.
+    keys: The keys to return values for.
+
+  Returns:
+    A dict of the keys found to their values.
+  """
+  if not isinstance(result, rdf_protodict.Dict):
+    return dict((key, result[key]) for key in keys if key in result)
+
+  values = {}
+  for entry in result.dat:
+    key = entry.k.GetValue()
+    if key in keys:
+      values[key] = entry.v.GetValue()
+
+  return values
+
+
 class WMIEventConsumerParser(parsers.WMIQueryParser):
   """Base class for WMI EventConsumer Parsers."""
 
@@ -140,18 +166,26 @@ class WMIInstalledSoftwareParser(parsers.WMIQueryParser):
 
   output_types = [rdf_client.SoftwarePackage.__name__]
   supported_artifacts = ["WMIInstalledSoftware"]
+  process_in_batch = True
+
+  wmi_keys = frozenset(["Name", "Description", "Version"])
 
   def Parse(self, query, result, knowledge_base):
+    """Parse the WMI packages output."""
+    return self.ParseBatch(query, [result], knowledge_base)
+
+  def ParseBatch(self, query, results, knowledge_base):
     """Parse the WMI packages output."""
     _ = query, knowledge_base
     status = rdf_client.SoftwarePackage.InstallState.INSTALLED
-    soft = rdf_client.SoftwarePackage(
-        name=result["Name"],
-        description=result["Description"],
-        version=result["Version"],
-        install_state=status)
-
-    yield soft
+    for result in results:
+      result = GetWMIValues(result, self.wmi_keys)
+      yield rdf_client.SoftwarePackage.FromValues({
+          "name": result["Name"],
+          "description": result["Description"],
+          "version": result["Version"],
+          "install_state": status
+      })
 
 
 class WMIHotfixesSoftwareParser(parsers.WMIQueryParser):
@@ -159,22 +193,31 @@ class WMIHotfixesSoftwareParser(parsers.WMIQueryParser):
 
   output_types = [rdf_client.SoftwarePackage.__name__]
   supported_artifacts = ["WMIHotFixes"]
+  process_in_batch = True
+
+  wmi_keys = frozenset(["HotFixID", "Caption", "InstalledBy", "InstalledOn"])
 
   def Parse(self, query, result, knowledge_base):
+    """Parse the WMI packages output."""
+    return self.ParseBatch(query, [result], knowledge_base)
+
+  def ParseBatch(self, query, results, knowledge_base):
     """Parse the WMI packages output."""
     _ = query, knowledge_base
     status = rdf_client.SoftwarePackage.InstallState.INSTALLED
-    result = result.ToDict()
+    for result in results:
+      result = GetWMIValues(result, self.wmi_keys)
 
-    # InstalledOn comes back in a godawful format such as '7/10/2013'.
-    installed_on = time_utils.AmericanDateToEpoch(result.get("InstalledOn", ""))
-    soft = rdf_client.SoftwarePackage(
-        name=result.get("HotFixID"),
-        description=result.get("Caption"),
-        installed_by=result.get("InstalledBy"),
-        install_state=status,
-        installed_on=installed_on)
-    yield soft
+      # InstalledOn comes back in a godawful format such as '7/10/2013'.
+      installed_on = time_utils.AmericanDateToEpoch(
+          result.get("InstalledOn", ""))
+      yield rdf_client.SoftwarePackage.FromValues({
+          "name": result.get("HotFixID"),
+          "description": result.get("Caption"),
+          "installed_by": result.get("InstalledBy"),
+          "install_state": status,
+          "installed_on": installed_on
+      })
 
 
 class WMIUserParser(parsers.WMIQueryParser):
@@ -194,21 +237,31 @@ class WMIUserParser(parsers.WMIQueryParser):
       "LocalPath": "homedir"
   }
 
+  process_in_batch = True
+
   def Parse(self, query, result, knowledge_base):
+    """Parse the WMI Win32_UserAccount output."""
+    return self.ParseBatch(query, [result], knowledge_base)
+
+  def ParseBatch(self, query, results, knowledge_base):
     """Parse the WMI Win32_UserAccount output."""
     _ = query, knowledge_base
-    kb_user = rdf_client.User()
-    for wmi_key, kb_key in self.account_mapping.items():
-      try:
-        kb_user.Set(kb_key, result[wmi_key])
-      except KeyError:
-        pass
-    # We need at least a sid or a username.  If these are missing its likely we
-    # retrieved just the userdomain for an AD account that has a name collision
-    # with a local account that is correctly populated.  We drop the bogus
-    # domain account.
-    if kb_user.sid or kb_user.username:
-      yield kb_user
+    for result in results:
+      result = GetWMIValues(result, self.account_mapping)
+      values = {}
+      for wmi_key, kb_key in self.account_mapping.iteritems():
+        try:
+          values[kb_key] = result[wmi_key]
+        except KeyError:
+          pass
+      kb_user = rdf_client.User.FromValues(values)
+
+      # We need at least a sid or a username.  If these are missing its likely
+      # we retrieved just the userdomain for an AD account that has a name
+      # collision with a local account that is correctly populated.  We drop the
+      # bogus domain account.
+      if kb_user.sid or kb_user.username:
+        yield kb_user
 
 
 class WMILogicalDisksParser(parsers.WMIQueryParser):
@@ -216,36 +269,49 @@ class WMILogicalDisksParser(parsers.WMIQueryParser):
 
   output_types = [rdf_client.Volume.__name__]
   supported_artifacts = ["WMILogicalDisks"]
+  process_in_batch = True
+
+  wmi_keys = frozenset([
+      "DeviceID", "DriveType", "Size", "FreeSpace", "VolumeName", "FileSystem",
+      "VolumeSerialNumber"
+  ])
 
   def Parse(self, query, result, knowledge_base):
+    """Parse the WMI packages output."""
+    return self.ParseBatch(query, [result], knowledge_base)
+
+  def ParseBatch(self, query, results, knowledge_base):
     """Parse the WMI packages output."""
     _ = query, knowledge_base
-    result = result.ToDict()
-    winvolume = rdf_client.WindowsVolume(
-        drive_letter=result.get("DeviceID"), drive_type=result.get("DriveType"))
+    for result in results:
+      result = GetWMIValues(result, self.wmi_keys)
+      winvolume = rdf_client.WindowsVolume.FromValues({
+          "drive_letter": result.get("DeviceID"),
+          "drive_type": result.get("DriveType")
+      })
 
-    try:
-      size = int(result.get("Size"))
-    except (ValueError, TypeError):
-      size = None
+      try:
+        size = int(result.get("Size"))
+      except (ValueError, TypeError):
+        size = None
 
-    try:
-      free_space = int(result.get("FreeSpace"))
-    except (ValueError, TypeError):
-      free_space = None
-
-    # Since we don't get the sector sizes from WMI, we just set them at 1 byte
-    volume = rdf_client.Volume(
-        windowsvolume=winvolume,
-        name=result.get("VolumeName"),
-        file_system_type=result.get("FileSystem"),
-        serial_number=result.get("VolumeSerialNumber"),
-        sectors_per_allocation_unit=1,
-        bytes_per_sector=1,
-        total_allocation_units=size,
-        actual_available_allocation_units=free_space)
-
-    yield volume
+      try:
+        free_space = int(result.get("FreeSpace"))
+      except (ValueError, TypeError):
+        free_space = None
+
+      # Since we don't get the sector sizes from WMI, we just set them at 1
+      # byte.
+      yield rdf_client.Volume.FromValues({
+          "windowsvolume": winvolume,
+          "name": result.get("VolumeName"),
+          "file_system_type": result.get("FileSystem"),
+          "serial_number": result.get("VolumeSerialNumber"),
+          "sectors_per_allocation_unit": 1,
+          "bytes_per_sector": 1,
+          "total_allocation_units": size,
+          "actual_available_allocation_units": free_space
+      })
 
 
 class WMIComputerSystemProductParser(parsers.WMIQueryParser):
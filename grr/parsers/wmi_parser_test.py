@@ -62,6 +62,92 @@ class WMIParserTest(test_lib.FlowTestsBaseclass):
             "example.com"
         ])
 
+  def testWMIInstalledSoftwareParserBatch(self):
+    parser = wmi_parser.WMIInstalledSoftwareParser()
+    wmi_dicts = []
+    for i in range(3):
+      wmi_dicts.append(
+          rdf_protodict.Dict({
+              "Name": u"Package %d" % i,
+              "Description": "Description %d" % i,
+              "Version": u"1.%d" % i
+          }))
+
+    results = list(parser.ParseBatch(None, wmi_dicts, None))
+    self.assertEqual(results, [
+        result for wmi_dict in wmi_dicts
+        for result in parser.Parse(None, wmi_dict, None)
+    ])
+
+    self.assertEqual(len(results), 3)
+    self.assertEqual(results[2].name, u"Package 2")
+    self.assertEqual(results[2].description, u"Description 2")
+    self.assertIsInstance(results[2].description, unicode)
+    self.assertEqual(results[2].version, u"1.2")
+    self.assertEqual(results[2].install_state,
+                     rdf_client.SoftwarePackage.InstallState.INSTALLED)
+
+  def testWMIInstalledSoftwareParserPlainDict(self):
+    """Results which aren't Dicts, e.g. loaded from yaml, are parsed too."""
+    parser = wmi_parser.WMIInstalledSoftwareParser()
+    wmi_dict = {"Name": "Package", "Description": "A package", "Version": "1.0"}
+
+    results = list(parser.Parse(None, wmi_dict, None))
+    self.assertEqual(
+        results, list(parser.Parse(None, rdf_protodict.Dict(wmi_dict), None)))
+    self.assertEqual(results[0].name, u"Package")
+    self.assertIsInstance(results[0].name, unicode)
+    self.assertEqual(results[0].version, u"1.0")
+
+  def testWMIUserParserBatch(self):
+    parser = wmi_parser.WMIUserParser()
+    wmi_dicts = [
+        rdf_protodict.Dict({
+            "Name": u"user1",
+            "Domain": u"DOMAIN",
+            "SID": u"S-1-5-21-1010-10101-1001"
+        }),
+        # Accounts without a name or SID are dropped.
+        rdf_protodict.Dict({
+            "Domain": u"DOMAIN"
+        }),
+        rdf_protodict.Dict({
+            "SID": u"S-1-5-21-1010-10101-1002",
+            "LocalPath": u"C:\\Users\\user2"
+        })
+    ]
+
+    results = list(parser.ParseBatch(None, wmi_dicts, None))
+    self.assertEqual(len(results), 2)
+    self.assertEqual(results[0].username, u"user1")
+    self.assertEqual(results[0].userdomain, u"DOMAIN")
+    self.assertEqual(results[1].sid, u"S-1-5-21-1010-10101-1002")
+    self.assertEqual(results[1].homedir, u"C:\\Users\\user2")
+
+  def testWMILogicalDisksParserBatch(self):
+    parser = wmi_parser.WMILogicalDisksParser()
+    wmi_dicts = [
+        rdf_protodict.Dict({
+            "DeviceID": u"C:",
+            "DriveType": 3,
+            "VolumeName": u"System",
+            "FileSystem": u"NTFS",
+            "Size": u"1000",
+            "FreeSpace": u"bogus"
+        }), rdf_protodict.Dict({
+            "DeviceID": u"D:"
+        })
+    ]
+
+    results = list(parser.ParseBatch(None, wmi_dicts, None))
+    self.assertEqual(len(results), 2)
+    self.assertEqual(results[0].windowsvolume.drive_letter, u"C:")
+    self.assertEqual(results[0].windowsvolume.drive_type, 3)
+    self.assertEqual(results[0].name, u"System")
+    self.assertEqual(results[0].total_allocation_units, 1000)
+    self.assertFalse(results[0].HasField("actual_available_allocation_units"))
+    self.assertEqual(results[1].windowsvolume.drive_letter, u"D:")
+
   def testWMIActiveScriptEventConsumerParser(self):
     parser = wmi_parser.WMIActiveScriptEventConsumerParser()
     rdf_dict = rdf_protodict.Dict()
@@ -46,6 +46,27 @@ class ForemanClientRuleSet(rdf_structs.RDFProtoStruct):
 
     return quantifier(rule.Evaluate(objects, client_id) for rule in self.rules)
 
+  def GetIndexKeys(self):
+    """Returns index keys of which a matching client has at least one.
+
+    Returns:
+      A set of (kind, value) tuples or None if the rule set can't be indexed.
+    """
+    rule_keys = [rule.GetIndexKeys() for rule in self.rules]
+    if not rule_keys:
+      return None
+
+    if self.match_mode == ForemanClientRuleSet.MatchMode.MATCH_ALL:
+      # Every rule has to match, so the smallest key set of any rule will do.
+      indexed = [keys for keys in rule_keys if keys is not None]
+      if indexed:
+        return min(indexed, key=len)
+    elif self.match_mode == ForemanClientRuleSet.MatchMode.MATCH_ANY:
+      if None not in rule_keys:
+        return set(itertools.chain.from_iterable(rule_keys))
+
+    return None
+
   def Validate(self):
     for rule in self.rules:
       rule.Validate()
@@ -65,6 +86,17 @@ class ForemanClientRuleBase(rdf_structs.RDFProtoStruct):
     """
     return ["/"]
 
+  def GetIndexKeys(self):
+    """Returns index keys of which a matching client has at least one.
+
+    Rules which can't be expressed this way return None and get evaluated for
+    every client.
+
+    Returns:
+      A set of (kind, value) tuples or None.
+    """
+    return None
+
   def Evaluate(self, objects, client_id):
     """Evaluates the rule represented by this object.
 
@@ -93,6 +125,9 @@ class ForemanClientRule(ForemanClientRuleBase):
   def Evaluate(self, objects, client_id):
     return self.UnionCast().Evaluate(objects, client_id)
 
+  def GetIndexKeys(self):
+    return self.UnionCast().GetIndexKeys()
+
   def Validate(self):
     self.UnionCast().Validate()
 
@@ -101,6 +136,17 @@ class ForemanOsClientRule(ForemanClientRuleBase):
   """This rule will fire if the client OS is marked as true in the proto."""
   protobuf = jobs_pb2.ForemanOsClientRule
 
+  # Prefixes of the System attribute for each of the supported systems.
+  SYSTEMS = ["Windows", "Linux", "Darwin"]
+
+  @classmethod
+  def GetSystemIndexKey(cls, value):
+    """Returns the index key for a System attribute value."""
+    value = utils.SmartStr(value)
+    for system in cls.SYSTEMS:
+      if value.startswith(system):
+        return ("os", system)
+
   def Evaluate(self, objects, client_id):
     try:
       fd = objects[client_id]
@@ -114,6 +160,12 @@ class ForemanOsClientRule(ForemanClientRuleBase):
             (self.os_linux and value.startswith("Linux")) or
             (self.os_darwin and value.startswith("Darwin")))
 
+  def GetIndexKeys(self):
+    flags = dict(Windows=self.os_windows,
+                 Linux=self.os_linux,
+                 Darwin=self.os_darwin)
+    return set(("os", system) for system in self.SYSTEMS if flags[system])
+
   def Validate(self):
     pass
 
@@ -143,6 +195,16 @@ class ForemanLabelClientRule(ForemanClientRuleBase):
 
     return quantifier((name in client_label_names) for name in self.label_names)
 
+  def GetIndexKeys(self):
+    # Only the positive match modes require the client to carry a label.
+    if (self.match_mode in [ForemanLabelClientRule.MatchMode.MATCH_ALL,
+                            ForemanLabelClientRule.MatchMode.MATCH_ANY] and
+        self.label_names):
+      return set(("label", utils.SmartUnicode(name))
+                 for name in self.label_names)
+
+    return None
+
   def Validate(self):
     pass
 
@@ -237,3 +299,90 @@ class ForemanRule(rdf_structs.RDFProtoStruct):
 class ForemanRules(rdf_protodict.RDFValueArray):
   """A list of rules that the foreman will apply."""
   rdf_type = ForemanRule
+
+
+class ForemanRuleIndex(object):
+  """A compiled form of the foreman rules for evaluation against clients.
+
+  Rules are grouped by the labels and operating systems a client has to have
+  for them to match, so only the rules which can possibly match a given client
+  need to be evaluated. Rules without such a requirement are evaluated for
+  every client. The rule sets are also union cast once here instead of on
+  every evaluation.
+  """
+
+  def __init__(self, rules, version=None):
+    self.rules = list(rules)
+    self.version = version
+
+    self.latest_created = 0
+    self._rule_sets = []
+    self._unindexed = []
+    self._index = {}
+
+    for position, rule in enumerate(self.rules):
+      self.latest_created = max(self.latest_created, int(rule.created))
+
+      rule_set = rule.client_rule_set
+      self._rule_sets.append((rule_set.match_mode,
+                              [r.UnionCast() for r in rule_set.rules]))
+
+      keys = rule_set.GetIndexKeys()
+      if keys is None:
+        self._unindexed.append(position)
+      else:
+        for key in keys:
+          self._index.setdefault(key, []).append(position)
+
+  def __len__(self):
+    return len(self.rules)
+
+  @property
+  def indexed_keys(self):
+    return set(self._index)
+
+  def GetClientIndexKeys(self, client):
+    """Returns the index keys for a client object."""
+    keys = set(("label", name) for name in client.GetLabelsNames())
+    system_key = ForemanOsClientRule.GetSystemIndexKey(
+        client.Get(aff4.Attribute.NAMES["System"]))
+    if system_key:
+      keys.add(system_key)
+    return keys
+
+  def GetCandidates(self, client, created_after=0):
+    """Returns the positions of the rules which might match the client.
+
+    Args:
+      client: The client's aff4 object.
+      created_after: Only consider rules created after this time.
+
+    Returns:
+      A sorted list of rule positions.
+    """
+    positions = set(self._unindexed)
+    for key in self.GetClientIndexKeys(client):
+      positions.update(self._index.get(key, []))
+
+    return sorted(position for position in positions
+                  if self.rules[position].created > created_after)
+
+  def GetPathsToCheck(self, positions):
+    """Returns the aff4 paths needed to evaluate the given rules."""
+    paths = set()
+    for position in positions:
+      for rule in self._rule_sets[position][1]:
+        paths.update(rule.GetPathsToCheck())
+    return paths
+
+  def Evaluate(self, position, objects, client_id):
+    """Evaluates the rule set of a rule like ForemanClientRuleSet.Evaluate."""
+    match_mode, rules = self._rule_sets[position]
+    if match_mode == ForemanClientRuleSet.MatchMode.MATCH_ALL:
+      quantifier = all
+    elif match_mode == ForemanClientRuleSet.MatchMode.MATCH_ANY:
+      quantifier = any
+    else:
+      raise ValueError("Unexpected match mode value: %s" % match_mode)
+
+    return quantifier(rule.Evaluate(objects, client_id) for rule in rules)
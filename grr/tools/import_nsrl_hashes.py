@@ -2,23 +2,44 @@
 """Script for importing NSRL files."""
 
 
+import collections
 import csv
+import itertools
+import json
+import multiprocessing
 import os
+import time
 
 # pylint: disable=unused-import,g-bad-import-order
 from grr.lib import server_plugins
 # pylint: enable=unused-import,g-bad-import-order
 
 from grr.lib import aff4
+from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import startup
 from grr.lib import utils
 
 from grr.lib.aff4_objects import filestore
+from grr.lib.rdfvalues import nsrl as rdf_nsrl
 
 flags.DEFINE_string("filename", "", "File with hashes.")
 flags.DEFINE_integer("start", None, "Start row in the file.")
+flags.DEFINE_bool("bulk", False,
+                  "Parse the file in parallel worker processes and write the "
+                  "hashes in large batches. Progress is checkpointed so an "
+                  "interrupted import resumes where it stopped.")
+flags.DEFINE_integer("workers", None,
+                     "Number of parser processes used by the bulk import "
+                     "(default: number of CPUs).")
+flags.DEFINE_integer("batch_size", 50000,
+                     "Number of hashes written per batch by the bulk import.")
+flags.DEFINE_integer("chunk_size", 16 * 1024 * 1024,
+                     "Number of bytes of the file parsed by a worker at a time.")
+flags.DEFINE_string("checkpoint_file", None,
+                    "File to record bulk import progress in "
+                    "(default: <filename>.checkpoint).")
 
 
 def _ImportRow(store, row, product_code_list, op_system_code_list):
@@ -78,6 +99,240 @@ def ImportFile(store, filename, start):
     return i
 
 
+# A range of an RDS file parsed by one worker. Each hash is a tuple of
+# (offset of its first row, sha1, serialized NSRLInformation).
+ParsedChunk = collections.namedtuple("ParsedChunk",
+                                     ["start", "end", "hashes", "errors"])
+
+
+def _ParseRow(row):
+  return (row[0].lower(), row[1].lower(), int(row[2], 16),
+          utils.SmartUnicode(row[3]), int(row[4]), [int(row[5])], [row[6]],
+          row[7])
+
+
+def _MergeSerialized(first, second):
+  """Merges the products of two serialized NSRLInformation for one hash."""
+  nsrl = rdf_nsrl.NSRLInformation.FromSerializedString(first)
+  other = rdf_nsrl.NSRLInformation.FromSerializedString(second)
+  nsrl.product_code.Extend(other.product_code)
+  nsrl.op_system_code.Extend(other.op_system_code)
+  return nsrl.SerializeToString()
+
+
+def ParseChunk(filename, start, end):
+  """Parses all rows starting in the byte range [start, end) of a file.
+
+  Consecutive rows for the same sha1 are merged into a single hash. A hash can
+  continue in the following chunk, the caller has to merge these.
+
+  Building and serializing the NSRLInformation protos is the expensive part
+  of an import, so this is done here as well.
+
+  Args:
+    filename: The RDS file.
+    start: Offset of the first byte of the range.
+    end: Offset after the last byte of the range.
+
+  Returns:
+    A ParsedChunk.
+  """
+  lines = []
+  offsets = []
+  with open(filename, "rb") as fp:
+    if start == 0:
+      # Skip the header.
+      fp.readline()
+    else:
+      # Skip the line which started in the previous chunk. If the range starts
+      # on a line boundary this only reads the previous newline.
+      fp.seek(start - 1)
+      fp.readline()
+
+    offset = fp.tell()
+    while offset < end:
+      line = fp.readline()
+      if not line:
+        break
+      lines.append(line)
+      offsets.append(offset)
+      offset += len(line)
+
+  hashes = []
+  errors = 0
+  reader = csv.reader(lines, delimiter=",", quotechar="\"")
+  for offset, row in itertools.izip(offsets, reader):
+    if len(row) != 8:
+      continue
+    try:
+      parsed = _ParseRow(row)
+    except ValueError:
+      errors += 1
+      continue
+
+    if hashes and hashes[-1][1][0] == parsed[0]:
+      # Same hash, add product/system.
+      hashes[-1][1][5].extend(parsed[5])
+      hashes[-1][1][6].extend(parsed[6])
+    else:
+      hashes.append((offset, parsed))
+
+  hashes = [(offset, row[0], filestore.NSRLFileStore.BuildNSRLInformation(
+      *row).SerializeToString()) for offset, row in hashes]
+  return ParsedChunk(start, end, hashes, errors)
+
+
+def _ParseChunks(ranges, workers):
+  """Yields ParsedChunks for all ranges in order."""
+  if workers <= 1:
+    for args in ranges:
+      yield ParseChunk(*args)
+    return
+
+  pool = multiprocessing.Pool(workers)
+  try:
+    # Only keep a few chunks in flight so parsed hashes don't pile up in memory
+    # when writing is slower than parsing.
+    ranges = iter(ranges)
+    in_flight = collections.deque()
+    for args in itertools.islice(ranges, workers * 2):
+      in_flight.append(pool.apply_async(ParseChunk, args))
+
+    while in_flight:
+      chunk = in_flight.popleft().get()
+      for args in itertools.islice(ranges, 1):
+        in_flight.append(pool.apply_async(ParseChunk, args))
+      yield chunk
+  finally:
+    pool.terminate()
+    pool.join()
+
+
+def _ReadCheckpoint(checkpoint_file, filename, file_size):
+  """Returns (offset, imported hashes) to resume an import from."""
+  if not checkpoint_file or not os.path.exists(checkpoint_file):
+    return 0, 0
+
+  with open(checkpoint_file, "rb") as fd:
+    checkpoint = json.load(fd)
+
+  if (checkpoint["filename"] != os.path.abspath(filename) or
+      checkpoint["size"] != file_size):
+    raise ValueError("Checkpoint %s was written for a different file (%s)." %
+                     (checkpoint_file, checkpoint["filename"]))
+
+  return checkpoint["offset"], checkpoint["hashes"]
+
+
+def _WriteCheckpoint(checkpoint_file, filename, file_size, offset, hashes):
+  if not checkpoint_file:
+    return
+
+  # Write to a temporary file and rename it into place so an interrupted
+  # import never leaves a truncated checkpoint behind.
+  temp_file = checkpoint_file + ".tmp"
+  with open(temp_file, "wb") as fd:
+    json.dump(
+        dict(
+            filename=os.path.abspath(filename),
+            size=file_size,
+            offset=offset,
+            hashes=hashes),
+        fd)
+  os.rename(temp_file, checkpoint_file)
+
+
+def BulkImportFile(store,
+                   filename,
+                   workers=None,
+                   batch_size=50000,
+                   chunk_size=16 * 1024 * 1024,
+                   checkpoint_file=None):
+  """Import hashes from 'filename' into 'store' using parallel parsers.
+
+  The file is split into chunks which are parsed by a pool of worker processes
+  while this process writes the hashes in batches through a mutation pool,
+  without the per hash overhead of NSRLFileStore.AddHash. After every
+  batch the offset of the first row not yet written is recorded in the
+  checkpoint file. If the checkpoint file exists the import resumes from
+  there, it is removed once the import is complete.
+
+  Args:
+    store: The NSRLFileStore to import into.
+    filename: The RDS file.
+    workers: Number of parser processes, defaults to the number of CPUs. With
+             a single worker the file is parsed in this process.
+    batch_size: Number of hashes to write per batch.
+    chunk_size: Number of bytes each worker parses at a time.
+    checkpoint_file: File to record progress in, None disables checkpointing.
+
+  Returns:
+    The number of hashes in the store imported from this file.
+
+  Raises:
+    ValueError: If the checkpoint file belongs to a different file.
+  """
+  if workers is None:
+    workers = multiprocessing.cpu_count()
+
+  file_size = os.path.getsize(filename)
+  offset, imported = _ReadCheckpoint(checkpoint_file, filename, file_size)
+  if offset:
+    print "Resuming import at offset %d (%d hashes imported)" % (offset,
+                                                                  imported)
+
+  ranges = [(filename, start, min(start + chunk_size, file_size))
+            for start in xrange(offset, file_size, chunk_size)]
+
+  mutation_pool = data_store.DB.GetMutationPool(token=store.token)
+  start_time = time.time()
+  start_count = imported
+  errors = 0
+  batch = []
+  # The last hash is held back since it may continue in the next chunk.
+  pending = None
+
+  for chunk in _ParseChunks(ranges, workers):
+    errors += chunk.errors
+    for offset, sha1, serialized in chunk.hashes:
+      if pending:
+        if pending[1] == sha1:
+          # The rows of this hash were split across chunks.
+          pending = (pending[0], sha1, _MergeSerialized(pending[2],
+                                                        serialized))
+          continue
+
+        batch.append(pending[1:])
+
+      pending = (offset, sha1, serialized)
+
+      if len(batch) >= batch_size:
+        store.AddSerializedHashes(batch, mutation_pool)
+        mutation_pool.Flush()
+        imported += len(batch)
+        batch = []
+
+        # Everything before the pending hash is now in the data store.
+        _WriteCheckpoint(checkpoint_file, filename, file_size, pending[0],
+                         imported)
+        print "Imported %d hashes (%d/s)" % (
+            imported, (imported - start_count) / (time.time() - start_time))
+
+  if pending:
+    batch.append(pending[1:])
+  store.AddSerializedHashes(batch, mutation_pool)
+  mutation_pool.Flush()
+  imported += len(batch)
+
+  if errors:
+    print "Skipped %d invalid rows" % errors
+
+  if checkpoint_file and os.path.exists(checkpoint_file):
+    os.unlink(checkpoint_file)
+
+  return imported
+
+
 def main(unused_argv):
   """Main."""
   startup.Init()
@@ -92,10 +347,24 @@ def main(unused_argv):
       filestore.NSRLFileStore,
       mode="rw",
       token=aff4.FACTORY.root_token) as store:
-    imported = ImportFile(store, filename, flags.FLAGS.start)
+    if flags.FLAGS.bulk:
+      imported = BulkImportFile(
+          store,
+          filename,
+          workers=flags.FLAGS.workers,
+          batch_size=flags.FLAGS.batch_size,
+          chunk_size=flags.FLAGS.chunk_size,
+          checkpoint_file=(flags.FLAGS.checkpoint_file or
+                           filename + ".checkpoint"))
+    else:
+      imported = ImportFile(store, filename, flags.FLAGS.start)
     data_store.DB.Flush()
     print "Imported %d hashes" % imported
 
+    if config_lib.CONFIG["FileStore.hash_filter_enabled"]:
+      hash_filter = store.RebuildHashFilter()
+      print "Rebuilt hash filter with %d hashes" % hash_filter.num_items
+
 
 if __name__ == "__main__":
   flags.StartMain(main)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Benchmarks for importing NSRL hashes."""
+
+
+import os
+
+from grr.lib import aff4
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.aff4_objects import filestore
+from grr.tools import import_nsrl_hashes
+from grr.tools import import_nsrl_hashes_test
+
+
+class NSRLImportBenchmarks(test_lib.AverageMicroBenchmarks):
+  """Compare the throughput of the sequential and bulk import modes."""
+
+  REPEATS = 2
+
+  NUM_HASHES = 20000
+
+  def setUp(self):
+    super(NSRLImportBenchmarks, self).setUp()
+    self.filename = os.path.join(self.temp_dir, "NSRLFile.txt")
+    import_nsrl_hashes_test.WriteSyntheticRDS(self.filename, self.NUM_HASHES)
+
+    self.store = aff4.FACTORY.Create(
+        filestore.NSRLFileStore.PATH,
+        filestore.NSRLFileStore,
+        mode="rw",
+        token=self.token)
+
+  def testSequentialImport(self):
+
+    def Import():
+      return import_nsrl_hashes.ImportFile(self.store, self.filename, None)
+
+    self.TimeIt(Import, name="Sequential import of %d hashes" % self.NUM_HASHES)
+
+  def testBulkImport(self):
+    for workers in [1, 4]:
+
+      def Import():
+        return import_nsrl_hashes.BulkImportFile(
+            self.store,
+            self.filename,
+            workers=workers,  # pylint: disable=cell-var-from-loop
+            chunk_size=256 * 1024)
+
+      self.TimeIt(
+          Import,
+          name="Bulk import of %d hashes (%d workers)" % (self.NUM_HASHES,
+                                                          workers))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""Tests for the NSRL import tool."""
+
+
+import csv
+import hashlib
+import json
+import os
+
+from grr.lib import aff4
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib import utils
+from grr.lib.aff4_objects import filestore
+from grr.tools import import_nsrl_hashes
+
+RDS_HEADER = ["SHA-1", "MD5", "CRC32", "FileName", "FileSize", "ProductCode",
+              "OpSystemCode", "SpecialCode"]
+
+
+def WriteSyntheticRDS(filename, num_hashes, rows_per_hash=2):
+  """Writes an RDS file with num_hashes hashes, each listed rows_per_hash times.
+
+  Args:
+    filename: The file to write.
+    num_hashes: Number of distinct hashes.
+    rows_per_hash: Number of rows (products) per hash.
+
+  Returns:
+    A list of the sha1 hashes in the file.
+  """
+  hashes = []
+  with open(filename, "wb") as fd:
+    writer = csv.writer(fd, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\r\n")
+    writer.writerow(RDS_HEADER)
+    for i in xrange(num_hashes):
+      data = "file%d" % i
+      sha1 = hashlib.sha1(data).hexdigest().upper()
+      hashes.append(sha1.lower())
+      for product in xrange(rows_per_hash):
+        writer.writerow([
+            sha1, hashlib.md5(data).hexdigest().upper(), "%08X" % i,
+            "%s.dll" % data, i, product, "WIN%d" % product,
+            "M" if i % 10 == 0 else ""
+        ])
+  return hashes
+
+
+class BulkImportTest(test_lib.GRRBaseTest):
+  """Tests for the bulk import mode."""
+
+  def setUp(self):
+    super(BulkImportTest, self).setUp()
+    self.filename = os.path.join(self.temp_dir, "NSRLFile.txt")
+    self.checkpoint_file = self.filename + ".checkpoint"
+    self.hashes = WriteSyntheticRDS(self.filename, 50, rows_per_hash=3)
+
+  def _Store(self):
+    return aff4.FACTORY.Create(
+        filestore.NSRLFileStore.PATH,
+        filestore.NSRLFileStore,
+        mode="rw",
+        token=self.token)
+
+  def _CheckImported(self):
+    urns = [filestore.NSRLFileStore.PATH.Add(sha1) for sha1 in self.hashes]
+    fds = aff4.FACTORY.MultiOpen(urns, token=self.token)
+    nsrl = dict((fd.urn, fd.Get(fd.Schema.NSRL)) for fd in fds)
+    self.assertEqual(len(nsrl), len(self.hashes))
+
+    for i, urn in enumerate(urns):
+      self.assertEqual(nsrl[urn].file_name, "file%d.dll" % i)
+      self.assertEqual(nsrl[urn].file_size, i)
+      self.assertEqual(nsrl[urn].crc32, i)
+      self.assertEqual(list(nsrl[urn].product_code), [0, 1, 2])
+      self.assertEqual(list(nsrl[urn].op_system_code), ["WIN0", "WIN1", "WIN2"])
+
+  def testBulkImport(self):
+    # Small chunks split the rows of a hash over several chunks.
+    imported = import_nsrl_hashes.BulkImportFile(
+        self._Store(), self.filename, workers=1, chunk_size=500)
+    self.assertEqual(imported, 50)
+    self._CheckImported()
+
+  def testBulkImportWithWorkerProcesses(self):
+    imported = import_nsrl_hashes.BulkImportFile(
+        self._Store(), self.filename, workers=2, chunk_size=1000)
+    self.assertEqual(imported, 50)
+    self._CheckImported()
+
+  def testParsedChunksCoverTheFile(self):
+    size = os.path.getsize(self.filename)
+    offsets = []
+    for start in xrange(0, size, 333):
+      chunk = import_nsrl_hashes.ParseChunk(self.filename, start,
+                                            min(start + 333, size))
+      offsets.extend(offset for offset, _, _ in chunk.hashes)
+      self.assertEqual(chunk.errors, 0)
+
+    # Every row starts in exactly one chunk.
+    self.assertEqual(len(offsets), len(set(offsets)))
+    with open(self.filename, "rb") as fd:
+      fd.readline()
+      first_row = fd.tell()
+    self.assertEqual(offsets[0], first_row)
+
+  def testInterruptedImportResumesFromCheckpoint(self):
+    store = self._Store()
+    calls = [0]
+    add_hashes = store.AddSerializedHashes
+
+    def FailingAddSerializedHashes(hashes, mutation_pool):
+      calls[0] += 1
+      if calls[0] > 2:
+        raise RuntimeError("Import interrupted.")
+      return add_hashes(hashes, mutation_pool)
+
+    with utils.Stubber(store, "AddSerializedHashes",
+                       FailingAddSerializedHashes):
+      self.assertRaises(
+          RuntimeError,
+          import_nsrl_hashes.BulkImportFile,
+          store,
+          self.filename,
+          workers=1,
+          batch_size=10,
+          chunk_size=500,
+          checkpoint_file=self.checkpoint_file)
+
+    with open(self.checkpoint_file, "rb") as fd:
+      checkpoint = json.load(fd)
+    self.assertEqual(checkpoint["hashes"], 20)
+
+    imported = import_nsrl_hashes.BulkImportFile(
+        self._Store(),
+        self.filename,
+        workers=1,
+        batch_size=10,
+        chunk_size=500,
+        checkpoint_file=self.checkpoint_file)
+    self.assertEqual(imported, 50)
+    self._CheckImported()
+    self.assertFalse(os.path.exists(self.checkpoint_file))
+
+  def testCheckpointForDifferentFileIsRejected(self):
+    with open(self.checkpoint_file, "wb") as fd:
+      json.dump(
+          dict(filename="/tmp/other.txt", size=1, offset=0, hashes=0), fd)
+
+    self.assertRaises(
+        ValueError,
+        import_nsrl_hashes.BulkImportFile,
+        self._Store(),
+        self.filename,
+        workers=1,
+        checkpoint_file=self.checkpoint_file)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Script for copying blobs from the memory stream blob store to another one."""
+
+
+# pylint: disable=unused-import,g-bad-import-order
+from grr.lib import server_plugins
+# pylint: enable=unused-import,g-bad-import-order
+
+from grr.lib import aff4
+from grr.lib import blob_store
+from grr.lib import flags
+from grr.lib import startup
+
+from grr.lib.blob_stores import memory_stream_bs
+
+flags.DEFINE_string("target", "LocalFileBlobstore",
+                    "Name of the blob store to copy blobs to.")
+flags.DEFINE_integer("batch_size", 100,
+                     "Number of blobs to copy at a time.")
+
+
+def main(unused_argv):
+  """Main."""
+  startup.Init()
+
+  token = aff4.FACTORY.root_token
+  source = memory_stream_bs.MemoryStreamBlobstore()
+  target = blob_store.Blobstore.GetPlugin(flags.FLAGS.target)()
+
+  copied = 0
+  for _ in blob_store.CopyBlobs(
+      source,
+      target,
+      source.ListBlobs(token=token),
+      batch_size=flags.FLAGS.batch_size,
+      token=token):
+    copied += 1
+    if copied % 1000 == 0:
+      print "Copied %d blobs" % copied
+
+  print "Copied %d blobs" % copied
+  print ("Set Blobstore.implementation to %s to start using the copied "
+         "blobs." % flags.FLAGS.target)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
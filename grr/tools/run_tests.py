@@ -29,6 +29,7 @@ from grr.parsers import tests
 from grr.path_detection import tests
 from grr.server import tests
 from grr.tools.export_plugins import tests
+from grr.tools import import_nsrl_hashes_test
 from grr.worker import worker_test
 # pylint: enable=unused-import,g-bad-import-order
 
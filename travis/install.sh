@@ -12,7 +12,7 @@ nodeenv -p --prebuilt
 source "${HOME}/INSTALL/bin/activate"
 pip install -e .
 if [[ "$TRAVIS_OS_NAME" == "linux" ]]; then
-  pip install -e grr/config/grr-response-server/
+  pip install -e "grr/config/grr-response-server[sqlitevfs]"
 fi
 pip install -e grr/config/grr-response-test/
 pip install -e grr/config/grr-response-client/